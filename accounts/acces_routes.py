@@ -0,0 +1,142 @@
+"""
+Règles d'accès aux URL selon le rôle (utilisées par AdminAccessMiddleware)
+
+Les règles en dur sont une table rôle -> (préfixes autorisés, page de repli)
+compilée une fois par processus en une expression régulière par rôle. S'y
+ajoutent les motifs d'URL (Permission.url_pattern) des permissions RBAC du
+rôle de l'utilisateur et de son rôle RBAC, lus dans le cache des permissions
+(rbac.cache_permissions, invalidé par les signaux) : ils se modifient depuis
+la gestion des rôles, sans déploiement. Ils n'élargissent que les préfixes
+du rôle : la fermeture du tableau de bord feuilles aux rôles non DAF est
+vérifiée avant eux, comme avant leur introduction. La vérification d'une
+requête est une recherche dans la table et une ou deux correspondances
+d'expression régulière.
+"""
+import re
+from functools import lru_cache
+
+
+PREFIXES_COMMUNS = ['/accounts/logout/', '/static/', '/media/']
+
+# Rôle -> préfixes autorisés (en plus des préfixes communs) et page de repli.
+# Pour DG, DF et CD_FINANCE, la racine « / » couvre tous les chemins : seul
+# le tableau de bord feuilles leur est fermé (voir ROLES_TABLEAU_BORD_FEUILLES).
+REGLES_ROLES = {
+    # USERS DE DAF
+    'OpsDaf': {
+        'prefixes': [
+            '/demandes/depenses/feuille/',
+            '/recettes/feuille/',
+            '/tableau-bord-feuilles/etats-',
+            '/tableau-bord-feuilles/imports/',
+        ],
+        'repli': '/demandes/depenses/feuille/',
+    },
+    'DirDaf': {
+        'prefixes': ['/tableau-bord-feuilles/', '/clotures/'],
+        'repli': '/tableau-bord-feuilles/',
+    },
+    'DivDaf': {
+        'prefixes': ['/tableau-bord-feuilles/', '/clotures/'],
+        'repli': '/tableau-bord-feuilles/',
+    },
+    'AdminDaf': {
+        'prefixes': ['/demandes/natures/', '/accounts/services/'],
+        'repli': '/demandes/natures/',
+    },
+    # USERS NORMALS (WICKFLOW)
+    'ADMIN': {
+        'prefixes': ['/demandes/', '/recettes/', '/accounts/users/', '/accounts/services/', '/demandes/natures/'],
+        'repli': '/demandes/',
+    },
+    'DG': {
+        'prefixes': ['/', '/demandes/', '/recettes/'],
+        'repli': '/',
+    },
+    'DF': {
+        'prefixes': ['/', '/demandes/', '/recettes/'],
+        'repli': '/',
+    },
+    'CD_FINANCE': {
+        'prefixes': ['/', '/demandes/', '/recettes/', '/releves/creer/', '/tableau-bord-feuilles/etats-'],
+        'repli': '/',
+    },
+    'OPERATEUR_SAISIE': {
+        'prefixes': ['/demandes/depenses/feuille/', '/recettes/feuille/'],
+        'repli': '/demandes/depenses/feuille/',
+    },
+    'AGENT_PAYEUR': {
+        'prefixes': ['/demandes/paiements/'],
+        'repli': '/demandes/paiements/',
+    },
+}
+
+# Tableau de bord feuilles : réservé aux rôles DAF et aux super-administrateurs
+PREFIXE_TABLEAU_BORD_FEUILLES = '/tableau-bord-feuilles/'
+ROLES_TABLEAU_BORD_FEUILLES = {'OpsDaf', 'DirDaf', 'DivDaf', 'AdminDaf', 'SUPER_ADMIN'}
+
+# Page de repli des rôles sans règle
+REPLI_PAR_DEFAUT = '/accounts/login/'
+
+# Convertisseurs de chemin acceptés dans Permission.url_pattern (<int:pk>, <slug:code>...)
+CONVERTISSEURS = {
+    'str': '[^/]+',
+    'int': '[0-9]+',
+    'slug': '[-a-zA-Z0-9_]+',
+    'uuid': '[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}',
+    'path': '.+',
+}
+CONVERTISSEUR = re.compile(r'<(?:(?P<type>[^>:]+):)?[^>]+>')
+
+
+def motif_vers_regex(motif):
+    """Motif d'URL (préfixe, éventuellement avec des convertisseurs) -> expression régulière"""
+    morceaux = []
+    debut = 0
+    for convertisseur in CONVERTISSEUR.finditer(motif):
+        morceaux.append(re.escape(motif[debut:convertisseur.start()]))
+        morceaux.append(CONVERTISSEURS.get(convertisseur.group('type') or 'str', '[^/]+'))
+        debut = convertisseur.end()
+    morceaux.append(re.escape(motif[debut:]))
+    return ''.join(morceaux)
+
+
+@lru_cache(maxsize=512)
+def compiler(motifs):
+    """Une seule expression régulière pour un ensemble (frozenset) de préfixes"""
+    if not motifs:
+        return None
+    return re.compile('|'.join(motif_vers_regex(motif) for motif in sorted(motifs)))
+
+
+@lru_cache(maxsize=None)
+def table_acces():
+    """Règles en dur compilées : rôle -> (expression des préfixes autorisés, page de repli)"""
+    return {
+        role: (compiler(frozenset(regle['prefixes'] + PREFIXES_COMMUNS)), regle['repli'])
+        for role, regle in REGLES_ROLES.items()
+    }
+
+
+def redirection_acces(user, chemin):
+    """Page vers laquelle rediriger `user` qui demande `chemin`, ou None si l'accès est permis"""
+    if not user.is_authenticated:
+        return None
+
+    autorises, repli = table_acces().get(user.role, (None, REPLI_PAR_DEFAUT))
+    # Le tableau de bord feuilles reste fermé aux rôles non DAF : une permission RBAC ne l'ouvre pas
+    if (chemin.startswith(PREFIXE_TABLEAU_BORD_FEUILLES)
+            and user.role not in ROLES_TABLEAU_BORD_FEUILLES and not user.is_superuser):
+        cible = repli
+    elif autorises is None or autorises.match(chemin):
+        return None
+    else:
+        # Hors des règles en dur : motifs d'URL accordés par les permissions RBAC du rôle
+        from rbac.cache_permissions import motifs_url
+        accordes = compiler(motifs_url(user.role, user.rbac_role_id))
+        if accordes is not None and accordes.match(chemin):
+            return None
+        cible = repli
+
+    # Éviter la boucle de redirection : ne pas rediriger si déjà sur la page de repli
+    return None if cible == chemin else cible
@@ -6,3 +6,6 @@ class AccountsConfig(AppConfig):
     name = 'accounts'
     verbose_name = 'Gestion des Utilisateurs'
 
+    def ready(self):
+        # Attribution des permissions du rôle à l'enregistrement des utilisateurs
+        from . import signals  # noqa: F401
@@ -0,0 +1,33 @@
+"""
+Commande de rattrapage des permissions attribuées selon le rôle
+(voir accounts.provisionnement)
+"""
+from django.core.management.base import BaseCommand
+
+from accounts.models import User
+from accounts.provisionnement import VERSION_PERMISSIONS_AUTO, provisionner, provisionner_si_necessaire
+
+
+class Command(BaseCommand):
+    help = "Attribue les permissions de leur rôle aux utilisateurs dont le marqueur est en retard"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tous', action='store_true',
+            help="Reprendre tous les utilisateurs, même ceux déjà à jour",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"=== Permissions selon le rôle (version {VERSION_PERMISSIONS_AUTO}) ===")
+
+        repris = 0
+        utilisateurs = User.objects.only('pk', 'username', 'role', 'is_superuser', 'is_staff', 'permissions_auto')
+        for user in utilisateurs.iterator():
+            if options['tous']:
+                provisionner(user)
+            elif not provisionner_si_necessaire(user):
+                continue
+            repris += 1
+            self.stdout.write(f"  → {user.username} ({user.role})")
+
+        self.stdout.write(self.style.SUCCESS(f"✓ {repris} utilisateur(s) mis à jour"))
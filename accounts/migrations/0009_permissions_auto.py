@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-18 00:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_alter_user_role'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='permissions_auto',
+            field=models.CharField(blank=True, default='', editable=False, max_length=50),
+        ),
+    ]
@@ -100,6 +100,8 @@ class User(AbstractUser, UserPermissionMixin):
     )
     telephone = models.CharField(max_length=20, blank=True)
     actif = models.BooleanField(default=True)
+    # Marqueur « rôle:version » des permissions attribuées automatiquement (voir accounts.provisionnement)
+    permissions_auto = models.CharField(max_length=50, blank=True, default='', editable=False)
     date_creation = models.DateTimeField(auto_now_add=True)
     date_modification = models.DateTimeField(auto_now=True)
     
@@ -157,10 +159,9 @@ class User(AbstractUser, UserPermissionMixin):
         return Permission.objects.none()
     
     def has_rbac_permission(self, permission_code):
-        """Vérifier si l'utilisateur a une permission RBAC spécifique"""
-        if self.rbac_role:
-            return self.rbac_role.permissions.filter(code=permission_code).exists()
-        return False
+        """Vérifier si l'utilisateur a une permission RBAC spécifique (sans requête une fois l'ensemble en cache)"""
+        from rbac.cache_permissions import permissions_utilisateur
+        return permission_code in permissions_utilisateur(self)
     
     @property
     def is_comptable(self):
@@ -272,6 +273,10 @@ class User(AbstractUser, UserPermissionMixin):
         """Vérifie si l'utilisateur peut valider les paiements (AGENT_PAYEUR)"""
         return self.role in ['SUPER_ADMIN', 'AGENT_PAYEUR']
     
+    def peut_voir_menu_demandes(self):
+        """Vérifie si l'utilisateur peut voir le menu demandes (tous les rôles concernés)"""
+        return self.role in ['SUPER_ADMIN', 'ADMIN', 'DG', 'DF', 'CD_FINANCE']
+
     def peut_voir_paiements(self):
         """Vérifie si l'utilisateur peut voir le menu paiements (tous les rôles concernés)"""
         return self.role in ['SUPER_ADMIN', 'ADMIN', 'DG', 'DF', 'CD_FINANCE', 'AGENT_PAYEUR']
@@ -0,0 +1,59 @@
+"""
+Attribution automatique des permissions selon le rôle
+
+Les utilisateurs ADMIN reçoivent les permissions Django sur les utilisateurs,
+les services et les natures économiques ; les SUPER_ADMIN deviennent
+superuser. L'attribution a lieu une fois, à l'enregistrement de l'utilisateur
+(signal post_save, donc à la création et au changement de rôle) ou par la
+commande `provisionner_permissions`, et elle est notée dans
+User.permissions_auto sous la forme « rôle:version ». Augmenter
+VERSION_PERMISSIONS_AUTO quand les règles changent : chaque utilisateur est
+alors repris une fois.
+"""
+VERSION_PERMISSIONS_AUTO = 1
+
+# Clé de session où AutoPermissionsMiddleware garde le marqueur vérifié
+CLE_SESSION = 'permissions_auto'
+
+# Permissions Django des ADMIN : app_label -> modèles (toutes les actions)
+MODELES_ADMIN = {
+    'accounts': ['user', 'service'],
+    'demandes': ['natureeconomique'],
+}
+
+
+def marqueur(user):
+    """Marqueur attendu pour le rôle actuel de l'utilisateur"""
+    return f'{user.role}:{VERSION_PERMISSIONS_AUTO}'
+
+
+def est_a_jour(user):
+    return user.permissions_auto == marqueur(user)
+
+
+def provisionner(user):
+    """Donne à l'utilisateur les permissions de son rôle et enregistre le marqueur"""
+    from django.contrib.auth.models import Permission
+    from django.db.models import Q
+
+    champs = {'permissions_auto': marqueur(user)}
+    if user.role == 'ADMIN':
+        modeles = Q()
+        for app_label, noms in MODELES_ADMIN.items():
+            modeles |= Q(content_type__app_label=app_label, content_type__model__in=noms)
+        user.user_permissions.add(*Permission.objects.filter(modeles))
+    elif user.role == 'SUPER_ADMIN' and not user.is_superuser:
+        champs.update(is_superuser=True, is_staff=True)
+
+    # update() plutôt que save() : pas de nouveau post_save
+    type(user).objects.filter(pk=user.pk).update(**champs)
+    for champ, valeur in champs.items():
+        setattr(user, champ, valeur)
+
+
+def provisionner_si_necessaire(user):
+    """Provisionne l'utilisateur si son marqueur est en retard ; True si c'était le cas"""
+    if est_a_jour(user):
+        return False
+    provisionner(user)
+    return True
@@ -0,0 +1,16 @@
+"""
+Attribution des permissions du rôle à l'enregistrement d'un utilisateur
+(voir accounts.provisionnement)
+"""
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import User
+from .provisionnement import provisionner_si_necessaire
+
+
+@receiver(post_save, sender=User)
+def provisionner_selon_role(sender, instance, raw=False, **kwargs):
+    # Sans requête quand le marqueur est à jour (rôle inchangé)
+    if not raw:
+        provisionner_si_necessaire(instance)
@@ -0,0 +1,232 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.core.signals import request_finished
+from django.db import close_old_connections, connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from efinance_daf.instrumentation import InstrumentationSQLMiddleware, empreinte
+from efinance_daf.session_backend import SessionStore
+
+from rbac.models import Permission, Role
+from .acces_routes import redirection_acces
+from .auto_permissions_middleware import AutoPermissionsMiddleware
+from .models import User
+from .provisionnement import CLE_SESSION, VERSION_PERMISSIONS_AUTO, marqueur
+
+
+class AccesRoutesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ops = User.objects.create_user('ops', password='x', role='OpsDaf')
+        cls.cd = User.objects.create_user('cd', password='x', role='CD_FINANCE')
+        cls.directeur = User.objects.create_user('directeur', password='x', role='DIRECTEUR')
+
+    def setUp(self):
+        # Le cache partagé survit à l'annulation de la transaction de chaque test
+        cache.clear()
+
+    def test_regles_en_dur(self):
+        cas = [
+            (self.ops, '/demandes/depenses/feuille/12/', None),
+            (self.ops, '/tableau-bord-feuilles/imports/3/', None),
+            (self.ops, '/static/css/app.css', None),
+            (self.ops, '/clotures/', '/demandes/depenses/feuille/'),
+            (self.ops, '/tableau-bord-feuilles/', '/demandes/depenses/feuille/'),
+            (self.cd, '/releves/creer/', None),
+            (self.cd, '/banques/', None),
+            (self.cd, '/tableau-bord-feuilles/etats-depenses/', '/'),
+            (self.directeur, '/demandes/', None),
+            (self.directeur, '/tableau-bord-feuilles/', '/accounts/login/'),
+        ]
+        for utilisateur, chemin, attendu in cas:
+            with self.subTest(role=utilisateur.role, chemin=chemin):
+                self.assertEqual(redirection_acces(utilisateur, chemin), attendu)
+
+    def test_motifs_url_des_permissions_rbac(self):
+        self.assertEqual(redirection_acces(self.ops, '/clotures/4/detail/'), '/demandes/depenses/feuille/')
+
+        role = Role.objects.create(nom='Opérateur DAF', code='OpsDaf')
+        clotures = Permission.objects.create(
+            nom='Voir clôtures', code='voir_clotures', module='clotures', url_pattern='/clotures/<int:pk>/'
+        )
+        role.permissions.add(clotures)
+        self.assertIsNone(redirection_acces(self.ops, '/clotures/4/detail/'))
+        self.assertEqual(redirection_acces(self.ops, '/clotures/'), '/demandes/depenses/feuille/')
+
+        clotures.est_active = False
+        clotures.save()
+        self.assertEqual(redirection_acces(self.ops, '/clotures/4/detail/'), '/demandes/depenses/feuille/')
+
+    def test_tableau_bord_feuilles_reste_ferme_malgre_les_permissions_rbac(self):
+        role = Role.objects.create(nom='Chef de division finance', code='CD_FINANCE')
+        role.permissions.add(Permission.objects.create(
+            nom='Tableau de bord feuilles', code='voir_tbf', module='tableau_bord', url_pattern='/tableau-bord-feuilles/'
+        ))
+        for chemin in ('/tableau-bord-feuilles/', '/tableau-bord-feuilles/operations/'):
+            with self.subTest(chemin=chemin):
+                self.assertEqual(redirection_acces(self.cd, chemin), '/')
+                self.assertEqual(redirection_acces(self.directeur, chemin), '/accounts/login/')
+
+    def test_middleware(self):
+        self.client.force_login(self.ops)
+        reponse = self.client.get('/clotures/')
+        self.assertRedirects(reponse, '/demandes/depenses/feuille/', fetch_redirect_response=False)
+
+
+class ProvisionnementTests(TestCase):
+
+    def test_attribution_a_l_enregistrement(self):
+        admin = User.objects.create_user('admin2', password='x', role='ADMIN')
+        self.assertEqual(admin.permissions_auto, marqueur(admin))
+        self.assertTrue(admin.user_permissions.filter(codename='change_service').exists())
+
+        admin.role = 'SUPER_ADMIN'
+        admin.save()
+        admin.refresh_from_db()
+        self.assertTrue(admin.is_superuser and admin.is_staff)
+        self.assertEqual(admin.permissions_auto, 'SUPER_ADMIN:%d' % VERSION_PERMISSIONS_AUTO)
+
+    def test_commande_de_rattrapage(self):
+        admin = User.objects.create_user('admin2', password='x', role='ADMIN')
+        User.objects.filter(pk=admin.pk).update(permissions_auto='')
+        admin.user_permissions.clear()
+
+        sortie = StringIO()
+        call_command('provisionner_permissions', stdout=sortie)
+        self.assertIn('1 utilisateur(s) mis à jour', sortie.getvalue())
+        self.assertTrue(admin.user_permissions.exists())
+
+    def test_middleware_sans_requete(self):
+        # Avant : user_permissions.count() à chaque requête d'un ADMIN
+        admin = User.objects.create_user('admin2', password='x', role='ADMIN')
+        middleware = AutoPermissionsMiddleware(lambda request: HttpResponse())
+        requete = RequestFactory().get('/demandes/')
+        requete.user = User.objects.get(pk=admin.pk)
+        requete.session = SessionStore()
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                middleware(requete)
+        self.assertEqual(requete.session[CLE_SESSION], marqueur(admin))
+
+
+class SessionBackendTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ops = User.objects.create_user('ops', password='x', role='OpsDaf')
+
+    def setUp(self):
+        cache.clear()
+
+    def mises_a_jour_session(self, requetes):
+        with CaptureQueriesContext(connection) as requetes_sql:
+            for _ in range(requetes):
+                self.client.get('/clotures/')
+        return [q for q in requetes_sql.captured_queries if q['sql'].startswith('UPDATE "django_session"')]
+
+    def test_pas_d_ecriture_par_requete(self):
+        # Avant : un UPDATE de django_session par requête (SESSION_SAVE_EVERY_REQUEST)
+        self.client.force_login(self.ops)
+        self.client.get('/clotures/')  # Première requête : le marqueur des permissions est ajouté à la session
+        self.assertEqual(self.mises_a_jour_session(20), [])
+
+    def test_report_de_l_expiration_apres_le_seuil(self):
+        self.client.force_login(self.ops)
+        self.client.get('/clotures/')
+        cle = self.client.session.session_key
+        Session.objects.filter(session_key=cle).update(expire_date=timezone.now() + timedelta(hours=1))
+        cache.clear()
+
+        self.assertEqual(len(self.mises_a_jour_session(5)), 1)
+        expiration = Session.objects.get(session_key=cle).expire_date
+        self.assertGreater(expiration, timezone.now() + timedelta(seconds=settings.SESSION_COOKIE_AGE - 60))
+
+    def test_modification_ecrite_aussitot(self):
+        session = SessionStore()
+        session['cle'] = 'valeur'
+        session.save()
+        cache.clear()
+        self.assertEqual(SessionStore(session.session_key)['cle'], 'valeur')
+
+    @override_settings(
+        SESSION_ENGINE='efinance_daf.session_backend_cache',
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    )
+    def test_sessions_lues_dans_le_cache_partage(self):
+        from efinance_daf.session_backend_cache import SessionStore as SessionStoreCache
+
+        self.client.force_login(self.ops)
+        self.client.get('/clotures/')
+        with CaptureQueriesContext(connection) as requetes:
+            for _ in range(5):
+                self.client.get('/clotures/')
+        self.assertFalse([q for q in requetes.captured_queries if 'django_session' in q['sql']])
+
+        session = SessionStoreCache()
+        session['cle'] = 'valeur'
+        session.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(SessionStoreCache(session.session_key)['cle'], 'valeur')
+        Session.objects.filter(session_key=session.session_key).delete()
+        cache.clear()
+        self.assertEqual(SessionStoreCache(session.session_key).load(), {})
+
+
+class InstrumentationSQLTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ops = User.objects.create_user('ops', password='x', role='OpsDaf')
+
+    @override_settings(INSTRUMENTATION_SQL=False)
+    def test_desactivee(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            InstrumentationSQLMiddleware(lambda request: HttpResponse())
+
+    def test_empreinte(self):
+        self.assertEqual(
+            empreinte('SELECT * FROM "t" WHERE "id" IN (%s, %s, %s) AND "x" = \'a\'  LIMIT 21'),
+            'SELECT * FROM "t" WHERE "id" IN (...) AND "x" = ? LIMIT ?',
+        )
+
+    @override_settings(INSTRUMENTATION_SQL=True, INSTRUMENTATION_SQL_BUDGET={'repetitions': 5})
+    def test_requetes_repetees(self):
+        def vue_n_plus_1(request):
+            for utilisateur in User.objects.all():
+                for _ in range(5):
+                    User.objects.filter(pk=utilisateur.pk).exists()
+            return HttpResponse()
+
+        middleware = InstrumentationSQLMiddleware(vue_n_plus_1)
+        with self.assertLogs('efinance_daf.instrumentation', 'WARNING') as journal:
+            reponse = middleware(RequestFactory().get('/demandes/'))
+        self.assertIn('N+1 probable', journal.output[0])
+        self.assertRegex(reponse['Server-Timing'], r'^sql;dur=[\d.]+;desc="6 requetes", vue;dur=[\d.]+$')
+
+    @override_settings(INSTRUMENTATION_SQL=True, INSTRUMENTATION_SQL_BUDGET={'requetes': 2})
+    def test_contenu_en_flux_compte_jusqu_a_la_fermeture(self):
+        def lignes():
+            for _ in range(3):
+                yield str(User.objects.count())
+
+        middleware = InstrumentationSQLMiddleware(lambda request: StreamingHttpResponse(lignes()))
+        with self.assertNoLogs('efinance_daf.instrumentation', 'WARNING'):
+            reponse = middleware(RequestFactory().get('/export/'))
+            self.assertIn('desc="0 requetes"', reponse['Server-Timing'])
+            self.assertEqual(b''.join(reponse.streaming_content), b'111')
+        # Comme le client de test : pas de fermeture de la connexion de la transaction du test
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+        with self.assertLogs('efinance_daf.instrumentation', 'WARNING') as journal:
+            reponse.close()
+        self.assertIn('3 requêtes SQL', journal.output[0])
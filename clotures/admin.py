@@ -1,4 +1,12 @@
-from django.contrib import admin
+import tempfile
+
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.http import FileResponse
+from django.shortcuts import render
+from django.utils import timezone
+
 from .models import ClotureMensuelle
 
 
@@ -10,6 +18,7 @@ class ClotureMensuelleAdmin(admin.ModelAdmin):
     ]
     list_filter = ['statut', 'annee', 'mois']
     search_fields = ['observations']
+    actions = ['generer_etats_du_lot']
     readonly_fields = ['date_creation', 'date_modification']
     
     fieldsets = (
@@ -45,3 +54,34 @@ class ClotureMensuelleAdmin(admin.ModelAdmin):
                    'total_depenses_usd', 'solde_net_fc', 'solde_net_usd', 
                    'date_cloture', 'cloture_par']
         return self.readonly_fields
+    
+    @admin.action(description="Générer les états des périodes sélectionnées (ZIP)")
+    def generer_etats_du_lot(self, request, queryset):
+        from tableau_bord_feuilles.lots_etats import TYPES_LOT, generer_lot, rapports_du_lot
+        
+        if 'generer' not in request.POST:
+            return render(request, 'admin/clotures/generer_etats_lot.html', {
+                **self.admin_site.each_context(request),
+                'opts': self.model._meta,
+                'clotures': queryset.order_by('annee', 'mois'),
+                'types': list(TYPES_LOT.items()),
+                'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+                'title': "Génération des états par lot",
+            })
+        
+        types = [type_etat for type_etat in request.POST.getlist('types') if type_etat in TYPES_LOT]
+        if not types:
+            self.message_user(request, "Aucun type d'état sélectionné.", level=messages.WARNING)
+            return None
+        
+        periodes = sorted(set(queryset.values_list('annee', 'mois')))
+        rapports = rapports_du_lot(periodes, types, annuel=bool(request.POST.get('annuel')))
+        archive = tempfile.TemporaryFile(suffix='.zip')
+        # Dans la requête : jamais de pool de processus (voir ETATS_LOT_MODE)
+        mode = 'direct' if settings.ETATS_LOT_MODE == 'direct' else 'thread'
+        generer_lot(rapports, archive, mode=mode, concurrence=max(1, settings.ETATS_LOT_CONCURRENCE))
+        archive.seek(0)
+        return FileResponse(
+            archive, as_attachment=True, content_type='application/zip',
+            filename=f"etats_{timezone.now().strftime('%Y%m%d_%H%M')}.zip"
+        )
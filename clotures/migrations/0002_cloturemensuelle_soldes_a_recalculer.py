@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-17 23:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clotures', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cloturemensuelle',
+            name='soldes_a_recalculer',
+            field=models.BooleanField(default=True, verbose_name='Soldes à recalculer'),
+        ),
+    ]
@@ -104,6 +104,12 @@ class ClotureMensuelle(models.Model):
         verbose_name="Observations"
     )
     
+    # Positionné à chaque écriture d'une feuille de la période, remis à False par calculer_soldes()
+    soldes_a_recalculer = models.BooleanField(
+        default=True,
+        verbose_name="Soldes à recalculer"
+    )
+    
     date_creation = models.DateTimeField(auto_now_add=True)
     date_modification = models.DateTimeField(auto_now=True)
 
@@ -116,40 +122,55 @@ class ClotureMensuelle(models.Model):
     def __str__(self):
         return f"Clôture {self.mois:02d}/{self.annee} - {self.statut}"
 
-    def calculer_soldes(self):
-        """Calculer les soldes de la période"""
-        from demandes.models import DepenseFeuille
-        from recettes.models import RecetteFeuille
+    def _calculer_totaux(self):
+        """
+        Calculer les totaux et soldes de la période sans les enregistrer.
+        Les totaux sont lus dans les agrégats mensuels des feuilles (une seule requête).
+        """
+        from tableau_bord_feuilles.agregation import AgregationFeuilles
         
-        # Calculer les totaux des recettes
-        recettes = RecetteFeuille.objects.filter(
-            mois=self.mois,
-            annee=self.annee
-        )
-        self.total_recettes_fc = recettes.aggregate(
-            total=models.Sum('montant_fc')
-        )['total'] or Decimal('0.00')
-        self.total_recettes_usd = recettes.aggregate(
-            total=models.Sum('montant_usd')
-        )['total'] or Decimal('0.00')
+        totaux = AgregationFeuilles(models.Q(mois=self.mois, annee=self.annee)).totaux()
         
-        # Calculer les totaux des dépenses
-        depenses = DepenseFeuille.objects.filter(
-            mois=self.mois,
-            annee=self.annee
-        )
-        self.total_depenses_fc = depenses.aggregate(
-            total=models.Sum('montant_fc')
-        )['total'] or Decimal('0.00')
-        self.total_depenses_usd = depenses.aggregate(
-            total=models.Sum('montant_usd')
-        )['total'] or Decimal('0.00')
+        self.total_recettes_fc = totaux['recettes_cdf']
+        self.total_recettes_usd = totaux['recettes_usd']
+        self.total_depenses_fc = totaux['depenses_cdf']
+        self.total_depenses_usd = totaux['depenses_usd']
         
         # Calculer le solde net
         self.solde_net_fc = self.total_recettes_fc - self.total_depenses_fc
         self.solde_net_usd = self.total_recettes_usd - self.total_depenses_usd
-        
-        self.save()
+
+    def calculer_soldes(self):
+        """Calculer les soldes de la période et les enregistrer"""
+        self._calculer_totaux()
+        self.soldes_a_recalculer = False
+        self.save(update_fields=[
+            'total_recettes_fc', 'total_recettes_usd',
+            'total_depenses_fc', 'total_depenses_usd',
+            'solde_net_fc', 'solde_net_usd',
+            'soldes_a_recalculer', 'date_modification',
+        ])
+
+    def calculer_soldes_lecture_seule(self):
+        """
+        Soldes à jour pour l'affichage, sans écriture en base.
+        Les valeurs enregistrées sont utilisées telles quelles tant qu'aucune
+        feuille de la période n'a été modifiée ; sinon elles sont recalculées
+        en mémoire uniquement (pas de save(), donc pas de verrou sur la clôture).
+        """
+        if self.soldes_a_recalculer and self.statut == 'OUVERT':
+            self._calculer_totaux()
+        return self
+
+    @classmethod
+    def marquer_a_recalculer(cls, mois, annee):
+        """Signaler que les feuilles d'une période ouverte ont changé"""
+        cls.objects.filter(
+            mois=mois,
+            annee=annee,
+            statut='OUVERT',
+            soldes_a_recalculer=False
+        ).update(soldes_a_recalculer=True)
 
     def cloturer(self, utilisateur, observations=""):
         """Clôturer la période"""
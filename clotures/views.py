@@ -184,6 +184,7 @@ def calculer_soldes(request, pk):
 def periode_actuelle(request):
     """Vue pour afficher la période actuelle"""
     cloture = ClotureMensuelle.get_periode_actuelle()
+    cloture.calculer_soldes_lecture_seule()
     
     # Récupérer les dépenses et recettes de la période actuelle
     depenses = DepenseFeuille.objects.filter(
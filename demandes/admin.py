@@ -1,6 +1,7 @@
 """
 Admin pour les modèles demandes
 """
+from django import forms
 from django.contrib import admin
 from .models import DemandePaiement, ReleveDepense, NomenclatureDepense, Depense, NatureEconomique, Paiement, DepenseFeuille
 
@@ -109,8 +110,26 @@ class PaiementAdmin(admin.ModelAdmin):
         ).prefetch_related('demande__service_demandeur')
 
 
+class DepenseFeuilleAdminForm(forms.ModelForm):
+    """Refuse une ligne de même contenu qu'une ligne existante (index unique de l'empreinte)"""
+
+    class Meta:
+        model = DepenseFeuille
+        fields = '__all__'
+
+    def validate_unique(self):
+        super().validate_unique()
+        if not self.errors:
+            doublon = self.instance.doublon()
+            if doublon is not None:
+                self.add_error(None, forms.ValidationError(
+                    'Cette dépense est déjà enregistrée (ligne du {:%d/%m/%Y} : même libellé, banque et montants).'.format(doublon.date)
+                ))
+
+
 @admin.register(DepenseFeuille)
 class DepenseFeuilleAdmin(admin.ModelAdmin):
+    form = DepenseFeuilleAdminForm
     list_display = ['date', 'mois', 'annee', 'nature_economique', 'service_beneficiaire', 'libelle_depenses', 'banque', 'montant_fc', 'montant_usd']
     list_filter = ['annee', 'mois', 'banque', 'nature_economique', 'service_beneficiaire']
     search_fields = ['libelle_depenses', 'banque__nom_banque', 'nature_economique__code', 'nature_economique__titre', 'service_beneficiaire__nom_service']
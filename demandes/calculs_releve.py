@@ -0,0 +1,84 @@
+"""
+Calcul des montants d'un relevé de dépense : sous-totaux par code de nature
+économique, IPR et net à payer.
+
+Les montants par groupe sont obtenus par une seule requête
+values('nature_economique__code', 'devise').annotate(Sum('montant')) : le coût
+dépend du nombre de groupes, pas du nombre de demandes. L'IPR est appliqué une
+fois par groupe et le total général est la somme des groupes ; les exports PDF,
+Excel et la liste à l'écran affichent donc les mêmes chiffres.
+"""
+from decimal import Decimal
+
+from django.db.models import Sum
+
+
+TAUX_IPR = Decimal('0.03')
+SANS_CODE = 'Sans code'
+
+
+def code_groupe(code):
+    """Clé de groupe d'un code de nature économique : SANS_CODE si absent ou vide"""
+    return code or SANS_CODE
+
+
+def montants(montant_usd, montant_cdf):
+    """Montant, IPR et net à payer par devise"""
+    ipr_usd = montant_usd * TAUX_IPR
+    ipr_cdf = montant_cdf * TAUX_IPR
+    return {
+        'montant_usd': montant_usd,
+        'montant_cdf': montant_cdf,
+        'ipr_usd': ipr_usd,
+        'ipr_cdf': ipr_cdf,
+        'net_usd': montant_usd - ipr_usd,
+        'net_cdf': montant_cdf - ipr_cdf,
+    }
+
+
+def calculer_sous_totaux(lignes):
+    """
+    Sous-totaux et total général à partir de lignes agrégées
+    {'nature_economique__code', 'devise', 'total'} (sans accès à la base).
+
+    Retourne (sous_totaux, totaux) : sous_totaux est un dict code_groupe() ->
+    montants() trié par code, « Sans code » (code absent ou vide) en dernier ;
+    totaux est la somme des groupes.
+    """
+    par_code = {}
+    for ligne in lignes:
+        code = code_groupe(ligne['nature_economique__code'])
+        cumul = par_code.setdefault(code, {'USD': Decimal('0.00'), 'CDF': Decimal('0.00')})
+        if ligne['devise'] in cumul:
+            cumul[ligne['devise']] += ligne['total'] or Decimal('0.00')
+
+    sous_totaux = {}
+    for code in sorted(par_code, key=lambda code: (code == SANS_CODE, code)):
+        sous_totaux[code] = montants(par_code[code]['USD'], par_code[code]['CDF'])
+
+    totaux = dict.fromkeys(montants(Decimal('0.00'), Decimal('0.00')), Decimal('0.00'))
+    for groupe in sous_totaux.values():
+        for cle, valeur in groupe.items():
+            totaux[cle] += valeur
+    return sous_totaux, totaux
+
+
+def sous_totaux_releve(queryset):
+    """Sous-totaux et total général des demandes de `queryset`, en une requête"""
+    lignes = queryset.order_by().values('nature_economique__code', 'devise').annotate(total=Sum('montant'))
+    return calculer_sous_totaux(lignes)
+
+
+def contexte_totaux(queryset):
+    """Variables de gabarit des relevés : sous_totaux, totaux et totaux par devise"""
+    sous_totaux, totaux = sous_totaux_releve(queryset)
+    return {
+        'sous_totaux': sous_totaux,
+        'totaux': totaux,
+        'montant_cdf': totaux['montant_cdf'],
+        'montant_usd': totaux['montant_usd'],
+        'ipr_cdf': totaux['ipr_cdf'],
+        'ipr_usd': totaux['ipr_usd'],
+        'net_a_payer_cdf': totaux['net_cdf'],
+        'net_a_payer_usd': totaux['net_usd'],
+    }
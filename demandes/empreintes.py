@@ -0,0 +1,38 @@
+"""
+Empreinte de contenu des lignes des feuilles DEPENSES / RECETTES.
+
+Deux lignes ont la même empreinte quand elles ont la même date, le même
+libellé (espaces superflus et casse ignorés), la même banque et les mêmes
+montants FC et $us. L'empreinte (SHA-256 hexadécimal) est stockée dans
+DepenseFeuille.empreinte et RecetteFeuille.empreinte, couverte par un index
+unique partiel : la détection des doublons est une recherche dans l'index,
+à la saisie comme à l'import.
+
+Module sans dépendance aux modèles : utilisé aussi par les migrations.
+"""
+import hashlib
+from decimal import Decimal
+
+
+CENTIEME = Decimal('0.01')
+
+
+def normaliser_libelle(libelle):
+    return ' '.join((libelle or '').split()).casefold()
+
+
+def normaliser_montant(montant):
+    return str(Decimal(str(montant or 0)).quantize(CENTIEME))
+
+
+def empreinte_ligne(date, libelle, banque_id, montant_fc, montant_usd):
+    """Empreinte d'une ligne de feuille (date : date ou chaîne ISO)"""
+    date_iso = date.isoformat() if hasattr(date, 'isoformat') else str(date)
+    contenu = '\x1f'.join([
+        date_iso,
+        normaliser_libelle(libelle),
+        str(banque_id or ''),
+        normaliser_montant(montant_fc),
+        normaliser_montant(montant_usd),
+    ])
+    return hashlib.sha256(contenu.encode('utf-8')).hexdigest()
@@ -599,6 +599,16 @@ class DepenseFeuilleForm(forms.ModelForm):
         
         # Le champ date reste modifiable mais sera pré-rempli avec la période en cours
 
+    def validate_unique(self):
+        super().validate_unique()
+        # Même contenu qu'une ligne existante : recherche dans l'index unique de l'empreinte
+        if not self.errors:
+            doublon = self.instance.doublon()
+            if doublon is not None:
+                self.add_error(None, forms.ValidationError(
+                    'Cette dépense est déjà enregistrée (ligne du {:%d/%m/%Y} : même libellé, banque et montants).'.format(doublon.date)
+                ))
+
     def clean(self):
         cleaned_data = super().clean()
         montant_fc = cleaned_data.get('montant_fc') or Decimal('0.00')
@@ -626,6 +636,7 @@ class DepenseFeuilleForm(forms.ModelForm):
                 raise forms.ValidationError('En mode workflow, veuillez spécifier qui a effectué le paiement.')
             if not beneficiaire:
                 raise forms.ValidationError('En mode workflow, veuillez spécifier le bénéficiaire du paiement.')
+        return cleaned_data
 
 
 class DepenseFeuilleWorkflowForm(DepenseFeuilleForm):
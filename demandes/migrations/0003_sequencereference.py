@@ -0,0 +1,54 @@
+# Generated by Django 5.0.4 on 2026-10-17 23:07
+
+from django.db import migrations, models
+
+
+# (préfixe, app, modèle, champ de référence)
+SEQUENCES = [
+    ('DEM', 'demandes', 'DemandePaiement', 'reference'),
+    ('PAY', 'demandes', 'Paiement', 'reference'),
+    ('REL', 'demandes', 'ReleveDepense', 'numero'),
+    ('CHQ', 'demandes', 'Cheque', 'numero_cheque'),
+    ('DPF', 'demandes', 'DepenseFeuille', 'reference_paiement'),
+    ('REC', 'recettes', 'Recette', 'reference'),
+]
+
+
+def initialiser_sequences(apps, schema_editor):
+    """Démarre chaque séquence après le plus grand numéro déjà attribué"""
+    SequenceReference = apps.get_model('demandes', 'SequenceReference')
+    for prefixe, app_label, model_name, champ in SEQUENCES:
+        model = apps.get_model(app_label, model_name)
+        dernier = 0
+        references = model.objects.filter(**{f'{champ}__startswith': f'{prefixe}-'}).values_list(champ, flat=True)
+        for reference in references.iterator():
+            try:
+                dernier = max(dernier, int(reference.rsplit('-', 1)[-1]))
+            except ValueError:
+                continue
+        SequenceReference.objects.create(prefixe=prefixe, dernier_numero=dernier)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('demandes', '0002_depensefeuille_beneficiaire_and_more'),
+        ('recettes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenceReference',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefixe', models.CharField(max_length=10, unique=True, verbose_name='Préfixe')),
+                ('dernier_numero', models.PositiveBigIntegerField(default=0, verbose_name='Dernier numéro attribué')),
+            ],
+            options={
+                'verbose_name': 'Séquence de référence',
+                'verbose_name_plural': 'Séquences de référence',
+                'ordering': ['prefixe'],
+            },
+        ),
+        migrations.RunPython(initialiser_sequences, migrations.RunPython.noop),
+    ]
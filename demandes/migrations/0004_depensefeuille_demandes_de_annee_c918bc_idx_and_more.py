@@ -0,0 +1,33 @@
+# Generated by Django 5.0.4 on 2026-10-17 23:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_alter_user_role'),
+        ('banques', '0001_initial'),
+        ('demandes', '0003_sequencereference'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='depensefeuille',
+            index=models.Index(fields=['annee', 'mois', 'date'], name='demandes_de_annee_c918bc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='depensefeuille',
+            index=models.Index(fields=['banque', 'annee', 'mois'], name='demandes_de_banque__a5f3ed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='depensefeuille',
+            index=models.Index(fields=['nature_economique', 'annee', 'mois'], name='demandes_de_nature__21b396_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='depensefeuille',
+            index=models.Index(fields=['date', 'date_creation'], name='demandes_de_date_f901d1_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.4 on 2026-10-17 23:58
+
+from django.db import migrations, models
+
+from demandes.empreintes import empreinte_ligne
+
+
+def calculer_empreintes(apps, schema_editor):
+    """
+    Empreinte des lignes existantes du mode direct, par lots. Si des doublons
+    sont déjà en base, seule la première ligne (plus petit id) reçoit
+    l'empreinte : les autres restent hors de l'index unique.
+    """
+    DepenseFeuille = apps.get_model('demandes', 'DepenseFeuille')
+    lignes = DepenseFeuille.objects.filter(demande__isnull=True, releve_depense__isnull=True).order_by('pk').values_list(
+        'pk', 'date', 'libelle_depenses', 'banque_id', 'montant_fc', 'montant_usd'
+    )
+    vues = set()
+    lot = []
+    for pk, *contenu in lignes.iterator(chunk_size=2000):
+        empreinte = empreinte_ligne(*contenu)
+        if empreinte in vues:
+            continue
+        vues.add(empreinte)
+        lot.append(DepenseFeuille(pk=pk, empreinte=empreinte))
+        if len(lot) >= 1000:
+            DepenseFeuille.objects.bulk_update(lot, ['empreinte'])
+            lot = []
+    DepenseFeuille.objects.bulk_update(lot, ['empreinte'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('demandes', '0004_depensefeuille_demandes_de_annee_c918bc_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='depensefeuille',
+            name='empreinte',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(calculer_empreintes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='depensefeuille',
+            constraint=models.UniqueConstraint(condition=models.Q(('empreinte__isnull', False)), fields=('empreinte',), name='depense_feuille_empreinte_unique'),
+        ),
+    ]
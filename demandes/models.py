@@ -1,13 +1,70 @@
 """
 Modèles pour la gestion des demandes de paiement
 """
-from django.db import models, transaction
-from django.db.models import Max
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 from django.utils import timezone
 from accounts.models import User, Service
 from banques.models import Banque, CompteBancaire
+from .empreintes import empreinte_ligne
+
+
+class SequenceReference(models.Model):
+    """
+    Compteur par préfixe pour les références des documents financiers
+    (DEM-, PAY-, REC-, DPF-, REL-, CHQ-).
+
+    L'allocation incrémente le compteur par un UPDATE atomique puis relit la
+    valeur, dans la transaction de l'appelant : deux écritures concurrentes ne
+    peuvent pas obtenir le même numéro, et si la création du document échoue
+    l'incrément est annulé avec la transaction (pas de trou dans la série).
+    """
+    prefixe = models.CharField(max_length=10, unique=True, verbose_name="Préfixe")
+    dernier_numero = models.PositiveBigIntegerField(default=0, verbose_name="Dernier numéro attribué")
+
+    class Meta:
+        verbose_name = "Séquence de référence"
+        verbose_name_plural = "Séquences de référence"
+        ordering = ['prefixe']
+
+    def __str__(self):
+        return f"{self.prefixe} : {self.dernier_numero}"
+
+    @classmethod
+    def allouer(cls, prefixe, nombre=1):
+        """
+        Réserve `nombre` numéros consécutifs pour le préfixe et retourne le range correspondant.
+        Doit être appelé dans la transaction qui enregistre les documents pour rester sans trou.
+        """
+        if nombre < 1:
+            raise ValueError("Le nombre de numéros à allouer doit être positif")
+
+        with transaction.atomic():
+            mis_a_jour = cls.objects.filter(prefixe=prefixe).update(
+                dernier_numero=F('dernier_numero') + nombre
+            )
+            if not mis_a_jour:
+                try:
+                    # Première allocation pour ce préfixe (savepoint : une création concurrente est possible)
+                    with transaction.atomic():
+                        cls.objects.create(prefixe=prefixe, dernier_numero=nombre)
+                except IntegrityError:
+                    cls.objects.filter(prefixe=prefixe).update(
+                        dernier_numero=F('dernier_numero') + nombre
+                    )
+            dernier = cls.objects.filter(prefixe=prefixe).values_list('dernier_numero', flat=True).get()
+        return range(dernier - nombre + 1, dernier + 1)
+
+    @classmethod
+    def prochaine_reference(cls, prefixe):
+        """Retourne la prochaine référence formatée, ex. DEM-000042"""
+        return cls.formater(prefixe, cls.allouer(prefixe)[0])
+
+    @staticmethod
+    def formater(prefixe, numero):
+        return f"{prefixe}-{numero:06d}"
 
 
 class NomenclatureDepense(models.Model):
@@ -120,11 +177,6 @@ class DemandePaiement(models.Model):
         return f"{self.reference} - {self.montant} {self.devise}"
     
     def save(self, *args, **kwargs):
-        if not self.reference:
-            # Génération automatique de la référence
-            count = DemandePaiement.objects.count() + 1
-            self.reference = f"DEM-{count:06d}"
-        
         # Correction automatique des montants incohérents
         if self.montant_deja_paye > self.montant:
             self.montant_deja_paye = self.montant
@@ -138,7 +190,11 @@ class DemandePaiement(models.Model):
             self.montant_deja_paye = self.montant
             self.reste_a_payer = Decimal('0.00')
         
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.reference:
+                # Génération automatique de la référence
+                self.reference = SequenceReference.prochaine_reference('DEM')
+            super().save(*args, **kwargs)
 
 
 class ReleveDepense(models.Model):
@@ -203,33 +259,11 @@ class ReleveDepense(models.Model):
         return f"{self.numero} - {self.periode} - {self.get_total_general()} total"
     
     def save(self, *args, **kwargs):
-        if not self.numero:
-            # Génération automatique du numéro de relevé dans une transaction
-            with transaction.atomic():
-                # Trouver le prochain numéro disponible
-                max_numero = ReleveDepense.objects.exclude(numero__isnull=True).aggregate(
-                    max_num=Max('numero')
-                )['max_num']
-                
-                if max_numero:
-                    # Extraire le numéro et l'incrémenter
-                    try:
-                        last_num = int(max_numero.split('-')[-1])
-                        next_num = last_num + 1
-                    except (ValueError, IndexError):
-                        # Si le format n'est pas correct, compter les relevés
-                        next_num = ReleveDepense.objects.exclude(numero__isnull=True).count() + 1
-                else:
-                    next_num = 1
-                
-                # Vérifier que le numéro n'existe pas déjà (pour éviter les conflits)
-                numero = f"REL-{next_num:06d}"
-                while ReleveDepense.objects.filter(numero=numero).exists():
-                    next_num += 1
-                    numero = f"REL-{next_num:06d}"
-                
-                self.numero = numero
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.numero:
+                # Génération automatique du numéro de relevé
+                self.numero = SequenceReference.prochaine_reference('REL')
+            super().save(*args, **kwargs)
     
     def ajouter_demandes_securise(self, demandes_queryset):
         """
@@ -517,35 +551,16 @@ class Cheque(models.Model):
         return f"Chèque {self.numero_cheque} - {self.releve_depense.numero} - {self.banque.nom_banque}"
     
     def save(self, *args, **kwargs):
-        if not self.numero_cheque:
-            # Génération automatique du numéro de chèque
-            with transaction.atomic():
-                max_numero = Cheque.objects.exclude(numero_cheque__isnull=True).aggregate(
-                    max_num=Max('numero_cheque')
-                )['max_num']
-                
-                if max_numero:
-                    try:
-                        last_num = int(max_numero.split('-')[-1])
-                        next_num = last_num + 1
-                    except (ValueError, IndexError):
-                        next_num = Cheque.objects.exclude(numero_cheque__isnull=True).count() + 1
-                else:
-                    next_num = 1
-                
-                numero = f"CHQ-{next_num:06d}"
-                while Cheque.objects.filter(numero_cheque=numero).exists():
-                    next_num += 1
-                    numero = f"CHQ-{next_num:06d}"
-                
-                self.numero_cheque = numero
-        
         # Copier les montants du relevé si non définis
         if not self.montant_cdf and not self.montant_usd:
             self.montant_cdf = self.releve_depense.net_a_payer_cdf
             self.montant_usd = self.releve_depense.net_a_payer_usd
         
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.numero_cheque:
+                # Génération automatique du numéro de chèque
+                self.numero_cheque = SequenceReference.prochaine_reference('CHQ')
+            super().save(*args, **kwargs)
     
     def get_montant_total(self):
         """Calcule le montant total du chèque"""
@@ -618,21 +633,21 @@ class Paiement(models.Model):
         return f"{self.reference} - {self.montant_paye} {self.devise} - {self.demande.reference}"
     
     def save(self, *args, **kwargs):
-        if not self.reference:
-            # Génération automatique de la référence
-            count = Paiement.objects.count() + 1
-            self.reference = f"PAY-{count:06d}"
-        
         # Synchroniser la devise avec la demande
         if self.demande:
             self.devise = self.demande.devise
         
-        super().save(*args, **kwargs)
-        
-        # Mettre à jour la demande après le paiement
-        if self.demande:
-            self.demande.montant_deja_paye += self.montant_paye
-            self.demande.save()
+        with transaction.atomic():
+            if not self.reference:
+                # Génération automatique de la référence
+                self.reference = SequenceReference.prochaine_reference('PAY')
+            
+            super().save(*args, **kwargs)
+            
+            # Mettre à jour la demande après le paiement
+            if self.demande:
+                self.demande.montant_deja_paye += self.montant_paye
+                self.demande.save()
         
         # NOTE: La mise à jour du solde bancaire est maintenant gérée dans les vues
         # pour permettre la sélection explicite du compte bancaire.
@@ -763,6 +778,8 @@ class DepenseFeuille(models.Model):
         blank=True,
         help_text="Généré automatiquement en mode workflow"
     )
+    # Empreinte du contenu (voir demandes.empreintes), unique ; nulle en mode workflow
+    empreinte = models.CharField(max_length=64, null=True, blank=True, editable=False)
     
     date_creation = models.DateTimeField(auto_now_add=True)
     date_modification = models.DateTimeField(auto_now=True)
@@ -771,6 +788,20 @@ class DepenseFeuille(models.Model):
         verbose_name = "Dépense (feuille)"
         verbose_name_plural = "Dépenses (feuille)"
         ordering = ['-date', '-date_creation']
+        # Index alignés sur les filtres des listes, du tableau général et des états
+        indexes = [
+            models.Index(fields=['annee', 'mois', 'date']),
+            models.Index(fields=['banque', 'annee', 'mois']),
+            models.Index(fields=['nature_economique', 'annee', 'mois']),
+            models.Index(fields=['date', 'date_creation']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['empreinte'],
+                condition=models.Q(empreinte__isnull=False),
+                name='depense_feuille_empreinte_unique',
+            ),
+        ]
 
     def __str__(self):
         nat = f"{self.nature_economique}" if self.nature_economique else ""
@@ -803,24 +834,58 @@ class DepenseFeuille(models.Model):
         """Calcule le montant total dans la devise principale"""
         return self.montant_fc + self.montant_usd
     
+    def calculer_empreinte(self):
+        """
+        Empreinte du contenu de la ligne. Les lignes du mode workflow n'en ont
+        pas : deux paiements identiques le même jour restent possibles.
+        """
+        if self.is_mode_workflow:
+            return None
+        return empreinte_ligne(self.date, self.libelle_depenses, self.banque_id, self.montant_fc, self.montant_usd)
+    
+    def empreinte_a_enregistrer(self):
+        """
+        Empreinte enregistrée par save(). Une ligne existante sans empreinte
+        (doublon antérieur à l'index, laissé hors de l'index par la migration
+        0005) la garde nulle tant que son contenu est celui d'une autre ligne.
+        """
+        empreinte = self.calculer_empreinte()
+        if empreinte is not None and self.pk and self.empreinte is None and self._meme_empreinte(empreinte):
+            return None
+        return empreinte
+    
+    def _meme_empreinte(self, empreinte):
+        return DepenseFeuille.objects.filter(empreinte=empreinte).exclude(pk=self.pk).first()
+    
+    def doublon(self):
+        """Ligne existante de même contenu (recherche dans l'index de l'empreinte), None sinon"""
+        empreinte = self.empreinte_a_enregistrer()
+        if empreinte is None:
+            return None
+        return self._meme_empreinte(empreinte)
+    
     def save(self, *args, **kwargs):
-        # Génération automatique de la référence si en mode workflow
-        if self.is_mode_workflow and not self.reference_paiement:
-            from django.utils import timezone
-            count = DepenseFeuille.objects.filter(reference_paiement__isnull=False).count() + 1
-            self.reference_paiement = f"DPF-{count:06d}"
-        
         # Si en mode workflow et pas de date de paiement, utiliser la date actuelle
         if self.is_mode_workflow and not self.date_paiement:
             from django.utils import timezone
             self.date_paiement = timezone.now()
         
-        super().save(*args, **kwargs)
+        self.empreinte = self.empreinte_a_enregistrer()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'empreinte'}
         
-        # Mettre à jour la demande liée si en mode workflow
-        if self.demande:
-            self.demande.montant_deja_paye += (self.montant_fc if self.demande.devise == 'CDF' else self.montant_usd)
-            self.demande.save()
+        # Transaction : la référence et les agrégats mensuels (signaux pre/post_save) sont écrits avec la ligne
+        with transaction.atomic():
+            # Génération automatique de la référence si en mode workflow
+            if self.is_mode_workflow and not self.reference_paiement:
+                self.reference_paiement = SequenceReference.prochaine_reference('DPF')
+            
+            super().save(*args, **kwargs)
+            
+            # Mettre à jour la demande liée si en mode workflow
+            if self.demande:
+                self.demande.montant_deja_paye += (self.montant_fc if self.demande.devise == 'CDF' else self.montant_usd)
+                self.demande.save()
     
     def get_montant_in_devise(self, devise):
         """Retourne le montant dans la devise spécifiée"""
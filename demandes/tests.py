@@ -0,0 +1,361 @@
+import gzip
+import threading
+from decimal import Decimal
+from io import BytesIO
+
+from django.db import connections, transaction
+from django.test import TestCase, TransactionTestCase
+from openpyxl import load_workbook
+
+from accounts.models import Service, User
+from banques.models import Banque
+from .models import DemandePaiement, DepenseFeuille, NatureEconomique, SequenceReference
+
+
+class SequenceReferenceTests(TestCase):
+
+    def test_allocation_consecutive(self):
+        self.assertEqual(list(SequenceReference.allouer('TST')), [1])
+        self.assertEqual(list(SequenceReference.allouer('TST', 3)), [2, 3, 4])
+        self.assertEqual(SequenceReference.prochaine_reference('TST'), 'TST-000005')
+        self.assertEqual(list(SequenceReference.allouer('AUTRE')), [1])
+
+    def test_pas_de_trou_apres_rollback(self):
+        SequenceReference.allouer('TST')
+        try:
+            with transaction.atomic():
+                SequenceReference.allouer('TST')
+                raise RuntimeError("échec de l'enregistrement du document")
+        except RuntimeError:
+            pass
+        self.assertEqual(list(SequenceReference.allouer('TST')), [2])
+
+
+class SequenceReferenceConcurrenceTests(TransactionTestCase):
+    NB_THREADS = 8
+    ALLOCATIONS_PAR_THREAD = 25
+
+    def test_aucune_collision_entre_threads(self):
+        numeros = []
+        erreurs = []
+        verrou = threading.Lock()
+        depart = threading.Barrier(self.NB_THREADS)
+
+        def travailleur():
+            try:
+                depart.wait()
+                obtenus = []
+                for i in range(self.ALLOCATIONS_PAR_THREAD):
+                    obtenus.extend(SequenceReference.allouer('STRESS', 1 + i % 3))
+                with verrou:
+                    numeros.extend(obtenus)
+            except Exception as e:
+                with verrou:
+                    erreurs.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=travailleur) for _ in range(self.NB_THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(erreurs, [])
+        attendu = self.NB_THREADS * sum(1 + i % 3 for i in range(self.ALLOCATIONS_PAR_THREAD))
+        self.assertEqual(len(numeros), attendu)
+        self.assertEqual(len(set(numeros)), attendu)
+        self.assertEqual(sorted(numeros), list(range(1, attendu + 1)))
+
+
+class ReleveDepenseExcelTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.utilisateur = User.objects.create_user('daf', password='x', role='SUPER_ADMIN')
+        service = Service.objects.create(nom_service="Service test")
+        nature_a = NatureEconomique.objects.create(code="1111", titre="Article A")
+        nature_b = NatureEconomique.objects.create(code="2222", titre="Article B")
+        for nature, montant, devise in [
+            (nature_b, '300.00', 'CDF'), (nature_a, '100.00', 'USD'),
+            (nature_a, '200.00', 'CDF'), (None, '50.00', 'USD'),
+        ]:
+            DemandePaiement.objects.create(
+                service_demandeur=service, nature_economique=nature, description="Demande de test",
+                montant=Decimal(montant), devise=devise, statut='VALIDEE_DG', cree_par=cls.utilisateur,
+            )
+
+    def test_export_en_flux_avec_sous_totaux(self):
+        self.client.force_login(self.utilisateur)
+        response = self.client.get('/demandes/releves/excel/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+
+        ws = load_workbook(BytesIO(b''.join(response.streaming_content))).active
+        lignes = [row for row in ws.iter_rows(min_row=10, max_col=6, values_only=True) if any(row)]
+        self.assertEqual(lignes[:7], [
+            (1, '1111', 'Article A', '-', '-', 200.0),
+            (2, '1111', 'Article A', 100.0, 3.0, '-'),
+            (None, None, 'Sous-total (Code: 1111)', 100.0, 3.0, 200.0),
+            (3, '2222', 'Article B', '-', '-', 300.0),
+            (None, None, 'Sous-total (Code: 2222)', '-', '-', 300.0),
+            (4, 'Sans code', '-', 50.0, 1.5, '-'),
+            (None, None, 'Sous-total (Code: Sans code)', 50.0, 1.5, '-'),
+        ])
+        self.assertEqual(lignes[7][2:4], ('TOTAL GÉNÉRAL', 150.0))
+        self.assertEqual(ws['A10'].style, 'texte_alterne')
+        self.assertEqual(ws['A11'].style, 'texte')
+        self.assertEqual(ws['D10'].number_format, '#,##0.00')
+
+
+class CalculsReleveTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.utilisateur = User.objects.create_user('daf', password='x', role='SUPER_ADMIN')
+        service = Service.objects.create(nom_service="Service test")
+        nature_a = NatureEconomique.objects.create(code="1111", titre="Article A")
+        nature_b = NatureEconomique.objects.create(code="2222", titre="Article B")
+        for nature, montant, devise, statut in [
+            (nature_b, '300.00', 'CDF', 'VALIDEE_DG'), (nature_a, '100.00', 'USD', 'VALIDEE_DF'),
+            (nature_a, '200.00', 'CDF', 'PAYEE'), (nature_a, '0.50', 'USD', 'VALIDEE_DG'),
+            (None, '50.00', 'USD', 'VALIDEE_DG'), (nature_b, '999.00', 'USD', 'EN_ATTENTE'),
+        ]:
+            DemandePaiement.objects.create(
+                service_demandeur=service, nature_economique=nature, description="Demande de test",
+                montant=Decimal(montant), devise=devise, statut=statut, cree_par=cls.utilisateur,
+            )
+
+    def test_calcul_pur_par_groupe(self):
+        from .calculs_releve import calculer_sous_totaux
+
+        sous_totaux, totaux = calculer_sous_totaux([
+            {'nature_economique__code': None, 'devise': 'USD', 'total': Decimal('10.00')},
+            {'nature_economique__code': '2222', 'devise': 'CDF', 'total': Decimal('1000.00')},
+            {'nature_economique__code': '1111', 'devise': 'USD', 'total': Decimal('100.00')},
+            {'nature_economique__code': '1111', 'devise': 'CDF', 'total': Decimal('200.00')},
+        ])
+        self.assertEqual(list(sous_totaux), ['1111', '2222', 'Sans code'])
+        self.assertEqual(sous_totaux['1111'], {
+            'montant_usd': Decimal('100.00'), 'montant_cdf': Decimal('200.00'),
+            'ipr_usd': Decimal('3.00'), 'ipr_cdf': Decimal('6.00'),
+            'net_usd': Decimal('97.00'), 'net_cdf': Decimal('194.00'),
+        })
+        self.assertEqual(totaux['montant_usd'], Decimal('110.00'))
+        self.assertEqual(totaux['ipr_cdf'], Decimal('36.00'))
+        self.assertEqual(totaux['net_cdf'], Decimal('1164.00'))
+
+    def test_code_vide_groupe_avec_les_demandes_sans_code(self):
+        from .views import ReleveDepensePDFView
+
+        DemandePaiement.objects.create(
+            service_demandeur=Service.objects.get(), description="Demande de test",
+            nature_economique=NatureEconomique.objects.create(code="", titre="Article sans code"),
+            montant=Decimal('25.00'), devise='USD', statut='VALIDEE_DG', cree_par=self.utilisateur,
+        )
+        context = ReleveDepensePDFView().get_context_data()
+        self.assertEqual(list(context['sous_totaux']), ['1111', '2222', 'Sans code'])
+        self.assertEqual(context['sous_totaux']['Sans code']['montant_usd'], Decimal('75.00'))
+        self.assertEqual(len(context['demandes_par_code']['Sans code']), 2)
+
+        self.client.force_login(self.utilisateur)
+        response = self.client.get('/demandes/releves/excel/')
+        ws = load_workbook(BytesIO(b''.join(response.streaming_content))).active
+        sous_totaux = [row[3] for row in ws.iter_rows(min_row=10, max_col=9, values_only=True)
+                       if row[2] == 'Sous-total (Code: Sans code)']
+        self.assertEqual(sous_totaux, [75.0])
+
+    def test_une_requete_pour_les_sous_totaux(self):
+        from .calculs_releve import sous_totaux_releve
+        from .views import DemandesAReleverMixin
+
+        queryset = DemandesAReleverMixin().get_queryset()
+        with self.assertNumQueries(1):
+            sous_totaux, totaux = sous_totaux_releve(queryset)
+        self.assertEqual(sous_totaux['1111']['montant_usd'], Decimal('100.50'))
+        self.assertEqual(sous_totaux['1111']['ipr_usd'], Decimal('3.015'))
+        self.assertEqual(sous_totaux['Sans code']['net_usd'], Decimal('48.50'))
+        self.assertEqual(totaux['montant_usd'], Decimal('150.50'))
+        self.assertEqual(totaux['montant_cdf'], Decimal('500.00'))
+
+    def test_ecran_et_excel_coherents(self):
+        self.client.force_login(self.utilisateur)
+        context = self.client.get('/demandes/releves/old/').context
+        self.assertEqual(context['montant_usd'], Decimal('150.50'))
+        self.assertEqual(context['net_a_payer_cdf'], Decimal('485.00'))
+        self.assertEqual(context['total_general'], Decimal('485.00') + Decimal('145.985'))
+
+        response = self.client.get('/demandes/releves/excel/')
+        ws = load_workbook(BytesIO(b''.join(response.streaming_content))).active
+        lignes = {row[2]: row[3:] for row in ws.iter_rows(min_row=10, max_col=9, values_only=True) if row[0] is None and row[2]}
+        for code, total in context['sous_totaux'].items():
+            self.assertEqual(lignes[f'Sous-total (Code: {code})'][0], float(total['montant_usd']) or '-')
+        self.assertEqual(lignes['TOTAL GÉNÉRAL'][5], float(context['net_a_payer_cdf']))
+
+    def test_pdf(self):
+        self.client.force_login(self.utilisateur)
+        response = self.client.get('/demandes/releves/pdf/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b'%PDF'))
+
+
+class ExportsCSVTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        from datetime import date
+
+        cls.utilisateur = User.objects.create_user('daf', password='x', role='SUPER_ADMIN')
+        banque_a = Banque.objects.create(nom_banque="Banque A")
+        banque_b = Banque.objects.create(nom_banque="Banque B")
+        nature = NatureEconomique.objects.create(code="1111", titre="Article A")
+        service = Service.objects.create(nom_service="Service test")
+        for i, banque in enumerate([banque_a, banque_a, banque_b]):
+            DepenseFeuille.objects.create(
+                mois=3, annee=2025, date=date(2025, 3, i + 1), nature_economique=nature,
+                service_beneficiaire=service, libelle_depenses=f"Dépense, n° {i}", banque=banque,
+                montant_fc=Decimal('1500.50'), montant_usd=Decimal('0.00'),
+            )
+        cls.banque_a = banque_a
+
+    def setUp(self):
+        self.client.force_login(self.utilisateur)
+
+    def test_csv_filtre_comme_la_liste(self):
+        response = self.client.get('/demandes/depenses/feuille/export/', {'banque': self.banque_a.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('.csv"', response['Content-Disposition'])
+
+        lignes = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lignes), 3)
+        self.assertTrue(lignes[0].startswith('Date,Mois,Année,'))
+        self.assertIn('2025-03-02,3,2025,1111,Article A,Service test,"Dépense, n° 1",Banque A,1500.50,0.00,', lignes[1])
+
+    def test_tsv_gzip(self):
+        response = self.client.get('/demandes/depenses/feuille/export/', {'format': 'tsv', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('.tsv.gz"', response['Content-Disposition'])
+
+        lignes = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lignes), 4)
+        self.assertIn('\tDépense, n° 2\t', lignes[1])
+
+    def test_mouvements_filtre_valide_vide_ignore(self):
+        from datetime import date
+        from banques.models import CompteBancaire
+        from releves.models import MouvementBancaire, ReleveBancaire
+
+        compte = CompteBancaire.objects.create(
+            banque=self.banque_a, intitule_compte="Compte A", numero_compte="0001",
+            devise='USD', date_ouverture=date(2025, 1, 1),
+        )
+        releve = ReleveBancaire.objects.create(
+            banque=self.banque_a, compte_bancaire=compte, periode_debut=date(2025, 3, 1),
+            periode_fin=date(2025, 3, 31), saisi_par=self.utilisateur, valide=True,
+        )
+        MouvementBancaire.objects.create(
+            releve=releve, type_mouvement='RECETTE', description="Versement",
+            montant=Decimal('10.00'), date_operation=date(2025, 3, 5),
+        )
+        # Paramètre vide (formulaire non renseigné) : pas de filtre sur la validation
+        for valide, lignes in (('', 2), ('true', 2), ('false', 1)):
+            response = self.client.get('/releves/mouvements/export/', {'valide': valide})
+            contenu = b''.join(response.streaming_content).decode('utf-8-sig')
+            self.assertEqual(len(contenu.splitlines()), lignes, valide)
+
+    def test_tous_les_exports_repondent(self):
+        for url in ['/demandes/export/', '/demandes/paiements/export/', '/recettes/export/',
+                    '/recettes/feuille/export/', '/releves/mouvements/export/']:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertTrue(b''.join(response.streaming_content).decode('utf-8-sig').count('\r\n'), url)
+
+
+class EmpreinteFeuilleTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.banque = Banque.objects.create(nom_banque="Rawbank")
+
+    def ligne(self, libelle='Carburant', montant_fc=Decimal('250.00'), **champs):
+        from datetime import date
+        return DepenseFeuille(mois=3, annee=2025, date=date(2025, 3, 2), libelle_depenses=libelle,
+                              banque=self.banque, montant_fc=montant_fc, **champs)
+
+    def test_empreinte_normalisee_et_unique(self):
+        from django.db import IntegrityError
+
+        premiere = self.ligne()
+        premiere.save()
+        self.assertEqual(len(premiere.empreinte), 64)
+        # Espaces superflus, casse et écriture des montants ignorés
+        self.assertEqual(self.ligne('  CARBURANT ', Decimal('250')).calculer_empreinte(), premiere.empreinte)
+        self.assertNotEqual(self.ligne(montant_fc=Decimal('250.01')).calculer_empreinte(), premiere.empreinte)
+        self.assertEqual(self.ligne('carburant').doublon(), premiere)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.ligne('carburant').save()
+
+        # La modification d'une ligne met son empreinte à jour
+        premiere.libelle_depenses = 'Carburant groupe'
+        premiere.save(update_fields=['libelle_depenses'])
+        premiere.refresh_from_db()
+        self.assertEqual(premiere.empreinte, self.ligne('Carburant groupe').calculer_empreinte())
+
+    def test_saisie_refuse_un_doublon(self):
+        from .forms import DepenseFeuilleDirectForm
+
+        self.ligne().save()
+        donnees = {'mois': 3, 'annee': 2025, 'date': '2025-03-02', 'libelle_depenses': 'carburant',
+                   'banque': self.banque.pk, 'montant_fc': '250', 'montant_usd': '0'}
+        form = DepenseFeuilleDirectForm(data=donnees)
+        self.assertFalse(form.is_valid())
+        self.assertIn('déjà enregistrée', str(form.non_field_errors()))
+        self.assertTrue(DepenseFeuilleDirectForm(data={**donnees, 'montant_fc': '300'}).is_valid())
+
+    def test_admin_refuse_un_doublon(self):
+        self.ligne().save()
+        admin = User.objects.create_user('admin2', password='x', role='SUPER_ADMIN', is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+        reponse = self.client.post('/admin/demandes/depensefeuille/add/', {
+            'mois': 3, 'annee': 2025, 'date': '2025-03-02', 'libelle_depenses': 'carburant',
+            'banque': self.banque.pk, 'montant_fc': '250', 'montant_usd': '0',
+        })
+        self.assertContains(reponse, 'déjà enregistrée')
+        self.assertEqual(DepenseFeuille.objects.count(), 1)
+
+    def test_doublon_anterieur_a_l_index_reste_modifiable(self):
+        from datetime import date
+        from recettes.models import RecetteFeuille
+
+        # Doublon déjà en base avant l'index : la migration lui laisse une empreinte nulle
+        self.ligne().save()
+        ancien = self.ligne('Autre')
+        ancien.save()
+        DepenseFeuille.objects.filter(pk=ancien.pk).update(libelle_depenses='Carburant', empreinte=None)
+
+        admin = User.objects.create_user('admin2', password='x', role='SUPER_ADMIN', is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+        reponse = self.client.post(f'/admin/demandes/depensefeuille/{ancien.pk}/change/', {
+            'mois': 3, 'annee': 2025, 'date': '2025-03-02', 'libelle_depenses': 'Carburant',
+            'banque': self.banque.pk, 'montant_fc': '250', 'montant_usd': '0', 'observation': 'Vérifiée',
+        })
+        self.assertEqual(reponse.status_code, 302)
+        ancien.refresh_from_db()
+        self.assertEqual(ancien.observation, 'Vérifiée')
+        self.assertIsNone(ancien.empreinte)
+
+        # Corrigée, la ligne reçoit son empreinte
+        ancien.libelle_depenses = 'Carburant groupe'
+        ancien.save()
+        self.assertIsNotNone(ancien.empreinte)
+
+        recettes = [
+            RecetteFeuille.objects.create(mois=3, annee=2025, date=date(2025, 3, 2), libelle_recette=libelle,
+                                          banque=self.banque, montant_fc=Decimal('10.00'))
+            for libelle in ('Versement', 'Autre')
+        ]
+        RecetteFeuille.objects.filter(pk=recettes[1].pk).update(libelle_recette='Versement', empreinte=None)
+        recette = RecetteFeuille.objects.get(pk=recettes[1].pk)
+        recette.save()
+        self.assertIsNone(recette.empreinte)
@@ -8,6 +8,7 @@ app_name = 'demandes'
 
 urlpatterns = [
     path('', views.DemandePaiementListView.as_view(), name='liste'),
+    path('export/', views.DemandePaiementExportView.as_view(), name='export'),
     path('creer/', views.DemandePaiementCreateView.as_view(), name='creer'),
     path('<int:pk>/', views.DemandePaiementDetailView.as_view(), name='detail'),
     path('<int:pk>/modifier/', views.DemandePaiementUpdateView.as_view(), name='modifier'),
@@ -34,6 +35,7 @@ urlpatterns = [
     path('depenses/<int:pk>/modifier/', views.DepenseUpdateView.as_view(), name='depense_modifier'),
     # Feuille DEPENSES (structure Excel)
     path('depenses/feuille/', views.DepenseFeuilleListView.as_view(), name='depense_feuille_liste'),
+    path('depenses/feuille/export/', views.DepenseFeuilleExportView.as_view(), name='depense_feuille_export'),
     path('depenses/feuille/creer/', views.DepenseFeuilleCreateView.as_view(), name='depense_feuille_creer'),
     path('depenses/feuille/<int:pk>/', views.DepenseFeuilleDetailView.as_view(), name='depense_feuille_detail'),
     path('depenses/feuille/<int:pk>/modifier/', views.DepenseFeuilleUpdateView.as_view(), name='depense_feuille_modifier'),
@@ -45,6 +47,7 @@ urlpatterns = [
     
     # URLs pour les paiements
     path('paiements/', views.PaiementListView.as_view(), name='paiement_liste'),
+    path('paiements/export/', views.PaiementExportView.as_view(), name='paiement_export'),
     path('paiements/creer/', views.PaiementCreateView.as_view(), name='paiement_create'),
     path('paiements/<int:pk>/', views.PaiementDetailView.as_view(), name='paiement_detail'),
     path('paiements/releve/', views.PaiementParReleveView.as_view(), name='paiement_par_releve'),
@@ -7,25 +7,24 @@ from django.urls import reverse_lazy
 from django.shortcuts import redirect, get_object_or_404, render
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models import Q, Sum
-from django.db import transaction
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import NullIf
+from django.db import IntegrityError, transaction
 from django.http import JsonResponse, HttpResponse
 from decimal import Decimal
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.lib.units import cm
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
-from .models import DemandePaiement, ReleveDepense, Depense, NomenclatureDepense, NatureEconomique, Cheque, Paiement, DepenseFeuille
+from .models import DemandePaiement, ReleveDepense, Depense, NomenclatureDepense, NatureEconomique, Cheque, Paiement, DepenseFeuille, SequenceReference
 from accounts.models import Service
 from banques.models import Banque, CompteBancaire
 from releves.models import ReleveBancaire
 from .forms import DemandePaiementForm, DemandePaiementValidationForm, ReleveDepenseForm, ReleveDepenseCreateForm, ReleveDepenseAutoForm, DepenseForm, DepenseFeuilleForm, DepenseFeuilleDirectForm, DepenseFeuilleWorkflowForm, NatureEconomiqueForm, ChequeBanqueForm, PaiementForm, PaiementMultipleForm
 from accounts.permissions import RoleRequiredMixin
+from rapports.export_csv import ExportCSVMixin
+from rapports.mise_en_page_pdf import styles_pdf
+from .calculs_releve import TAUX_IPR, code_groupe, contexte_totaux, montants, sous_totaux_releve
 
 
 class DemandePaiementListView(RoleRequiredMixin, ListView):
@@ -40,11 +39,8 @@ class DemandePaiementListView(RoleRequiredMixin, ListView):
             'service_demandeur', 'cree_par', 'approuve_par', 'nature_economique'
         ).prefetch_related('releves_depense')
         
-        # Filtrage selon le rôle
-        if not self.request.user.peut_voir_tout_sans_modification():
-            # Pour l'instant, on désactive le filtrage par service car le rôle CHEF_SERVICE n'existe plus
-            # TODO: Adapter selon les nouveaux rôles si nécessaire
-            pass
+        # Pas de filtrage par service : le rôle CHEF_SERVICE n'existe plus
+        # TODO: Adapter selon les nouveaux rôles si nécessaire
         
         # Filtrage par statut
         statut = self.request.GET.get('statut')
@@ -73,6 +69,25 @@ class DemandePaiementListView(RoleRequiredMixin, ListView):
         return context
 
 
+class DemandePaiementExportView(ExportCSVMixin, DemandePaiementListView):
+    """Export CSV/TSV des demandes de paiement, avec les filtres de la liste"""
+    nom_export = 'demandes_paiement'
+    colonnes_export = (
+        ('Référence', 'reference'),
+        ('Date de soumission', 'date_soumission'),
+        ('Date de demande', 'date_demande'),
+        ('Service', 'service_demandeur__nom_service'),
+        ('Code article', 'nature_economique__code'),
+        ('Article littera', 'nature_economique__titre'),
+        ('Description', 'description'),
+        ('Montant', 'montant'),
+        ('Devise', 'devise'),
+        ('Déjà payé', 'montant_deja_paye'),
+        ('Reste à payer', 'reste_a_payer'),
+        ('Statut', 'statut'),
+    )
+
+
 class DemandePaiementCreateView(RoleRequiredMixin, CreateView):
     model = DemandePaiement
     form_class = DemandePaiementForm
@@ -213,26 +228,13 @@ class ReleveDepenseGenererPDFView(LoginRequiredMixin, DetailView):
         
         # Contenu du PDF
         story = []
-        styles = getSampleStyleSheet()
+        styles = styles_pdf()
         
         # Style personnalisé pour les titres
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=16,
-            spaceAfter=30,
-            alignment=TA_CENTER,
-            textColor=colors.darkblue
-        )
+        title_style = styles['TitreDGRAD']
         
         # Style pour les en-têtes de tableau
-        header_style = ParagraphStyle(
-            'TableHeader',
-            parent=styles['Normal'],
-            fontSize=10,
-            alignment=TA_CENTER,
-            textColor=colors.white
-        )
+        header_style = styles['EnteteTableau']
         
         # En-tête
         story.append(Paragraph("DGRAD - DIRECTION GÉNÉRALE DES REVENUS", title_style))
@@ -326,87 +328,44 @@ class ReleveDepenseGenererPDFView(LoginRequiredMixin, DetailView):
         return response
 
 
-class ReleveDepensePDFView(LoginRequiredMixin, ListView):
-    """Vue pour générer un PDF du relevé de dépense"""
-    model = DemandePaiement
+class DemandesAReleverMixin:
+    """Demandes validées qui ne sont pas encore dans un relevé, et leurs totaux"""
+    relations = ('service_demandeur', 'cree_par', 'approuve_par', 'nature_economique')
     
     def get_queryset(self):
         """Récupérer uniquement les demandes validées qui ne sont pas déjà dans un relevé"""
-        queryset = DemandePaiement.objects.select_related(
-            'service_demandeur', 'cree_par', 'approuve_par', 'nature_economique'
-        ).filter(
+        queryset = DemandePaiement.objects.select_related(*self.relations).filter(
             statut__in=['VALIDEE_DG', 'VALIDEE_DF', 'PAYEE']
         ).exclude(
             releves_depense__isnull=False  # Exclure les demandes déjà dans un relevé
         )
         
-        # Filtrage selon le rôle
-        if not self.request.user.peut_voir_tout_sans_modification():
-            # Pour l'instant, on désactive le filtrage par service car le rôle CHEF_SERVICE n'existe plus
-            # TODO: Adapter selon les nouveaux rôles si nécessaire
-            pass
+        # Pas de filtrage par service : le rôle CHEF_SERVICE n'existe plus
+        # TODO: Adapter selon les nouveaux rôles si nécessaire
         
-        # Trier par code de nature économique, puis par date
-        return queryset.order_by('nature_economique__code', '-date_soumission')
+        # Trier par code de nature économique (demandes sans code, absent ou vide, en dernier
+        # et regroupées : l'export Excel écrit un sous-total à chaque changement de code), puis par date
+        return queryset.order_by(
+            NullIf('nature_economique__code', Value('')).asc(nulls_last=True), '-date_soumission'
+        )
+
+
+class ReleveDepensePDFView(DemandesAReleverMixin, LoginRequiredMixin, ListView):
+    """Vue pour générer un PDF du relevé de dépense"""
+    model = DemandePaiement
     
     def get_context_data(self, **kwargs):
-        context = {}
-        
-        # Calculer les totaux pour toutes les demandes validées
+        # Totaux et sous-totaux par code calculés par la base
         queryset = self.get_queryset()
+        context = contexte_totaux(queryset)
         
-        # Montants par devise
-        montant_cdf = queryset.filter(devise='CDF').aggregate(total=Sum('montant'))['total'] or Decimal('0.00')
-        montant_usd = queryset.filter(devise='USD').aggregate(total=Sum('montant'))['total'] or Decimal('0.00')
-        
-        # IPR (3%)
-        ipr_cdf = montant_cdf * Decimal('0.03')
-        ipr_usd = montant_usd * Decimal('0.03')
-        
-        # Net à payer (montant - IPR)
-        net_a_payer_cdf = montant_cdf - ipr_cdf
-        net_a_payer_usd = montant_usd - ipr_usd
-        
-        context['montant_cdf'] = montant_cdf
-        context['montant_usd'] = montant_usd
-        context['ipr_cdf'] = ipr_cdf
-        context['ipr_usd'] = ipr_usd
-        context['net_a_payer_cdf'] = net_a_payer_cdf
-        context['net_a_payer_usd'] = net_a_payer_usd
-        
-        # Grouper les demandes par code de nature économique pour les sous-totaux
+        # Lignes du tableau groupées par code de nature économique
         from collections import defaultdict
         demandes_par_code = defaultdict(list)
-        demande_numero = {}
-        numero = 1
-        
         for demande in queryset:
-            code = demande.nature_economique.code if demande.nature_economique else 'Sans code'
+            code = code_groupe(demande.nature_economique.code if demande.nature_economique else None)
             demandes_par_code[code].append(demande)
-            demande_numero[demande.pk] = numero
-            numero += 1
-        
-        # Calculer les sous-totaux pour chaque groupe
-        sous_totaux = {}
-        for code, demandes_groupe in demandes_par_code.items():
-            montant_usd_groupe = sum(d.montant for d in demandes_groupe if d.devise == 'USD')
-            montant_cdf_groupe = sum(d.montant for d in demandes_groupe if d.devise == 'CDF')
-            ipr_usd_groupe = montant_usd_groupe * Decimal('0.03')
-            ipr_cdf_groupe = montant_cdf_groupe * Decimal('0.03')
-            net_usd_groupe = montant_usd_groupe - ipr_usd_groupe
-            net_cdf_groupe = montant_cdf_groupe - ipr_cdf_groupe
-            
-            sous_totaux[code] = {
-                'montant_usd': montant_usd_groupe,
-                'montant_cdf': montant_cdf_groupe,
-                'ipr_usd': ipr_usd_groupe,
-                'ipr_cdf': ipr_cdf_groupe,
-                'net_usd': net_usd_groupe,
-                'net_cdf': net_cdf_groupe,
-            }
         
-        context['sous_totaux'] = sous_totaux
-        context['demande_numero'] = demande_numero
         context['demandes_par_code'] = demandes_par_code
         context['queryset'] = queryset
         
@@ -459,23 +418,10 @@ class ReleveDepensePDFView(LoginRequiredMixin, ListView):
         elements = []
         
         # Styles
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=16,
-            textColor=colors.HexColor('#1a3a5f'),
-            alignment=TA_CENTER,
-            spaceAfter=30,
-        )
+        styles = styles_pdf()
+        title_style = styles['TitreReleve']
         
-        footer_style = ParagraphStyle(
-            'FooterStyle',
-            parent=styles['Normal'],
-            fontSize=10,
-            alignment=TA_RIGHT,
-            spaceBefore=20,
-        )
+        footer_style = styles['PiedReleve']
         
         # Titre avec numéro de relevé
         date_du_jour = releve.date_creation.strftime('%d/%m/%Y')
@@ -517,13 +463,13 @@ class ReleveDepensePDFView(LoginRequiredMixin, ListView):
                       'Montant CDF', 'IPR CDF', 'Net à payer USD', 'Net à payer CDF']]
         
         numero = 1
-        for code in sorted(demandes_par_code.keys()):
+        for code in context['sous_totaux']:
             demandes_groupe = demandes_par_code[code]
             for demande in demandes_groupe:
                 montant_usd = demande.montant if demande.devise == 'USD' else Decimal('0.00')
                 montant_cdf = demande.montant if demande.devise == 'CDF' else Decimal('0.00')
-                ipr_usd = montant_usd * Decimal('0.03')
-                ipr_cdf = montant_cdf * Decimal('0.03')
+                ipr_usd = montant_usd * TAUX_IPR
+                ipr_cdf = montant_cdf * TAUX_IPR
                 net_usd = montant_usd - ipr_usd
                 net_cdf = montant_cdf - ipr_cdf
                 
@@ -618,26 +564,11 @@ class ReleveDepensePDFView(LoginRequiredMixin, ListView):
         elements.append(Spacer(1, 1*cm))
         
         # Styles pour les signataires
-        signataire_gauche_style = ParagraphStyle(
-            'SignataireGaucheStyle',
-            parent=styles['Normal'],
-            fontSize=10,
-            alignment=TA_LEFT,
-        )
+        signataire_gauche_style = styles['SignataireGauche']
         
-        signataire_droite_style = ParagraphStyle(
-            'SignataireDroiteStyle',
-            parent=styles['Normal'],
-            fontSize=10,
-            alignment=TA_RIGHT,
-        )
+        signataire_droite_style = styles['SignataireDroite']
         
-        signataire_centre_style = ParagraphStyle(
-            'SignataireCentreStyle',
-            parent=styles['Normal'],
-            fontSize=10,
-            alignment=TA_CENTER,
-        )
+        signataire_centre_style = styles['SignataireCentre']
         
         # Première ligne : deux signataires (gauche et droite)
         signataire_gauche = Paragraph("_________________________<br/>Signature 1", signataire_gauche_style)
@@ -682,294 +613,105 @@ class ReleveDepensePDFView(LoginRequiredMixin, ListView):
         return response
 
 
-class ReleveDepenseExcelView(LoginRequiredMixin, ListView):
+class ReleveDepenseExcelView(DemandesAReleverMixin, LoginRequiredMixin, ListView):
     """Vue pour générer un fichier Excel du relevé de dépense avec la même mise en forme que le PDF"""
     model = DemandePaiement
-    
-    def get_queryset(self):
-        """Récupérer uniquement les demandes validées qui ne sont pas déjà dans un relevé"""
-        queryset = DemandePaiement.objects.select_related(
-            'service_demandeur', 'cree_par', 'approuve_par', 'nature_economique'
-        ).filter(
-            statut__in=['VALIDEE_DG', 'VALIDEE_DF', 'PAYEE']
-        ).exclude(
-            releves_depense__isnull=False  # Exclure les demandes déjà dans un relevé
-        )
-        
-        # Filtrage selon le rôle
-        if not self.request.user.peut_voir_tout_sans_modification():
-            # Pour l'instant, on désactive le filtrage par service car le rôle CHEF_SERVICE n'existe plus
-            # TODO: Adapter selon les nouveaux rôles si nécessaire
-            pass
-        
-        # Trier par code de nature économique, puis par date
-        return queryset.order_by('nature_economique__code', '-date_soumission')
+    relations = ('nature_economique',)
     
     def get_context_data(self, **kwargs):
-        context = {}
-        
-        # Calculer les totaux pour toutes les demandes validées
+        """Totaux et sous-totaux calculés par la base (les lignes ne sont lues qu'à l'écriture)"""
         queryset = self.get_queryset()
-        
-        # Montants par devise
-        montant_cdf = queryset.filter(devise='CDF').aggregate(total=Sum('montant'))['total'] or Decimal('0.00')
-        montant_usd = queryset.filter(devise='USD').aggregate(total=Sum('montant'))['total'] or Decimal('0.00')
-        
-        # IPR (3%)
-        ipr_cdf = montant_cdf * Decimal('0.03')
-        ipr_usd = montant_usd * Decimal('0.03')
-        
-        # Net à payer (montant - IPR)
-        net_a_payer_cdf = montant_cdf - ipr_cdf
-        net_a_payer_usd = montant_usd - ipr_usd
-        
-        context['montant_cdf'] = montant_cdf
-        context['montant_usd'] = montant_usd
-        context['ipr_cdf'] = ipr_cdf
-        context['ipr_usd'] = ipr_usd
-        context['net_a_payer_cdf'] = net_a_payer_cdf
-        context['net_a_payer_usd'] = net_a_payer_usd
-        
-        # Grouper les demandes par code de nature économique pour les sous-totaux
-        from collections import defaultdict
-        demandes_par_code = defaultdict(list)
-        demande_numero = {}
-        numero = 1
-        
-        for demande in queryset:
-            code = demande.nature_economique.code if demande.nature_economique else 'Sans code'
-            demandes_par_code[code].append(demande)
-            demande_numero[demande.pk] = numero
-            numero += 1
-        
-        # Calculer les sous-totaux pour chaque groupe
-        sous_totaux = {}
-        for code, demandes_groupe in demandes_par_code.items():
-            montant_usd_groupe = sum(d.montant for d in demandes_groupe if d.devise == 'USD')
-            montant_cdf_groupe = sum(d.montant for d in demandes_groupe if d.devise == 'CDF')
-            ipr_usd_groupe = montant_usd_groupe * Decimal('0.03')
-            ipr_cdf_groupe = montant_cdf_groupe * Decimal('0.03')
-            net_usd_groupe = montant_usd_groupe - ipr_usd_groupe
-            net_cdf_groupe = montant_cdf_groupe - ipr_cdf_groupe
-            
-            sous_totaux[code] = {
-                'montant_usd': montant_usd_groupe,
-                'montant_cdf': montant_cdf_groupe,
-                'ipr_usd': ipr_usd_groupe,
-                'ipr_cdf': ipr_cdf_groupe,
-                'net_usd': net_usd_groupe,
-                'net_cdf': net_cdf_groupe,
-            }
-        
-        context['sous_totaux'] = sous_totaux
-        context['demande_numero'] = demande_numero
-        context['demandes_par_code'] = demandes_par_code
+        context = contexte_totaux(queryset)
         context['queryset'] = queryset
-        
         return context
     
+    @staticmethod
+    def _colonnes(total):
+        """Colonnes montant / IPR / net d'une ligne (voir calculs_releve.montants), '-' pour les montants nuls"""
+        valeurs = [total['montant_usd'], total['ipr_usd'], total['montant_cdf'], total['ipr_cdf'],
+                   total['net_usd'], total['net_cdf']]
+        return [float(valeur) if valeur > 0 else '-' for valeur in valeurs]
+    
     def get(self, request, *args, **kwargs):
-        context = self.get_context_data()
-        queryset = context['queryset']
-        demandes_par_code = context['demandes_par_code']
-        
-        # Créer le fichier Excel
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename="releve_depense_{timezone.now().strftime("%Y%m%d_%H%M%S")}.xlsx"'
-        
-        # Créer le workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Relevé de Dépense"
-        
-        # Styles
-        header_fill = PatternFill(start_color="1a3a5f", end_color="1a3a5f", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF", size=12)
-        title_font = Font(bold=True, size=16, color="1a3a5f")
-        border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-        center_align = Alignment(horizontal='center', vertical='center')
-        right_align = Alignment(horizontal='right', vertical='center')
-        left_align = Alignment(horizontal='left', vertical='center')
+        from rapports.excel_flux import classeur_flux, ligne, ligne_fusionnee, par_lots, reponse_excel
         
-        row = 1
+        context = self.get_context_data()
+        wb, ws = classeur_flux("Relevé de Dépense", largeurs=[8, 12, 30] + [15] * 6)
         
         # Titre
         date_du_jour = timezone.now().strftime('%d/%m/%Y')
-        ws.merge_cells(f'A{row}:I{row}')
-        cell = ws.cell(row=row, column=1, value=f"RELEVÉ DE DÉPENSE DU {date_du_jour}")
-        cell.font = title_font
-        cell.alignment = center_align
-        row += 2
+        ligne_fusionnee(ws, 1, f"RELEVÉ DE DÉPENSE DU {date_du_jour}", 'titre', 9)
+        ligne(ws, [])
         
         # Résumé des montants
-        resume_start_row = row
-        resume_headers = ['Désignation', 'CDF', 'USD']
-        for col, header in enumerate(resume_headers, start=1):
-            cell = ws.cell(row=row, column=col, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = center_align
-            cell.border = border
-        
-        row += 1
-        resume_data = [
-            ['Montant', context['montant_cdf'], context['montant_usd']],
-            ['IPR (3%)', context['ipr_cdf'], context['ipr_usd']],
-            ['Net à payer', context['net_a_payer_cdf'], context['net_a_payer_usd']],
-        ]
-        
-        for data_row in resume_data:
-            for col, value in enumerate(data_row, start=1):
-                cell = ws.cell(row=row, column=col, value=value if col == 1 else float(value))
-                cell.alignment = center_align if col == 1 else right_align
-                cell.border = border
-                if col > 1:
-                    cell.number_format = '#,##0.00'
-            row += 1
-        
-        # Appliquer le style beige aux données du résumé
-        for r in range(resume_start_row + 1, row):
-            for c in range(1, 4):
-                ws.cell(row=r, column=c).fill = PatternFill(start_color="F5F5DC", end_color="F5F5DC", fill_type="solid")
-        
-        row += 2
+        ligne(ws, ['Désignation', 'CDF', 'USD'], 'entete')
+        for designation, cdf, usd in [
+            ('Montant', context['montant_cdf'], context['montant_usd']),
+            ('IPR (3%)', context['ipr_cdf'], context['ipr_usd']),
+            ('Net à payer', context['net_a_payer_cdf'], context['net_a_payer_usd']),
+        ]:
+            ligne(ws, [designation, float(cdf), float(usd)], ['resume', 'resume_montant', 'resume_montant'])
+        ligne(ws, [])
+        ligne(ws, [])
         
         # Tableau principal - En-têtes
-        headers = ['N°', 'Code', 'Article Littera', 'Montant USD', 'IPR USD', 
-                   'Montant CDF', 'IPR CDF', 'Net à payer USD', 'Net à payer CDF']
-        for col, header in enumerate(headers, start=1):
-            cell = ws.cell(row=row, column=col, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = center_align
-            cell.border = border
-        row += 1
-        
-        # Données du tableau
-        numero = 1
-        for code in sorted(demandes_par_code.keys()):
-            demandes_groupe = demandes_par_code[code]
-            for demande in demandes_groupe:
-                montant_usd = demande.montant if demande.devise == 'USD' else Decimal('0.00')
-                montant_cdf = demande.montant if demande.devise == 'CDF' else Decimal('0.00')
-                ipr_usd = montant_usd * Decimal('0.03')
-                ipr_cdf = montant_cdf * Decimal('0.03')
-                net_usd = montant_usd - ipr_usd
-                net_cdf = montant_cdf - ipr_cdf
-                
-                nature = demande.nature_economique.titre if demande.nature_economique else '-'
-                
-                data = [
-                    numero,
-                    code,
-                    nature,
-                    float(montant_usd) if montant_usd > 0 else '-',
-                    float(ipr_usd) if ipr_usd > 0 else '-',
-                    float(montant_cdf) if montant_cdf > 0 else '-',
-                    float(ipr_cdf) if ipr_cdf > 0 else '-',
-                    float(net_usd) if net_usd > 0 else '-',
-                    float(net_cdf) if net_cdf > 0 else '-',
-                ]
-                
-                for col, value in enumerate(data, start=1):
-                    cell = ws.cell(row=row, column=col, value=value)
-                    cell.alignment = center_align if col <= 3 else right_align
-                    cell.border = border
-                    if col > 3 and isinstance(value, (int, float)):
-                        cell.number_format = '#,##0.00'
-                    # Alterner les couleurs de fond
-                    if row % 2 == 0:
-                        cell.fill = PatternFill(start_color="F0F0F0", end_color="F0F0F0", fill_type="solid")
-                
+        ligne(ws, ['N°', 'Code', 'Article Littera', 'Montant USD', 'IPR USD',
+                   'Montant CDF', 'IPR CDF', 'Net à payer USD', 'Net à payer CDF'], 'entete')
+        row = 10
+        
+        def sous_total(code):
+            ligne(ws, ['', '', f'Sous-total (Code: {code})'] + self._colonnes(context['sous_totaux'][code]),
+                  ['sous_total'] * 3 + ['sous_total_montant'] * 6)
+        
+        # Données du tableau, lues par lots ; sous-total (calculé par la base) écrit à chaque changement de code
+        code_courant = None
+        for numero, demande in enumerate(par_lots(context['queryset']), start=1):
+            code = code_groupe(demande.nature_economique.code if demande.nature_economique else None)
+            if numero > 1 and code != code_courant:
+                sous_total(code_courant)
                 row += 1
-                numero += 1
+            code_courant = code
             
-            # Sous-total
-            if code in context['sous_totaux']:
-                total = context['sous_totaux'][code]
-                data = [
-                    '', '', f'Sous-total (Code: {code})',
-                    float(total['montant_usd']) if total['montant_usd'] > 0 else '-',
-                    float(total['ipr_usd']) if total['ipr_usd'] > 0 else '-',
-                    float(total['montant_cdf']) if total['montant_cdf'] > 0 else '-',
-                    float(total['ipr_cdf']) if total['ipr_cdf'] > 0 else '-',
-                    float(total['net_usd']) if total['net_usd'] > 0 else '-',
-                    float(total['net_cdf']) if total['net_cdf'] > 0 else '-',
-                ]
-                
-                for col, value in enumerate(data, start=1):
-                    cell = ws.cell(row=row, column=col, value=value)
-                    cell.alignment = center_align if col <= 3 else right_align
-                    cell.border = border
-                    cell.font = Font(bold=True)
-                    cell.fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
-                    if col > 3 and isinstance(value, (int, float)):
-                        cell.number_format = '#,##0.00'
-                row += 1
+            montant_usd = demande.montant if demande.devise == 'USD' else Decimal('0.00')
+            montant_cdf = demande.montant if demande.devise == 'CDF' else Decimal('0.00')
+            
+            nature = demande.nature_economique.titre if demande.nature_economique else '-'
+            alterne = '_alterne' if row % 2 == 0 else ''
+            ligne(ws, [numero, code, nature] + self._colonnes(montants(montant_usd, montant_cdf)),
+                  [f'texte{alterne}'] * 3 + [f'montant{alterne}'] * 6)
+            row += 1
+        if code_courant is not None:
+            sous_total(code_courant)
+            row += 1
         
         # Total général
-        data = [
-            '', '', 'TOTAL GÉNÉRAL',
-            float(context['montant_usd']) if context['montant_usd'] > 0 else '-',
-            float(context['ipr_usd']) if context['ipr_usd'] > 0 else '-',
-            float(context['montant_cdf']) if context['montant_cdf'] > 0 else '-',
-            float(context['ipr_cdf']) if context['ipr_cdf'] > 0 else '-',
-            float(context['net_a_payer_usd']) if context['net_a_payer_usd'] > 0 else '-',
-            float(context['net_a_payer_cdf']) if context['net_a_payer_cdf'] > 0 else '-',
-        ]
-        
-        for col, value in enumerate(data, start=1):
-            cell = ws.cell(row=row, column=col, value=value)
-            cell.alignment = center_align if col <= 3 else right_align
-            cell.border = border
-            cell.font = Font(bold=True, color="FFFFFF", size=11)
-            cell.fill = header_fill
-            if col > 3 and isinstance(value, (int, float)):
-                cell.number_format = '#,##0.00'
-        
-        row += 2
+        ligne(ws, ['', '', 'TOTAL GÉNÉRAL'] + self._colonnes(context['totaux']),
+              ['total'] * 3 + ['total_montant'] * 6)
+        row += 1
+        ligne(ws, [])
+        row += 1
         
         # "Fait à Kinshasa" aligné à droite
-        ws.merge_cells(f'A{row}:I{row}')
-        date_text = f"Fait à Kinshasa le {timezone.now().strftime('%d/%m/%Y')}"
-        cell = ws.cell(row=row, column=1, value=date_text)
-        cell.alignment = Alignment(horizontal='right', vertical='center')
-        cell.font = Font(size=10)
+        ligne_fusionnee(ws, row, f"Fait à Kinshasa le {timezone.now().strftime('%d/%m/%Y')}", 'note_droite', 9)
+        ligne(ws, [])
+        ligne(ws, [])
         row += 3
         
         # Signataires
         # Première ligne : deux signataires (gauche et droite)
-        ws.merge_cells(f'A{row}:E{row}')
-        ws.merge_cells(f'F{row}:I{row}')
-        cell_left = ws.cell(row=row, column=1, value="_________________________\nSignature 1")
-        cell_left.alignment = Alignment(horizontal='left', vertical='center', wrap_text=True)
-        cell_right = ws.cell(row=row, column=6, value="_________________________\nSignature 2")
-        cell_right.alignment = Alignment(horizontal='right', vertical='center', wrap_text=True)
+        ws.merged_cells.add(f'A{row}:E{row}')
+        ws.merged_cells.add(f'F{row}:I{row}')
+        ligne(ws, ["_________________________\nSignature 1", None, None, None, None,
+                   "_________________________\nSignature 2"],
+              ['signature_gauche', None, None, None, None, 'signature_droite'])
+        ligne(ws, [])
+        ligne(ws, [])
         row += 3
         
         # Deuxième ligne : signataire centré
-        ws.merge_cells(f'A{row}:I{row}')
-        cell_center = ws.cell(row=row, column=1, value="_________________________\nSignature 3")
-        cell_center.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-        
-        # Ajuster les largeurs des colonnes
-        ws.column_dimensions['A'].width = 8
-        ws.column_dimensions['B'].width = 12
-        ws.column_dimensions['C'].width = 30
-        for col in range(4, 10):
-            ws.column_dimensions[get_column_letter(col)].width = 15
+        ligne_fusionnee(ws, row, "_________________________\nSignature 3", 'signature_centre', 9)
         
-        # Sauvegarder le workbook
-        wb.save(response)
-        
-        return response
+        return reponse_excel(wb, f'releve_depense_{timezone.now().strftime("%Y%m%d_%H%M%S")}.xlsx')
 
 
 class ReleveDepenseReprintPDFView(LoginRequiredMixin, View):
@@ -990,46 +732,20 @@ class ReleveDepenseReprintPDFView(LoginRequiredMixin, View):
         # Récupérer les demandes du relevé
         demandes = releve.demandes.all().select_related(
             'service_demandeur', 'cree_par', 'approuve_par', 'nature_economique'
-        ).order_by('nature_economique__code', '-date_soumission')
+        ).order_by(F('nature_economique__code').asc(nulls_last=True), '-date_soumission')
         
-        # Calculer les totaux
-        montant_cdf = sum(d.montant for d in demandes if d.devise == 'CDF')
-        montant_usd = sum(d.montant for d in demandes if d.devise == 'USD')
-        ipr_cdf = montant_cdf * Decimal('0.03')
-        ipr_usd = montant_usd * Decimal('0.03')
-        net_a_payer_cdf = montant_cdf - ipr_cdf
-        net_a_payer_usd = montant_usd - ipr_usd
+        # Totaux et sous-totaux par code calculés par la base
+        sous_totaux, totaux = sous_totaux_releve(demandes)
+        montant_cdf, montant_usd = totaux['montant_cdf'], totaux['montant_usd']
+        ipr_cdf, ipr_usd = totaux['ipr_cdf'], totaux['ipr_usd']
+        net_a_payer_cdf, net_a_payer_usd = totaux['net_cdf'], totaux['net_usd']
         
         # Grouper les demandes par code
         from collections import defaultdict
         demandes_par_code = defaultdict(list)
-        demande_numero = {}
-        numero_demande = 1
-        
         for demande in demandes:
-            code = demande.nature_economique.code if demande.nature_economique else 'Sans code'
+            code = code_groupe(demande.nature_economique.code if demande.nature_economique else None)
             demandes_par_code[code].append(demande)
-            demande_numero[demande.pk] = numero_demande
-            numero_demande += 1
-        
-        # Calculer les sous-totaux
-        sous_totaux = {}
-        for code, demandes_groupe in demandes_par_code.items():
-            montant_usd_groupe = sum(d.montant for d in demandes_groupe if d.devise == 'USD')
-            montant_cdf_groupe = sum(d.montant for d in demandes_groupe if d.devise == 'CDF')
-            ipr_usd_groupe = montant_usd_groupe * Decimal('0.03')
-            ipr_cdf_groupe = montant_cdf_groupe * Decimal('0.03')
-            net_usd_groupe = montant_usd_groupe - ipr_usd_groupe
-            net_cdf_groupe = montant_cdf_groupe - ipr_cdf_groupe
-            
-            sous_totaux[code] = {
-                'montant_usd': montant_usd_groupe,
-                'montant_cdf': montant_cdf_groupe,
-                'ipr_usd': ipr_usd_groupe,
-                'ipr_cdf': ipr_cdf_groupe,
-                'net_usd': net_usd_groupe,
-                'net_cdf': net_cdf_groupe,
-            }
         
         # Créer le PDF (utiliser le même code que ReleveDepensePDFView)
         response = HttpResponse(content_type='application/pdf')
@@ -1040,23 +756,10 @@ class ReleveDepenseReprintPDFView(LoginRequiredMixin, View):
                                 topMargin=1*cm, bottomMargin=1*cm)
         elements = []
         
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=16,
-            textColor=colors.HexColor('#1a3a5f'),
-            alignment=TA_CENTER,
-            spaceAfter=30,
-        )
+        styles = styles_pdf()
+        title_style = styles['TitreReleve']
         
-        footer_style = ParagraphStyle(
-            'FooterStyle',
-            parent=styles['Normal'],
-            fontSize=10,
-            alignment=TA_RIGHT,
-            spaceBefore=20,
-        )
+        footer_style = styles['PiedReleve']
         
         # Titre avec numéro de relevé
         date_du_jour = releve.date_creation.strftime('%d/%m/%Y')
@@ -1096,13 +799,13 @@ class ReleveDepenseReprintPDFView(LoginRequiredMixin, View):
                       'Montant CDF', 'IPR CDF', 'Net à payer USD', 'Net à payer CDF']]
         
         numero_dem = 1
-        for code in sorted(demandes_par_code.keys()):
+        for code in sous_totaux:
             demandes_groupe = demandes_par_code[code]
             for demande in demandes_groupe:
                 montant_usd_d = demande.montant if demande.devise == 'USD' else Decimal('0.00')
                 montant_cdf_d = demande.montant if demande.devise == 'CDF' else Decimal('0.00')
-                ipr_usd_d = montant_usd_d * Decimal('0.03')
-                ipr_cdf_d = montant_cdf_d * Decimal('0.03')
+                ipr_usd_d = montant_usd_d * TAUX_IPR
+                ipr_cdf_d = montant_cdf_d * TAUX_IPR
                 net_usd_d = montant_usd_d - ipr_usd_d
                 net_cdf_d = montant_cdf_d - ipr_cdf_d
                 
@@ -1189,9 +892,9 @@ class ReleveDepenseReprintPDFView(LoginRequiredMixin, View):
         
         # Signataires
         elements.append(Spacer(1, 1*cm))
-        signataire_gauche_style = ParagraphStyle('SignataireGaucheStyle', parent=styles['Normal'], fontSize=10, alignment=TA_LEFT)
-        signataire_droite_style = ParagraphStyle('SignataireDroiteStyle', parent=styles['Normal'], fontSize=10, alignment=TA_RIGHT)
-        signataire_centre_style = ParagraphStyle('SignataireCentreStyle', parent=styles['Normal'], fontSize=10, alignment=TA_CENTER)
+        signataire_gauche_style = styles['SignataireGauche']
+        signataire_droite_style = styles['SignataireDroite']
+        signataire_centre_style = styles['SignataireCentre']
         
         signataire_gauche = Paragraph("_________________________<br/>Signature 1", signataire_gauche_style)
         signataire_droite = Paragraph("_________________________<br/>Signature 2", signataire_droite_style)
@@ -1417,22 +1120,10 @@ class ChequePDFView(LoginRequiredMixin, View):
         elements = []
         
         # Styles
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'ChequeTitle',
-            parent=styles['Heading1'],
-            fontSize=18,
-            textColor=colors.HexColor('#1a3a5f'),
-            alignment=TA_CENTER,
-            spaceAfter=30,
-        )
+        styles = styles_pdf()
+        title_style = styles['TitreCheque']
         
-        normal_style = ParagraphStyle(
-            'Normal',
-            parent=styles['Normal'],
-            fontSize=12,
-            alignment=TA_LEFT,
-        )
+        normal_style = styles['NormalCheque']
         
         # Titre
         title = Paragraph("CHÈQUE", title_style)
@@ -1595,14 +1286,7 @@ class ChequePDFView(LoginRequiredMixin, View):
         montant_usd_lettres = nombre_en_lettres(cheque.montant_usd)
         
         # Style pour les montants en lettres
-        lettres_style = ParagraphStyle(
-            'LettresStyle',
-            parent=styles['Normal'],
-            fontSize=9,
-            fontName='Helvetica-Oblique',
-            textColor=colors.HexColor('#666666'),
-            alignment=TA_LEFT,
-        )
+        lettres_style = styles['LettresCheque']
         
         # Tableau des montants
         montant_data = [
@@ -1864,96 +1548,21 @@ class ReleveDepenseValiderDepensesView(LoginRequiredMixin, View):
         return redirect('demandes:releve_detail', pk=releve.pk)
 
 
-class ReleveDepenseOldListView(LoginRequiredMixin, ListView):
+class ReleveDepenseOldListView(DemandesAReleverMixin, LoginRequiredMixin, ListView):
     """Vue pour afficher les demandes validées comme relevé de dépense (ancienne version)"""
     model = DemandePaiement
     template_name = 'demandes/releve_liste_simple.html'
     context_object_name = 'demandes'
     paginate_by = 20
     
-    def get_queryset(self):
-        """Récupérer uniquement les demandes validées qui ne sont pas déjà dans un relevé"""
-        queryset = DemandePaiement.objects.select_related(
-            'service_demandeur', 'cree_par', 'approuve_par', 'nature_economique'
-        ).filter(
-            statut__in=['VALIDEE_DG', 'VALIDEE_DF', 'PAYEE']
-        ).exclude(
-            releves_depense__isnull=False  # Exclure les demandes déjà dans un relevé
-        )
-        
-        # Filtrage selon le rôle
-        if not self.request.user.peut_voir_tout_sans_modification():
-            # Pour l'instant, on désactive le filtrage par service car le rôle CHEF_SERVICE n'existe plus
-            # TODO: Adapter selon les nouveaux rôles si nécessaire
-            pass
-        
-        # Trier par code de nature économique, puis par date
-        return queryset.order_by('nature_economique__code', '-date_soumission')
-    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Calculer les totaux pour toutes les demandes validées
-        queryset = self.get_queryset()
-        
-        # Montants par devise
-        montant_cdf = queryset.filter(devise='CDF').aggregate(total=Sum('montant'))['total'] or Decimal('0.00')
-        montant_usd = queryset.filter(devise='USD').aggregate(total=Sum('montant'))['total'] or Decimal('0.00')
-        
-        # IPR (3%)
-        ipr_cdf = montant_cdf * Decimal('0.03')
-        ipr_usd = montant_usd * Decimal('0.03')
-        
-        # Net à payer (montant - IPR)
-        net_a_payer_cdf = montant_cdf - ipr_cdf
-        net_a_payer_usd = montant_usd - ipr_usd
+        # Totaux et sous-totaux par code pour toutes les demandes validées (pas seulement la page)
+        context.update(contexte_totaux(self.object_list))
         
         # Total général
-        total_general = net_a_payer_cdf + net_a_payer_usd
-        
-        context['montant_cdf'] = montant_cdf
-        context['montant_usd'] = montant_usd
-        context['ipr_cdf'] = ipr_cdf
-        context['ipr_usd'] = ipr_usd
-        context['net_a_payer_cdf'] = net_a_payer_cdf
-        context['net_a_payer_usd'] = net_a_payer_usd
-        context['total_general'] = total_general
-        
-        # Grouper les demandes par code de nature économique pour les sous-totaux
-        # et ajouter un numéro d'ordre à chaque demande
-        demandes_groupes = {}
-        demande_numero = {}
-        numero = 1
-        
-        for demande in queryset:
-            code = demande.nature_economique.code if demande.nature_economique else 'Sans code'
-            if code not in demandes_groupes:
-                demandes_groupes[code] = []
-            demandes_groupes[code].append(demande)
-            demande_numero[demande.pk] = numero
-            numero += 1
-        
-        # Calculer les sous-totaux pour chaque groupe
-        sous_totaux = {}
-        for code, demandes_groupe in demandes_groupes.items():
-            montant_usd_groupe = sum(d.montant for d in demandes_groupe if d.devise == 'USD')
-            montant_cdf_groupe = sum(d.montant for d in demandes_groupe if d.devise == 'CDF')
-            ipr_usd_groupe = montant_usd_groupe * Decimal('0.03')
-            ipr_cdf_groupe = montant_cdf_groupe * Decimal('0.03')
-            net_usd_groupe = montant_usd_groupe - ipr_usd_groupe
-            net_cdf_groupe = montant_cdf_groupe - ipr_cdf_groupe
-            
-            sous_totaux[code] = {
-                'montant_usd': montant_usd_groupe,
-                'montant_cdf': montant_cdf_groupe,
-                'ipr_usd': ipr_usd_groupe,
-                'ipr_cdf': ipr_cdf_groupe,
-                'net_usd': net_usd_groupe,
-                'net_cdf': net_cdf_groupe,
-            }
-        
-        context['sous_totaux'] = sous_totaux
-        context['demande_numero'] = demande_numero
+        context['total_general'] = context['net_a_payer_cdf'] + context['net_a_payer_usd']
         
         return context
 
@@ -1995,7 +1604,7 @@ class ReleveDepenseCreateView(LoginRequiredMixin, View):
                     # Ajouter un delta de temps pour rendre la période unique
                     periode_unique = periode_unique + timedelta(days=existing_count)
                 
-                numero = f"REL-{now.year}-{now.month:02d}-{ReleveDepense.objects.count() + 1:06d}"
+                numero = f"REL-{now.year}-{now.month:02d}-{SequenceReference.allouer('REL')[0]:06d}"
                 
                 releve = ReleveDepense.objects.create(
                     numero=numero,
@@ -2428,10 +2037,9 @@ class DepenseFeuilleListView(RoleRequiredMixin, ListView):
         
         mots_cles = self.request.GET.get('mots_cles', '').strip()
         if mots_cles:
-            qs = qs.filter(
-                Q(libelle_depenses__icontains=mots_cles) |
-                Q(observation__icontains=mots_cles)
-            )
+            # Recherche plein texte, résultats classés par pertinence
+            from tableau_bord_feuilles.recherche import rechercher_feuilles
+            qs = rechercher_feuilles(qs, mots_cles)
         
         # Filtres par date
         date_debut = self.request.GET.get('date_debut')
@@ -2474,6 +2082,24 @@ class DepenseFeuilleListView(RoleRequiredMixin, ListView):
         return context
 
 
+class DepenseFeuilleExportView(ExportCSVMixin, DepenseFeuilleListView):
+    """Export CSV/TSV de la feuille DEPENSES, avec les filtres de la liste"""
+    nom_export = 'depenses_feuille'
+    colonnes_export = (
+        ('Date', 'date'),
+        ('Mois', 'mois'),
+        ('Année', 'annee'),
+        ('Code article', 'nature_economique__code'),
+        ('Article littera', 'nature_economique__titre'),
+        ('Service bénéficiaire', 'service_beneficiaire__nom_service'),
+        ('Libellé', 'libelle_depenses'),
+        ('Banque', 'banque__nom_banque'),
+        ('Montant FC', 'montant_fc'),
+        ('Montant USD', 'montant_usd'),
+        ('Observation', 'observation'),
+    )
+
+
 class DepenseFeuilleCreateView(RoleRequiredMixin, CreateView):
     model = DepenseFeuille
     form_class = DepenseFeuilleDirectForm  # Par défaut pour les DAF
@@ -2567,8 +2193,14 @@ class DepenseFeuilleCreateView(RoleRequiredMixin, CreateView):
         return initial
 
     def form_valid(self, form):
+        try:
+            reponse = super().form_valid(form)
+        except IntegrityError:
+            # Même ligne enregistrée entre la validation du formulaire et l'insertion
+            form.add_error(None, 'Cette dépense vient d\'être enregistrée (même libellé, banque et montants).')
+            return self.form_invalid(form)
         messages.success(self.request, 'Ligne dépense (feuille) enregistrée.')
-        return super().form_valid(form)
+        return reponse
 
 
 class DepenseFeuilleUpdateView(LoginRequiredMixin, UpdateView):
@@ -2776,6 +2408,23 @@ class PaiementListView(RoleRequiredMixin, ListView):
         return context
 
 
+class PaiementExportView(ExportCSVMixin, PaiementListView):
+    """Export CSV/TSV des paiements, avec les filtres de la liste"""
+    nom_export = 'paiements'
+    colonnes_export = (
+        ('Référence', 'reference'),
+        ('Date de paiement', 'date_paiement'),
+        ('Relevé de dépense', 'releve_depense__numero'),
+        ('Demande', 'demande__reference'),
+        ('Service', 'demande__service_demandeur__nom_service'),
+        ('Montant payé', 'montant_paye'),
+        ('Devise', 'devise'),
+        ('Bénéficiaire', 'beneficiaire'),
+        ('Payé par', 'paiement_par__username'),
+        ('Observations', 'observations'),
+    )
+
+
 class PaiementParReleveView(LoginRequiredMixin, FormView):
     """Vue pour payer les demandes d'un relevé de dépenses"""
     template_name = 'demandes/paiement_releve.html'
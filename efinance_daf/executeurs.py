@@ -0,0 +1,75 @@
+"""
+Exécuteurs des traitements parallèles (imports DATADAF, lots d'états, travailleur)
+
+executeur(mode) retourne un exécuteur concurrent.futures :
+  - process : pool de processus ; les connexions du parent sont fermées avant
+    la création des processus, qui chargent Django à leur démarrage ;
+  - thread : pool de threads ;
+  - direct : sans pool, chaque tâche est exécutée à la soumission dans le
+    thread appelant.
+
+Dans les pools, les connexions à la base du thread ou du processus sont
+fermées après chaque tâche ; en direct, la connexion de l'appelant reste
+ouverte. Dans les trois modes, une exception est portée par le Future : elle
+est traitée au même endroit, par future.result().
+"""
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.db import connections
+
+
+MODES = ('process', 'thread', 'direct')
+
+
+def _initialiser_processus():
+    # Processus lancés par « spawn » (Windows, macOS) : Django doit être chargé
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def _executer_puis_fermer(fonction, *args, **kwargs):
+    try:
+        return fonction(*args, **kwargs)
+    finally:
+        connections.close_all()
+
+
+class PoolProcessus(ProcessPoolExecutor):
+
+    def __init__(self, max_workers=None):
+        # Les processus enfants ne doivent pas hériter des connexions du parent
+        connections.close_all()
+        super().__init__(max_workers=max_workers, initializer=_initialiser_processus)
+
+    def submit(self, fonction, /, *args, **kwargs):
+        return super().submit(_executer_puis_fermer, fonction, *args, **kwargs)
+
+
+class PoolThreads(ThreadPoolExecutor):
+
+    def submit(self, fonction, /, *args, **kwargs):
+        return super().submit(_executer_puis_fermer, fonction, *args, **kwargs)
+
+
+class ExecutionDirecte(Executor):
+    """Exécuteur sans pool : chaque tâche est exécutée dans le thread appelant, à la soumission"""
+
+    def submit(self, fonction, /, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fonction(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def executeur(mode, concurrence=None, nom='pool'):
+    """Exécuteur pour `mode` (voir MODES) ; `nom` préfixe le nom des threads"""
+    if mode == 'process':
+        return PoolProcessus(max_workers=concurrence)
+    if mode == 'thread':
+        return PoolThreads(max_workers=concurrence, thread_name_prefix=nom)
+    if mode == 'direct':
+        return ExecutionDirecte()
+    raise ValueError(f'Mode inconnu : {mode!r} (attendu : {", ".join(MODES)})')
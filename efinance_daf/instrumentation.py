@@ -0,0 +1,171 @@
+"""
+Instrumentation SQL par requête (activée par INSTRUMENTATION_SQL)
+
+Pour chaque requête HTTP, InstrumentationSQLMiddleware relève, sur toutes
+les connexions, le nombre de requêtes SQL, leur durée cumulée, les plus
+lentes et les requêtes répétées (même forme, paramètres et listes IN mis à
+part : signe d'une requête dans une boucle, N+1). Le relevé est :
+  - ajouté à la réponse dans l'en-tête Server-Timing (visible dans l'onglet
+    réseau du navigateur) ;
+  - journalisé (logger efinance_daf.instrumentation) en WARNING quand la vue
+    dépasse INSTRUMENTATION_SQL_BUDGET, en DEBUG sinon.
+
+Pour une réponse en flux, les requêtes exécutées pendant la lecture du contenu
+sont comptées jusqu'à la fermeture de la réponse (response.close()), dans le
+thread qui a exécuté la vue ; l'en-tête Server-Timing ne couvre que la vue.
+
+Fonctionne sans DEBUG (connection.execute_wrapper), donc en production.
+"""
+import heapq
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+# Budget par requête HTTP : au-delà, un WARNING est journalisé
+BUDGET_PAR_DEFAUT = {
+    'requetes': 50,      # nombre de requêtes SQL
+    'duree_ms': 500,     # durée SQL cumulée
+    'repetitions': 10,   # exécutions d'une même requête (N+1)
+}
+
+LISTE_IN = re.compile(r'\bIN \((?:%s, )*%s\)', re.IGNORECASE)
+LITTERAUX = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+ESPACES = re.compile(r'\s+')
+
+
+def empreinte(sql):
+    """Forme d'une requête : paramètres, listes IN et littéraux remplacés"""
+    sql = LISTE_IN.sub('IN (...)', sql)
+    sql = LITTERAUX.sub('?', sql)
+    return ESPACES.sub(' ', sql).strip()
+
+
+class ReleveSQL:
+    """Requêtes SQL d'une requête HTTP (à brancher par connection.execute_wrapper)"""
+
+    def __init__(self, lentes=3):
+        self.nombre = 0
+        self.duree = 0.0
+        self.empreintes = Counter()
+        self.lentes = lentes
+        self._plus_lentes = []  # tas (durée, rang, sql) des `lentes` requêtes les plus lentes
+
+    def __call__(self, execute, sql, params, many, context):
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.enregistrer(sql, time.perf_counter() - debut)
+
+    def enregistrer(self, sql, duree):
+        self.nombre += 1
+        self.duree += duree
+        self.empreintes[empreinte(sql)] += 1
+        heapq.heappush(self._plus_lentes, (duree, self.nombre, sql))
+        if len(self._plus_lentes) > self.lentes:
+            heapq.heappop(self._plus_lentes)
+
+    @property
+    def duree_ms(self):
+        return self.duree * 1000
+
+    def plus_lentes(self):
+        """[(durée en ms, sql)] de la plus lente à la moins lente"""
+        return [(duree * 1000, sql) for duree, _, sql in sorted(self._plus_lentes, reverse=True)]
+
+    def repetees(self, seuil):
+        """[(empreinte, exécutions)] des requêtes exécutées au moins `seuil` fois"""
+        return [(forme, nombre) for forme, nombre in self.empreintes.most_common() if nombre >= seuil]
+
+
+class InstrumentationSQLMiddleware:
+    """
+    Relevé SQL et temps de chaque vue ; à placer en tête de MIDDLEWARE pour
+    compter aussi les requêtes des autres middlewares (session, utilisateur).
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTATION_SQL', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.budget = {**BUDGET_PAR_DEFAUT, **getattr(settings, 'INSTRUMENTATION_SQL_BUDGET', {})}
+        self.lentes = getattr(settings, 'INSTRUMENTATION_SQL_LENTES', 3)
+
+    def __call__(self, request):
+        releve = ReleveSQL(self.lentes)
+        debut = time.perf_counter()
+        branchements = ExitStack()
+        for connexion in connections.all():
+            branchements.enter_context(connexion.execute_wrapper(releve))
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            branchements.close()
+            raise
+
+        if response.streaming:
+            # Le contenu en flux (StreamingHttpResponse, FileResponse) est produit
+            # après le retour de la vue : le relevé reste branché jusqu'à
+            # response.close() et n'est journalisé qu'alors. L'en-tête, envoyé
+            # avant le contenu, ne couvre que la vue.
+            self.ajouter_server_timing(response, releve, (time.perf_counter() - debut) * 1000)
+            response._resource_closers.append(
+                lambda: self.terminer(branchements, request, response, releve, debut)
+            )
+        else:
+            duree_ms = self.terminer(branchements, request, response, releve, debut)
+            self.ajouter_server_timing(response, releve, duree_ms)
+        return response
+
+    def terminer(self, branchements, request, response, releve, debut):
+        """Débranche le relevé et le journalise ; retourne la durée totale en ms"""
+        branchements.close()
+        duree_ms = (time.perf_counter() - debut) * 1000
+        self.journaliser(request, response, releve, duree_ms)
+        return duree_ms
+
+    def ajouter_server_timing(self, response, releve, duree_ms):
+        mesures = [
+            f'sql;dur={releve.duree_ms:.1f};desc="{releve.nombre} requetes"',
+            f'vue;dur={duree_ms:.1f}',
+        ]
+        if response.has_header('Server-Timing'):
+            mesures.insert(0, response['Server-Timing'])
+        response['Server-Timing'] = ', '.join(mesures)
+
+    def journaliser(self, request, response, releve, duree_ms):
+        correspondance = getattr(request, 'resolver_match', None)
+        vue = correspondance.view_name if correspondance else request.path
+        repetees = releve.repetees(self.budget['repetitions'])
+
+        depassements = []
+        if releve.nombre > self.budget['requetes']:
+            depassements.append(f"{releve.nombre} requêtes (budget {self.budget['requetes']})")
+        if releve.duree_ms > self.budget['duree_ms']:
+            depassements.append(f"{releve.duree_ms:.0f} ms de SQL (budget {self.budget['duree_ms']} ms)")
+        if repetees:
+            depassements.append(f"{len(repetees)} requête(s) répétée(s), N+1 probable")
+
+        resume = (
+            f"{request.method} {request.path} [{vue}] {response.status_code} : "
+            f"{releve.nombre} requêtes SQL, {releve.duree_ms:.1f} ms SQL, {duree_ms:.1f} ms au total"
+        )
+        if not depassements:
+            logger.debug(resume)
+            return
+
+        lignes = [f"{resume} — hors budget : {' ; '.join(depassements)}"]
+        for forme, nombre in repetees[:5]:
+            lignes.append(f"  × {nombre} : {forme[:300]}")
+        for duree, sql in releve.plus_lentes():
+            lignes.append(f"  {duree:.1f} ms : {sql[:300]}")
+        logger.warning('\n'.join(lignes))
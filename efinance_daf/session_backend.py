@@ -0,0 +1,82 @@
+"""
+Sessions en base, avec écritures regroupées
+
+Avec SESSION_SAVE_EVERY_REQUEST = True, le moteur de base de données écrit
+la session à chaque requête (page, appel AJAX, téléchargement PDF) rien que
+pour repousser son expiration. Ce moteur (SESSION_ENGINE) :
+  - écrit aussitôt une session modifiée ;
+  - pour une session seulement consultée, n'écrit le report de l'expiration
+    que lorsque celui-ci dépasse SESSION_SEUIL_RAFRAICHISSEMENT (par défaut un
+    dixième de SESSION_COOKIE_AGE), par un UPDATE de la seule colonne
+    expire_date.
+
+L'expiration glissante est conservée : le cookie est renouvelé à chaque
+réponse et l'expiration en base ne retarde jamais de plus du seuil.
+
+Avec un cache partagé par tous les processus (Redis, voir REDIS_URL dans les
+réglages), efinance_daf.session_backend_cache lit en plus les sessions dans
+le cache. La table de cache de la base n'épargnerait aucune requête : sans
+Redis, les sessions sont lues en base.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+
+
+def seuil_rafraichissement():
+    seuil = getattr(settings, 'SESSION_SEUIL_RAFRAICHISSEMENT', None)
+    if seuil is None:
+        seuil = settings.SESSION_COOKIE_AGE // 10
+    return timedelta(seconds=seuil)
+
+
+class SessionStore(DBStore):
+    """
+    Retient l'expiration enregistrée en base au chargement, pour décider sans
+    requête si elle doit être repoussée.
+    """
+
+    def __init__(self, session_key=None):
+        self._expiration_en_base = None
+        super().__init__(session_key)
+
+    def load(self):
+        s = self._get_session_from_db()
+        if not s:
+            self._expiration_en_base = None
+            return {}
+        self._expiration_en_base = s.expire_date
+        return self.decode(s.session_data)
+
+    def save(self, must_create=False):
+        if not must_create and not self.modified and self._expiration_en_base is not None:
+            self._reporter_expiration()
+            return
+        DBStore.save(self, must_create)
+        self._expiration_en_base = self.get_expiry_date()
+        self._session_enregistree()
+
+    def _reporter_expiration(self):
+        """Session inchangée : repousse l'expiration en base si elle a pris assez de retard"""
+        expiration = self.get_expiry_date()
+        if expiration - self._expiration_en_base < seuil_rafraichissement():
+            return
+        if not self._reserver_report():
+            return  # Une requête simultanée de la même session s'en charge
+        if not self.model.objects.filter(session_key=self.session_key).update(expire_date=expiration):
+            self._session_disparue()
+            return
+        self._expiration_en_base = expiration
+        self._session_enregistree()
+
+    # Points d'extension de efinance_daf.session_backend_cache
+
+    def _reserver_report(self):
+        return True
+
+    def _session_enregistree(self):
+        pass
+
+    def _session_disparue(self):
+        """Session supprimée entre-temps (déconnexion) : rien à reporter"""
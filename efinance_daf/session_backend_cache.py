@@ -0,0 +1,55 @@
+"""
+Sessions en cache et en base, avec écritures regroupées
+
+Moteur de efinance_daf.session_backend, lu en plus dans le cache comme
+cached_db : la base n'est lue qu'au premier accès ou après éviction. Une
+session modifiée est écrite aussitôt en base et dans le cache ; les requêtes
+simultanées d'une même session ne font qu'un report d'expiration.
+
+À n'utiliser qu'avec un cache partagé par tous les processus (Redis,
+SESSION_CACHE_ALIAS) : les réglages ne le choisissent que si REDIS_URL est
+défini.
+"""
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+from .session_backend import SessionStore as SessionStoreBase
+
+
+KEY_PREFIX = 'efinance_daf.session_backend'
+
+# Durée pendant laquelle un report d'expiration en cours écarte les autres
+DUREE_VERROU = 60
+
+
+class SessionStore(SessionStoreBase, CachedDBStore):
+    """Le cache contient {'donnees': ..., 'expiration': ...}"""
+    cache_key_prefix = KEY_PREFIX
+
+    def load(self):
+        try:
+            entree = self._cache.get(self.cache_key)
+        except Exception:
+            # Clé refusée par le cache (voir cached_db) : la session est relue en base
+            entree = None
+
+        if entree is None:
+            donnees = super().load()
+            if self._expiration_en_base is None:
+                return {}
+            entree = {'donnees': donnees, 'expiration': self._expiration_en_base}
+            self._mettre_en_cache(entree)
+        self._expiration_en_base = entree['expiration']
+        return entree['donnees']
+
+    def _reserver_report(self):
+        return self._cache.add(f'{self.cache_key}:report', True, DUREE_VERROU)
+
+    def _session_enregistree(self):
+        self._mettre_en_cache({'donnees': self._session, 'expiration': self._expiration_en_base})
+
+    def _session_disparue(self):
+        # Ne pas la remettre en cache
+        self._cache.delete(self.cache_key)
+
+    def _mettre_en_cache(self, entree):
+        self._cache.set(self.cache_key, entree, self.get_expiry_age(expiry=entree['expiration']))
@@ -72,6 +72,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'efinance_daf.instrumentation.InstrumentationSQLMiddleware',  # Relevé SQL par requête (si INSTRUMENTATION_SQL)
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'efinance_daf.middleware.SessionInterruptedMiddleware',  # Gestion gracieuse des sessions interrompues (juste après SessionMiddleware)
@@ -132,6 +133,9 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Base de test sur fichier (et non en mémoire) : les tests de
+            # concurrence ouvrent une connexion par thread
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
         }
     }
 
@@ -180,6 +184,23 @@ STATICFILES_DIRS = [
 MEDIA_URL = config('MEDIA_URL', default='/media/')
 MEDIA_ROOT = config('MEDIA_ROOT', default=BASE_DIR / 'media')
 
+# Génération des états en arrière-plan par `manage.py run_report_worker` : à
+# n'activer que là où ce travailleur tourne (service worker de docker-compose),
+# sinon les états restent en GENERATION. Par défaut, génération dans la requête.
+ETATS_GENERATION_ASYNCHRONE = config('ETATS_GENERATION_ASYNCHRONE', default=False, cast=bool)
+
+# Cache disque des rapports générés (voir rapports.cache_artefacts)
+RAPPORTS_CACHE_REPERTOIRE = config('RAPPORTS_CACHE_REPERTOIRE', default=Path(MEDIA_ROOT) / 'cache_rapports')
+RAPPORTS_CACHE_TAILLE_MAX = config('RAPPORTS_CACHE_TAILLE_MAX', default=200 * 1024 * 1024, cast=int)
+
+# Génération des états par lot depuis l'administration : thread ou direct.
+# L'action s'exécute dans la requête : pas de pool de processus dans un worker
+# gunicorn (process est réservé à la commande generate_etats_batch).
+ETATS_LOT_MODE = config('ETATS_LOT_MODE', default='thread')
+# Rapports générés simultanément par l'action (chaque thread ouvre sa connexion
+# et construit un document en mémoire) ; les gros lots relèvent de la commande
+ETATS_LOT_CONCURRENCE = config('ETATS_LOT_CONCURRENCE', default=2, cast=int)
+
 # Production settings
 if not DEBUG:
     # Security settings
@@ -272,7 +293,22 @@ LOGOUT_REDIRECT_URL = 'accounts:login'
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10 MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10 MB
 
+# Cache partagé par tous les processus gunicorn (sessions, permissions RBAC) :
+# Redis si REDIS_URL est défini (paquet redis requis), sinon une table de la base
+# créée par la migration accounts 0010 (ou `manage.py createcachetable`)
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'efinance_cache'}}
+
 # Session settings
+# Sessions en base ; le report d'expiration n'est écrit qu'une fois par
+# SESSION_SEUIL_RAFRAICHISSEMENT secondes (None : 1/10 de SESSION_COOKIE_AGE).
+# Avec Redis, elles sont aussi lues dans le cache (la table de cache de la base
+# n'épargnerait aucune requête)
+SESSION_ENGINE = 'efinance_daf.session_backend_cache' if REDIS_URL else 'efinance_daf.session_backend'
+SESSION_SEUIL_RAFRAICHISSEMENT = None
 SESSION_SAVE_EVERY_REQUEST = True
 SESSION_COOKIE_SECURE = False  # True en production avec HTTPS
 SESSION_COOKIE_HTTPONLY = True
@@ -318,6 +354,22 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': True,
         },
+        'efinance_daf.instrumentation': {
+            'handlers': ['console', 'file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
+
+# Instrumentation SQL par requête (efinance_daf.instrumentation) : en-tête
+# Server-Timing et WARNING quand une vue dépasse le budget
+INSTRUMENTATION_SQL = config('INSTRUMENTATION_SQL', default=False, cast=bool)
+INSTRUMENTATION_SQL_BUDGET = {
+    'requetes': config('INSTRUMENTATION_SQL_MAX_REQUETES', default=50, cast=int),
+    'duree_ms': config('INSTRUMENTATION_SQL_MAX_MS', default=500, cast=int),
+    'repetitions': config('INSTRUMENTATION_SQL_MAX_REPETITIONS', default=10, cast=int),
+}
+INSTRUMENTATION_SQL_LENTES = 3
+
 CSRF_TRUSTED_ORIGINS = ['http://187.77.171.80:8000']
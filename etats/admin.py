@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import EtatGenerique, ConfigurationEtat, HistoriqueGeneration
+from .models import EtatGenerique, ConfigurationEtat, HistoriqueGeneration, TacheGeneration
 
 
 @admin.register(EtatGenerique)
@@ -11,7 +11,7 @@ class EtatGeneriqueAdmin(admin.ModelAdmin):
     
     fieldsets = (
         ('Informations générales', {
-            'fields': ('titre', 'type_etat', 'description', 'statut')
+            'fields': ('titre', 'type_etat', 'description', 'statut', 'progression', 'message_progression')
         }),
         ('Période', {
             'fields': ('date_debut', 'date_fin', 'periodicite')
@@ -49,3 +49,11 @@ class HistoriqueGenerationAdmin(admin.ModelAdmin):
     list_display = ['etat', 'action', 'utilisateur', 'date_action']
     list_filter = ['action', 'date_action']
     search_fields = ['etat__titre', 'utilisateur__username']
+
+
+@admin.register(TacheGeneration)
+class TacheGenerationAdmin(admin.ModelAdmin):
+    list_display = ['etat', 'statut', 'tentatives', 'max_tentatives', 'travailleur', 'executer_apres', 'date_fin']
+    list_filter = ['statut', 'date_creation']
+    search_fields = ['etat__titre', 'travailleur']
+    readonly_fields = ['jeton', 'travailleur', 'date_limite', 'date_creation', 'date_debut', 'date_fin', 'derniere_erreur']
@@ -0,0 +1,147 @@
+"""
+Travailleur de génération des états en arrière-plan
+
+Réserve les tâches TacheGeneration en attente et les exécute dans un pool de
+threads ou de processus. Plusieurs travailleurs peuvent tourner en parallèle
+(sur une ou plusieurs machines) : la réservation d'une tâche est atomique.
+Les tâches dont la date limite est dépassée sont remises en file (ou passées
+en échec après leur dernière tentative) ; un thread bloqué ne peut pas être
+interrompu, mais son résultat tardif est ignoré.
+
+Le même travailleur analyse puis importe les feuilles téléversées depuis
+l'application (ImportFeuilleWeb, voir tableau_bord_feuilles.taches_import)
+quand aucune génération d'état n'est en attente.
+"""
+import os
+import signal
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.core.management.base import BaseCommand
+
+from efinance_daf.executeurs import MODES, executeur
+from etats.models import TacheGeneration
+from tableau_bord_feuilles.models import ImportFeuilleWeb
+
+
+class Command(BaseCommand):
+    help = "Exécute en arrière-plan les générations d'états et les imports de feuilles mis en file d'attente"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrence',
+            type=int,
+            default=2,
+            help='Nombre de générations simultanées (défaut : 2)'
+        )
+        parser.add_argument(
+            '--mode',
+            choices=MODES,
+            default='thread',
+            help='Pool de threads ou de processus, ou direct : une tâche à la fois dans le processus principal (défaut : thread)'
+        )
+        parser.add_argument(
+            '--intervalle',
+            type=float,
+            default=2.0,
+            help="Secondes entre deux recherches de tâches quand la file est vide (défaut : 2)"
+        )
+        parser.add_argument(
+            '--une-fois',
+            action='store_true',
+            help="Traiter les tâches disponibles puis s'arrêter (cron, tests)"
+        )
+
+    def handle(self, *args, **options):
+        concurrence = max(1, options['concurrence'])
+        self.arret_demande = False
+        self.travailleur = f"{socket.gethostname()}:{os.getpid()}"
+        gestionnaires = {}
+        for signal_arret in (signal.SIGINT, signal.SIGTERM):
+            try:
+                gestionnaires[signal_arret] = signal.signal(signal_arret, self._demander_arret)
+            except ValueError:
+                # Hors du thread principal
+                pass
+
+        from etats.taches import executer_tache
+        from tableau_bord_feuilles.taches_import import executer as executer_import
+        if options['mode'] == 'direct':
+            # Une tâche à la fois ; la connexion du thread principal reste ouverte
+            concurrence = 1
+        pool = executeur(options['mode'], concurrence, nom='etats')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Travailleur {self.travailleur} démarré ({options["mode"]}, {concurrence} simultanée(s))'
+        ))
+        en_cours = {}
+        traitees = 0
+        try:
+            while not self.arret_demande:
+                expirees = TacheGeneration.expirer_taches_depassees()
+                if expirees:
+                    self.stdout.write(self.style.WARNING(f'⚠ {expirees} tâche(s) expirée(s) remise(s) en file'))
+                expirees = ImportFeuilleWeb.expirer_imports_depasses()
+                if expirees:
+                    self.stdout.write(self.style.WARNING(f'⚠ {expirees} import(s) expiré(s) remis en file'))
+
+                reservees = 0
+                while len(en_cours) < concurrence:
+                    tache = TacheGeneration.reserver(self.travailleur)
+                    if tache is None:
+                        break
+                    reservees += 1
+                    self.stdout.write(f'→ Tâche {tache.pk} : {tache.etat.titre} (tentative {tache.tentatives})')
+                    en_cours[pool.submit(executer_tache, tache.pk, tache.jeton)] = f'Tâche {tache.pk}'
+                while len(en_cours) < concurrence:
+                    import_feuille = ImportFeuilleWeb.reserver(self.travailleur)
+                    if import_feuille is None:
+                        break
+                    reservees += 1
+                    self.stdout.write(
+                        f'→ Import {import_feuille.pk} : {import_feuille.get_statut_display()} '
+                        f'{import_feuille.nom_fichier} [{import_feuille.feuille}]'
+                    )
+                    en_cours[pool.submit(executer_import, import_feuille.pk, import_feuille.jeton)] = f'Import {import_feuille.pk}'
+
+                if not en_cours:
+                    if options['une_fois'] and not reservees:
+                        break
+                    time.sleep(options['intervalle'])
+                    continue
+
+                terminees, _ = wait(list(en_cours), timeout=options['intervalle'], return_when=FIRST_COMPLETED)
+                for future in terminees:
+                    traitees += 1
+                    self._compte_rendu(en_cours.pop(future), future)
+        finally:
+            # Arrêt propre : les générations commencées vont à leur terme
+            for future in list(en_cours):
+                self._compte_rendu(en_cours.pop(future), future)
+                traitees += 1
+            pool.shutdown(wait=True)
+            for signal_arret, gestionnaire in gestionnaires.items():
+                signal.signal(signal_arret, gestionnaire)
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Travailleur arrêté, {traitees} tâche(s) traitée(s)'))
+
+    def _compte_rendu(self, libelle, future):
+        try:
+            nombre = future.result()
+        except Exception as e:
+            # Erreur hors de la génération (processus interrompu, base indisponible)
+            self.stdout.write(self.style.ERROR(f'✗ {libelle} : {e}'))
+            return
+        tache = libelle.startswith('Tâche')
+        if nombre is None:
+            detail = 'TacheGeneration.derniere_erreur' if tache else 'ImportFeuilleWeb.message'
+            self.stdout.write(self.style.ERROR(f'✗ {libelle} en échec (voir {detail})'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ {libelle} {"terminée" if tache else "terminé"}, {nombre} enregistrement(s)'
+            ))
+
+    def _demander_arret(self, signum, frame):
+        self.stdout.write(self.style.WARNING('⚠ Arrêt demandé, fin des générations en cours...'))
+        self.arret_demande = True
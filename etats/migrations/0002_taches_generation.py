@@ -0,0 +1,50 @@
+# Generated by Django 5.0.4 on 2026-10-17 23:30
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('etats', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='etatgenerique',
+            name='message_progression',
+            field=models.CharField(blank=True, max_length=200, verbose_name='Étape en cours'),
+        ),
+        migrations.AddField(
+            model_name='etatgenerique',
+            name='progression',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Progression (%)'),
+        ),
+        migrations.CreateModel(
+            name='TacheGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('statut', models.CharField(choices=[('EN_ATTENTE', 'En attente'), ('EN_COURS', 'En cours'), ('TERMINEE', 'Terminée'), ('ECHEC', 'Échec')], default='EN_ATTENTE', max_length=20)),
+                ('tentatives', models.PositiveSmallIntegerField(default=0)),
+                ('max_tentatives', models.PositiveSmallIntegerField(default=3, verbose_name='Nombre maximal de tentatives')),
+                ('delai_max', models.PositiveIntegerField(default=600, verbose_name="Durée maximale d'exécution (s)")),
+                ('executer_apres', models.DateTimeField(default=django.utils.timezone.now)),
+                ('jeton', models.UUIDField(blank=True, editable=False, null=True)),
+                ('travailleur', models.CharField(blank=True, max_length=100)),
+                ('date_limite', models.DateTimeField(blank=True, null=True)),
+                ('derniere_erreur', models.TextField(blank=True)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_debut', models.DateTimeField(blank=True, null=True)),
+                ('date_fin', models.DateTimeField(blank=True, null=True)),
+                ('etat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='taches', to='etats.etatgenerique')),
+            ],
+            options={
+                'verbose_name': 'Tâche de génération',
+                'verbose_name_plural': 'Tâches de génération',
+                'ordering': ['date_creation'],
+                'indexes': [models.Index(fields=['statut', 'executer_apres'], name='etats_tache_statut_35d994_idx'), models.Index(fields=['statut', 'date_limite'], name='etats_tache_statut_b69a55_idx')],
+            },
+        ),
+    ]
@@ -1,6 +1,9 @@
 """
 Modèles pour la gestion des états générés
 """
+import uuid
+from datetime import timedelta
+
 from django.db import models
 from django.core.validators import MinValueValidator
 from decimal import Decimal
@@ -68,6 +71,8 @@ class EtatGenerique(models.Model):
     date_generation = models.DateTimeField(auto_now_add=True)
     date_modification = models.DateTimeField(auto_now=True)
     statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='GENERATION')
+    progression = models.PositiveSmallIntegerField(default=0, verbose_name="Progression (%)")
+    message_progression = models.CharField(max_length=200, blank=True, verbose_name="Étape en cours")
     
     # Paramètres supplémentaires (JSON)
     filtres_supplementaires = models.JSONField(default=dict, blank=True, verbose_name="Filtres supplémentaires")
@@ -145,3 +150,152 @@ class HistoriqueGeneration(models.Model):
     
     def __str__(self):
         return f"{self.action} - {self.etat.titre} par {self.utilisateur.username}"
+
+
+class TacheGeneration(models.Model):
+    """
+    File d'attente des générations d'états, traitée par `manage.py run_report_worker`.
+
+    Une tâche est réservée par une mise à jour conditionnelle (EN_ATTENTE ->
+    EN_COURS) qui lui attribue un jeton ; toutes les écritures suivantes du
+    travailleur portent sur ce jeton, si bien qu'une tâche expirée puis
+    reprise par un autre travailleur ne peut plus être modifiée par le premier.
+    """
+    
+    STATUT_CHOICES = [
+        ('EN_ATTENTE', 'En attente'),
+        ('EN_COURS', 'En cours'),
+        ('TERMINEE', 'Terminée'),
+        ('ECHEC', 'Échec'),
+    ]
+    
+    # Délai avant nouvelle tentative : 30 s, 60 s, 120 s...
+    DELAI_NOUVELLE_TENTATIVE = 30
+    
+    etat = models.ForeignKey(EtatGenerique, on_delete=models.CASCADE, related_name='taches')
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='EN_ATTENTE')
+    tentatives = models.PositiveSmallIntegerField(default=0)
+    max_tentatives = models.PositiveSmallIntegerField(default=3, verbose_name="Nombre maximal de tentatives")
+    delai_max = models.PositiveIntegerField(default=600, verbose_name="Durée maximale d'exécution (s)")
+    executer_apres = models.DateTimeField(default=timezone.now)
+    
+    # Réservation par un travailleur
+    jeton = models.UUIDField(null=True, blank=True, editable=False)
+    travailleur = models.CharField(max_length=100, blank=True)
+    date_limite = models.DateTimeField(null=True, blank=True)
+    
+    derniere_erreur = models.TextField(blank=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_debut = models.DateTimeField(null=True, blank=True)
+    date_fin = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Tâche de génération"
+        verbose_name_plural = "Tâches de génération"
+        ordering = ['date_creation']
+        indexes = [
+            models.Index(fields=['statut', 'executer_apres']),
+            models.Index(fields=['statut', 'date_limite']),
+        ]
+    
+    def __str__(self):
+        return f"Tâche {self.pk} - {self.etat.titre} ({self.get_statut_display()})"
+    
+    @classmethod
+    def planifier(cls, etat, **options):
+        """
+        Met l'état en file d'attente (sans doublon si une tâche est déjà en
+        attente ou en cours) et le repasse au statut GENERATION.
+        """
+        tache = cls.objects.filter(etat=etat, statut__in=['EN_ATTENTE', 'EN_COURS']).first()
+        if tache is None:
+            tache = cls.objects.create(etat=etat, **options)
+        EtatGenerique.objects.filter(pk=etat.pk).update(
+            statut='GENERATION', progression=0, message_progression="En attente d'un travailleur"
+        )
+        return tache
+    
+    @classmethod
+    def reserver(cls, travailleur, queryset=None):
+        """
+        Réserve la prochaine tâche exécutable pour `travailleur`, None s'il n'y
+        en a pas. Sûr entre plusieurs travailleurs : seule la mise à jour qui
+        trouve encore la tâche EN_ATTENTE l'obtient.
+        """
+        candidates = (queryset if queryset is not None else cls.objects.all()).filter(
+            statut='EN_ATTENTE', executer_apres__lte=timezone.now()
+        ).order_by('executer_apres', 'pk').values_list('pk', 'delai_max')
+        for pk, delai_max in candidates[:10]:
+            maintenant = timezone.now()
+            jeton = uuid.uuid4()
+            reservee = cls.objects.filter(pk=pk, statut='EN_ATTENTE').update(
+                statut='EN_COURS',
+                jeton=jeton,
+                travailleur=travailleur[:100],
+                tentatives=models.F('tentatives') + 1,
+                date_debut=maintenant,
+                date_limite=maintenant + timedelta(seconds=delai_max),
+            )
+            if reservee:
+                return cls.objects.select_related('etat').get(pk=pk)
+        return None
+    
+    def _mettre_a_jour(self, **champs):
+        """Écrit seulement si la tâche appartient toujours à ce jeton ; retourne True si c'est le cas"""
+        return bool(TacheGeneration.objects.filter(pk=self.pk, jeton=self.jeton, statut='EN_COURS').update(**champs))
+    
+    def est_active(self):
+        return TacheGeneration.objects.filter(pk=self.pk, jeton=self.jeton, statut='EN_COURS').exists()
+    
+    def signaler_progression(self, pourcentage, message=''):
+        """Reporte l'avancement sur l'état, tant que la tâche n'a pas expiré"""
+        if not self.est_active():
+            return False
+        pourcentage = max(0, min(100, int(pourcentage)))
+        EtatGenerique.objects.filter(pk=self.etat_id).update(progression=pourcentage, message_progression=message[:200])
+        # L'état en mémoire est réenregistré par la génération : il doit rester à jour
+        self.etat.progression = pourcentage
+        self.etat.message_progression = message[:200]
+        return True
+    
+    def terminer(self):
+        if self._mettre_a_jour(statut='TERMINEE', date_fin=timezone.now(), derniere_erreur=''):
+            EtatGenerique.objects.filter(pk=self.etat_id).update(
+                statut='GENERE', progression=100, message_progression='Terminé'
+            )
+            return True
+        return False
+    
+    def echouer(self, erreur):
+        """
+        Enregistre l'échec : nouvelle tentative différée tant que
+        max_tentatives n'est pas atteint, sinon l'état passe en ERREUR.
+        """
+        self.refresh_from_db(fields=['tentatives', 'max_tentatives'])
+        if self.tentatives < self.max_tentatives:
+            delai = self.DELAI_NOUVELLE_TENTATIVE * 2 ** (self.tentatives - 1)
+            if self._mettre_a_jour(
+                statut='EN_ATTENTE', derniere_erreur=erreur, date_limite=None,
+                executer_apres=timezone.now() + timedelta(seconds=delai),
+            ):
+                EtatGenerique.objects.filter(pk=self.etat_id).update(
+                    progression=0,
+                    message_progression=f"Échec de la tentative {self.tentatives}, nouvel essai dans {delai} s"
+                )
+                return True
+            return False
+        if self._mettre_a_jour(statut='ECHEC', derniere_erreur=erreur, date_fin=timezone.now()):
+            EtatGenerique.objects.filter(pk=self.etat_id).update(
+                statut='ERREUR', message_progression=erreur.strip().splitlines()[-1][:200] if erreur.strip() else ''
+            )
+            return True
+        return False
+    
+    @classmethod
+    def expirer_taches_depassees(cls):
+        """Traite comme des échecs les tâches EN_COURS dont la date limite est passée (travailleur bloqué ou arrêté)"""
+        nombre = 0
+        for tache in cls.objects.filter(statut='EN_COURS', date_limite__lt=timezone.now()):
+            if tache.echouer(f"Délai d'exécution dépassé ({tache.delai_max} s)"):
+                nombre += 1
+        return nombre
@@ -0,0 +1,46 @@
+"""
+Exécution des tâches de génération d'états (voir TacheGeneration).
+
+`executer_tache` est appelée par le travailleur `manage.py run_report_worker`
+(thread ou processus), ou directement dans la requête quand la génération
+asynchrone est désactivée (ETATS_GENERATION_ASYNCHRONE = False).
+"""
+import logging
+import traceback
+
+from .models import TacheGeneration
+
+logger = logging.getLogger('etats')
+
+
+class TacheExpiree(Exception):
+    """La tâche a dépassé son délai et a été reprise : le travail en cours est abandonné"""
+
+
+def executer_tache(pk, jeton):
+    """
+    Génère les fichiers de l'état d'une tâche réservée avec `jeton`.
+    Retourne le nombre d'enregistrements de l'état, None en cas d'échec.
+    """
+    from .views import EtatGenererView
+
+    tache = TacheGeneration.objects.select_related('etat').get(pk=pk)
+    if tache.jeton != jeton:
+        return None
+
+    def progression(pourcentage, message):
+        if not tache.signaler_progression(pourcentage, message):
+            raise TacheExpiree()
+
+    try:
+        nombre = EtatGenererView().generer_fichiers(tache.etat, progression)
+    except TacheExpiree:
+        logger.warning("Tâche %s expirée, génération de l'état %s abandonnée", pk, tache.etat_id)
+        return None
+    except Exception:
+        logger.exception("Erreur lors de la génération de l'état %s (tâche %s)", tache.etat_id, pk)
+        tache.echouer(traceback.format_exc())
+        return None
+
+    tache.terminer()
+    return nombre
@@ -0,0 +1,173 @@
+import shutil
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import User
+from .models import EtatGenerique, TacheGeneration
+from .views import EtatGenererView
+
+
+MEDIA_TEST = tempfile.mkdtemp()
+CACHE_TEST = f'{MEDIA_TEST}/cache_rapports'
+
+
+@override_settings(MEDIA_ROOT=MEDIA_TEST, RAPPORTS_CACHE_REPERTOIRE=CACHE_TEST)
+class TacheGenerationTests(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_TEST, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.utilisateur = User.objects.create_user('daf', password='x', role='SUPER_ADMIN')
+
+    def creer_etat(self, format_sortie='LES_DEUX'):
+        return EtatGenerique.objects.create(
+            titre='Demandes du mois', type_etat='DEMANDE_PAIEMENT',
+            date_debut=date(2025, 1, 1), date_fin=date(2025, 1, 31), genere_par=self.utilisateur,
+            parametres_affichage={'format_sortie': format_sortie},
+        )
+
+    def test_planifier_sans_doublon(self):
+        etat = self.creer_etat()
+        tache = TacheGeneration.planifier(etat)
+        self.assertEqual(TacheGeneration.planifier(etat), tache)
+        etat.refresh_from_db()
+        self.assertEqual((etat.statut, etat.progression), ('GENERATION', 0))
+
+    def test_reservation_unique(self):
+        TacheGeneration.planifier(self.creer_etat())
+        tache = TacheGeneration.reserver('travailleur-1')
+        self.assertEqual((tache.statut, tache.tentatives, tache.travailleur), ('EN_COURS', 1, 'travailleur-1'))
+        self.assertIsNone(TacheGeneration.reserver('travailleur-2'))
+
+    def test_nouvelle_tentative_puis_echec(self):
+        etat = self.creer_etat()
+        TacheGeneration.planifier(etat, max_tentatives=2)
+
+        tache = TacheGeneration.reserver('t')
+        self.assertTrue(tache.echouer('Traceback\nValueError: montant invalide'))
+        tache.refresh_from_db()
+        self.assertEqual(tache.statut, 'EN_ATTENTE')
+        self.assertGreater(tache.executer_apres, timezone.now())
+        # Le premier travailleur ne peut plus écrire sur la tâche
+        self.assertFalse(tache.terminer())
+
+        TacheGeneration.objects.filter(pk=tache.pk).update(executer_apres=timezone.now())
+        tache = TacheGeneration.reserver('t')
+        self.assertEqual(tache.tentatives, 2)
+        tache.echouer('Traceback\nValueError: montant invalide')
+        tache.refresh_from_db()
+        etat.refresh_from_db()
+        self.assertEqual(tache.statut, 'ECHEC')
+        self.assertEqual((etat.statut, etat.message_progression), ('ERREUR', 'ValueError: montant invalide'))
+
+    def test_tache_expiree_remise_en_file(self):
+        TacheGeneration.planifier(self.creer_etat())
+        tache = TacheGeneration.reserver('t')
+        TacheGeneration.objects.filter(pk=tache.pk).update(date_limite=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(TacheGeneration.expirer_taches_depassees(), 1)
+        tache.refresh_from_db()
+        self.assertEqual(tache.statut, 'EN_ATTENTE')
+        self.assertIn('Délai', tache.derniere_erreur)
+
+    @override_settings(ETATS_GENERATION_ASYNCHRONE=True)
+    def test_travailleur_genere_l_etat(self):
+        etat = self.creer_etat()
+        self.client.force_login(self.utilisateur)
+        response = self.client.get(f'/etats/generer/{etat.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, f'/etats/progression/{etat.pk}/')
+
+        sortie = StringIO()
+        call_command('run_report_worker', '--une-fois', '--mode', 'direct', stdout=sortie)
+        self.assertIn('terminée', sortie.getvalue())
+
+        etat.refresh_from_db()
+        self.assertEqual((etat.statut, etat.progression), ('GENERE', 100))
+        self.assertTrue(etat.fichier_pdf)
+        self.assertTrue(etat.fichier_excel)
+        self.assertEqual(etat.taches.get().statut, 'TERMINEE')
+
+        donnees = self.client.get(f'/etats/progression/{etat.pk}/').json()
+        self.assertEqual((donnees['statut'], donnees['termine'], donnees['tache']['statut']), ('GENERE', True, 'TERMINEE'))
+
+    @override_settings(ETATS_GENERATION_ASYNCHRONE=False)
+    def test_generation_synchrone(self):
+        etat = self.creer_etat(format_sortie='EXCEL')
+        self.client.force_login(self.utilisateur)
+        response = self.client.get(f'/etats/generer/{etat.pk}/')
+        self.assertRedirects(response, f'/etats/detail/{etat.pk}/', fetch_redirect_response=False)
+        etat.refresh_from_db()
+        self.assertEqual(etat.statut, 'GENERE')
+        self.assertTrue(etat.fichier_excel)
+
+    @override_settings(ETATS_GENERATION_ASYNCHRONE=False)
+    def test_generation_synchrone_deja_en_cours(self):
+        etat = self.creer_etat(format_sortie='EXCEL')
+        tache = TacheGeneration.planifier(etat)
+        TacheGeneration.reserver('autre-requete')
+        self.client.force_login(self.utilisateur)
+        response = self.client.get(f'/etats/generer/{etat.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['tache'], tache)
+        self.assertEqual(TacheGeneration.objects.get().statut, 'EN_COURS')
+
+    def test_fichiers_repris_du_cache(self):
+        shutil.rmtree(CACHE_TEST, ignore_errors=True)
+        vue = EtatGenererView()
+        premier = self.creer_etat()
+        vue.generer_fichiers(premier)
+
+        second = self.creer_etat()
+        with mock.patch.object(EtatGenererView, 'generer_pdf') as generer_pdf, \
+                mock.patch.object(EtatGenererView, 'generer_excel') as generer_excel:
+            vue.generer_fichiers(second)
+        generer_pdf.assert_not_called()
+        generer_excel.assert_not_called()
+        with premier.fichier_pdf.open('rb') as a, second.fichier_pdf.open('rb') as b:
+            self.assertEqual(a.read(), b.read())
+
+        # Téléchargement : fichier de l'état servi sans recalculer les données
+        self.client.force_login(self.utilisateur)
+        with mock.patch.object(EtatGenererView, 'calculer_donnees') as calculer_donnees:
+            response = self.client.get(f'/etats/telecharger/{second.pk}/excel/')
+        calculer_donnees.assert_not_called()
+        with second.fichier_excel.open('rb') as fichier:
+            self.assertEqual(b''.join(response.streaming_content), fichier.read())
+
+        # Filtres différents : nouvelle génération
+        troisieme = self.creer_etat()
+        troisieme.filtres_supplementaires = {'devise': 'USD'}
+        with mock.patch.object(EtatGenererView, 'generer_pdf') as generer_pdf:
+            vue.generer_fichiers(troisieme)
+        generer_pdf.assert_called_once()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_TEST, RAPPORTS_CACHE_REPERTOIRE=CACHE_TEST)
+class TravailleurPoolTests(TransactionTestCase):
+
+    def test_pool_de_threads(self):
+        utilisateur = User.objects.create_user('daf', password='x', role='SUPER_ADMIN')
+        etats = [
+            EtatGenerique.objects.create(
+                titre=f'État {i}', type_etat='DEMANDE_PAIEMENT', date_debut=date(2025, 1, 1),
+                date_fin=date(2025, 1, 31), genere_par=utilisateur, parametres_affichage={'format_sortie': 'EXCEL'},
+            )
+            for i in range(4)
+        ]
+        for etat in etats:
+            TacheGeneration.planifier(etat)
+
+        call_command('run_report_worker', '--une-fois', '--concurrence', '3', '--intervalle', '0.1', stdout=StringIO())
+        self.assertEqual(set(TacheGeneration.objects.values_list('statut', flat=True)), {'TERMINEE'})
+        self.assertEqual(EtatGenerique.objects.filter(statut='GENERE').count(), 4)
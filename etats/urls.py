@@ -15,6 +15,7 @@ urlpatterns = [
     path('preview/', views.EtatPreviewView.as_view(), name='preview'),
     path('create/', views.EtatCreateAjaxView.as_view(), name='create_ajax'),
     path('generer/<int:pk>/', views.EtatGenererView.as_view(), name='generer'),
+    path('progression/<int:pk>/', views.EtatProgressionView.as_view(), name='progression'),
     
     # Détails et téléchargement
     path('detail/<int:pk>/', views.EtatDetailView.as_view(), name='detail'),
@@ -4,10 +4,11 @@ Vues pour la gestion des états
 import logging
 from django.views.generic import ListView, CreateView, DetailView, View
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.urls import reverse_lazy
+from django.conf import settings
+from django.urls import reverse, reverse_lazy
 from django.shortcuts import redirect, get_object_or_404, render
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
+from django.http import FileResponse, JsonResponse, HttpResponse
 from django.db.models import Q, Sum
 from django.utils import timezone
 from decimal import Decimal
@@ -15,8 +16,7 @@ from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import cm
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+from reportlab.lib.enums import TA_RIGHT
 from reportlab.platypus.doctemplate import PageTemplate, BaseDocTemplate
 from accounts.permissions import RoleRequiredMixin
 from reportlab.platypus.frames import Frame
@@ -26,13 +26,16 @@ import json
 
 logger = logging.getLogger('etats')
 
-from .models import EtatGenerique, ConfigurationEtat, HistoriqueGeneration
+from .models import EtatGenerique, ConfigurationEtat, HistoriqueGeneration, TacheGeneration
 from .forms import EtatSelectionForm, FiltresAvancesForm
 from demandes.models import DemandePaiement, ReleveDepense, Depense, Paiement, NatureEconomique
 from recettes.models import Recette
 from releves.models import ReleveBancaire
 from accounts.models import Service
 from banques.models import Banque, CompteBancaire
+from rapports.cache_artefacts import CacheRapports, version_donnees
+from rapports.excel_flux import CONTENT_TYPE_XLSX
+from rapports.mise_en_page_pdf import styles_pdf
 
 
 class EtatListView(LoginRequiredMixin, ListView):
@@ -750,7 +753,12 @@ class EtatDetailView(LoginRequiredMixin, DetailView):
 
 
 class EtatGenererView(LoginRequiredMixin, DetailView):
-    """Vue pour générer les fichiers d'un état"""
+    """
+    Vue pour générer les fichiers d'un état. La génération est confiée au
+    travailleur (manage.py run_report_worker) : la page d'attente suit sa
+    progression via EtatProgressionView. Si ETATS_GENERATION_ASYNCHRONE est
+    désactivé, l'état est généré dans la requête comme auparavant.
+    """
     model = EtatGenerique
     template_name = 'etats/etat_generer.html'
     context_object_name = 'etat'
@@ -758,48 +766,108 @@ class EtatGenererView(LoginRequiredMixin, DetailView):
     def get(self, request, *args, **kwargs):
         etat = self.get_object()
         
-        try:
-            # Calculer les données selon le type d'état
-            donnees = self.calculer_donnees(etat)
-            
-            # Mettre à jour les totaux
-            etat.total_usd = donnees.get('total_usd', Decimal('0.00'))
-            etat.total_cdf = donnees.get('total_cdf', Decimal('0.00'))
-            etat.save()
-            
-            # Générer les fichiers selon le format demandé
-            format_sortie = etat.parametres_affichage.get('format_sortie', 'PDF')
-            
-            if format_sortie in ['PDF', 'LES_DEUX']:
+        if getattr(settings, 'ETATS_GENERATION_ASYNCHRONE', False):
+            tache = TacheGeneration.planifier(etat)
+            return render(request, self.template_name, {'etat': etat, 'tache': tache})
+        
+        # Génération dans la requête, sans nouvelle tentative ; une tâche en attente
+        # reprise (nouvel essai différé) est exécutée tout de suite
+        from .taches import executer_tache
+        planifiee = TacheGeneration.planifier(etat, max_tentatives=1)
+        TacheGeneration.objects.filter(pk=planifiee.pk, statut='EN_ATTENTE').update(executer_apres=timezone.now())
+        tache = TacheGeneration.reserver('requete', TacheGeneration.objects.filter(pk=planifiee.pk))
+        if tache is None:
+            # Déjà en cours dans une autre requête : page d'attente, qui suit sa progression
+            return render(request, self.template_name, {'etat': etat, 'tache': planifiee})
+        nombre = executer_tache(tache.pk, tache.jeton)
+        
+        if nombre is None:
+            etat.refresh_from_db()
+            messages.error(request, f'Erreur lors de la génération: {etat.message_progression}')
+        elif nombre == 0:
+            messages.info(request, f'État généré avec succès! Aucune donnée trouvée pour la période sélectionnée.')
+        else:
+            messages.success(request, f'État généré avec succès! {nombre} enregistrement(s) trouvé(s).')
+        return redirect('etats:detail', pk=etat.pk)
+    
+    def generer_fichiers(self, etat, progression=None):
+        """
+        Calcule les données de l'état et écrit ses fichiers. `progression`
+        (pourcentage, message) est appelée au début de chaque étape.
+        Retourne le nombre d'enregistrements.
+        """
+        signaler = progression or (lambda pourcentage, message: None)
+        
+        # Calculer les données selon le type d'état
+        signaler(10, 'Calcul des données')
+        donnees = self.calculer_donnees(etat)
+        
+        # Mettre à jour les totaux
+        etat.total_usd = donnees.get('total_usd', Decimal('0.00'))
+        etat.total_cdf = donnees.get('total_cdf', Decimal('0.00'))
+        etat.save()
+        
+        # Générer les fichiers selon le format demandé
+        format_sortie = etat.parametres_affichage.get('format_sortie', 'PDF')
+        
+        # Fichiers identiques déjà produits aujourd'hui (mêmes filtres, mêmes données) : repris du cache
+        cache = CacheRapports()
+        cle = self.cle_cache(etat, donnees)
+        
+        if format_sortie in ['PDF', 'LES_DEUX']:
+            signaler(40, 'Génération du PDF')
+            if not self._fichier_depuis_cache(etat, 'fichier_pdf', 'pdf', cache, cle):
+                nom_precedent = etat.fichier_pdf.name
                 self.generer_pdf(etat, donnees)
-            
-            if format_sortie in ['EXCEL', 'LES_DEUX']:
+                self._conserver_fichier(etat, 'fichier_pdf', 'pdf', cache, cle, nom_precedent)
+        
+        if format_sortie in ['EXCEL', 'LES_DEUX']:
+            signaler(70, 'Génération du fichier Excel')
+            if not self._fichier_depuis_cache(etat, 'fichier_excel', 'xlsx', cache, cle):
+                nom_precedent = etat.fichier_excel.name
                 self.generer_excel(etat, donnees)
-            
-            # Marquer comme généré
-            etat.statut = 'GENERE'
-            etat.save()
-            
-            # Message informatif selon le nombre de résultats
-            if donnees.get('count', 0) == 0:
-                messages.info(request, f'État généré avec succès! Aucune donnée trouvée pour la période sélectionnée.')
-            else:
-                messages.success(request, f'État généré avec succès! {donnees.get("count", 0)} enregistrement(s) trouvé(s).')
-            
-            return redirect('etats:detail', pk=etat.pk)
-            
-        except Exception as e:
-            import traceback
-            etat.statut = 'ERREUR'
-            etat.save()
-            
-            # Logger l'erreur complète pour le débogage
-            error_details = traceback.format_exc()
-            print(f"Erreur lors de la génération de l'état {etat.pk}: {str(e)}")
-            print(f"Détails complets: {error_details}")
-            
-            messages.error(request, f'Erreur lors de la génération: {str(e)}')
-            return redirect('etats:detail', pk=etat.pk)
+                self._conserver_fichier(etat, 'fichier_excel', 'xlsx', cache, cle, nom_precedent)
+        
+        signaler(95, 'Enregistrement des fichiers')
+        return donnees.get('count', 0)
+    
+    def cle_cache(self, etat, donnees):
+        """Clé des fichiers de l'état dans le cache des rapports (None : pas de mise en cache)"""
+        version = version_donnees(donnees.get('lignes'))
+        if version is None:
+            return None
+        affichage = dict(etat.parametres_affichage)
+        affichage.pop('format_sortie', None)
+        filtres = {
+            'titre': etat.titre,
+            'date_debut': etat.date_debut,
+            'date_fin': etat.date_fin,
+            'filtres': etat.filtres_supplementaires,
+            'affichage': affichage,
+            'services': list(etat.services.values_list('pk', flat=True)),
+            'natures': list(etat.natures_economiques.values_list('pk', flat=True)),
+            'banques': list(etat.banques.values_list('pk', flat=True)),
+            'comptes': list(etat.comptes_bancaires.values_list('pk', flat=True)),
+            'jour': timezone.localdate(),
+        }
+        return CacheRapports.cle(f'etat:{etat.type_etat}', filtres, version)
+    
+    def _fichier_depuis_cache(self, etat, champ, extension, cache, cle):
+        from django.core.files import File
+        chemin = cache.lire(cle, extension) if cle else None
+        if chemin is None:
+            return False
+        with open(chemin, 'rb') as fichier:
+            getattr(etat, champ).save(etat.get_nom_fichier(extension), File(fichier))
+        return True
+    
+    def _conserver_fichier(self, etat, champ, extension, cache, cle, nom_precedent):
+        fichier = getattr(etat, champ)
+        # generer_pdf journalise ses erreurs sans les propager : rien de nouveau à conserver
+        if cle is None or not fichier or fichier.name == nom_precedent:
+            return
+        with fichier.open('rb') as contenu:
+            cache.enregistrer(cle, extension, contenu)
     
     def calculer_donnees(self, etat):
         """Calcule les données selon le type d'état"""
@@ -1090,17 +1158,10 @@ class EtatGenererView(LoginRequiredMixin, DetailView):
             
             # Contenu du PDF
             story = []
-            styles = getSampleStyleSheet()
+            styles = styles_pdf()
             
             # Style pour le titre principal (type + période sur une ligne)
-            title_style = ParagraphStyle(
-                'CustomTitle',
-                parent=styles['Heading1'],
-                fontSize=16,
-                spaceAfter=20,
-                alignment=TA_CENTER,
-                textColor=colors.darkblue
-            )
+            title_style = styles['TitreEtat']
             
             # Titre principal
             titre_complet = self.generer_titre_complet(etat)
@@ -1629,39 +1690,25 @@ class EtatGenererView(LoginRequiredMixin, DetailView):
         story.append(table)
     
     def generer_excel(self, etat, donnees):
-        """Génère le fichier Excel pour l'état"""
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Border, Side
-        from openpyxl.utils import get_column_letter
+        """Génère le fichier Excel pour l'état (classeur en écriture seule, lignes lues par lots)"""
+        from django.core.files import File
+        from rapports.excel_flux import classeur_flux, enregistrer_classeur, ligne, par_lots
         
-        wb = Workbook()
-        ws = wb.active
-        ws.title = etat.get_type_etat_display()
+        wb, ws = classeur_flux(etat.get_type_etat_display())
         
         # En-tête
-        ws['A1'] = 'DGRAD - DIRECTION GÉNÉRALE DES REVENUS'
-        ws['A2'] = etat.get_type_etat_display()
-        ws['A3'] = f'Titre: {etat.titre}'
-        ws['A4'] = f'Période: {etat.date_debut} au {etat.date_fin}'
-        
-        # Styles
-        header_font = Font(bold=True, color='FFFFFF')
-        header_fill = PatternFill(start_color='1a3a5f', end_color='1a3a5f', fill_type='solid')
+        ligne(ws, ['DGRAD - DIRECTION GÉNÉRALE DES REVENUS'])
+        ligne(ws, [etat.get_type_etat_display()])
+        ligne(ws, [f'Titre: {etat.titre}'])
+        ligne(ws, [f'Période: {etat.date_debut} au {etat.date_fin}'])
+        ligne(ws, [])
         
         # Ajouter les données selon le type d'état
-        row = 8
         if etat.type_etat == 'DEMANDE_PAIEMENT':
-            headers = ['Référence', 'Service', 'Nature', 'Description', 'Montant', 'Devise', 'Statut']
-            ws.append(headers)
+            ligne(ws, ['Référence', 'Service', 'Nature', 'Description', 'Montant', 'Devise', 'Statut'], 'entete')
             
-            for col_num, header in enumerate(headers, 1):
-                cell = ws.cell(row=row, column=col_num)
-                cell.font = header_font
-                cell.fill = header_fill
-            
-            for demande in donnees['lignes']:
-                row += 1
-                ws.append([
+            for demande in par_lots(donnees['lignes']):
+                ligne(ws, [
                     demande.reference,
                     demande.service_demandeur.nom_service if demande.service_demandeur else '',
                     demande.nature_economique.code if demande.nature_economique else '',
@@ -1671,30 +1718,49 @@ class EtatGenererView(LoginRequiredMixin, DetailView):
                     demande.get_statut_display()
                 ])
         
-        # Sauvegarder le fichier
-        from io import BytesIO
-        output = BytesIO()
-        wb.save(output)
-        
-        from django.core.files.base import ContentFile
-        etat.fichier_excel.save(etat.get_nom_fichier('xlsx'), ContentFile(output.getvalue()))
+        # Sauvegarder le fichier depuis le fichier temporaire, sans copie en mémoire
+        with enregistrer_classeur(wb) as fichier:
+            etat.fichier_excel.save(etat.get_nom_fichier('xlsx'), File(fichier))
         etat.save()
 
 
+class EtatProgressionView(LoginRequiredMixin, View):
+    """Avancement de la génération d'un état (JSON), interrogé par la page d'attente"""
+    
+    def get(self, request, pk):
+        etat = get_object_or_404(EtatGenerique, pk=pk)
+        tache = etat.taches.order_by('-date_creation').first()
+        return JsonResponse({
+            'statut': etat.statut,
+            'progression': etat.progression,
+            'message': etat.message_progression,
+            'tache': {
+                'statut': tache.statut,
+                'tentatives': tache.tentatives,
+                'max_tentatives': tache.max_tentatives,
+            } if tache else None,
+            'termine': etat.statut in ('GENERE', 'ERREUR'),
+            'url_detail': reverse('etats:detail', kwargs={'pk': etat.pk}),
+        })
+
+
 class EtatTelechargerView(LoginRequiredMixin, View):
     """Vue pour télécharger un état généré"""
     
     def get(self, request, pk, format_file):
         etat = get_object_or_404(EtatGenerique, pk=pk)
         
+        # Fichiers écrits à la génération (repris du cache des rapports le cas échéant) : servis tels quels
         if format_file == 'pdf' and etat.fichier_pdf:
-            response = HttpResponse(etat.fichier_pdf.read(), content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="{etat.get_nom_fichier("pdf")}"'
-            return response
+            return FileResponse(
+                etat.fichier_pdf.open('rb'), as_attachment=True,
+                filename=etat.get_nom_fichier('pdf'), content_type='application/pdf'
+            )
         elif format_file == 'excel' and etat.fichier_excel:
-            response = HttpResponse(etat.fichier_excel.read(), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-            response['Content-Disposition'] = f'attachment; filename="{etat.get_nom_fichier("xlsx")}"'
-            return response
+            return FileResponse(
+                etat.fichier_excel.open('rb'), as_attachment=True,
+                filename=etat.get_nom_fichier('xlsx'), content_type=CONTENT_TYPE_XLSX
+            )
         else:
             messages.error(request, 'Fichier non disponible')
             return redirect('etats:detail', pk=etat.pk)
@@ -0,0 +1,214 @@
+"""
+Cache disque des fichiers de rapports générés (PDF, Excel).
+
+Un fichier est rangé sous une clé SHA-256 calculée à partir :
+  - du type de rapport ;
+  - des filtres normalisés (valeurs vides retirées, clés triées) ;
+  - de la version des données, empreinte des lignes sous-jacentes obtenue en
+    une requête d'agrégat (nombre, plus grand id, dernière modification,
+    sommes des montants), et des libellés qu'elles impriment (nom de la
+    banque, code et titre de nature, nom du service, voir LIBELLES_IMPRIMES),
+    lus en une seule requête pour les lignes référencées. Toute
+    création, modification ou suppression d'une ligne de la période, ou
+    tout renommage d'une banque, d'une nature ou d'un service, change la
+    version, donc la clé : une entrée n'est jamais invalidée, elle n'est
+    simplement plus demandée.
+
+Les documents portent leur date d'émission : les vues ajoutent le jour aux
+filtres, un rapport en cache n'est donc servi que le jour de sa génération.
+
+La taille totale du répertoire est bornée (RAPPORTS_CACHE_TAILLE_MAX) ; au-delà,
+les fichiers les moins récemment servis sont supprimés (LRU sur la date de
+modification, rafraîchie à chaque lecture). Les écritures passent par un
+fichier temporaire renommé : plusieurs processus peuvent partager le répertoire.
+"""
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Count, Max, Sum, Value
+from django.http import FileResponse
+
+
+def normaliser_filtres(filtres):
+    """
+    Représentation canonique (texte JSON) d'un ensemble de filtres : valeurs
+    vides retirées, chaînes nettoyées, listes triées, clés triées.
+    """
+    def normaliser(valeur):
+        if isinstance(valeur, dict):
+            return {str(cle): normaliser(v) for cle, v in valeur.items() if not _est_vide(v)}
+        if isinstance(valeur, (list, tuple, set)):
+            return sorted((normaliser(v) for v in valeur if not _est_vide(v)), key=str)
+        if isinstance(valeur, str):
+            return valeur.strip()
+        if isinstance(valeur, (Decimal, date, datetime)):
+            return str(valeur)
+        return valeur
+
+    return json.dumps(normaliser(dict(filtres)), sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _est_vide(valeur):
+    if valeur is None:
+        return True
+    if isinstance(valeur, str):
+        return not valeur.strip()
+    if isinstance(valeur, (list, tuple, set, dict)):
+        return not valeur
+    return False
+
+
+# Libellés imprimés par les rapports, par modèle référencé : seuls ces champs
+# entrent dans la version des données (un mot de passe changé ou une
+# description modifiée ne périme pas les rapports)
+LIBELLES_IMPRIMES = {
+    'banques.Banque': ('nom_banque',),
+    'demandes.NatureEconomique': ('code', 'titre'),
+    'accounts.Service': ('nom_service',),
+}
+
+
+def version_donnees(*querysets):
+    """
+    Empreinte des lignes de chaque queryset (une requête d'agrégat par
+    queryset) et des libellés qu'elles impriment (une requête pour l'ensemble).
+    Retourne None si un argument n'est pas un QuerySet (pas de mise en cache).
+    """
+    empreinte = hashlib.sha256()
+    libelles = []
+    for queryset in querysets:
+        if not isinstance(queryset, models.QuerySet):
+            return None
+        modele = queryset.model
+        agregats = {'nombre': Count('pk'), 'dernier': Max('pk')}
+        for champ in modele._meta.concrete_fields:
+            if champ.name == 'date_modification':
+                agregats['modifie'] = Max(champ.name)
+            elif isinstance(champ, models.DecimalField):
+                agregats[f'somme_{champ.name}'] = Sum(champ.name)
+        valeurs = queryset.order_by().aggregate(**agregats)
+        empreinte.update(modele._meta.label.encode())
+        empreinte.update(json.dumps(valeurs, sort_keys=True, default=str).encode())
+        libelles.extend(_libelles_references(queryset))
+
+    if libelles:
+        requete = libelles[0].union(*libelles[1:], all=True) if len(libelles) > 1 else libelles[0]
+        lignes = sorted(requete, key=lambda ligne: [str(valeur) for valeur in ligne])
+        empreinte.update(json.dumps(lignes, default=str).encode())
+    return empreinte.hexdigest()[:16]
+
+
+def _libelles_references(queryset):
+    """
+    Requêtes (modèle, clé, pk, libellé 1, libellé 2) des lignes de
+    LIBELLES_IMPRIMES référencées par le queryset, à réunir par UNION
+    """
+    for champ in queryset.model._meta.concrete_fields:
+        textes = LIBELLES_IMPRIMES.get(champ.related_model._meta.label) if champ.many_to_one else None
+        if not textes:
+            continue
+        colonnes = [Value(texte, output_field=models.CharField()) for texte in (queryset.model._meta.label, champ.name)]
+        colonnes += [*textes, *[Value('', output_field=models.CharField())] * (2 - len(textes))]
+        yield champ.related_model._default_manager.filter(
+            pk__in=queryset.order_by().values(champ.attname)
+        ).order_by().values_list(*colonnes[:2], 'pk', *colonnes[2:])
+
+
+class CacheRapports:
+    """Répertoire de fichiers de rapports adressés par clé, borné en taille"""
+
+    def __init__(self, repertoire=None, taille_max=None):
+        self.repertoire = Path(repertoire or settings.RAPPORTS_CACHE_REPERTOIRE)
+        self.taille_max = settings.RAPPORTS_CACHE_TAILLE_MAX if taille_max is None else taille_max
+
+    @staticmethod
+    def cle(type_rapport, filtres, version):
+        contenu = f'{type_rapport}\n{normaliser_filtres(filtres)}\n{version}'
+        return hashlib.sha256(contenu.encode('utf-8')).hexdigest()
+
+    def chemin(self, cle, extension):
+        return self.repertoire / cle[:2] / f'{cle}.{extension}'
+
+    def lire(self, cle, extension):
+        """Chemin du fichier en cache (marqué comme récemment servi), None sinon"""
+        chemin = self.chemin(cle, extension)
+        try:
+            os.utime(chemin)
+        except FileNotFoundError:
+            return None
+        return chemin
+
+    def enregistrer(self, cle, extension, fichier):
+        """Copie le contenu de l'objet fichier `fichier` (depuis le début) dans le cache"""
+        chemin = self.chemin(cle, extension)
+        chemin.parent.mkdir(parents=True, exist_ok=True)
+        position = fichier.tell()
+        fichier.seek(0)
+        descripteur, temporaire = tempfile.mkstemp(dir=chemin.parent, suffix='.tmp')
+        try:
+            with os.fdopen(descripteur, 'wb') as destination:
+                shutil.copyfileobj(fichier, destination)
+            os.replace(temporaire, chemin)
+        except BaseException:
+            Path(temporaire).unlink(missing_ok=True)
+            raise
+        finally:
+            fichier.seek(position)
+        self.evincer()
+        return chemin
+
+    def evincer(self):
+        """Supprime les fichiers les moins récemment servis tant que la taille maximale est dépassée"""
+        entrees = []
+        for chemin in self.repertoire.glob('*/*'):
+            if chemin.suffix == '.tmp':
+                continue
+            try:
+                infos = chemin.stat()
+            except FileNotFoundError:
+                continue
+            entrees.append((infos.st_mtime, infos.st_size, chemin))
+        total = sum(taille for _, taille, _ in entrees)
+        supprimes = 0
+        for _, taille, chemin in sorted(entrees, key=lambda entree: entree[0]):
+            if total <= self.taille_max:
+                break
+            chemin.unlink(missing_ok=True)
+            total -= taille
+            supprimes += 1
+        return supprimes
+
+    def reponse(self, cle, extension, nom_fichier, content_type):
+        """FileResponse du fichier en cache, None si la clé est absente"""
+        chemin = self.lire(cle, extension)
+        if chemin is None:
+            return None
+        try:
+            fichier = open(chemin, 'rb')
+        except FileNotFoundError:
+            # Évincé entre-temps par un autre processus
+            return None
+        return FileResponse(fichier, as_attachment=True, filename=nom_fichier, content_type=content_type)
+
+    def conserver_reponse(self, cle, extension, response, content_type):
+        """
+        Met en cache le contenu d'une réponse de rapport réussie (FileResponse
+        sur fichier temporaire ou HttpResponse) et la retourne inchangée.
+        """
+        if response.status_code != 200 or not response.get('Content-Type', '').startswith(content_type):
+            return response
+        fichier = getattr(response, 'file_to_stream', None)
+        if fichier is not None:
+            self.enregistrer(cle, extension, fichier)
+        elif not response.streaming:
+            self.enregistrer(cle, extension, io.BytesIO(response.content))
+        return response
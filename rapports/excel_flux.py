@@ -0,0 +1,125 @@
+"""
+Exports Excel en flux (relevés de dépense, états).
+
+Les classeurs sont créés en mode `write_only` d'openpyxl : chaque ligne est
+écrite sur disque dès son ajout, la mémoire ne dépend donc pas du nombre de
+lignes. Les styles sont déclarés une fois comme styles nommés (STYLES) et
+référencés par leur nom sur chaque cellule, au lieu de recréer Font /
+PatternFill / Border par cellule.
+
+- classeur_flux : classeur + feuille en écriture seule, styles enregistrés ;
+- ligne / ligne_fusionnee : lignes de cellules stylées ;
+- par_lots : parcours d'un queryset par blocs (curseur côté serveur sous
+  PostgreSQL) ;
+- enregistrer_classeur / reponse_excel : le classeur est écrit dans un
+  fichier temporaire puis servi par FileResponse, sans copie en mémoire.
+"""
+import tempfile
+
+from django.http import FileResponse
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+
+CONTENT_TYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+TAILLE_LOT = 2000
+
+BLEU = '1a3a5f'
+FORMAT_MONTANT = '#,##0.00'
+
+_bordure = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+_centre = Alignment(horizontal='center', vertical='center')
+_droite = Alignment(horizontal='right', vertical='center')
+_gauche = Alignment(horizontal='left', vertical='center')
+
+
+def _fond(couleur):
+    return PatternFill(start_color=couleur, end_color=couleur, fill_type='solid')
+
+
+def _definitions():
+    """Styles nommés communs aux exports : nom -> paramètres de NamedStyle"""
+    return {
+        'titre': dict(font=Font(bold=True, size=16, color=BLEU), alignment=_centre),
+        'entete': dict(font=Font(bold=True, color='FFFFFF', size=12), fill=_fond(BLEU), alignment=_centre, border=_bordure),
+        'texte': dict(alignment=_centre, border=_bordure),
+        'texte_alterne': dict(alignment=_centre, border=_bordure, fill=_fond('F0F0F0')),
+        'montant': dict(alignment=_droite, border=_bordure, number_format=FORMAT_MONTANT),
+        'montant_alterne': dict(alignment=_droite, border=_bordure, number_format=FORMAT_MONTANT, fill=_fond('F0F0F0')),
+        'resume': dict(alignment=_centre, border=_bordure, fill=_fond('F5F5DC')),
+        'resume_montant': dict(alignment=_droite, border=_bordure, number_format=FORMAT_MONTANT, fill=_fond('F5F5DC')),
+        'sous_total': dict(font=Font(bold=True), alignment=_centre, border=_bordure, fill=_fond('D3D3D3')),
+        'sous_total_montant': dict(font=Font(bold=True), alignment=_droite, border=_bordure,
+                                   number_format=FORMAT_MONTANT, fill=_fond('D3D3D3')),
+        'total': dict(font=Font(bold=True, color='FFFFFF', size=11), alignment=_centre, border=_bordure, fill=_fond(BLEU)),
+        'total_montant': dict(font=Font(bold=True, color='FFFFFF', size=11), alignment=_droite, border=_bordure,
+                              number_format=FORMAT_MONTANT, fill=_fond(BLEU)),
+        'note_droite': dict(font=Font(size=10), alignment=_droite),
+        'signature_gauche': dict(alignment=Alignment(horizontal='left', vertical='center', wrap_text=True)),
+        'signature_droite': dict(alignment=Alignment(horizontal='right', vertical='center', wrap_text=True)),
+        'signature_centre': dict(alignment=Alignment(horizontal='center', vertical='center', wrap_text=True)),
+        'gras': dict(font=Font(bold=True), alignment=_gauche),
+    }
+
+
+def classeur_flux(titre_feuille, largeurs=None):
+    """
+    Classeur en écriture seule avec les styles nommés enregistrés.
+    `largeurs` : largeurs de colonnes (à fixer avant la première ligne).
+    Retourne (classeur, feuille).
+    """
+    wb = Workbook(write_only=True)
+    for nom, parametres in _definitions().items():
+        wb.add_named_style(NamedStyle(name=nom, **parametres))
+    ws = wb.create_sheet(title=titre_feuille[:31])
+    for colonne, largeur in enumerate(largeurs or [], start=1):
+        ws.column_dimensions[get_column_letter(colonne)].width = largeur
+    return wb, ws
+
+
+def cellule(ws, valeur, style=None):
+    cell = WriteOnlyCell(ws, value=valeur)
+    if style:
+        cell.style = style
+    return cell
+
+
+def ligne(ws, valeurs, styles=None):
+    """
+    Ajoute une ligne. `styles` est un nom de style commun à toute la ligne ou
+    une liste de noms (un par cellule, None = sans style).
+    """
+    if styles is None or isinstance(styles, str):
+        styles = [styles] * len(valeurs)
+    ws.append([cellule(ws, valeur, style) for valeur, style in zip(valeurs, styles)])
+
+
+def ligne_fusionnee(ws, numero_ligne, valeur, style, colonnes, debut=1):
+    """Ajoute une ligne dont la valeur occupe `colonnes` cellules fusionnées à partir de `debut`"""
+    premiere = get_column_letter(debut)
+    derniere = get_column_letter(debut + colonnes - 1)
+    ws.merged_cells.add(f'{premiere}{numero_ligne}:{derniere}{numero_ligne}')
+    ws.append([None] * (debut - 1) + [cellule(ws, valeur, style)])
+
+
+def par_lots(queryset, taille=TAILLE_LOT):
+    """Itère un queryset par blocs de `taille` lignes sans le mettre en cache"""
+    return queryset.iterator(chunk_size=taille)
+
+
+def enregistrer_classeur(wb):
+    """Écrit le classeur dans un fichier temporaire (supprimé à sa fermeture), rembobiné"""
+    fichier = tempfile.TemporaryFile(suffix='.xlsx')
+    wb.save(fichier)
+    fichier.seek(0)
+    return fichier
+
+
+def reponse_excel(wb, nom_fichier):
+    """Sert le classeur en téléchargement, lu par blocs depuis le fichier temporaire"""
+    return FileResponse(
+        enregistrer_classeur(wb), as_attachment=True, filename=nom_fichier, content_type=CONTENT_TYPE_XLSX
+    )
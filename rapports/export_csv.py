@@ -0,0 +1,112 @@
+"""
+Exports CSV / TSV en flux des tables financières.
+
+Les vues d'export héritent de la vue de liste correspondante et réutilisent
+donc son get_queryset() (mêmes paramètres GET de filtrage, mêmes droits).
+Les lignes sont lues avec values_list().iterator() : curseur côté serveur
+sous PostgreSQL, aucun objet modèle instancié, et envoyées au client par
+StreamingHttpResponse au fil de la lecture, éventuellement compressées en
+gzip (paramètre `gzip=1`). Le paramètre `format=tsv` sépare par tabulations.
+"""
+import csv
+import io
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+
+TAILLE_LOT = 2000
+
+FORMATS = {
+    'csv': {'delimiter': ',', 'extension': 'csv', 'content_type': 'text/csv'},
+    'tsv': {'delimiter': '\t', 'extension': 'tsv', 'content_type': 'text/tab-separated-values'},
+}
+
+# Marque d'ordre des octets : Excel ouvre alors le fichier en UTF-8 (accents)
+BOM = '\ufeff'
+
+
+def _valeur(valeur):
+    if valeur is None:
+        return ''
+    if isinstance(valeur, Decimal):
+        return f'{valeur:f}'
+    if isinstance(valeur, datetime):
+        return timezone.localtime(valeur).strftime('%Y-%m-%d %H:%M:%S') if timezone.is_aware(valeur) else valeur.isoformat(' ')
+    if isinstance(valeur, date):
+        return valeur.isoformat()
+    if isinstance(valeur, bool):
+        return 'oui' if valeur else 'non'
+    return valeur
+
+
+def lignes_csv(queryset, colonnes, delimiter=',', taille_lot=TAILLE_LOT):
+    """
+    Génère le contenu texte par blocs d'environ `taille_lot` lignes.
+    `colonnes` : séquence de (entête, chemin ORM) ; le chemin peut traverser
+    les clés étrangères (ex. 'banque__nom_banque').
+    """
+    champs = [champ for _, champ in colonnes]
+    # values_list() est incompatible avec les prefetch_related des vues de liste
+    lignes = queryset.prefetch_related(None).values_list(*champs).iterator(chunk_size=taille_lot)
+
+    tampon = io.StringIO()
+    writer = csv.writer(tampon, delimiter=delimiter, lineterminator='\r\n')
+    tampon.write(BOM)
+    writer.writerow([entete for entete, _ in colonnes])
+    for numero, ligne in enumerate(lignes, start=1):
+        writer.writerow([_valeur(valeur) for valeur in ligne])
+        if numero % taille_lot == 0:
+            yield tampon.getvalue()
+            tampon.seek(0)
+            tampon.truncate()
+    yield tampon.getvalue()
+
+
+def compresser_gzip(blocs):
+    """Compresse à la volée un flux de blocs texte en un fichier gzip"""
+    compresseur = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for bloc in blocs:
+        donnees = compresseur.compress(bloc.encode('utf-8'))
+        if donnees:
+            yield donnees
+    yield compresseur.flush()
+
+
+def reponse_csv(queryset, colonnes, nom_export, format_export='csv', compression=False):
+    """StreamingHttpResponse d'un export CSV ou TSV, gzip en option"""
+    parametres = FORMATS.get(format_export, FORMATS['csv'])
+    contenu = lignes_csv(queryset, colonnes, delimiter=parametres['delimiter'])
+    nom_fichier = f"{nom_export}_{timezone.now().strftime('%Y%m%d_%H%M%S')}.{parametres['extension']}"
+
+    if compression:
+        response = StreamingHttpResponse(compresser_gzip(contenu), content_type='application/gzip')
+        nom_fichier += '.gz'
+    else:
+        response = StreamingHttpResponse(
+            (bloc.encode('utf-8') for bloc in contenu),
+            content_type=f"{parametres['content_type']}; charset=utf-8"
+        )
+    response['Content-Disposition'] = f'attachment; filename="{nom_fichier}"'
+    return response
+
+
+class ExportCSVMixin:
+    """
+    À combiner avec une vue de liste : GET renvoie le queryset filtré de la
+    liste au format CSV (ou TSV) au lieu de la page HTML.
+    """
+    colonnes_export = ()
+    nom_export = 'export'
+
+    def get(self, request, *args, **kwargs):
+        return reponse_csv(
+            self.get_queryset(),
+            self.colonnes_export,
+            self.nom_export,
+            format_export=request.GET.get('format', 'csv'),
+            compression=request.GET.get('gzip', '').lower() in ('1', 'true', 'oui'),
+        )
@@ -0,0 +1,105 @@
+"""
+Commande de mesure de la mémoire consommée par un export Excel volumineux
+
+Des lignes au format du relevé de dépense (9 colonnes, styles nommés) sont
+écrites avec la couche d'export en flux (rapports.excel_flux) ; le pic
+d'allocation Python est mesuré avec tracemalloc. L'option --comparer refait
+la même mesure avec un classeur openpyxl classique enregistré dans un BytesIO,
+comme le faisaient les anciennes vues.
+"""
+import time
+import tracemalloc
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+from openpyxl import Workbook
+from openpyxl.styles import Alignment, Border, Side
+
+from rapports.excel_flux import classeur_flux, enregistrer_classeur, ligne
+
+
+ENTETES = ['N°', 'Code', 'Article Littera', 'Montant USD', 'IPR USD',
+           'Montant CDF', 'IPR CDF', 'Net à payer USD', 'Net à payer CDF']
+
+
+def lignes_releve(nb_lignes):
+    """Lignes synthétiques du relevé de dépense"""
+    for numero in range(1, nb_lignes + 1):
+        montant = float(numero % 10000) + 0.5
+        ipr = montant * 0.03
+        yield [numero, f'{numero % 300:04d}', f'Article littera {numero % 300}',
+               montant, ipr, '-', '-', montant - ipr, '-']
+
+
+def mesurer(fonction):
+    """Exécute `fonction` et retourne (pic d'allocation en octets, durée en secondes, taille du fichier)"""
+    tracemalloc.start()
+    debut = time.monotonic()
+    try:
+        taille = fonction()
+        _, pic = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return pic, time.monotonic() - debut, taille
+
+
+class Command(BaseCommand):
+    help = "Mesure le pic mémoire d'un export Excel de N lignes (écriture en flux, et classeur classique avec --comparer)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lignes',
+            type=int,
+            default=200000,
+            help='Nombre de lignes exportées (défaut : 200000)'
+        )
+        parser.add_argument(
+            '--comparer',
+            action='store_true',
+            help='Mesurer aussi le classeur openpyxl classique enregistré en mémoire'
+        )
+
+    def handle(self, *args, **options):
+        nb_lignes = options['lignes']
+
+        pic, duree, taille = mesurer(lambda: self._export_flux(nb_lignes))
+        self._afficher('Écriture en flux', nb_lignes, pic, duree, taille)
+
+        if options['comparer']:
+            pic_classique, duree, taille = mesurer(lambda: self._export_classique(nb_lignes))
+            self._afficher('Classeur classique', nb_lignes, pic_classique, duree, taille)
+            self.stdout.write(
+                self.style.SUCCESS(f'✓ Pic mémoire divisé par {pic_classique / max(pic, 1):.1f}')
+            )
+
+    def _afficher(self, libelle, nb_lignes, pic, duree, taille):
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {libelle} : {nb_lignes} ligne(s), pic {pic / 1024 / 1024:.1f} Mo, '
+            f'fichier {taille / 1024 / 1024:.1f} Mo, {duree:.2f}s'
+        ))
+
+    def _export_flux(self, nb_lignes):
+        wb, ws = classeur_flux('Relevé de Dépense', largeurs=[8, 12, 30] + [15] * 6)
+        ligne(ws, ENTETES, 'entete')
+        for valeurs in lignes_releve(nb_lignes):
+            ligne(ws, valeurs, ['texte'] * 3 + ['montant'] * 6)
+        with enregistrer_classeur(wb) as fichier:
+            fichier.seek(0, 2)
+            return fichier.tell()
+
+    def _export_classique(self, nb_lignes):
+        wb = Workbook()
+        ws = wb.active
+        bordure = Border(left=Side(style='thin'), right=Side(style='thin'),
+                         top=Side(style='thin'), bottom=Side(style='thin'))
+        ws.append(ENTETES)
+        for row, valeurs in enumerate(lignes_releve(nb_lignes), start=2):
+            for col, valeur in enumerate(valeurs, start=1):
+                cell = ws.cell(row=row, column=col, value=valeur)
+                cell.alignment = Alignment(horizontal='right' if col > 3 else 'center', vertical='center')
+                cell.border = bordure
+                if col > 3:
+                    cell.number_format = '#,##0.00'
+        output = BytesIO()
+        wb.save(output)
+        return len(output.getvalue())
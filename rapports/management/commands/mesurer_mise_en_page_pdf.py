@@ -0,0 +1,93 @@
+"""
+Commande de mesure du temps CPU par PDF avec le kit de mise en page partagé
+
+Le même petit état (logo, titre, ligne de période, tableau de 30 lignes, pied
+de page) est produit N fois :
+  - avec rapports.mise_en_page_pdf (styles, logo et pied de page partagés) ;
+  - comme le faisaient les vues auparavant : getSampleStyleSheet(), nouveaux
+    ParagraphStyle et Image du logo relue depuis le disque à chaque PDF.
+"""
+import time
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from rapports.mise_en_page_pdf import (
+    CHEMIN_LOGO, STYLE_TABLE_LOGO, DocumentRapport, entete_logo, pied_de_page, styles_pdf,
+)
+
+
+STYLE_TABLEAU = [
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+    ('FONTSIZE', (0, 0), (-1, -1), 8),
+]
+
+
+def contenu(styles, style_cell):
+    elements = [Paragraph('ÉTAT DES DÉPENSES', styles['Title'])]
+    elements.append(Paragraph('<b>Émis le : 01/03/2025 08:00   |   Période : MARS 2025</b>', styles['Normal']))
+    lignes = [['Date', 'Libellé', 'Banque', 'Montant FC', 'Montant $us']]
+    for i in range(30):
+        lignes.append(['01/03/2025', Paragraph(f'Dépense de fonctionnement n° {i}', style_cell),
+                       'Banque', f'{i * 1000:,.2f}', f'{i:,.2f}'])
+    table = Table(lignes, colWidths=[2*cm, 14*cm, 4*cm, 4*cm, 4*cm], repeatRows=1)
+    table.setStyle(TableStyle(STYLE_TABLEAU))
+    elements.append(table)
+    return elements
+
+
+def pdf_avec_kit():
+    doc = DocumentRapport(BytesIO(), pagesize=landscape(A4), rightMargin=0.5*cm, leftMargin=0.3*cm,
+                          topMargin=0.5*cm, bottomMargin=0.8*cm)
+    styles = styles_pdf()
+    doc.build(entete_logo() + contenu(styles, styles['CellLibelle']))
+
+
+def pdf_sans_kit():
+    doc = SimpleDocTemplate(BytesIO(), pagesize=landscape(A4), rightMargin=0.5*cm, leftMargin=0.3*cm,
+                            topMargin=0.5*cm, bottomMargin=0.8*cm)
+    styles = getSampleStyleSheet()
+    style_cell = ParagraphStyle('CellLibelle', parent=styles['Normal'], fontSize=8, leading=9)
+    elements = []
+    if CHEMIN_LOGO.exists():
+        logo = Image(str(CHEMIN_LOGO), width=3*cm, height=3*cm)
+        logo_table = Table([[logo, ''], ['', '']], colWidths=[3*cm, 20*cm], rowHeights=[3*cm, 0.5*cm])
+        logo_table.setStyle(TableStyle(list(STYLE_TABLE_LOGO.getCommands())))
+        elements += [logo_table, Spacer(1, 0.3*cm)]
+    doc.build(elements + contenu(styles, style_cell), onFirstPage=pied_de_page, onLaterPages=pied_de_page)
+
+
+def temps_cpu_par_pdf(fonction, nombre):
+    fonction()  # échauffement : polices, caches du kit
+    debut = time.process_time()
+    for _ in range(nombre):
+        fonction()
+    return (time.process_time() - debut) / nombre
+
+
+class Command(BaseCommand):
+    help = "Compare le temps CPU par PDF avec et sans le kit de mise en page partagé"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pdfs',
+            type=int,
+            default=200,
+            help='Nombre de PDF produits pour chaque mesure (défaut : 200)'
+        )
+
+    def handle(self, *args, **options):
+        nombre = max(1, options['pdfs'])
+        sans_kit = temps_cpu_par_pdf(pdf_sans_kit, nombre)
+        avec_kit = temps_cpu_par_pdf(pdf_avec_kit, nombre)
+        self.stdout.write(f'  Sans kit : {sans_kit * 1000:.2f} ms CPU par PDF')
+        self.stdout.write(f'  Avec kit : {avec_kit * 1000:.2f} ms CPU par PDF')
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {nombre} PDF : temps CPU par PDF réduit de {(1 - avec_kit / sans_kit) * 100:.0f} %'
+        ))
@@ -0,0 +1,219 @@
+"""
+Commande de mesure des performances des vues principales
+
+Chaque scénario (tableaux de bord, listes, aperçus d'états, exports PDF /
+XLSX / CSV) est joué par le client de test de Django, connecté avec
+l'utilisateur `benchmark` de seed_benchmark_data, sur le mois le plus récent
+du jeu de données. Pour chaque scénario sont relevés :
+  - la latence p50 / p95 sur --iterations exécutions (après un échauffement),
+    contenu des réponses en flux compris ;
+  - le nombre de requêtes SQL et leur durée (efinance_daf.instrumentation) ;
+  - le pic d'allocation Python d'une exécution supplémentaire (tracemalloc,
+    mesurée à part pour ne pas fausser la latence).
+
+Les résultats sont écrits en JSON (--sortie) avec le commit et les volumes ;
+--comparer relit un fichier précédent et signale les scénarios dont la p95
+ou le nombre de requêtes s'est dégradé au-delà de --tolerance.
+"""
+import json
+import math
+import subprocess
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from demandes.models import Cheque, DemandePaiement, DepenseFeuille, Paiement, ReleveDepense
+from efinance_daf.instrumentation import ReleveSQL
+from recettes.models import RecetteFeuille
+from rapports.management.commands.seed_benchmark_data import UTILISATEUR_BENCHMARK
+
+
+def scenarios(annee, mois, releve):
+    """[(nom, méthode, URL, paramètres)] des vues mesurées"""
+    periode = {'annee': annee, 'mois': mois}
+    return [
+        # Tableaux de bord
+        ('Tableau de bord', 'get', reverse('rapports:dashboard'), {}),
+        ('Tableau de bord feuilles', 'get', reverse('tableau_bord_feuilles:tableau_bord_feuilles'), {'annee': annee}),
+        ('Détail des opérations', 'get', reverse('tableau_bord_feuilles:detail_operations'), periode),
+        ('Tableau général', 'get', reverse('tableau_bord_feuilles:tableau_general'), periode),
+        # Listes
+        ('Liste DEPENSES', 'get', reverse('demandes:depense_feuille_liste'), periode),
+        ('Liste RECETTES', 'get', reverse('recettes:feuille_liste'), periode),
+        ('Demandes de paiement', 'get', reverse('demandes:liste'), {}),
+        ('Relevés de dépense', 'get', reverse('demandes:releves_crees_liste'), {}),
+        ('Paiements', 'get', reverse('demandes:paiement_liste'), {}),
+        ('Paiements du relevé', 'get', reverse('demandes:paiement_releve_detail', args=[releve.pk]), {}),
+        ('Chèques', 'get', reverse('demandes:cheque_liste'), {}),
+        # Aperçus des états
+        ('Aperçu dépenses du mois', 'post', reverse('tableau_bord_feuilles:preview_etats'),
+         {'type_etat': 'depense_par_mois', 'annee_mois': annee, 'mois_depense': mois}),
+        ('Aperçu synthèse par banque', 'post', reverse('tableau_bord_feuilles:preview_etats'),
+         {'type_etat': 'synthese_par_banque', 'annee_synthese_banque': annee, 'mois_synthese_banque': mois}),
+        # Exports
+        ('PDF rapport des dépenses', 'get', reverse('tableau_bord_feuilles:rapport_depense_pdf'), periode),
+        ('PDF tableau général', 'post', reverse('tableau_bord_feuilles:tableau_general_pdf'), periode),
+        ('PDF relevé réimprimé', 'get', reverse('demandes:releve_reprint_pdf'), {'numero': releve.numero}),
+        ('XLSX relevé de dépense', 'get', reverse('demandes:releve_excel'), {}),
+        ('CSV DEPENSES', 'get', reverse('demandes:depense_feuille_export'), {'annee': annee}),
+    ]
+
+
+def centile(valeurs, rang):
+    """Centile au rang le plus proche (valeurs non vides)"""
+    ordonnees = sorted(valeurs)
+    return ordonnees[max(1, math.ceil(rang / 100 * len(ordonnees))) - 1]
+
+
+def commit_courant():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure latence p50/p95, requêtes SQL et pic mémoire des vues principales "
+        "(jeu de seed_benchmark_data) et les enregistre en JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=10,
+                            help='Exécutions mesurées par scénario (défaut : 10)')
+        parser.add_argument('--echauffement', type=int, default=1,
+                            help='Exécutions non mesurées avant la mesure (défaut : 1)')
+        parser.add_argument('--filtre', default='',
+                            help='Ne jouer que les scénarios dont le nom contient ce texte')
+        parser.add_argument('--sortie', default='benchmarks.json',
+                            help='Fichier JSON des résultats (défaut : benchmarks.json)')
+        parser.add_argument('--comparer', default=None,
+                            help='Fichier JSON d\'une mesure précédente à comparer')
+        parser.add_argument('--tolerance', type=float, default=20.0,
+                            help='Dégradation tolérée de la p95, en %% (défaut : 20)')
+
+    def handle(self, *args, **options):
+        utilisateur = User.objects.filter(username=UTILISATEUR_BENCHMARK).first()
+        if utilisateur is None:
+            raise CommandError("Utilisateur « benchmark » introuvable : lancer d'abord seed_benchmark_data.")
+        derniere = DepenseFeuille.objects.order_by('-annee', '-mois').values('annee', 'mois').first()
+        releve = ReleveDepense.objects.filter(paiements__isnull=False).order_by('-periode').first()
+        if derniere is None or releve is None:
+            raise CommandError("Jeu de données incomplet : lancer d'abord seed_benchmark_data.")
+
+        client = Client(raise_request_exception=False)
+        client.force_login(utilisateur)
+
+        resultats = {}
+        for nom, methode, url, parametres in scenarios(derniere['annee'], derniere['mois'], releve):
+            if options['filtre'].lower() not in nom.lower():
+                continue
+            mesure = self._mesurer(client, methode, url, parametres, options['iterations'], options['echauffement'])
+            resultats[nom] = mesure
+            self._afficher(nom, mesure)
+
+        rapport = {
+            'date': timezone.now().isoformat(),
+            'commit': commit_courant(),
+            'base': connection.vendor,
+            'periode': derniere,
+            'iterations': options['iterations'],
+            'volumes': {
+                'depenses_feuille': DepenseFeuille.objects.count(),
+                'recettes_feuille': RecetteFeuille.objects.count(),
+                'demandes': DemandePaiement.objects.count(),
+                'releves': ReleveDepense.objects.count(),
+                'paiements': Paiement.objects.count(),
+                'cheques': Cheque.objects.count(),
+            },
+            'scenarios': resultats,
+        }
+        Path(options['sortie']).write_text(json.dumps(rapport, ensure_ascii=False, indent=2), encoding='utf-8')
+        self.stdout.write(self.style.SUCCESS(f'✓ {len(resultats)} scénario(s) mesuré(s) → {options["sortie"]}'))
+
+        if options['comparer']:
+            self._comparer(resultats, options['comparer'], options['tolerance'])
+
+    def _executer(self, client, methode, url, parametres):
+        """Joue la requête, contenu en flux compris ; retourne (statut, taille de la réponse)"""
+        reponse = getattr(client, methode)(url, parametres)
+        contenu = b''.join(reponse.streaming_content) if reponse.streaming else reponse.content
+        return reponse.status_code, len(contenu)
+
+    def _mesurer(self, client, methode, url, parametres, iterations, echauffement):
+        for _ in range(echauffement):
+            self._executer(client, methode, url, parametres)
+
+        durees = []
+        for _ in range(iterations):
+            releve_sql = ReleveSQL()
+            debut = time.perf_counter()
+            with connection.execute_wrapper(releve_sql):
+                statut, taille = self._executer(client, methode, url, parametres)
+            durees.append((time.perf_counter() - debut) * 1000)
+
+        tracemalloc.start()
+        try:
+            self._executer(client, methode, url, parametres)
+            _, pic = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'methode': methode.upper(),
+            'url': url,
+            'statut': statut,
+            'taille_octets': taille,
+            'p50_ms': round(centile(durees, 50), 1),
+            'p95_ms': round(centile(durees, 95), 1),
+            'requetes': releve_sql.nombre,
+            'sql_ms': round(releve_sql.duree_ms, 1),
+            'memoire_pic_mo': round(pic / 1024 / 1024, 2),
+        }
+
+    def _afficher(self, nom, mesure):
+        ligne = (
+            f"{nom} : p50 {mesure['p50_ms']} ms, p95 {mesure['p95_ms']} ms, "
+            f"{mesure['requetes']} requêtes ({mesure['sql_ms']} ms), pic {mesure['memoire_pic_mo']} Mo"
+        )
+        if mesure['statut'] == 200:
+            self.stdout.write(f'✓ {ligne}')
+        else:
+            self.stdout.write(self.style.ERROR(f"✗ {ligne} — statut {mesure['statut']}"))
+
+    def _comparer(self, resultats, chemin, tolerance):
+        try:
+            precedent = json.loads(Path(chemin).read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Mesure de référence illisible ({chemin}) : {e}")
+
+        self.stdout.write(f"\n=== Comparaison avec {chemin} (commit {precedent.get('commit') or '?'}) ===")
+        degradations = 0
+        for nom, mesure in resultats.items():
+            reference = precedent.get('scenarios', {}).get(nom)
+            if reference is None:
+                self.stdout.write(f'  → {nom} : nouveau scénario')
+                continue
+            ecart_p95 = (mesure['p95_ms'] - reference['p95_ms']) / max(reference['p95_ms'], 0.1) * 100
+            ecart_requetes = mesure['requetes'] - reference['requetes']
+            ligne = f"{nom} : p95 {ecart_p95:+.0f} %, requêtes {ecart_requetes:+d}"
+            if ecart_p95 > tolerance or ecart_requetes > 0:
+                degradations += 1
+                self.stdout.write(self.style.WARNING(f'⚠ {ligne}'))
+            else:
+                self.stdout.write(f'✓ {ligne}')
+
+        if degradations:
+            raise CommandError(f'{degradations} scénario(s) dégradé(s) par rapport à {chemin}')
+        self.stdout.write(self.style.SUCCESS('✓ Aucune dégradation'))
@@ -0,0 +1,325 @@
+"""
+Commande de génération d'un jeu de données pour la mesure des performances
+
+Les volumes sont réalistes et insérés par lots (bulk_create) :
+  - banques et leurs comptes, articles littera sur deux niveaux, services ;
+  - feuilles DEPENSES / RECETTES réparties sur plusieurs années, avec leur
+    empreinte de contenu ;
+  - demandes de paiement (en attente, rejetées, validées), regroupées en
+    relevés de dépense, avec un chèque par relevé et, pour les relevés
+    payés, les paiements et les lignes DEPENSES du mode workflow.
+
+Les références sont prises dans les séquences (SequenceReference.allouer) et
+les agrégats mensuels sont reconstruits à la fin : les vues voient les mêmes
+données qu'après une saisie normale. Le tirage est initialisé par --graine,
+deux exécutions produisent le même jeu.
+
+À lancer sur une base dédiée, vide de tout jeu précédent ; l'utilisateur
+`benchmark` créé ici est celui de la commande run_benchmarks.
+"""
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import Service, User
+from banques.models import Banque, CompteBancaire
+from demandes.empreintes import empreinte_ligne
+from demandes.models import (
+    Cheque, DemandePaiement, DepenseFeuille, NatureEconomique, Paiement, ReleveDepense, SequenceReference,
+)
+from recettes.models import RecetteFeuille
+from tableau_bord_feuilles.models import AgregatFeuilleMensuel
+
+
+UTILISATEUR_BENCHMARK = 'benchmark'
+PREFIXE = 'BENCH'
+
+TAILLE_LOT = 5000
+DEMANDES_PAR_RELEVE = 10
+TAUX_CHANGE = Decimal('2800')
+
+OBJETS_DEPENSE = [
+    'Achat fournitures de bureau', 'Frais de mission', 'Carburant véhicules', 'Maintenance informatique',
+    'Prime de rendement', 'Loyer bureaux', 'Facture électricité', 'Communication et internet',
+    'Entretien bâtiment', 'Frais bancaires', 'Formation du personnel', 'Impression des formulaires',
+]
+OBJETS_RECETTE = [
+    'Droits de chancellerie', 'Taxe administrative', 'Redevance minière', 'Frais de dossier',
+    'Pénalités de retard', 'Taxe de transit', 'Droits de visa', 'Amendes transactionnelles',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Génère un jeu de données volumineux (feuilles, demandes, relevés, paiements, chèques) "
+        "pour run_benchmarks, sur une base dédiée"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--depenses', type=int, default=100000,
+                            help='Lignes de la feuille DEPENSES (défaut : 100000)')
+        parser.add_argument('--recettes', type=int, default=100000,
+                            help='Lignes de la feuille RECETTES (défaut : 100000)')
+        parser.add_argument('--demandes', type=int, default=3000,
+                            help='Demandes de paiement (défaut : 3000)')
+        parser.add_argument('--banques', type=int, default=15, help='Banques (défaut : 15)')
+        parser.add_argument('--natures', type=int, default=300,
+                            help='Articles littera, dont un dixième de rubriques parentes (défaut : 300)')
+        parser.add_argument('--services', type=int, default=40, help='Services (défaut : 40)')
+        parser.add_argument('--annees', type=int, default=3,
+                            help="Années couvertes, jusqu'à l'année en cours (défaut : 3)")
+        parser.add_argument('--graine', type=int, default=42, help='Graine du tirage aléatoire (défaut : 42)')
+
+    def handle(self, *args, **options):
+        if Banque.objects.filter(nom_banque__startswith=f'{PREFIXE} ').exists():
+            raise CommandError("Un jeu de mesure est déjà présent : utiliser une base vide.")
+
+        self.hasard = random.Random(options['graine'])
+        annee_fin = date.today().year
+        self.annees = list(range(annee_fin - options['annees'] + 1, annee_fin + 1))
+        debut = time.monotonic()
+
+        with transaction.atomic():
+            self.utilisateur = self._utilisateur()
+            self.banques = self._etape('Banques et comptes', lambda: self._banques(options['banques']))
+            self.natures = self._etape('Articles littera', lambda: self._natures(options['natures']))
+            self.services = self._etape('Services', lambda: self._services(options['services']))
+        self._etape('Feuille DEPENSES', lambda: self._depenses(options['depenses']))
+        self._etape('Feuille RECETTES', lambda: self._recettes(options['recettes']))
+        with transaction.atomic():
+            self._etape('Demandes, relevés, chèques et paiements', lambda: self._demandes(options['demandes']))
+        self._etape('Agrégats mensuels', AgregatFeuilleMensuel.reconstruire)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Jeu de mesure généré en {time.monotonic() - debut:.1f}s '
+            f'(utilisateur « {UTILISATEUR_BENCHMARK} »)'
+        ))
+
+    def _etape(self, libelle, fonction):
+        debut = time.monotonic()
+        resultat = fonction()
+        nombre = len(resultat) if isinstance(resultat, list) else resultat
+        self.stdout.write(f'  → {libelle} : {nombre} en {time.monotonic() - debut:.1f}s')
+        return resultat
+
+    def _utilisateur(self):
+        utilisateur, _ = User.objects.get_or_create(
+            username=UTILISATEUR_BENCHMARK,
+            defaults={'role': 'SUPER_ADMIN', 'is_superuser': True, 'is_staff': True},
+        )
+        utilisateur.set_unusable_password()
+        utilisateur.save(update_fields=['password'])
+        return utilisateur
+
+    def _banques(self, nombre):
+        banques = Banque.objects.bulk_create([Banque(nom_banque=f'{PREFIXE} Banque {i + 1:02d}') for i in range(nombre)])
+        CompteBancaire.objects.bulk_create([
+            CompteBancaire(
+                banque=banque,
+                intitule_compte=f'Compte {devise} {banque.nom_banque}',
+                numero_compte=f'{PREFIXE}-{banque.pk}-{devise}',
+                devise=devise,
+                solde_initial=Decimal('1000000.00'),
+                solde_courant=Decimal('1000000.00'),
+                date_ouverture=date(self.annees[0], 1, 1),
+            )
+            for banque in banques for devise in ('USD', 'CDF')
+        ])
+        return banques
+
+    def _natures(self, nombre):
+        """Un dixième de rubriques parentes, les autres articles rattachés"""
+        nb_parents = max(1, nombre // 10)
+        parents = NatureEconomique.objects.bulk_create([
+            NatureEconomique(code=f'{PREFIXE}{i + 1:02d}', titre=f'Rubrique {i + 1}') for i in range(nb_parents)
+        ])
+        articles = []
+        for i in range(nombre - nb_parents):
+            parent = parents[i % nb_parents]
+            articles.append(NatureEconomique(
+                code=f'{parent.code}.{i + 1:03d}',
+                titre=f'Article {i + 1} de la {parent.titre.lower()}',
+                code_parent=parent.code,
+                parent=parent,
+            ))
+        return NatureEconomique.objects.bulk_create(articles)
+
+    def _services(self, nombre):
+        directions = Service.objects.bulk_create([
+            Service(nom_service=f'{PREFIXE} Direction {i + 1}') for i in range(max(1, nombre // 8))
+        ])
+        services = Service.objects.bulk_create([
+            Service(nom_service=f'{PREFIXE} Service {i + 1}', parent_service=directions[i % len(directions)])
+            for i in range(nombre - len(directions))
+        ])
+        return directions + services
+
+    def _date(self):
+        annee = self.hasard.choice(self.annees)
+        mois = self.hasard.randint(1, 12 if annee < date.today().year else date.today().month)
+        return date(annee, mois, self.hasard.randint(1, 28))
+
+    def _montants(self):
+        """Montants FC et $us : surtout en francs, parfois en dollars, rarement les deux"""
+        montant_fc = Decimal(f'{self.hasard.lognormvariate(12, 1.3):.2f}')
+        tirage = self.hasard.random()
+        if tirage < 0.6:
+            return montant_fc, Decimal('0.00')
+        montant_usd = (montant_fc / TAUX_CHANGE).quantize(Decimal('0.01')) + Decimal('0.01')
+        if tirage < 0.9:
+            return Decimal('0.00'), montant_usd
+        return montant_fc, montant_usd
+
+    def _par_lots(self, modele, nombre, construire):
+        """Insère `nombre` lignes construites par `construire(i)`, un lot par transaction"""
+        for debut in range(0, nombre, TAILLE_LOT):
+            with transaction.atomic():
+                modele.objects.bulk_create([construire(i) for i in range(debut, min(debut + TAILLE_LOT, nombre))])
+        return nombre
+
+    def _depenses(self, nombre):
+        def construire(i):
+            jour = self._date()
+            service = self.hasard.choice(self.services)
+            libelle = f'{self.hasard.choice(OBJETS_DEPENSE)} - {service.nom_service} n°{i + 1}'
+            banque = self.hasard.choice(self.banques)
+            montant_fc, montant_usd = self._montants()
+            return DepenseFeuille(
+                mois=jour.month, annee=jour.year, date=jour,
+                nature_economique=self.hasard.choice(self.natures),
+                service_beneficiaire=service,
+                libelle_depenses=libelle,
+                banque=banque,
+                montant_fc=montant_fc, montant_usd=montant_usd,
+                observation='' if self.hasard.random() < 0.8 else 'Pièce justificative en attente',
+                empreinte=empreinte_ligne(jour, libelle, banque.pk, montant_fc, montant_usd),
+            )
+        return self._par_lots(DepenseFeuille, nombre, construire)
+
+    def _recettes(self, nombre):
+        def construire(i):
+            jour = self._date()
+            libelle = f'{self.hasard.choice(OBJETS_RECETTE)} n°{i + 1}'
+            banque = self.hasard.choice(self.banques)
+            montant_fc, montant_usd = self._montants()
+            return RecetteFeuille(
+                mois=jour.month, annee=jour.year, date=jour,
+                libelle_recette=libelle,
+                banque=banque,
+                montant_fc=montant_fc, montant_usd=montant_usd,
+                empreinte=empreinte_ligne(jour, libelle, banque.pk, montant_fc, montant_usd),
+            )
+        return self._par_lots(RecetteFeuille, nombre, construire)
+
+    def _demandes(self, nombre):
+        """
+        Demandes : 15 % en attente, 5 % rejetées, les autres validées par le DG.
+        Neuf dixièmes des validées sont regroupées par DEMANDES_PAR_RELEVE en
+        relevés (un par jour, en remontant depuis aujourd'hui), le reste attend
+        son relevé. Chaque relevé a son chèque ; les trois quarts des relevés
+        sont payés.
+        """
+        maintenant = timezone.now()
+        references = SequenceReference.allouer('DEM', nombre)
+        demandes = []
+        for numero in references:
+            tirage = self.hasard.random()
+            statut = 'EN_ATTENTE' if tirage < 0.15 else 'REJETEE' if tirage < 0.2 else 'VALIDEE_DG'
+            devise = 'CDF' if self.hasard.random() < 0.6 else 'USD'
+            montant_fc, montant_usd = self._montants()
+            montant = (montant_fc if devise == 'CDF' else montant_usd) or Decimal('100.00')
+            demandes.append(DemandePaiement(
+                reference=SequenceReference.formater('DEM', numero),
+                service_demandeur=self.hasard.choice(self.services),
+                nature_economique=self.hasard.choice(self.natures),
+                description=f'{self.hasard.choice(OBJETS_DEPENSE)} (demande {numero})',
+                montant=montant,
+                reste_a_payer=montant,
+                devise=devise,
+                date_demande=self._date(),
+                statut=statut,
+                cree_par=self.utilisateur,
+                approuve_par=self.utilisateur if statut == 'VALIDEE_DG' else None,
+                date_approbation=maintenant if statut == 'VALIDEE_DG' else None,
+                commentaire_rejet='Pièces incomplètes' if statut == 'REJETEE' else '',
+            ))
+        DemandePaiement.objects.bulk_create(demandes, batch_size=1000)
+
+        validees = [demande for demande in demandes if demande.statut == 'VALIDEE_DG']
+        a_relever = validees[:len(validees) * 9 // 10]
+        groupes = [a_relever[i:i + DEMANDES_PAR_RELEVE] for i in range(0, len(a_relever), DEMANDES_PAR_RELEVE)]
+        releves = []
+        for numero, groupe in zip(SequenceReference.allouer('REL', len(groupes)), groupes):
+            montant_cdf = sum((d.montant for d in groupe if d.devise == 'CDF'), Decimal('0.00'))
+            montant_usd = sum((d.montant for d in groupe if d.devise == 'USD'), Decimal('0.00'))
+            ipr_cdf = (montant_cdf * Decimal('0.03')).quantize(Decimal('0.01'))
+            ipr_usd = (montant_usd * Decimal('0.03')).quantize(Decimal('0.01'))
+            releves.append(ReleveDepense(
+                numero=SequenceReference.formater('REL', numero),
+                periode=date.today() - timedelta(days=len(releves)),
+                montant_cdf=montant_cdf, montant_usd=montant_usd,
+                ipr_cdf=ipr_cdf, ipr_usd=ipr_usd,
+                net_a_payer_cdf=montant_cdf - ipr_cdf, net_a_payer_usd=montant_usd - ipr_usd,
+                total=montant_cdf + montant_usd,
+                valide_par=self.utilisateur,
+            ))
+        ReleveDepense.objects.bulk_create(releves, batch_size=1000)
+        ReleveDepense.demandes.through.objects.bulk_create([
+            ReleveDepense.demandes.through(relevedepense_id=releve.pk, demandepaiement_id=demande.pk)
+            for releve, groupe in zip(releves, groupes) for demande in groupe
+        ], batch_size=5000)
+
+        cheques = []
+        for numero, releve in zip(SequenceReference.allouer('CHQ', len(releves)), releves):
+            cheques.append(Cheque(
+                numero_cheque=SequenceReference.formater('CHQ', numero),
+                releve_depense=releve,
+                banque=self.hasard.choice(self.banques),
+                montant_cdf=releve.net_a_payer_cdf, montant_usd=releve.net_a_payer_usd,
+                date_emission=releve.periode,
+                statut='EMIS',
+                beneficiaire=f'Bénéficiaires du relevé {releve.numero}',
+                cree_par=self.utilisateur,
+            ))
+        Cheque.objects.bulk_create(cheques, batch_size=1000)
+
+        payes = [(releve, groupe, cheque) for releve, groupe, cheque in zip(releves, groupes, cheques)
+                 if self.hasard.random() < 0.75]
+        a_payer = [(releve, demande, cheque) for releve, groupe, cheque in payes for demande in groupe]
+        paiements = []
+        lignes = []
+        for numero, (releve, demande, cheque) in zip(SequenceReference.allouer('PAY', len(a_payer)), a_payer):
+            reference = SequenceReference.formater('PAY', numero)
+            demande.statut = 'PAYEE'
+            demande.montant_deja_paye = demande.montant
+            demande.reste_a_payer = Decimal('0.00')
+            paiements.append(Paiement(
+                reference=reference, releve_depense=releve, demande=demande,
+                montant_paye=demande.montant, devise=demande.devise,
+                paiement_par=self.utilisateur, beneficiaire=demande.service_demandeur.nom_service[:50],
+            ))
+            lignes.append(DepenseFeuille(
+                mois=releve.periode.month, annee=releve.periode.year, date=releve.periode,
+                nature_economique=demande.nature_economique,
+                service_beneficiaire=demande.service_demandeur,
+                libelle_depenses=demande.description[:500],
+                banque=cheque.banque,
+                montant_fc=demande.montant if demande.devise == 'CDF' else Decimal('0.00'),
+                montant_usd=demande.montant if demande.devise == 'USD' else Decimal('0.00'),
+                releve_depense=releve, demande=demande,
+                paiement_par=self.utilisateur,
+                beneficiaire=demande.service_demandeur.nom_service,
+                date_paiement=maintenant,
+                reference_paiement=reference,
+            ))
+        Paiement.objects.bulk_create(paiements, batch_size=1000)
+        DepenseFeuille.objects.bulk_create(lignes, batch_size=1000)
+        DemandePaiement.objects.bulk_update(
+            [demande for _, demande, _ in a_payer], ['statut', 'montant_deja_paye', 'reste_a_payer'], batch_size=1000
+        )
+        return nombre
@@ -0,0 +1,142 @@
+"""
+Kit de mise en page ReportLab partagé par les exports PDF.
+
+Les éléments identiques d'un PDF à l'autre sont construits une seule fois par
+processus au lieu de l'être à chaque rapport :
+  - styles_pdf() : feuille de styles ReportLab complétée des styles de
+    paragraphe de l'application (cellules, titres, signataires...) ; elle est
+    partagée, les vues ne doivent donc pas modifier les styles obtenus ;
+  - le logo : le JPEG est lu et encodé pour le PDF (ASCII85, en Python pur,
+    l'essentiel du coût d'un petit rapport) une seule fois ; chaque document
+    en reçoit une copie légère de l'XObject image ;
+  - entete_logo() / pied_de_page() / DocumentRapport : en-tête avec logo et
+    pied de page « Page x de x / date » communs aux états.
+
+`manage.py mesurer_mise_en_page_pdf` compare le temps CPU par PDF avec et
+sans ces éléments partagés.
+"""
+import copy
+from datetime import date
+from functools import lru_cache
+
+from django.conf import settings
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import Flowable, SimpleDocTemplate, Spacer, Table, TableStyle
+
+
+CHEMIN_LOGO = settings.BASE_DIR / 'static' / 'img' / 'WhatsApp Image 2026-03-07 at 17.24.40.jpeg'
+
+# Styles de paragraphe de l'application : nom -> (style parent, attributs)
+STYLES_PARAGRAPHE = {
+    'CellLibelle': ('Normal', {'fontSize': 8, 'leading': 9}),
+    'Regroupement': ('Heading2', {'fontSize': 9, 'leading': 10}),
+    'TitreEtat': ('Heading1', {'fontSize': 16, 'spaceAfter': 20, 'alignment': TA_CENTER, 'textColor': colors.darkblue}),
+    'TitreDGRAD': ('Heading1', {'fontSize': 16, 'spaceAfter': 30, 'alignment': TA_CENTER, 'textColor': colors.darkblue}),
+    'EnteteTableau': ('Normal', {'fontSize': 10, 'alignment': TA_CENTER, 'textColor': colors.white}),
+    'TitreReleve': ('Heading1', {'fontSize': 16, 'textColor': colors.HexColor('#1a3a5f'), 'alignment': TA_CENTER, 'spaceAfter': 30}),
+    'PiedReleve': ('Normal', {'fontSize': 10, 'alignment': TA_RIGHT, 'spaceBefore': 20}),
+    'SignataireGauche': ('Normal', {'fontSize': 10, 'alignment': TA_LEFT}),
+    'SignataireDroite': ('Normal', {'fontSize': 10, 'alignment': TA_RIGHT}),
+    'SignataireCentre': ('Normal', {'fontSize': 10, 'alignment': TA_CENTER}),
+    'TitreCheque': ('Heading1', {'fontSize': 18, 'textColor': colors.HexColor('#1a3a5f'), 'alignment': TA_CENTER, 'spaceAfter': 30}),
+    'NormalCheque': ('Normal', {'fontSize': 12, 'alignment': TA_LEFT}),
+    'LettresCheque': ('Normal', {'fontSize': 9, 'fontName': 'Helvetica-Oblique', 'textColor': colors.HexColor('#666666'), 'alignment': TA_LEFT}),
+}
+
+# Tableau 2x2 de l'en-tête : logo en haut à gauche, cellules vides sans bordure
+STYLE_TABLE_LOGO = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 0),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+    ('TOPPADDING', (0, 0), (-1, -1), 0),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
+    ('GRID', (0, 0), (-1, -1), 0, colors.white),
+])
+
+
+@lru_cache(maxsize=None)
+def styles_pdf():
+    """Feuille de styles partagée (getSampleStyleSheet + STYLES_PARAGRAPHE)"""
+    styles = getSampleStyleSheet()
+    for nom, (parent, attributs) in STYLES_PARAGRAPHE.items():
+        styles.add(ParagraphStyle(nom, parent=styles[parent], **attributs))
+    return styles
+
+
+@lru_cache(maxsize=None)
+def _modele_logo():
+    """
+    XObject image du logo, encodé une fois. Il n'est enregistré dans aucun
+    document : ReportLab marque l'objet enregistré, chaque document en reçoit
+    donc une copie (qui partage le contenu encodé).
+    """
+    if not CHEMIN_LOGO.exists():
+        return None
+    from reportlab.pdfbase.pdfdoc import PDFImageXObject
+    from reportlab.pdfgen.canvas import _digester
+
+    # Nom calculé par Canvas.drawImage pour ce fichier, sans masque
+    nom = _digester(f'{CHEMIN_LOGO}None'.encode('utf-8'))
+    image = PDFImageXObject(nom, str(CHEMIN_LOGO))
+    image.name = nom
+    return image
+
+
+def dessiner_logo(canvas, x, y, largeur, hauteur):
+    """Dessine le logo sur `canvas` sans relire ni réencoder le fichier"""
+    modele = _modele_logo()
+    if modele is None:
+        return
+    document = canvas._doc
+    nom_enregistre = document.getXObjectName(modele.name)
+    if nom_enregistre not in document.idToObject:
+        # drawImage trouvera l'image déjà enregistrée sous son nom et ne chargera pas le fichier
+        image = copy.copy(modele)
+        document.Reference(image, nom_enregistre)
+        document.addForm(modele.name, image)
+    canvas.drawImage(str(CHEMIN_LOGO), x, y, largeur, hauteur)
+
+
+class Logo(Flowable):
+    """Logo de l'en-tête, dessiné depuis l'XObject partagé"""
+
+    def __init__(self, largeur=3*cm, hauteur=3*cm):
+        super().__init__()
+        self.largeur = largeur
+        self.hauteur = hauteur
+
+    def wrap(self, largeur_disponible, hauteur_disponible):
+        return self.largeur, self.hauteur
+
+    def draw(self):
+        dessiner_logo(self.canv, 0, 0, self.largeur, self.hauteur)
+
+
+def entete_logo():
+    """Flowables de l'en-tête des états : logo en haut à gauche puis espacement (vide sans logo)"""
+    if _modele_logo() is None:
+        return []
+    table = Table([[Logo(), ''], ['', '']], colWidths=[3*cm, 20*cm], rowHeights=[3*cm, 0.5*cm])
+    table.setStyle(STYLE_TABLE_LOGO)
+    return [table, Spacer(1, 0.3*cm)]
+
+
+def pied_de_page(canvas, doc):
+    """Pied de page : « Page x de x » à gauche, date du jour à droite"""
+    numero = canvas.getPageNumber()
+    canvas.saveState()
+    canvas.setFont("Helvetica", 8)
+    canvas.drawString(50, 25, f"Page {numero} de {numero}")
+    canvas.drawRightString(doc.pagesize[0] - 50, 25, date.today().strftime('%d/%m/%Y'))
+    canvas.restoreState()
+
+
+class DocumentRapport(SimpleDocTemplate):
+    """SimpleDocTemplate dont toutes les pages portent le pied de page commun"""
+
+    def build(self, flowables, onFirstPage=pied_de_page, onLaterPages=pied_de_page, **kwargs):
+        super().build(flowables, onFirstPage=onFirstPage, onLaterPages=onLaterPages, **kwargs)
@@ -107,8 +107,6 @@ class DashboardView(LoginRequiredMixin, TemplateView):
     def get_general_stats(self, start_date, end_date):
         """Obtenir les statistiques générales synchronisées avec le tableau de bord DAF"""
         try:
-            from demandes.models import DepenseFeuille
-            from recettes.models import RecetteFeuille
             from clotures.models import ClotureMensuelle
             from django.utils.timezone import now
             
@@ -120,8 +118,8 @@ class DashboardView(LoginRequiredMixin, TemplateView):
             # Récupérer la période actuelle
             try:
                 periode_actuelle = ClotureMensuelle.get_periode_actuelle()
-                periode_actuelle.calculer_soldes()
-                periode_actuelle.refresh_from_db()
+                # Soldes de la période (lecture seule : aucune écriture sur la clôture)
+                periode_actuelle.calculer_soldes_lecture_seule()
             except:
                 periode_actuelle = ClotureMensuelle.objects.create(
                     mois=current_month,
@@ -135,26 +133,21 @@ class DashboardView(LoginRequiredMixin, TemplateView):
             banques_count = Banque.objects.count()
             comptes_count = CompteBancaire.objects.count()
             
-            # Statistiques des dépenses (utilisant DepenseFeuille comme DAF)
-            depenses = DepenseFeuille.objects.filter(
+            # Statistiques des dépenses et recettes (même service d'agrégation que le DAF)
+            from tableau_bord_feuilles.agregation import AgregationFeuilles
+            totaux = AgregationFeuilles(Q(
                 mois=periode_actuelle.mois,
                 annee=periode_actuelle.annee
-            )
-            depenses_count = depenses.count()
+            )).totaux()
             
-            total_depenses_cdf = depenses.aggregate(total=Sum('montant_fc'))['total'] or Decimal('0.00')
-            total_depenses_usd = depenses.aggregate(total=Sum('montant_usd'))['total'] or Decimal('0.00')
+            depenses_count = totaux['nb_depenses']
+            total_depenses_cdf = totaux['depenses_cdf']
+            total_depenses_usd = totaux['depenses_usd']
             depenses_total = total_depenses_cdf  # Pour compatibilité
             
-            # Statistiques des recettes (utilisant RecetteFeuille comme DAF)
-            recettes = RecetteFeuille.objects.filter(
-                mois=periode_actuelle.mois,
-                annee=periode_actuelle.annee
-            )
-            recettes_count = recettes.count()
-            
-            total_recettes_cdf = recettes.aggregate(total=Sum('montant_fc'))['total'] or Decimal('0.00')
-            total_recettes_usd = recettes.aggregate(total=Sum('montant_usd'))['total'] or Decimal('0.00')
+            recettes_count = totaux['nb_recettes']
+            total_recettes_cdf = totaux['recettes_cdf']
+            total_recettes_usd = totaux['recettes_usd']
             recettes_total = total_recettes_cdf  # Pour compatibilité
             
             # Solde net (identique au DAF)
@@ -195,8 +188,6 @@ class DashboardView(LoginRequiredMixin, TemplateView):
     def get_chart_data(self, start_date, end_date):
         """Préparer les données pour les graphiques synchronisées avec le tableau de bord DAF"""
         try:
-            from demandes.models import DepenseFeuille
-            from recettes.models import RecetteFeuille
             from clotures.models import ClotureMensuelle
             from django.utils.timezone import now
             
@@ -204,28 +195,19 @@ class DashboardView(LoginRequiredMixin, TemplateView):
             today = now()
             current_year = today.year
             
-            # Données mensuelles pour l'année actuelle (similaire au DAF)
+            # Données mensuelles pour l'année actuelle (même service d'agrégation que le DAF)
+            from tableau_bord_feuilles.agregation import AgregationFeuilles
             chart_data = []
             
-            for mois in range(1, 13):
-                month_depenses = DepenseFeuille.objects.filter(
-                    annee=current_year,
-                    mois=mois
-                ).aggregate(total_fc=Sum('montant_fc'), total_usd=Sum('montant_usd'))
-                
-                month_recettes = RecetteFeuille.objects.filter(
-                    annee=current_year,
-                    mois=mois
-                ).aggregate(total_fc=Sum('montant_fc'), total_usd=Sum('montant_usd'))
-                
-                depenses_total = (month_depenses['total_fc'] or Decimal('0.00')) + (month_depenses['total_usd'] or Decimal('0.00'))
-                recettes_total = (month_recettes['total_fc'] or Decimal('0.00')) + (month_recettes['total_usd'] or Decimal('0.00'))
+            for item in AgregationFeuilles.evolution_mensuelle(current_year):
+                depenses_total = item['depenses_cdf'] + item['depenses_usd']
+                recettes_total = item['recettes_cdf'] + item['recettes_usd']
                 
                 chart_data.append({
-                    'month': f"{today.replace(day=1, month=mois).strftime('%b')} {current_year}",
-                    'depenses': float(depenses_total),
-                    'recettes': float(recettes_total),
-                    'solde': float(recettes_total - depenses_total)
+                    'month': f"{today.replace(day=1, month=item['mois']).strftime('%b')} {current_year}",
+                    'depenses': depenses_total,
+                    'recettes': recettes_total,
+                    'solde': recettes_total - depenses_total
                 })
             
             return {
@@ -7,3 +7,8 @@ from django.apps import AppConfig
 class RbacConfig(AppConfig):
     name = 'rbac'
     verbose_name = 'Gestion des Permissions'
+
+    def ready(self):
+        # Invalidation du cache des permissions à chaque modification des rôles,
+        # vérification que ce cache est partagé par les processus
+        from . import checks, signals  # noqa: F401
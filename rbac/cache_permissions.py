@@ -0,0 +1,132 @@
+"""
+Cache des permissions RBAC.
+
+Les vérifications (User.has_rbac_permission, User.has_permission_modele,
+Role.a_permission, RoleModele.a_permission_modele, filtres de gabarit) ne
+lancent plus une requête chacune :
+  - les permissions actives d'un rôle (codes pour Role, couples
+    (modele_django, action) pour RoleModele) sont lues une fois puis gardées
+    en frozenset dans le cache partagé de Django, sous une clé qui contient
+    le numéro de version des permissions ;
+  - l'ensemble effectif d'un utilisateur (codes de son rbac_role et couples
+    de son rbac_role_modele) est mémorisé sur l'instance : request.user étant
+    chargé à chaque requête, c'est un cache par requête ;
+  - les signaux (rbac.signals) changent le numéro de version à toute
+    modification de Permission, Role, PermissionModele, RoleModele ou de
+    leurs liaisons, et oublient l'ensemble mémorisé d'un utilisateur dont le
+    rôle change ; les anciennes clés expirent d'elles-mêmes.
+
+Le cache doit être partagé par tous les processus (CACHES : Redis ou table
+de la base) : un changement de version dans un cache local à un processus
+n'invaliderait pas les autres (vérification rbac.W001).
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+CLE_VERSION = 'rbac:permissions:version'
+DUREE_CACHE = 60 * 60
+
+# Attribut des instances (User, Role, RoleModele) où l'ensemble est mémorisé
+ATTRIBUT_MEMO = '_permissions_rbac'
+
+
+def version_permissions():
+    version = cache.get(CLE_VERSION)
+    if version is None:
+        # Horodatage : une clé de version évincée ne fait pas réapparaître d'anciennes entrées
+        cache.add(CLE_VERSION, time.time_ns(), None)
+        version = cache.get(CLE_VERSION, 0)
+    return version
+
+
+def _nouvelle_version():
+    try:
+        cache.incr(CLE_VERSION)
+    except ValueError:
+        cache.set(CLE_VERSION, time.time_ns(), None)
+
+
+def invalider_permissions():
+    """
+    Rend caduques toutes les permissions en cache (nouvelle version), tout de
+    suite puis à la validation de la transaction : un ensemble relu entre-temps
+    par une autre requête, avant la modification, n'est pas conservé.
+    """
+    _nouvelle_version()
+    transaction.on_commit(_nouvelle_version)
+
+
+def oublier(instance):
+    """Oublie l'ensemble mémorisé sur une instance"""
+    instance.__dict__.pop(ATTRIBUT_MEMO, None)
+
+
+def _en_cache(prefixe, pk, lire):
+    cle = f'rbac:{prefixe}:{version_permissions()}:{pk}'
+    permissions = cache.get(cle)
+    if permissions is None:
+        permissions = frozenset(lire())
+        cache.set(cle, permissions, DUREE_CACHE)
+    return permissions
+
+
+def codes_role(role_id):
+    """Codes des permissions actives d'un rbac.Role"""
+    if role_id is None:
+        return frozenset()
+    from .models import Permission
+    return _en_cache('role', role_id, lambda: Permission.objects.filter(
+        role=role_id, est_active=True
+    ).values_list('code', flat=True))
+
+
+def couples_role_modele(role_modele_id):
+    """Couples (modele_django, action) des permissions actives d'un RoleModele"""
+    if role_modele_id is None:
+        return frozenset()
+    from .models_modele import PermissionModele
+    return _en_cache('role_modele', role_modele_id, lambda: PermissionModele.objects.filter(
+        rolemodele=role_modele_id, est_active=True
+    ).values_list('modele_django', 'action'))
+
+
+def _memo(instance, calculer):
+    permissions = instance.__dict__.get(ATTRIBUT_MEMO)
+    if permissions is None:
+        permissions = instance.__dict__[ATTRIBUT_MEMO] = calculer()
+    return permissions
+
+
+def permissions_role(role):
+    return _memo(role, lambda: codes_role(role.pk))
+
+
+def permissions_role_modele(role_modele):
+    return _memo(role_modele, lambda: couples_role_modele(role_modele.pk))
+
+
+def permissions_utilisateur(user):
+    """
+    Ensemble effectif d'un utilisateur : codes (chaînes) de son rbac_role et
+    couples (modele_django, action) de son rbac_role_modele.
+    """
+    return _memo(user, lambda: codes_role(user.rbac_role_id) | couples_role_modele(user.rbac_role_modele_id))
+
+
+def motifs_url(role_code, role_id):
+    """
+    Motifs d'URL (Permission.url_pattern commençant par « / ») des permissions
+    actives du rôle RBAC `role_id` et du rôle RBAC actif de code `role_code`
+    (rôle de l'utilisateur) : règles d'accès modifiables sans déploiement.
+    """
+    if not role_code and role_id is None:
+        return frozenset()
+    from django.db.models import Q
+    from .models import Permission
+    roles = Q(role__code=role_code) | Q(role=role_id) if role_id is not None else Q(role__code=role_code)
+    return _en_cache('urls', f'{role_code}:{role_id}', lambda: Permission.objects.filter(
+        roles, role__est_actif=True, est_active=True, url_pattern__startswith='/'
+    ).values_list('url_pattern', flat=True))
@@ -0,0 +1,23 @@
+"""
+Vérifications système de l'application RBAC
+"""
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches)
+def verifier_cache_partage(app_configs, **kwargs):
+    """
+    Le cache des permissions (rbac.cache_permissions) n'est invalidé que dans
+    le cache où il est écrit : un cache local à chaque processus laisserait
+    les autres processus accorder d'anciennes permissions jusqu'à expiration.
+    """
+    if isinstance(caches['default'], LocMemCache):
+        return [Warning(
+            'Le cache par défaut est local à chaque processus : les permissions RBAC '
+            'retirées resteraient accordées par les autres processus.',
+            hint='Définir REDIS_URL ou utiliser le cache en base (DatabaseCache).',
+            id='rbac.W001',
+        )]
+    return []
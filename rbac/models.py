@@ -45,8 +45,9 @@ class Role(models.Model):
         return f"{self.nom} ({self.code})"
     
     def a_permission(self, code_permission):
-        """Vérifier si le rôle a une permission spécifique"""
-        return self.permissions.filter(code=code_permission, est_active=True).exists()
+        """Vérifier si le rôle a une permission spécifique (ensemble en cache, voir cache_permissions)"""
+        from .cache_permissions import permissions_role
+        return code_permission in permissions_role(self)
 
 
 # Supprimer la classe RolePermission car nous utilisons le M2M directement
@@ -76,6 +77,5 @@ class UserProfile(models.Model):
     
     def get_permissions_codes(self):
         """Obtenir la liste des codes de permissions de l'utilisateur"""
-        if not self.role:
-            return []
-        return list(self.role.permissions.filter(est_active=True).values_list('code', flat=True))
+        from .cache_permissions import codes_role
+        return sorted(codes_role(self.role_id))
@@ -123,12 +123,9 @@ class RoleModele(models.Model):
         super().save(*args, **kwargs)
     
     def a_permission_modele(self, modele_django, action):
-        """Vérifier si le rôle a une permission sur un modèle spécifique"""
-        return self.permissions_modeles.filter(
-            modele_django=modele_django, 
-            action=action, 
-            est_active=True
-        ).exists()
+        """Vérifier si le rôle a une permission sur un modèle spécifique (ensemble en cache, voir cache_permissions)"""
+        from .cache_permissions import permissions_role_modele
+        return (modele_django, action) in permissions_role_modele(self)
     
     def get_permissions_by_modele(self):
         """Retourne les permissions groupées par modèle"""
@@ -146,16 +143,9 @@ class UserPermissionMixin:
     """Mixin pour ajouter les méthodes de permissions basées sur les modèles à l'utilisateur"""
     
     def has_permission_modele(self, modele_django, action):
-        """Vérifie si l'utilisateur a une permission sur un modèle"""
-        # Priorité au nouveau système RBAC (basé sur les modèles)
-        if hasattr(self, 'rbac_role_modele') and self.rbac_role_modele:
-            return self.rbac_role_modele.a_permission_modele(modele_django, action)
-        
-        # Fallback vers l'ancien système RBAC
-        if hasattr(self, 'rbac_role') and self.rbac_role:
-            return self.rbac_role.a_permission_modele(modele_django, action)
-        
-        return False
+        """Vérifie si l'utilisateur a une permission sur un modèle (sans requête une fois l'ensemble en cache)"""
+        from .cache_permissions import permissions_utilisateur
+        return (modele_django, action) in permissions_utilisateur(self)
     
     def can_view_modele(self, modele_django):
         """Peut voir la liste du modèle"""
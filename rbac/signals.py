@@ -0,0 +1,35 @@
+"""
+Invalidation du cache des permissions RBAC (voir rbac.cache_permissions)
+"""
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .cache_permissions import invalider_permissions, oublier
+from .models import Permission, Role
+from .models_modele import PermissionModele, RoleModele
+
+
+def _invalider(sender, instance, **kwargs):
+    invalider_permissions()
+    oublier(instance)
+
+
+for modele in (Permission, Role, PermissionModele, RoleModele):
+    post_save.connect(_invalider, sender=modele, dispatch_uid=f'rbac_cache_save_{modele.__name__}')
+    post_delete.connect(_invalider, sender=modele, dispatch_uid=f'rbac_cache_delete_{modele.__name__}')
+
+
+@receiver(m2m_changed, sender=Role.permissions.through)
+@receiver(m2m_changed, sender=RoleModele.permissions_modeles.through)
+def liaisons_modifiees(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalider_permissions()
+        oublier(instance)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def role_utilisateur_modifie(sender, instance, update_fields=None, **kwargs):
+    # Les rôles en cache sont indexés par leur id : seul l'ensemble mémorisé sur l'instance est à oublier
+    if update_fields is None or {'rbac_role', 'rbac_role_modele'} & set(update_fields):
+        oublier(instance)
@@ -41,13 +41,13 @@ def can_access_module(user, module_name):
     
     modele_django, action = required_permission
     
-    # Essayer avec le nouveau système RBAC (basé sur les modèles)
-    if hasattr(user, 'rbac_role_modele') and user.rbac_role_modele:
+    # Essayer avec le nouveau système RBAC (basé sur les modèles) ; les *_id évitent de charger les rôles
+    if getattr(user, 'rbac_role_modele_id', None):
         if hasattr(user, 'has_permission_modele'):
             return user.has_permission_modele(modele_django, action)
     
     # Essayer avec l'ancien système RBAC
-    if hasattr(user, 'rbac_role') and user.rbac_role:
+    if getattr(user, 'rbac_role_id', None):
         if hasattr(user, 'has_rbac_permission'):
             # Mapping pour l'ancien système
             legacy_mapping = {
@@ -68,11 +68,16 @@ def can_access_module(user, module_name):
 
 @register.simple_tag
 def generate_dynamic_menu(user):
-    """Génère dynamiquement le menu selon les permissions de l'utilisateur"""
+    """
+    Génère dynamiquement le menu selon les permissions de l'utilisateur.
+    Seules les permissions actives (est_active) donnent une entrée, comme pour
+    has_permission_modele : une permission désactivée n'affiche plus de lien
+    vers une page qu'elle n'ouvre plus.
+    """
     if not user or not user.is_authenticated:
         return ""
     
-    if not hasattr(user, 'rbac_role_modele') or not user.rbac_role_modele:
+    if not getattr(user, 'rbac_role_modele_id', None):
         return ""
     
     # Mapping des permissions vers les informations de menu
@@ -129,19 +134,13 @@ def generate_dynamic_menu(user):
     
     menu_html = ""
     
-    # Obtenir toutes les permissions du rôle
-    if hasattr(user, 'rbac_role_modele') and user.rbac_role_modele:
-        permissions = user.rbac_role_modele.permissions_modeles.all()
-        
-        # Générer les items de menu dynamiquement
-        for permission in permissions:
-            modele = permission.modele_django
-            action = permission.action
-            
-            # Vérifier si on a une action de type 'liste' pour afficher le menu
-            if action in ['liste', 'voir'] and modele in menu_items:
-                item = menu_items[modele]
-                menu_html += f'<a class="nav-link" href="{item["url"]}"><i class="{item["icon"]}"></i> {item["label"]}</a>'
+    # Permissions actives du rôle : ensemble en cache, dans l'ordre de PermissionModele
+    from rbac.cache_permissions import couples_role_modele
+    for modele, action in sorted(couples_role_modele(user.rbac_role_modele_id)):
+        # Vérifier si on a une action de type 'liste' pour afficher le menu
+        if action in ['liste', 'voir'] and modele in menu_items:
+            item = menu_items[modele]
+            menu_html += f'<a class="nav-link" href="{item["url"]}"><i class="{item["icon"]}"></i> {item["label"]}</a>'
     
     return menu_html
 
@@ -0,0 +1,92 @@
+from django.core.cache import cache
+from django.db import connection
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import User
+from .models import Permission, Role
+from .models_modele import PermissionModele, RoleModele
+
+
+class CachePermissionsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.voir = Permission.objects.create(nom='Voir les banques', code='voir_banques', module='banques')
+        cls.role = Role.objects.create(nom='Comptable', code='COMPTABLE')
+        cls.role.permissions.add(cls.voir)
+        cls.liste = PermissionModele.objects.create(
+            nom='Liste des recettes', description='-', modele_django='recette', app_label='recettes', action='liste'
+        )
+        cls.role_modele = RoleModele.objects.create(nom='Recettes', description='-')
+        cls.role_modele.permissions_modeles.add(cls.liste)
+        cls.utilisateur = User.objects.create_user(
+            'compta', password='x', rbac_role=cls.role, rbac_role_modele=cls.role_modele
+        )
+
+    def setUp(self):
+        # Le cache partagé survit à l'annulation de la transaction de chaque test
+        cache.clear()
+
+    def utilisateur_de_la_requete(self):
+        # Comme request.user : une nouvelle instance à chaque requête
+        return User.objects.get(pk=self.utilisateur.pk)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_verifications_sans_requete(self):
+        # Cache hors de la base : toute requête capturée viendrait des vérifications
+        self.utilisateur_de_la_requete().has_rbac_permission('voir_banques')  # remplit le cache partagé
+
+        utilisateur = self.utilisateur_de_la_requete()
+        # Première vérification de la requête : lecture du cache partagé seulement
+        with self.assertNumQueries(0):
+            utilisateur.has_permission_modele('recette', 'liste')
+
+        gabarit = Template(
+            "{% load rbac_tags %}{{ u|has_rbac_permission:'voir_banques' }} {{ u|can_access_module:'recettes' }} "
+            "{{ u|can_access_module:'banques' }} {{ u|has_rbac_permission:'inconnue' }}"
+        )
+        with self.assertNumQueries(0):
+            rendu = gabarit.render(Context({'u': utilisateur}))
+            self.assertTrue(utilisateur.has_permission_modele('recette', 'liste'))
+            self.assertFalse(utilisateur.has_permission_modele('recette', 'supprimer'))
+        self.assertEqual(rendu, 'True True False False')
+
+    def test_invalidation_par_les_signaux(self):
+        self.assertFalse(self.role.a_permission('voir_clotures'))
+        clotures = Permission.objects.create(nom='Voir les clôtures', code='voir_clotures', module='clotures')
+        self.role.permissions.add(clotures)
+        self.assertTrue(self.role.a_permission('voir_clotures'))
+        self.assertTrue(self.utilisateur_de_la_requete().has_rbac_permission('voir_clotures'))
+
+        # Permission désactivée
+        self.liste.est_active = False
+        self.liste.save()
+        self.assertFalse(self.role_modele.a_permission_modele('recette', 'liste'))
+        self.assertFalse(self.utilisateur_de_la_requete().has_permission_modele('recette', 'liste'))
+
+        # Changement de rôle de l'utilisateur
+        utilisateur = self.utilisateur_de_la_requete()
+        self.assertTrue(utilisateur.has_rbac_permission('voir_banques'))
+        utilisateur.rbac_role = None
+        utilisateur.save(update_fields=['rbac_role'])
+        self.assertFalse(utilisateur.has_rbac_permission('voir_banques'))
+
+    def test_cache_partage_en_base(self):
+        # Cache par défaut (table efinance_cache) : la première vérification de la
+        # requête lit la table de cache (version, puis ensemble, pour le rôle et
+        # le rôle modèle), jamais les tables RBAC
+        self.utilisateur_de_la_requete().has_rbac_permission('voir_banques')
+        utilisateur = self.utilisateur_de_la_requete()
+        with CaptureQueriesContext(connection) as requetes:
+            self.assertTrue(utilisateur.has_permission_modele('recette', 'liste'))
+        tables = ['efinance_cache' if 'efinance_cache' in q['sql'] else q['sql'] for q in requetes.captured_queries]
+        self.assertEqual(tables, ['efinance_cache'] * 4)
+
+    def test_avertissement_cache_local(self):
+        from .checks import verifier_cache_partage
+
+        self.assertEqual(verifier_cache_partage(None), [])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([a.id for a in verifier_cache_partage(None)], ['rbac.W001'])
@@ -1,6 +1,7 @@
 """
 Admin pour les modèles recettes
 """
+from django import forms
 from django.contrib import admin
 from .models import Recette, SourceRecette, RecetteFeuille
 
@@ -46,8 +47,26 @@ class RecetteAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
     date_hierarchy = 'date_encaissement'
 
 
+class RecetteFeuilleAdminForm(forms.ModelForm):
+    """Refuse une ligne de même contenu qu'une ligne existante (index unique de l'empreinte)"""
+
+    class Meta:
+        model = RecetteFeuille
+        fields = '__all__'
+
+    def validate_unique(self):
+        super().validate_unique()
+        if not self.errors:
+            doublon = self.instance.doublon()
+            if doublon is not None:
+                self.add_error(None, forms.ValidationError(
+                    'Cette recette est déjà enregistrée (ligne du {:%d/%m/%Y} : même libellé, banque et montants).'.format(doublon.date)
+                ))
+
+
 @admin.register(RecetteFeuille)
 class RecetteFeuilleAdmin(admin.ModelAdmin):
+    form = RecetteFeuilleAdminForm
     list_display = ['date', 'mois', 'annee', 'libelle_recette', 'banque', 'montant_fc', 'montant_usd']
     list_filter = ['annee', 'mois', 'banque']
     search_fields = ['libelle_recette', 'banque']
@@ -116,6 +116,16 @@ class RecetteFeuilleForm(forms.ModelForm):
         
         # Le champ date reste modifiable mais sera pré-rempli avec la période en cours
 
+    def validate_unique(self):
+        super().validate_unique()
+        # Même contenu qu'une ligne existante : recherche dans l'index unique de l'empreinte
+        if not self.errors:
+            doublon = self.instance.doublon()
+            if doublon is not None:
+                self.add_error(None, forms.ValidationError(
+                    'Cette recette est déjà enregistrée (ligne du {:%d/%m/%Y} : même libellé, banque et montants).'.format(doublon.date)
+                ))
+
     def clean_annee(self):
         annee = self.cleaned_data.get('annee')
         if annee is not None:
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.4 on 2026-10-17 23:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banques', '0001_initial'),
+        ('recettes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recettefeuille',
+            index=models.Index(fields=['annee', 'mois', 'date'], name='recettes_re_annee_db5e0d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recettefeuille',
+            index=models.Index(fields=['banque', 'annee', 'mois'], name='recettes_re_banque__5aad73_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recettefeuille',
+            index=models.Index(fields=['date', 'date_creation'], name='recettes_re_date_9c0a4d_idx'),
+        ),
+    ]
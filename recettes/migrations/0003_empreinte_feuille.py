@@ -0,0 +1,49 @@
+# Generated by Django 5.0.4 on 2026-10-17 23:58
+
+from django.db import migrations, models
+
+from demandes.empreintes import empreinte_ligne
+
+
+def calculer_empreintes(apps, schema_editor):
+    """
+    Empreinte des lignes existantes, par lots. Si des doublons sont déjà en
+    base, seule la première ligne (plus petit id) reçoit l'empreinte : les
+    autres restent hors de l'index unique.
+    """
+    RecetteFeuille = apps.get_model('recettes', 'RecetteFeuille')
+    lignes = RecetteFeuille.objects.order_by('pk').values_list(
+        'pk', 'date', 'libelle_recette', 'banque_id', 'montant_fc', 'montant_usd'
+    )
+    vues = set()
+    lot = []
+    for pk, *contenu in lignes.iterator(chunk_size=2000):
+        empreinte = empreinte_ligne(*contenu)
+        if empreinte in vues:
+            continue
+        vues.add(empreinte)
+        lot.append(RecetteFeuille(pk=pk, empreinte=empreinte))
+        if len(lot) >= 1000:
+            RecetteFeuille.objects.bulk_update(lot, ['empreinte'])
+            lot = []
+    RecetteFeuille.objects.bulk_update(lot, ['empreinte'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recettes', '0002_recettefeuille_recettes_re_annee_db5e0d_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recettefeuille',
+            name='empreinte',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(calculer_empreintes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='recettefeuille',
+            constraint=models.UniqueConstraint(condition=models.Q(('empreinte__isnull', False)), fields=('empreinte',), name='recette_feuille_empreinte_unique'),
+        ),
+    ]
@@ -1,11 +1,12 @@
 """
 Modèles pour la gestion des recettes
 """
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 from accounts.models import User
 from banques.models import Banque, CompteBancaire
+from demandes.empreintes import empreinte_ligne
 
 
 class SourceRecette(models.Model):
@@ -117,10 +118,7 @@ class Recette(models.Model):
         return self.montant_usd > 0 or self.montant_cdf > 0
     
     def save(self, *args, **kwargs):
-        if not self.reference:
-            # Génération automatique de la référence
-            count = Recette.objects.count() + 1
-            self.reference = f"REC-{count:06d}"
+        from demandes.models import SequenceReference
         
         is_new = self.pk is None
         was_validated = False
@@ -131,7 +129,11 @@ class Recette(models.Model):
             except Recette.DoesNotExist:
                 pass
         
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.reference:
+                # Génération automatique de la référence
+                self.reference = SequenceReference.prochaine_reference('REC')
+            super().save(*args, **kwargs)
         
         # Mise à jour automatique des soldes lors de l'enregistrement de la recette
         # Cette mise à jour cumule automatiquement le montant dans le solde consolidé du tableau de bord
@@ -294,6 +296,8 @@ class RecetteFeuille(models.Model):
         validators=[MinValueValidator(Decimal('0.00'))],
         verbose_name="Montant $us"
     )
+    # Empreinte du contenu (voir demandes.empreintes), unique
+    empreinte = models.CharField(max_length=64, null=True, blank=True, editable=False)
     date_creation = models.DateTimeField(auto_now_add=True)
     date_modification = models.DateTimeField(auto_now=True)
 
@@ -301,8 +305,53 @@ class RecetteFeuille(models.Model):
         verbose_name = "Recette (feuille)"
         verbose_name_plural = "Recettes (feuille)"
         ordering = ['-date', '-date_creation']
+        # Index alignés sur les filtres des listes, du tableau général et des états
+        indexes = [
+            models.Index(fields=['annee', 'mois', 'date']),
+            models.Index(fields=['banque', 'annee', 'mois']),
+            models.Index(fields=['date', 'date_creation']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['empreinte'],
+                condition=models.Q(empreinte__isnull=False),
+                name='recette_feuille_empreinte_unique',
+            ),
+        ]
 
     def __str__(self):
         nom_banque = self.banque.nom_banque if self.banque else ""
         return f"{self.date} - {self.libelle_recette[:50]} - {nom_banque}"
 
+    def calculer_empreinte(self):
+        return empreinte_ligne(self.date, self.libelle_recette, self.banque_id, self.montant_fc, self.montant_usd)
+
+    def empreinte_a_enregistrer(self):
+        """
+        Empreinte enregistrée par save(). Une ligne existante sans empreinte
+        (doublon antérieur à l'index, laissé hors de l'index par la migration
+        0003) la garde nulle tant que son contenu est celui d'une autre ligne.
+        """
+        empreinte = self.calculer_empreinte()
+        if self.pk and self.empreinte is None and self._meme_empreinte(empreinte):
+            return None
+        return empreinte
+
+    def _meme_empreinte(self, empreinte):
+        return RecetteFeuille.objects.filter(empreinte=empreinte).exclude(pk=self.pk).first()
+
+    def doublon(self):
+        """Ligne existante de même contenu (recherche dans l'index de l'empreinte), None sinon"""
+        empreinte = self.empreinte_a_enregistrer()
+        if empreinte is None:
+            return None
+        return self._meme_empreinte(empreinte)
+
+    def save(self, *args, **kwargs):
+        self.empreinte = self.empreinte_a_enregistrer()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'empreinte'}
+        # Transaction : les agrégats mensuels (signaux pre/post_save) sont mis à jour avec la ligne
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
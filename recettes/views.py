@@ -8,8 +8,10 @@ from django.shortcuts import redirect, get_object_or_404
 from django.contrib import messages
 from django.http import JsonResponse
 from django.utils import timezone
+from django.db import IntegrityError
 from django.db.models import Q, Sum
 from accounts.permissions import RoleRequiredMixin
+from rapports.export_csv import ExportCSVMixin
 from .models import Recette, RecetteFeuille
 from .forms import RecetteForm, RecetteFeuilleForm
 from banques.models import CompteBancaire, Banque
@@ -98,6 +100,23 @@ class RecetteListView(RoleRequiredMixin, ListView):
         return context
 
 
+class RecetteExportView(ExportCSVMixin, RecetteListView):
+    """Export CSV/TSV des recettes, avec les filtres de la liste"""
+    nom_export = 'recettes'
+    colonnes_export = (
+        ('Référence', 'reference'),
+        ('Date d\'encaissement', 'date_encaissement'),
+        ('Banque', 'banque__nom_banque'),
+        ('Compte', 'compte_bancaire__intitule_compte'),
+        ('Source', 'source_recette__nom'),
+        ('Description', 'description'),
+        ('Montant USD', 'montant_usd'),
+        ('Montant CDF', 'montant_cdf'),
+        ('Validée', 'valide'),
+        ('Date de validation', 'date_validation'),
+    )
+
+
 class RecetteCreateView(RoleRequiredMixin, CreateView):
     model = Recette
     form_class = RecetteForm
@@ -217,7 +236,9 @@ class RecetteFeuilleListView(RoleRequiredMixin, ListView):
         
         mots_cles = self.request.GET.get('mots_cles', '').strip()
         if mots_cles:
-            qs = qs.filter(libelle_recette__icontains=mots_cles)
+            # Recherche plein texte, résultats classés par pertinence
+            from tableau_bord_feuilles.recherche import rechercher_feuilles
+            qs = rechercher_feuilles(qs, mots_cles)
         
         # Filtres par date
         date_debut = self.request.GET.get('date_debut')
@@ -259,6 +280,20 @@ class RecetteFeuilleListView(RoleRequiredMixin, ListView):
         return context
 
 
+class RecetteFeuilleExportView(ExportCSVMixin, RecetteFeuilleListView):
+    """Export CSV/TSV de la feuille RECETTES, avec les filtres de la liste"""
+    nom_export = 'recettes_feuille'
+    colonnes_export = (
+        ('Date', 'date'),
+        ('Mois', 'mois'),
+        ('Année', 'annee'),
+        ('Libellé', 'libelle_recette'),
+        ('Banque', 'banque__nom_banque'),
+        ('Montant FC', 'montant_fc'),
+        ('Montant USD', 'montant_usd'),
+    )
+
+
 class RecetteFeuilleCreateView(RoleRequiredMixin, CreateView):
     model = RecetteFeuille
     form_class = RecetteFeuilleForm
@@ -310,8 +345,14 @@ class RecetteFeuilleCreateView(RoleRequiredMixin, CreateView):
         return initial
 
     def form_valid(self, form):
+        try:
+            reponse = super().form_valid(form)
+        except IntegrityError:
+            # Même ligne enregistrée entre la validation du formulaire et l'insertion
+            form.add_error(None, 'Cette recette vient d\'être enregistrée (même libellé, banque et montants).')
+            return self.form_invalid(form)
         messages.success(self.request, 'Ligne recette (feuille) enregistrée.')
-        return super().form_valid(form)
+        return reponse
 
 
 class RecetteFeuilleUpdateView(LoginRequiredMixin, UpdateView):
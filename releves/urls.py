@@ -8,6 +8,7 @@ app_name = 'releves'
 
 urlpatterns = [
     path('', views.ReleveBancaireListView.as_view(), name='liste'),
+    path('mouvements/export/', views.MouvementBancaireExportView.as_view(), name='mouvements_export'),
     path('creer/', views.ReleveBancaireCreateView.as_view(), name='creer'),
     path('<int:pk>/', views.ReleveBancaireDetailView.as_view(), name='detail'),
     path('<int:pk>/modifier/', views.ReleveBancaireUpdateView.as_view(), name='modifier'),
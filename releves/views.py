@@ -8,9 +8,11 @@ from django.shortcuts import redirect, get_object_or_404
 from django.contrib import messages
 from django.http import JsonResponse
 from django.utils import timezone
+from datetime import datetime
 from .models import ReleveBancaire, MouvementBancaire
 from .forms import ReleveBancaireForm, MouvementBancaireForm
 from banques.models import CompteBancaire
+from rapports.export_csv import ExportCSVMixin
 
 
 class ReleveBancaireListView(LoginRequiredMixin, ListView):
@@ -31,7 +33,7 @@ class ReleveBancaireListView(LoginRequiredMixin, ListView):
         
         # Filtrage par statut
         valide = self.request.GET.get('valide')
-        if valide is not None:
+        if valide in ('true', 'false'):
             queryset = queryset.filter(valide=valide == 'true')
         
         # Filtrage par devise
@@ -150,6 +152,62 @@ class MouvementBancaireDeleteView(LoginRequiredMixin, DeleteView):
         return super().delete(request, *args, **kwargs)
 
 
+class MouvementBancaireExportView(ExportCSVMixin, LoginRequiredMixin, ListView):
+    """
+    Export CSV/TSV des mouvements bancaires. Accepte les filtres de la liste
+    des relevés (banque, valide, devise) appliqués au relevé, ainsi que
+    releve, type_mouvement, date_debut et date_fin.
+    """
+    model = MouvementBancaire
+    nom_export = 'mouvements_bancaires'
+    colonnes_export = (
+        ('Date d\'opération', 'date_operation'),
+        ('Banque', 'releve__banque__nom_banque'),
+        ('Compte', 'releve__compte_bancaire__intitule_compte'),
+        ('Relevé du', 'releve__periode_debut'),
+        ('Relevé au', 'releve__periode_fin'),
+        ('Type', 'type_mouvement'),
+        ('Référence opération', 'reference_operation'),
+        ('Description', 'description'),
+        ('Bénéficiaire ou source', 'beneficiaire_ou_source'),
+        ('Montant', 'montant'),
+        ('Devise', 'devise'),
+        ('Recette liée', 'lie_a_recette__reference'),
+        ('Demande liée', 'lie_a_demande__reference'),
+    )
+    
+    def get_queryset(self):
+        queryset = MouvementBancaire.objects.all()
+        
+        releve_id = self.request.GET.get('releve')
+        if releve_id:
+            queryset = queryset.filter(releve_id=releve_id)
+        
+        # Mêmes filtres que la liste des relevés
+        banque_id = self.request.GET.get('banque')
+        if banque_id:
+            queryset = queryset.filter(releve__banque_id=banque_id)
+        valide = self.request.GET.get('valide')
+        if valide in ('true', 'false'):
+            queryset = queryset.filter(releve__valide=valide == 'true')
+        devise = self.request.GET.get('devise')
+        if devise:
+            queryset = queryset.filter(devise=devise)
+        
+        type_mouvement = self.request.GET.get('type_mouvement')
+        if type_mouvement:
+            queryset = queryset.filter(type_mouvement=type_mouvement)
+        for parametre, lookup in (('date_debut', 'date_operation__gte'), ('date_fin', 'date_operation__lte')):
+            valeur = self.request.GET.get(parametre)
+            if valeur:
+                try:
+                    queryset = queryset.filter(**{lookup: datetime.strptime(valeur, '%Y-%m-%d').date()})
+                except ValueError:
+                    pass
+        
+        return queryset.order_by('-date_operation', '-date_creation')
+
+
 def load_comptes(request):
     """Vue AJAX pour charger les comptes bancaires selon la banque"""
     banque_id = request.GET.get('banque_id')
@@ -0,0 +1,144 @@
+"""
+Service d'agrégation des feuilles DEPENSES / RECETTES pour les tableaux de bord.
+
+Toutes les sommes d'une requête sont obtenues en quelques requêtes GROUP BY
+sur la table AgregatFeuilleMensuel (SUM conditionnels par type d'opération) :
+  - une requête groupée par banque, qui donne aussi les totaux généraux ;
+  - une requête groupée par mois pour l'évolution mensuelle ;
+  - une requête par top N (dépenses / recettes) sur les feuilles.
+Le nombre de requêtes ne dépend donc pas du nombre de banques ni de mois.
+"""
+from decimal import Decimal
+
+from django.db.models import Q, Sum
+
+from demandes.models import DepenseFeuille
+from recettes.models import RecetteFeuille
+from .models import AgregatFeuilleMensuel
+
+
+MOIS_NOMS_COURTS = ['Jan', 'Fév', 'Mar', 'Avr', 'Mai', 'Jun', 'Jul', 'Aoû', 'Sep', 'Oct', 'Nov', 'Déc']
+
+EST_DEPENSE = Q(type_operation=AgregatFeuilleMensuel.TYPE_DEPENSE)
+EST_RECETTE = Q(type_operation=AgregatFeuilleMensuel.TYPE_RECETTE)
+
+SOMMES_CONDITIONNELLES = {
+    'depenses_cdf': Sum('total_fc', filter=EST_DEPENSE),
+    'depenses_usd': Sum('total_usd', filter=EST_DEPENSE),
+    'recettes_cdf': Sum('total_fc', filter=EST_RECETTE),
+    'recettes_usd': Sum('total_usd', filter=EST_RECETTE),
+    'nb_depenses': Sum('nombre', filter=EST_DEPENSE),
+    'nb_recettes': Sum('nombre', filter=EST_RECETTE),
+}
+
+
+def _normaliser(row):
+    """Remplace les NULL des SUM par des zéros et ajoute les soldes"""
+    stats = {
+        'depenses_cdf': row.get('depenses_cdf') or Decimal('0.00'),
+        'depenses_usd': row.get('depenses_usd') or Decimal('0.00'),
+        'recettes_cdf': row.get('recettes_cdf') or Decimal('0.00'),
+        'recettes_usd': row.get('recettes_usd') or Decimal('0.00'),
+        'nb_depenses': row.get('nb_depenses') or 0,
+        'nb_recettes': row.get('nb_recettes') or 0,
+    }
+    stats['solde_cdf'] = stats['recettes_cdf'] - stats['depenses_cdf']
+    stats['solde_usd'] = stats['recettes_usd'] - stats['depenses_usd']
+    return stats
+
+
+class AgregationFeuilles:
+    """
+    Calcule les totaux des feuilles pour un filtre donné.
+
+    Le filtre est un objet Q portant sur les colonnes communes aux feuilles et
+    aux agrégats (annee, mois, banque_id), il est appliqué tel quel aux deux.
+    Les résultats sont mémorisés sur l'instance : une instance par requête HTTP.
+    """
+
+    def __init__(self, filtre=None):
+        self.filtre = filtre if filtre is not None else Q()
+        self._par_banque = None
+
+    def agregats(self):
+        return AgregatFeuilleMensuel.objects.filter(self.filtre)
+
+    def par_banque(self):
+        """Totaux par banque_id (None pour les lignes sans banque), une seule requête"""
+        if self._par_banque is None:
+            self._par_banque = {
+                row['banque_id']: _normaliser(row)
+                for row in self.agregats().values('banque_id').annotate(**SOMMES_CONDITIONNELLES).order_by()
+            }
+        return self._par_banque
+
+    def totaux(self):
+        """Totaux généraux, déduits des totaux par banque (aucune requête supplémentaire)"""
+        cumul = {cle: Decimal('0.00') for cle in ['depenses_cdf', 'depenses_usd', 'recettes_cdf', 'recettes_usd']}
+        cumul.update({'nb_depenses': 0, 'nb_recettes': 0})
+        for stats in self.par_banque().values():
+            for cle in cumul:
+                cumul[cle] += stats[cle]
+        return _normaliser(cumul)
+
+    def stats_banques(self, banques):
+        """Liste des statistiques pour les banques données (format du tableau de bord DAF)"""
+        par_banque = self.par_banque()
+        vide = _normaliser({})
+        stats_par_banque = []
+        for banque in banques:
+            stats = par_banque.get(banque.pk, vide)
+            stats_par_banque.append({
+                'banque': banque,
+                'total_depenses_cdf': stats['depenses_cdf'],
+                'total_depenses_usd': stats['depenses_usd'],
+                'total_recettes_cdf': stats['recettes_cdf'],
+                'total_recettes_usd': stats['recettes_usd'],
+                'solde_cdf': stats['solde_cdf'],
+                'solde_usd': stats['solde_usd'],
+                'nb_operations': stats['nb_depenses'] + stats['nb_recettes'],
+            })
+        return stats_par_banque
+
+    @staticmethod
+    def evolution_mensuelle(annee, banque_id=None):
+        """Totaux des 12 mois de l'année, en une requête groupée par mois"""
+        agregats = AgregatFeuilleMensuel.objects.filter(annee=annee)
+        if banque_id:
+            agregats = agregats.filter(banque_id=banque_id)
+        par_mois = {
+            row['mois']: _normaliser(row)
+            for row in agregats.values('mois').annotate(**SOMMES_CONDITIONNELLES).order_by()
+        }
+
+        vide = _normaliser({})
+        evolution = []
+        for mois in range(1, 13):
+            stats = par_mois.get(mois, vide)
+            evolution.append({
+                'mois': mois,
+                'mois_nom': MOIS_NOMS_COURTS[mois - 1],
+                'depenses_cdf': float(stats['depenses_cdf']),
+                'depenses_usd': float(stats['depenses_usd']),
+                'recettes_cdf': float(stats['recettes_cdf']),
+                'recettes_usd': float(stats['recettes_usd']),
+                'solde_cdf': float(stats['solde_cdf']),
+                'solde_usd': float(stats['solde_usd']),
+            })
+        return evolution
+
+    def top_depenses(self, n=10):
+        return DepenseFeuille.objects.filter(self.filtre).select_related(
+            'banque', 'nature_economique', 'service_beneficiaire'
+        ).order_by('-montant_fc', '-montant_usd')[:n]
+
+    def top_recettes(self, n=10):
+        return RecetteFeuille.objects.filter(self.filtre).select_related(
+            'banque'
+        ).order_by('-montant_fc', '-montant_usd')[:n]
+
+    @staticmethod
+    def annees_disponibles():
+        return list(
+            AgregatFeuilleMensuel.objects.filter(nombre__gt=0).order_by().values_list('annee', flat=True).distinct()
+        )
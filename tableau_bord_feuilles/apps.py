@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class TableauBordFeuillesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tableau_bord_feuilles'
+
+    def ready(self):
+        # Maintenance des agrégats mensuels à chaque écriture de feuille
+        from . import signals
+        from django.db.models.signals import post_migrate
+
+        # Index plein texte FTS5 (SQLite) : recréés après chaque migrate
+        post_migrate.connect(signals.installer_recherche_plein_texte, sender=self)
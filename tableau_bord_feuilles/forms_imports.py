@@ -0,0 +1,24 @@
+from django import forms
+from django.core.validators import FileExtensionValidator
+
+from .models import ImportFeuilleWeb
+
+
+class ImportFeuilleWebForm(forms.ModelForm):
+    """Téléversement d'un classeur DATADAF à analyser"""
+
+    class Meta:
+        model = ImportFeuilleWeb
+        fields = ['fichier', 'feuille']
+        widgets = {
+            'fichier': forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.xlsx,.xlsm'}),
+            'feuille': forms.Select(attrs={'class': 'form-select'}),
+        }
+        labels = {
+            'fichier': 'Classeur Excel (.xlsx)',
+            'feuille': 'Feuille à importer',
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['fichier'].validators.append(FileExtensionValidator(['xlsx', 'xlsm']))
@@ -0,0 +1,571 @@
+"""
+Import en masse des feuilles DEPENSES / RECETTES du classeur DATADAF.
+
+Utilisé par les commandes `import_depenses_feuille` et `import_recettes_feuille` :
+  - les articles littera et les banques sont chargés une fois en dictionnaires
+    (mêmes règles de correspondance qu'auparavant : code exact sans espaces
+    puis insensible à la casse ; nom de banque exact insensible à la casse
+    puis contenu dans le nom) ;
+  - les doublons (même date, libellé, banque, montants) sont détectés par
+    l'empreinte de contenu (demandes.empreintes, colonne `empreinte` sous
+    index unique) : une recherche empreinte__in dans l'index par lot, plus
+    les empreintes des lignes déjà lues ;
+  - les lignes sont insérées par bulk_create, une transaction par lot ; si
+    l'index unique refuse une ligne enregistrée entre la recherche et
+    l'insertion par un autre import ou une saisie, le lot est repris ligne
+    par ligne (save, donc signaux et agrégats) et la ligne refusée comptée
+    comme doublon ;
+  - importer_fichier() lit la feuille en mode read-only (lignes en flux) et
+    tient un point de reprise (RepriseImport : empreinte du fichier, feuille,
+    dernière ligne) mis à jour dans la transaction de chaque lot : un import
+    interrompu reprend après le dernier lot enregistré ;
+  - importer_en_parallele() traite plusieurs feuilles ou fichiers dans un
+    pool de processus (commande `import_datadaf`) ;
+  - analyser() classe les lignes (nouvelles, doublons, erreurs) sans rien
+    écrire : aperçu des imports téléversés depuis l'application
+    (ImportFeuilleWeb, voir taches_import).
+
+bulk_create n'envoie pas les signaux pre/post_save : les agrégats mensuels
+(AgregatFeuilleMensuel) et le marquage des clôtures à recalculer sont
+appliqués par lot, dans la transaction du lot, avec un delta par clé.
+"""
+import hashlib
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import as_completed
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import DatabaseError, IntegrityError, transaction
+
+from banques.models import Banque
+from clotures.models import ClotureMensuelle
+from demandes.empreintes import empreinte_ligne
+from demandes.models import DepenseFeuille, NatureEconomique
+from efinance_daf.executeurs import executeur
+from recettes.models import RecetteFeuille
+from .models import AgregatFeuilleMensuel, RepriseImport
+
+
+TAILLE_LOT = 1000
+
+# En-têtes ligne 3 du classeur DATADAF, données à partir de la ligne 4
+PREMIERE_LIGNE = 4
+
+
+class LigneInvalide(Exception):
+    """Ligne de la feuille impossible à importer (message affiché à l'utilisateur)"""
+
+
+class ImportImpossible(Exception):
+    """Fichier ou feuille illisible : rien n'est importé"""
+
+
+def en_decimal(valeur):
+    if valeur is None or valeur == '':
+        return Decimal('0.00')
+    try:
+        return Decimal(str(valeur).replace(',', '.').strip())
+    except (InvalidOperation, ValueError):
+        return Decimal('0.00')
+
+
+def en_texte(valeur):
+    """Texte d'une cellule ; un code saisi comme nombre (1111.0) redevient « 1111 »"""
+    if valeur is None:
+        return ''
+    if isinstance(valeur, float) and valeur.is_integer():
+        valeur = int(valeur)
+    return str(valeur).strip()
+
+
+def date_de_la_ligne(mois_val, annee_val, date_val):
+    """
+    (date, mois, annee) d'une ligne : la date de la cellule, sinon le premier
+    jour du mois indiqué ; mois et année de la date s'ils sont absents.
+    """
+    if date_val is None:
+        if not (annee_val and mois_val):
+            raise LigneInvalide('date manquante')
+        try:
+            date_val = datetime(int(annee_val), min(max(int(mois_val), 1), 12), 1).date()
+        except (ValueError, TypeError):
+            raise LigneInvalide(f'date invalide (mois={mois_val}, annee={annee_val})')
+
+    if hasattr(date_val, 'date'):
+        date_val = date_val.date()
+    elif isinstance(date_val, str):
+        for format_date in ('%Y-%m-%d', '%d/%m/%Y'):
+            try:
+                date_val = datetime.strptime(date_val[:10], format_date).date()
+                break
+            except ValueError:
+                continue
+        else:
+            raise LigneInvalide(f'format date invalide "{date_val}"')
+
+    try:
+        mois = int(mois_val) if mois_val is not None else date_val.month
+        annee = int(annee_val) if annee_val is not None else date_val.year
+    except (ValueError, TypeError):
+        mois, annee = date_val.month, date_val.year
+    return date_val, max(1, min(12, mois)), annee
+
+
+class ResultatImport:
+    """Compteurs d'un import"""
+
+    def __init__(self):
+        self.importees = 0
+        self.doublons = 0
+        self.erreurs = []
+        self.lues = 0
+        self.duree = 0.0
+        self.premiere_ligne = None
+        self.deja_termine = False
+
+    @property
+    def lignes_par_seconde(self):
+        return self.lues / self.duree if self.duree else 0.0
+
+
+class ImportFeuille:
+    """
+    Import d'une feuille : les sous-classes décrivent le modèle et les colonnes.
+    `importer()` reçoit les lignes (tuples de valeurs) à partir de `premiere_ligne`.
+    """
+    modele = None
+    champ_libelle = None
+    nb_colonnes = 0
+
+    def __init__(self, dry_run=False, taille_lot=TAILLE_LOT):
+        # Les doublons sont toujours écartés : l'index unique sur l'empreinte les refuse
+        self.dry_run = dry_run
+        self.taille_lot = max(1, taille_lot)
+        self.resultat = ResultatImport()
+        self.empreintes = set()
+        self._banques = None
+        self._banques_par_nom = {}
+        self.reprise = None
+        self._compteurs_reprise = None
+
+    # Correspondances chargées une seule fois
+
+    def charger_references(self):
+        self._banques = list(Banque.objects.order_by('nom_banque').values_list('nom_banque', 'pk'))
+        self._banques_par_nom = {}
+        for nom, pk in self._banques:
+            self._banques_par_nom.setdefault(nom.lower(), pk)
+
+    def banque_id(self, nom):
+        """Équivalent de nom_banque__iexact puis nom_banque__icontains (.first() par nom)"""
+        if not nom:
+            return None
+        cle = nom.lower()
+        if cle not in self._banques_par_nom:
+            self._banques_par_nom[cle] = next((pk for nom_banque, pk in self._banques if cle in nom_banque.lower()), None)
+        return self._banques_par_nom[cle]
+
+    # Lecture
+
+    def lire_ligne(self, row):
+        """
+        (champs, references) d'une ligne, None pour une ligne vide ; lève
+        LigneInvalide. `references` : valeurs lues dans le fichier pour les
+        clés étrangères ({'banque': ..., 'article': ...}).
+        """
+        raise NotImplementedError
+
+    def lignes_lues(self, lignes, premiere_ligne=1):
+        """
+        Génère (numero, champs, references, erreur) pour chaque ligne non vide ;
+        champs vaut None et erreur contient le message si la ligne est invalide.
+        """
+        if self._banques is None:
+            self.charger_references()
+        for numero, row in enumerate(lignes, start=premiere_ligne):
+            self.resultat.lues += 1
+            row = tuple(row or ()) + (None,) * self.nb_colonnes
+            if all(valeur is None for valeur in row[:self.nb_colonnes]):
+                continue
+            try:
+                ligne = self.lire_ligne(row)
+            except LigneInvalide as e:
+                yield numero, None, {}, str(e)
+                continue
+            if ligne is not None:
+                yield numero, ligne[0], ligne[1], None
+
+    def references_non_resolues(self, champs, references):
+        """Libellés des clés étrangères lues dans le fichier mais absentes de la base"""
+        non_resolues = {}
+        if references.get('banque') and champs.get('banque_id') is None:
+            non_resolues['banque'] = references['banque']
+        return non_resolues
+
+    def empreinte(self, champs):
+        return empreinte_ligne(champs['date'], champs[self.champ_libelle], champs['banque_id'],
+                               champs['montant_fc'], champs['montant_usd'])
+
+    def apercu(self, numero, champs, references):
+        return (f"  [{numero}] {champs['date']} | {champs[self.champ_libelle][:35]}... | {references['banque']} | "
+                f"FC={champs['montant_fc']} | USD={champs['montant_usd']}")
+
+    # Champs <-> JSON (lignes d'aperçu des imports téléversés)
+
+    @staticmethod
+    def champs_en_json(champs):
+        return {
+            cle: valeur.isoformat() if isinstance(valeur, date) else str(valeur) if isinstance(valeur, Decimal) else valeur
+            for cle, valeur in champs.items()
+        }
+
+    @staticmethod
+    def champs_depuis_json(donnees):
+        champs = dict(donnees)
+        champs['date'] = date.fromisoformat(champs['date'])
+        champs['montant_fc'] = Decimal(champs['montant_fc'])
+        champs['montant_usd'] = Decimal(champs['montant_usd'])
+        return champs
+
+    # Import
+
+    def importer(self, lignes, premiere_ligne=1, afficher=None, reprise=None):
+        """
+        Importe les lignes par lots. En mode dry_run, rien n'est écrit et
+        `afficher(texte)` reçoit l'aperçu de chaque ligne. Avec `reprise`
+        (RepriseImport), la dernière ligne traitée est enregistrée avec chaque
+        lot. Retourne le ResultatImport.
+        """
+        self.reprise = reprise
+        self.resultat.premiere_ligne = premiere_ligne
+        debut = time.perf_counter()
+        lot = []
+        numero = premiere_ligne - 1
+        for numero, champs, references, erreur in self.lignes_lues(lignes, premiere_ligne):
+            if erreur:
+                self.resultat.erreurs.append(f'Ligne {numero}: {erreur}')
+                continue
+            if self.dry_run:
+                if afficher:
+                    afficher(self.apercu(numero, champs, references))
+                self.resultat.importees += 1
+                continue
+            lot.append((numero, champs))
+            if len(lot) >= self.taille_lot:
+                self.enregistrer_lot(lot, numero)
+                lot = []
+        if not self.dry_run:
+            self.enregistrer_lot(lot, numero, termine=True)
+        self.resultat.duree = time.perf_counter() - debut
+        return self.resultat
+
+    def analyser(self, lignes, premiere_ligne=1):
+        """
+        Classe les lignes sans rien écrire, par lots de `taille_lot` : génère
+        des listes de (numero, categorie, champs, references, message) avec
+        categorie NOUVELLE, DOUBLON (en base ou plus haut dans le fichier) ou
+        ERREUR. Les compteurs de self.resultat sont tenus à jour
+        (importees : lignes nouvelles).
+        """
+        self.resultat.premiere_ligne = premiere_ligne
+        debut = time.perf_counter()
+        lot = []
+        for ligne in self.lignes_lues(lignes, premiere_ligne):
+            lot.append(ligne)
+            if len(lot) >= self.taille_lot:
+                yield self._classer_lot(lot)
+                lot = []
+        if lot:
+            yield self._classer_lot(lot)
+        self.resultat.duree = time.perf_counter() - debut
+
+    def _classer_lot(self, lot):
+        valides = [(numero, champs) for numero, champs, _, erreur in lot if not erreur]
+        if valides:
+            self.charger_empreintes(valides)
+        classees = []
+        for numero, champs, references, erreur in lot:
+            if erreur:
+                self.resultat.erreurs.append(f'Ligne {numero}: {erreur}')
+                classees.append((numero, 'ERREUR', None, references, erreur))
+                continue
+            empreinte = self.empreinte(champs)
+            if empreinte in self.empreintes:
+                self.resultat.doublons += 1
+                classees.append((numero, 'DOUBLON', champs, references, ''))
+                continue
+            self.empreintes.add(empreinte)
+            self.resultat.importees += 1
+            classees.append((numero, 'NOUVELLE', champs, references, ''))
+        return classees
+
+    def charger_empreintes(self, lot):
+        """Ajoute aux empreintes celles des lignes du lot déjà en base (une requête dans l'index unique)"""
+        empreintes = {self.empreinte(champs) for _, champs in lot} - self.empreintes
+        if empreintes:
+            existantes = self.modele.objects.filter(empreinte__in=empreintes).values_list('empreinte', flat=True)
+            self.empreintes.update(existantes)
+
+    def enregistrer_lot(self, lot, derniere_ligne, termine=False):
+        """Insère un lot dans une transaction, avec le point de reprise à `derniere_ligne`"""
+        if lot:
+            self.charger_empreintes(lot)
+        objets = []
+        for numero, champs in lot:
+            empreinte = self.empreinte(champs)
+            if empreinte in self.empreintes:
+                self.resultat.doublons += 1
+                continue
+            self.empreintes.add(empreinte)
+            objets.append((numero, self.modele(**champs, empreinte=empreinte)))
+
+        try:
+            with transaction.atomic():
+                if objets:
+                    self.modele.objects.bulk_create([objet for _, objet in objets], batch_size=self.taille_lot)
+                    self.mettre_a_jour_agregats([objet for _, objet in objets])
+                self.sauvegarder_reprise(derniere_ligne, termine, importees=len(objets))
+            self.resultat.importees += len(objets)
+        except DatabaseError:
+            # Un lot refusé est repris ligne par ligne pour isoler les lignes en erreur
+            # et celles enregistrées entre-temps par un autre import ou une saisie
+            for numero, objet in objets:
+                objet.pk = None
+                try:
+                    with transaction.atomic():
+                        objet.save(force_insert=True)
+                except IntegrityError:
+                    self.resultat.doublons += 1
+                except DatabaseError as e:
+                    self.resultat.erreurs.append(f'Ligne {numero}: {e}')
+                else:
+                    self.resultat.importees += 1
+            self.sauvegarder_reprise(derniere_ligne, termine)
+
+    def sauvegarder_reprise(self, derniere_ligne, termine=False, importees=0):
+        """Met à jour le point de reprise ; `importees` : lignes du lot en cours, pas encore comptées"""
+        reprise = self.reprise
+        if reprise is None:
+            return
+        if self._compteurs_reprise is None:
+            # Compteurs des passages précédents, complétés par ceux de ce passage
+            self._compteurs_reprise = (reprise.lignes_importees, reprise.doublons, reprise.erreurs)
+        importees_avant, doublons, erreurs = self._compteurs_reprise
+        reprise.derniere_ligne = max(reprise.derniere_ligne, derniere_ligne)
+        reprise.lignes_importees = importees_avant + self.resultat.importees + importees
+        reprise.doublons = doublons + self.resultat.doublons
+        reprise.erreurs = erreurs + len(self.resultat.erreurs)
+        if termine:
+            reprise.statut = 'TERMINE'
+        reprise.save(update_fields=['derniere_ligne', 'lignes_importees', 'doublons', 'erreurs', 'statut', 'date_modification'])
+
+    @staticmethod
+    def mettre_a_jour_agregats(objets):
+        """Ce que font les signaux post_save, une fois par clé d'agrégation"""
+        deltas = defaultdict(lambda: [Decimal('0.00'), Decimal('0.00'), 0])
+        for objet in objets:
+            cle = AgregatFeuilleMensuel.cle_depuis_feuille(objet)
+            delta = deltas[tuple(sorted(cle.items()))]
+            delta[0] += objet.montant_fc or Decimal('0.00')
+            delta[1] += objet.montant_usd or Decimal('0.00')
+            delta[2] += 1
+        periodes = set()
+        for cle, (montant_fc, montant_usd, nombre) in deltas.items():
+            cle = dict(cle)
+            AgregatFeuilleMensuel.appliquer(cle, montant_fc, montant_usd, nombre)
+            periodes.add((cle['mois'], cle['annee']))
+        for mois, annee in periodes:
+            ClotureMensuelle.marquer_a_recalculer(mois, annee)
+
+
+class ImportDepensesFeuille(ImportFeuille):
+    """MOIS, ANNEE, DATE, ARTICLE LITTERA, LIBELLE DEPENSES, BANQUE, MONTANT EN Fc, MONTANT EN $us, OBSERVATION"""
+    modele = DepenseFeuille
+    champ_libelle = 'libelle_depenses'
+    nb_colonnes = 9
+
+    def charger_references(self):
+        super().charger_references()
+        self._natures = {}
+        self._natures_sans_casse = {}
+        for code, pk in NatureEconomique.objects.filter(active=True).order_by('code').values_list('code', 'pk'):
+            self._natures[code] = pk
+            self._natures_sans_casse.setdefault(code.lower(), pk)
+
+    def nature_id(self, article_code):
+        if not article_code:
+            return None
+        return self._natures.get(article_code.replace(' ', '')) or self._natures_sans_casse.get(article_code.lower())
+
+    def lire_ligne(self, row):
+        article_code = en_texte(row[3])[:50]
+        libelle = en_texte(row[4])
+        banque = en_texte(row[5])
+        montant_fc = en_decimal(row[6])
+        montant_usd = en_decimal(row[7])
+        if not libelle and not banque and montant_fc == 0 and montant_usd == 0:
+            return None
+        date_val, mois, annee = date_de_la_ligne(row[0], row[1], row[2])
+        nom_banque = banque[:100]
+        return {
+            'mois': mois,
+            'annee': annee,
+            'date': date_val,
+            'nature_economique_id': self.nature_id(article_code),
+            'libelle_depenses': libelle[:500],
+            'banque_id': self.banque_id(nom_banque),
+            'montant_fc': montant_fc,
+            'montant_usd': montant_usd,
+            'observation': en_texte(row[8])[:5000],
+        }, {'banque': nom_banque, 'article': article_code}
+
+    def references_non_resolues(self, champs, references):
+        non_resolues = super().references_non_resolues(champs, references)
+        if references.get('article') and champs.get('nature_economique_id') is None:
+            non_resolues['article'] = references['article']
+        return non_resolues
+
+
+class ImportRecettesFeuille(ImportFeuille):
+    """MOIS, ANNEE, DATE, LIBELLE RECETTE, BANQUE, MONTANT FC, MONTANT $us"""
+    modele = RecetteFeuille
+    champ_libelle = 'libelle_recette'
+    nb_colonnes = 7
+
+    def lire_ligne(self, row):
+        libelle = en_texte(row[3])
+        banque = en_texte(row[4])
+        montant_fc = en_decimal(row[5])
+        montant_usd = en_decimal(row[6])
+        if not libelle and not banque and montant_fc == 0 and montant_usd == 0:
+            return None
+        date_val, mois, annee = date_de_la_ligne(row[0], row[1], row[2])
+        nom_banque = banque[:100]
+        return {
+            'mois': mois,
+            'annee': annee,
+            'date': date_val,
+            'libelle_recette': libelle[:500],
+            'banque_id': self.banque_id(nom_banque),
+            'montant_fc': montant_fc,
+            'montant_usd': montant_usd,
+        }, {'banque': nom_banque}
+
+    def apercu(self, numero, champs, references):
+        return (f"  [{numero}] {champs['date']} | {champs['libelle_recette'][:40]}... | {references['banque']} | "
+                f"FC={champs['montant_fc']} | USD={champs['montant_usd']}")
+
+
+IMPORTS_PAR_FEUILLE = {
+    'DEPENSES': ImportDepensesFeuille,
+    'RECETTES': ImportRecettesFeuille,
+}
+
+
+def empreinte_fichier(chemin):
+    """SHA-256 du contenu du fichier, lu par blocs"""
+    empreinte = hashlib.sha256()
+    with open(chemin, 'rb') as fichier:
+        for bloc in iter(lambda: fichier.read(1024 * 1024), b''):
+            empreinte.update(bloc)
+    return empreinte.hexdigest()
+
+
+def importer_fichier(chemin, feuille, classe=None, dry_run=False,
+                     taille_lot=TAILLE_LOT, recommencer=False, afficher=None):
+    """
+    Importe une feuille d'un classeur, en reprenant après la dernière ligne
+    enregistrée par un passage précédent sur le même fichier (sauf
+    `recommencer`). Une feuille déjà entièrement importée n'est pas relue
+    (resultat.deja_termine). `classe` : classe d'import, déduite du nom de
+    feuille par défaut. Lève ImportImpossible si le fichier ou la feuille
+    ne peut pas être lu.
+    """
+    import openpyxl
+
+    classe = classe or IMPORTS_PAR_FEUILLE.get(feuille.upper())
+    if classe is None:
+        raise ImportImpossible(f'Type de feuille inconnu : "{feuille}" (attendu : {", ".join(IMPORTS_PAR_FEUILLE)})')
+    if not os.path.isfile(chemin):
+        raise ImportImpossible(f'Fichier introuvable: {chemin}')
+
+    moteur = classe(dry_run=dry_run, taille_lot=taille_lot)
+    premiere_ligne = PREMIERE_LIGNE
+    reprise = None
+    if not dry_run:
+        reprise, _ = RepriseImport.objects.get_or_create(
+            empreinte_fichier=empreinte_fichier(chemin),
+            feuille=feuille,
+            defaults={'nom_fichier': os.path.basename(chemin)[:255]},
+        )
+        if recommencer:
+            reprise.statut = 'EN_COURS'
+            reprise.derniere_ligne = reprise.lignes_importees = reprise.doublons = reprise.erreurs = 0
+            reprise.save()
+        elif reprise.statut == 'TERMINE':
+            moteur.resultat.deja_termine = True
+            moteur.resultat.premiere_ligne = reprise.derniere_ligne + 1
+            return moteur.resultat
+        premiere_ligne = max(PREMIERE_LIGNE, reprise.derniere_ligne + 1)
+
+    wb = openpyxl.load_workbook(chemin, read_only=True, data_only=True)
+    try:
+        if feuille not in wb.sheetnames:
+            raise ImportImpossible(f'Feuille "{feuille}" introuvable. Feuilles: {wb.sheetnames}')
+        lignes = wb[feuille].iter_rows(min_row=premiere_ligne, values_only=True)
+        return moteur.importer(lignes, premiere_ligne=premiere_ligne, afficher=afficher, reprise=reprise)
+    finally:
+        wb.close()
+
+
+def compte_rendu(commande, resultat, titre='Import terminé'):
+    """Affiche le résultat d'un import dans la sortie d'une commande de gestion"""
+    if resultat.deja_termine:
+        commande.stdout.write(commande.style.WARNING(
+            f'⚠ Fichier déjà importé jusqu\'à la ligne {resultat.premiere_ligne - 1} (--restart pour le relire)'
+        ))
+        return
+    if resultat.premiere_ligne and resultat.premiere_ligne > PREMIERE_LIGNE:
+        commande.stdout.write(f'→ Reprise à la ligne {resultat.premiere_ligne}')
+    commande.stdout.write(commande.style.SUCCESS(
+        f'{titre}: {resultat.importees} ligne(s) importée(s), {resultat.doublons} doublon(s) ignoré(s).'
+    ))
+    erreurs = resultat.erreurs
+    for erreur in erreurs[:20]:
+        commande.stdout.write(commande.style.WARNING(erreur))
+    if len(erreurs) > 20:
+        commande.stdout.write(commande.style.WARNING(f'... et {len(erreurs) - 20} autre(s) erreur(s).'))
+    commande.stdout.write(
+        f'→ {resultat.lues} ligne(s) lue(s) en {resultat.duree:.2f}s ({resultat.lignes_par_seconde:.0f} lignes/s)'
+    )
+
+
+def importer_en_parallele(cibles, mode='process', concurrence=None, rappel=None, **options):
+    """
+    Importe chaque (chemin, feuille) de `cibles` dans un pool de processus
+    (ou de threads, ou l'un après l'autre en mode direct). `options` est
+    transmis à importer_fichier. `rappel(chemin, feuille, resultat, erreur)`
+    est appelée à la fin de chaque feuille. Retourne la liste des
+    (chemin, feuille, resultat, erreur) dans l'ordre des cibles.
+    """
+    cibles = list(dict.fromkeys(cibles))
+    resultats = {}
+
+    def terminer(index, resultat, erreur):
+        resultats[index] = (*cibles[index], resultat, erreur)
+        if rappel:
+            rappel(*resultats[index])
+
+    with executeur(mode, concurrence, nom='import_feuilles') as pool:
+        futures = {
+            pool.submit(importer_fichier, chemin, feuille, **options): index
+            for index, (chemin, feuille) in enumerate(cibles)
+        }
+        for future in as_completed(futures):
+            try:
+                terminer(futures[future], future.result(), None)
+            except Exception as e:
+                terminer(futures[future], None, str(e))
+    return [resultats[index] for index in range(len(cibles))]
@@ -0,0 +1,147 @@
+"""
+Génération par lot des états PDF « feuilles » (fin de mois, fin d'année).
+
+Un lot est la liste des rapports à produire pour une plage de périodes et une
+liste de types d'état ; le rapport par banque est décliné pour chaque banque
+ayant des dépenses sur la période. Chaque rapport est rendu par le code des
+vues (EtatsFeuillesGenererView, donc avec le cache des rapports) dans un pool
+de processus, puis tous les PDF sont réunis dans une archive ZIP accompagnée
+d'un fichier minutages.csv (durée et taille de chaque rapport).
+
+Utilisé par `manage.py generate_etats_batch` et par l'action d'administration
+des clôtures mensuelles.
+"""
+import csv
+import io
+import json
+import tempfile
+import time
+import zipfile
+from concurrent.futures import as_completed
+from pathlib import Path
+
+from django.utils.text import slugify
+
+from banques.models import Banque
+from demandes.models import DepenseFeuille
+from efinance_daf.executeurs import executeur
+
+
+TYPES_LOT = {
+    'depense_par_nature': 'Dépenses par article littera',
+    'rapport_par_banque': 'Rapport par banque',
+    'synthese_par_banque': 'Synthèse par banque',
+}
+
+
+def periodes(debut, fin):
+    """Mois de `debut` à `fin` inclus ; bornes et résultats sous forme (annee, mois)"""
+    annee, mois = debut
+    while (annee, mois) <= tuple(fin):
+        yield annee, mois
+        annee, mois = (annee + 1, 1) if mois == 12 else (annee, mois + 1)
+
+
+def rapports_du_lot(liste_periodes, types, annuel=False):
+    """
+    Liste des rapports d'un lot. Avec `annuel`, un rapport par type et par
+    année couverte est ajouté (mois = None : toute l'année).
+    """
+    liste_periodes = list(liste_periodes)
+    cibles = list(liste_periodes)
+    if annuel:
+        cibles += [(annee, None) for annee in sorted({annee for annee, _ in liste_periodes})]
+
+    noms_banques = dict(Banque.objects.values_list('pk', 'nom_banque'))
+    rapports = []
+    for annee, mois in cibles:
+        dossier = f'{annee}-{mois:02d}' if mois else f'{annee}-annuel'
+        for type_etat in types:
+            if type_etat != 'rapport_par_banque':
+                rapports.append({'type_etat': type_etat, 'annee': annee, 'mois': mois, 'banque_id': None,
+                                 'nom': f'{dossier}/{type_etat}.pdf'})
+                continue
+            depenses = DepenseFeuille.objects.filter(annee=annee, banque__isnull=False)
+            if mois:
+                depenses = depenses.filter(mois=mois)
+            for banque_id in sorted(set(depenses.values_list('banque_id', flat=True))):
+                nom_banque = slugify(noms_banques.get(banque_id, '')) or str(banque_id)
+                rapports.append({'type_etat': type_etat, 'annee': annee, 'mois': mois, 'banque_id': banque_id,
+                                 'nom': f'{dossier}/{type_etat}_{nom_banque}.pdf'})
+    return rapports
+
+
+def generer_rapport(rapport, repertoire):
+    """
+    Rend un rapport du lot dans `repertoire` avec le code de la vue.
+    Retourne le rapport complété de 'chemin', 'duree', 'taille' et 'erreur'.
+    """
+    from django.test import RequestFactory
+    from .views_etats_feuilles import CHAMPS_FILTRES_ETATS, EtatsFeuillesGenererView
+
+    type_etat = rapport['type_etat']
+    champs = CHAMPS_FILTRES_ETATS[type_etat]
+    donnees = {'type_etat': type_etat, champs[0]: rapport['annee'], champs[1]: rapport['mois'] or ''}
+    if rapport['banque_id']:
+        donnees[champs[2]] = rapport['banque_id']
+    request = RequestFactory().post('/tableau-bord-feuilles/generer-etats/', donnees)
+
+    resultat = dict(rapport, chemin=None, taille=0, erreur=None)
+    debut = time.perf_counter()
+    response = EtatsFeuillesGenererView()._generer_pdf_en_cache(request, type_etat)
+    try:
+        if response['Content-Type'] != 'application/pdf':
+            resultat['erreur'] = json.loads(response.content).get('error', 'Erreur inconnue')
+        else:
+            chemin = Path(repertoire) / resultat['nom'].replace('/', '__')
+            with open(chemin, 'wb') as fichier:
+                for bloc in response.streaming_content:
+                    fichier.write(bloc)
+            resultat.update(chemin=str(chemin), taille=chemin.stat().st_size)
+    finally:
+        # Pas de response.close() : hors requête HTTP, son signal request_finished
+        # fermerait la connexion à la base de l'appelant
+        for fermer in response._resource_closers:
+            fermer()
+    resultat['duree'] = time.perf_counter() - debut
+    return resultat
+
+
+def generer_lot(rapports, destination, mode='process', concurrence=None, rappel=None):
+    """
+    Génère les rapports et écrit l'archive ZIP dans `destination` (chemin ou
+    fichier binaire). `rappel(resultat)` est appelée à la fin de chaque rapport.
+    Retourne les résultats dans l'ordre des rapports.
+    """
+    resultats = {}
+    with tempfile.TemporaryDirectory(prefix='lot_etats_') as repertoire:
+        with executeur(mode, concurrence, nom='lot_etats') as pool:
+            futures = {
+                pool.submit(generer_rapport, rapport, repertoire): index
+                for index, rapport in enumerate(rapports)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    resultats[index] = future.result()
+                except Exception as e:
+                    resultats[index] = dict(rapports[index], chemin=None, taille=0, duree=0.0, erreur=str(e))
+                if rappel:
+                    rappel(resultats[index])
+
+        resultats = [resultats[index] for index in range(len(rapports))]
+        with zipfile.ZipFile(destination, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for resultat in resultats:
+                if resultat['chemin']:
+                    archive.write(resultat['chemin'], resultat['nom'])
+            archive.writestr('minutages.csv', minutages_csv(resultats))
+    return resultats
+
+
+def minutages_csv(resultats):
+    tampon = io.StringIO()
+    writer = csv.writer(tampon, delimiter=';', lineterminator='\r\n')
+    writer.writerow(['Rapport', 'Durée (s)', 'Taille (octets)', 'Erreur'])
+    for resultat in resultats:
+        writer.writerow([resultat['nom'], f"{resultat['duree']:.3f}", resultat['taille'], resultat['erreur'] or ''])
+    return tampon.getvalue()
@@ -0,0 +1,90 @@
+"""
+Commande de génération par lot des états PDF « feuilles »
+
+Exemple (tous les états de l'année 2025, mois par mois et annuels) :
+    python manage.py generate_etats_batch --debut 2025-01 --fin 2025-12 --annuel --sortie etats_2025.zip
+"""
+import os
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from efinance_daf.executeurs import MODES
+from tableau_bord_feuilles.lots_etats import TYPES_LOT, generer_lot, periodes, rapports_du_lot
+
+
+def _periode(valeur):
+    correspondance = re.fullmatch(r'(\d{4})-(\d{1,2})', valeur or '')
+    if not correspondance or not 1 <= int(correspondance.group(2)) <= 12:
+        raise CommandError(f'Période invalide : {valeur!r} (format attendu AAAA-MM)')
+    return int(correspondance.group(1)), int(correspondance.group(2))
+
+
+class Command(BaseCommand):
+    help = "Génère en parallèle les états PDF d'une plage de mois et les regroupe dans une archive ZIP"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--debut', required=True, help='Premier mois (AAAA-MM)')
+        parser.add_argument('--fin', help='Dernier mois inclus (AAAA-MM, défaut : --debut)')
+        parser.add_argument(
+            '--types',
+            nargs='+',
+            choices=list(TYPES_LOT),
+            default=list(TYPES_LOT),
+            help="Types d'état à produire (défaut : tous)"
+        )
+        parser.add_argument(
+            '--annuel',
+            action='store_true',
+            help='Produire aussi un état par type pour chaque année couverte'
+        )
+        parser.add_argument('--sortie', help="Archive ZIP produite (défaut : etats_<debut>_<fin>.zip)")
+        parser.add_argument(
+            '--concurrence',
+            type=int,
+            default=os.cpu_count(),
+            help='Nombre de rapports générés simultanément (défaut : nombre de processeurs)'
+        )
+        parser.add_argument(
+            '--mode',
+            choices=MODES,
+            default='process',
+            help='Pool de processus ou de threads, ou direct : un rapport à la fois (défaut : process)'
+        )
+
+    def handle(self, *args, **options):
+        debut = _periode(options['debut'])
+        fin = _periode(options['fin'] or options['debut'])
+        if fin < debut:
+            raise CommandError('La période de fin précède la période de début')
+
+        rapports = rapports_du_lot(periodes(debut, fin), options['types'], annuel=options['annuel'])
+        if not rapports:
+            self.stdout.write(self.style.WARNING('⚠ Aucun rapport à générer pour cette période'))
+            return
+
+        sortie = options['sortie'] or f"etats_{options['debut']}_{options['fin'] or options['debut']}.zip"
+        self.stdout.write(f"→ {len(rapports)} rapport(s) à générer ({options['mode']}, {options['concurrence']} simultané(s))")
+
+        chrono = time.monotonic()
+        resultats = generer_lot(
+            rapports, sortie, mode=options['mode'], concurrence=max(1, options['concurrence']), rappel=self._compte_rendu
+        )
+        duree = time.monotonic() - chrono
+
+        erreurs = sum(1 for resultat in resultats if resultat['erreur'])
+        cumul = sum(resultat['duree'] for resultat in resultats)
+        message = (
+            f'✓ {len(resultats) - erreurs} rapport(s) écrit(s) dans {sortie} en {duree:.2f}s '
+            f'(cumul des rapports : {cumul:.2f}s)'
+        )
+        self.stdout.write(self.style.SUCCESS(message))
+        if erreurs:
+            self.stdout.write(self.style.ERROR(f'✗ {erreurs} rapport(s) en erreur (voir minutages.csv)'))
+
+    def _compte_rendu(self, resultat):
+        if resultat['erreur']:
+            self.stdout.write(self.style.ERROR(f"✗ {resultat['nom']} : {resultat['erreur']}"))
+        else:
+            self.stdout.write(f"  {resultat['nom']} : {resultat['duree']:.2f}s, {resultat['taille'] / 1024:.0f} Ko")
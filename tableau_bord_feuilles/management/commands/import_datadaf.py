@@ -0,0 +1,93 @@
+"""
+Commande d'import des feuilles DEPENSES / RECETTES de un ou plusieurs classeurs DATADAF
+
+Chaque (fichier, feuille) est importé dans un pool de processus, par lots
+validés un à un ; un import interrompu reprend après le dernier lot enregistré.
+
+Exemple :
+    python manage.py import_datadaf --files DATADAF_2023.xlsx DATADAF_2024.xlsx --concurrence 4
+"""
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from efinance_daf.executeurs import MODES
+from tableau_bord_feuilles.import_feuilles import (
+    IMPORTS_PAR_FEUILLE, TAILLE_LOT, compte_rendu, importer_en_parallele,
+)
+
+
+class Command(BaseCommand):
+    help = 'Importe en parallèle les feuilles DEPENSES / RECETTES de un ou plusieurs classeurs DATADAF (avec reprise)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--files',
+            nargs='+',
+            default=[],
+            help='Classeurs à importer (défaut: DATADAF.xlsx à la racine du projet)',
+        )
+        parser.add_argument(
+            '--sheets',
+            nargs='+',
+            choices=list(IMPORTS_PAR_FEUILLE),
+            default=list(IMPORTS_PAR_FEUILLE),
+            help='Feuilles à importer dans chaque classeur (défaut: toutes)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=TAILLE_LOT,
+            help=f'Nombre de lignes insérées par transaction (défaut: {TAILLE_LOT})',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignorer les points de reprise et relire les feuilles depuis le début',
+        )
+        parser.add_argument(
+            '--concurrence',
+            type=int,
+            default=os.cpu_count(),
+            help='Nombre de feuilles importées simultanément (défaut : nombre de processeurs)',
+        )
+        parser.add_argument(
+            '--mode',
+            choices=MODES,
+            default='process',
+            help='Pool de processus ou de threads, ou direct : une feuille à la fois (défaut : process)',
+        )
+
+    def handle(self, *args, **options):
+        fichiers = options['files'] or [os.path.join(settings.BASE_DIR, 'DATADAF.xlsx')]
+        cibles = [(fichier, feuille) for fichier in fichiers for feuille in options['sheets']]
+        self.stdout.write(f"→ {len(cibles)} feuille(s) à importer ({options['mode']}, {options['concurrence']} simultanée(s))")
+
+        chrono = time.monotonic()
+        resultats = importer_en_parallele(
+            cibles,
+            mode=options['mode'],
+            concurrence=max(1, options['concurrence']),
+            rappel=self._compte_rendu,
+            taille_lot=options['batch_size'],
+            recommencer=options['restart'],
+        )
+        duree = time.monotonic() - chrono
+
+        importees = sum(resultat.importees for _, _, resultat, _ in resultats if resultat)
+        lues = sum(resultat.lues for _, _, resultat, _ in resultats if resultat)
+        echecs = sum(1 for _, _, _, erreur in resultats if erreur)
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {importees} ligne(s) importée(s) en {duree:.2f}s ({lues / duree if duree else 0:.0f} lignes/s au total)'
+        ))
+        if echecs:
+            self.stdout.write(self.style.ERROR(f'✗ {echecs} feuille(s) non importée(s)'))
+
+    def _compte_rendu(self, chemin, feuille, resultat, erreur):
+        nom = f'{os.path.basename(chemin)} [{feuille}]'
+        if erreur:
+            self.stdout.write(self.style.ERROR(f'✗ {nom} : {erreur}'))
+        else:
+            compte_rendu(self, resultat, titre=nom)
@@ -0,0 +1,20 @@
+"""
+Commande pour reconstruire les agrégats mensuels des feuilles DEPENSES / RECETTES
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from tableau_bord_feuilles.models import AgregatFeuilleMensuel
+
+
+class Command(BaseCommand):
+    help = 'Reconstruit entièrement la table des agrégats mensuels (DepenseFeuille / RecetteFeuille)'
+
+    def handle(self, *args, **options):
+        debut = time.monotonic()
+        nb_agregats = AgregatFeuilleMensuel.reconstruire()
+        duree = time.monotonic() - debut
+        self.stdout.write(
+            self.style.SUCCESS(f'✓ {nb_agregats} agrégat(s) reconstruit(s) en {duree:.2f}s')
+        )
@@ -0,0 +1,173 @@
+"""
+Commande de contrôle des plans d'exécution des requêtes sur les feuilles DEPENSES / RECETTES
+
+Un jeu de données est généré dans une transaction annulée en fin de commande,
+les statistiques sont mises à jour (ANALYZE) puis chaque requête de référence
+(listes, tableau général, états) est passée à EXPLAIN. La commande échoue si
+une table de feuilles est parcourue séquentiellement.
+"""
+import re
+import time
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from accounts.models import Service
+from banques.models import Banque
+from demandes.models import DepenseFeuille, NatureEconomique
+from recettes.models import RecetteFeuille
+
+
+TABLES_FEUILLES = (DepenseFeuille._meta.db_table, RecetteFeuille._meta.db_table)
+
+NB_BANQUES = 10
+NB_NATURES = 12
+NB_SERVICES = 5
+NB_ANNEES = 5
+
+
+def parcours_sequentiels(plan, vendor):
+    """Tables de feuilles lues intégralement d'après le texte du plan"""
+    tables = set()
+    for table in TABLES_FEUILLES:
+        if vendor == 'postgresql':
+            motif = rf'Seq Scan on {table}\b'
+        else:
+            # SQLite : SEARCH = accès par index, SCAN = parcours complet (table ou index)
+            motif = rf'\bSCAN (?:TABLE )?{table}\b'
+        if re.search(motif, plan):
+            tables.add(table)
+    return sorted(tables)
+
+
+class Command(BaseCommand):
+    help = (
+        "Exécute EXPLAIN sur les requêtes de référence des feuilles (jeu de données généré puis annulé) "
+        "et échoue si l'une d'elles parcourt séquentiellement une table de feuilles"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lignes',
+            type=int,
+            default=20000,
+            help='Nombre de lignes générées par table de feuilles (défaut : 20000)'
+        )
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if vendor not in ('postgresql', 'sqlite'):
+            raise CommandError(f"Base de données non prise en charge : {vendor}")
+
+        debut = time.monotonic()
+        with transaction.atomic():
+            contexte = self._peupler(options['lignes'])
+            self._analyser()
+            plans = [(nom, queryset.explain()) for nom, queryset in self._requetes(**contexte)]
+            # Le jeu de données n'est jamais conservé
+            transaction.set_rollback(True)
+
+        echecs = []
+        for nom, plan in plans:
+            tables = parcours_sequentiels(plan, vendor)
+            if tables:
+                echecs.append(nom)
+                self.stdout.write(self.style.ERROR(f'✗ {nom} : parcours séquentiel de {", ".join(tables)}'))
+                self.stdout.write(plan)
+            else:
+                self.stdout.write(f'✓ {nom}')
+
+        duree = time.monotonic() - debut
+        if echecs:
+            raise CommandError(f'{len(echecs)} requête(s) sur {len(plans)} sans index utilisable')
+        self.stdout.write(
+            self.style.SUCCESS(f'✓ {len(plans)} plan(s) vérifié(s) sur {vendor} en {duree:.2f}s')
+        )
+
+    def _peupler(self, nb_lignes):
+        """Génère les feuilles réparties sur plusieurs années, mois, banques et articles"""
+        banques = Banque.objects.bulk_create([
+            Banque(nom_banque=f"Banque plan {i}") for i in range(NB_BANQUES)
+        ])
+        natures = NatureEconomique.objects.bulk_create([
+            NatureEconomique(code=f"PLAN{i:02d}", titre=f"Article plan {i}") for i in range(NB_NATURES)
+        ])
+        services = Service.objects.bulk_create([
+            Service(nom_service=f"Service plan {i}") for i in range(NB_SERVICES)
+        ])
+        annee_fin = date.today().year
+        annees = list(range(annee_fin - NB_ANNEES + 1, annee_fin + 1))
+
+        depenses = []
+        recettes = []
+        for i in range(nb_lignes):
+            annee = annees[i % NB_ANNEES]
+            mois = (i // NB_ANNEES) % 12 + 1
+            jour = date(annee, mois, i % 28 + 1)
+            banque = banques[(i // 7) % NB_BANQUES]
+            depenses.append(DepenseFeuille(
+                mois=mois,
+                annee=annee,
+                date=jour,
+                nature_economique=natures[(i // 3) % NB_NATURES],
+                service_beneficiaire=services[i % NB_SERVICES],
+                libelle_depenses=f"Dépense plan {i}",
+                banque=banque,
+                montant_fc=Decimal(i % 1000),
+                montant_usd=Decimal(i % 50),
+            ))
+            recettes.append(RecetteFeuille(
+                mois=mois,
+                annee=annee,
+                date=jour,
+                libelle_recette=f"Recette plan {i}",
+                banque=banque,
+                montant_fc=Decimal(i % 1000),
+                montant_usd=Decimal(i % 50),
+            ))
+        DepenseFeuille.objects.bulk_create(depenses, batch_size=1000)
+        RecetteFeuille.objects.bulk_create(recettes, batch_size=1000)
+
+        return {'banque': banques[0], 'nature': natures[0], 'annee': annee_fin, 'mois': 6}
+
+    def _analyser(self):
+        """Met à jour les statistiques du planificateur sur les tables de feuilles"""
+        with connection.cursor() as cursor:
+            for table in TABLES_FEUILLES:
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(table)}')
+
+    def _requetes(self, banque, nature, annee, mois):
+        """Requêtes de référence, reprises des filtres des vues de listes, du tableau général et des états"""
+        date_debut = date(annee, mois, 1)
+        date_fin = date(annee, mois, 28)
+        depenses = DepenseFeuille.objects.select_related('nature_economique', 'service_beneficiaire', 'banque')
+        recettes = RecetteFeuille.objects.select_related('banque')
+        return [
+            ('Dépenses - liste par période',
+             depenses.filter(annee=annee, mois=mois).order_by('-date', '-date_creation')[:15]),
+            ('Dépenses - liste par banque',
+             depenses.filter(annee=annee, banque_id=banque.pk).order_by('-date', '-date_creation')[:15]),
+            ('Dépenses - liste par article littera',
+             depenses.filter(annee=annee, mois=mois, nature_economique_id=nature.pk).order_by('-date', '-date_creation')[:15]),
+            ('Dépenses - liste par intervalle de dates',
+             depenses.filter(date__gte=date_debut, date__lte=date_fin).order_by('-date', '-date_creation')[:15]),
+            ('Dépenses - tableau général par banque',
+             depenses.filter(annee=annee, mois=mois, banque_id=banque.pk)),
+            ('Dépenses - aperçu des états',
+             depenses.filter(annee=annee, mois=mois).order_by('-date')[:50]),
+            ('Dépenses - synthèse par banque',
+             DepenseFeuille.objects.filter(annee=annee, mois=mois).values('banque_id', 'banque__nom_banque').annotate(
+                 total_cdf=Sum('montant_fc'), total_usd=Sum('montant_usd')
+             ).order_by('banque__nom_banque')),
+            ('Recettes - liste par période',
+             recettes.filter(annee=annee, mois=mois).order_by('-date', '-date_creation')[:15]),
+            ('Recettes - liste par banque',
+             recettes.filter(annee=annee, banque_id=banque.pk).order_by('-date', '-date_creation')[:15]),
+            ('Recettes - liste par intervalle de dates',
+             recettes.filter(date__gte=date_debut, date__lte=date_fin).order_by('-date', '-date_creation')[:15]),
+            ('Recettes - aperçu des états',
+             recettes.filter(annee=annee, mois=mois).order_by('-date')[:50]),
+        ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.0.4 on 2026-10-17 23:02
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def remplir_agregats(apps, schema_editor):
+    """Calcule les agrégats initiaux depuis les feuilles existantes"""
+    DepenseFeuille = apps.get_model('demandes', 'DepenseFeuille')
+    RecetteFeuille = apps.get_model('recettes', 'RecetteFeuille')
+    AgregatFeuilleMensuel = apps.get_model('tableau_bord_feuilles', 'AgregatFeuilleMensuel')
+
+    agregats = []
+    depenses = DepenseFeuille.objects.order_by().values(
+        'annee', 'mois', 'banque_id', 'nature_economique_id', 'service_beneficiaire_id'
+    ).annotate(total_fc=Sum('montant_fc'), total_usd=Sum('montant_usd'), nombre=Count('id'))
+    for row in depenses:
+        agregats.append(AgregatFeuilleMensuel(
+            type_operation='DEPENSE',
+            annee=row['annee'],
+            mois=row['mois'],
+            banque_id=row['banque_id'],
+            nature_economique_id=row['nature_economique_id'],
+            service_id=row['service_beneficiaire_id'],
+            total_fc=row['total_fc'] or Decimal('0.00'),
+            total_usd=row['total_usd'] or Decimal('0.00'),
+            nombre=row['nombre'],
+        ))
+    recettes = RecetteFeuille.objects.order_by().values(
+        'annee', 'mois', 'banque_id'
+    ).annotate(total_fc=Sum('montant_fc'), total_usd=Sum('montant_usd'), nombre=Count('id'))
+    for row in recettes:
+        agregats.append(AgregatFeuilleMensuel(
+            type_operation='RECETTE',
+            annee=row['annee'],
+            mois=row['mois'],
+            banque_id=row['banque_id'],
+            total_fc=row['total_fc'] or Decimal('0.00'),
+            total_usd=row['total_usd'] or Decimal('0.00'),
+            nombre=row['nombre'],
+        ))
+    AgregatFeuilleMensuel.objects.bulk_create(agregats, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('accounts', '0008_alter_user_role'),
+        ('banques', '0001_initial'),
+        ('demandes', '0002_depensefeuille_beneficiaire_and_more'),
+        ('recettes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgregatFeuilleMensuel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_operation', models.CharField(choices=[('DEPENSE', 'Dépense'), ('RECETTE', 'Recette')], max_length=10, verbose_name="Type d'opération")),
+                ('annee', models.PositiveIntegerField(verbose_name='Année')),
+                ('mois', models.PositiveSmallIntegerField(choices=[(1, '1'), (2, '2'), (3, '3'), (4, '4'), (5, '5'), (6, '6'), (7, '7'), (8, '8'), (9, '9'), (10, '10'), (11, '11'), (12, '12')], verbose_name='Mois')),
+                ('total_fc', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18, verbose_name='Total FC')),
+                ('total_usd', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18, verbose_name='Total USD')),
+                ('nombre', models.IntegerField(default=0, verbose_name='Nombre de lignes')),
+                ('banque', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='agregats_feuilles', to='banques.banque', verbose_name='Banque')),
+                ('nature_economique', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='agregats_feuilles', to='demandes.natureeconomique', verbose_name='Article Littera')),
+                ('service', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='agregats_feuilles', to='accounts.service', verbose_name='Service bénéficiaire')),
+            ],
+            options={
+                'verbose_name': 'Agrégat mensuel (feuilles)',
+                'verbose_name_plural': 'Agrégats mensuels (feuilles)',
+                'ordering': ['-annee', '-mois', 'type_operation'],
+                'indexes': [models.Index(fields=['annee', 'mois', 'type_operation'], name='tableau_bor_annee_b489ec_idx'), models.Index(fields=['banque', 'annee'], name='tableau_bor_banque__1aa435_idx')],
+            },
+        ),
+        migrations.RunPython(remplir_agregats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Index de recherche plein texte des feuilles (PostgreSQL uniquement).
+# Sous SQLite les tables FTS5 sont installées par le signal post_migrate
+# (tableau_bord_feuilles.recherche.installer_fts_sqlite).
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models.functions import Upper
+
+
+# Les expressions doivent rester identiques à celles de tableau_bord_feuilles.recherche
+INDEX = [
+    ('demandes', 'DepenseFeuille', [
+        GinIndex(SearchVector('libelle_depenses', 'observation', config='fr_unaccent'), name='depfeuille_recherche_fts'),
+        GinIndex(OpClass(Upper('libelle_depenses'), name='gin_trgm_ops'), name='depfeuille_libelle_trgm'),
+    ]),
+    ('recettes', 'RecetteFeuille', [
+        GinIndex(SearchVector('libelle_recette', config='fr_unaccent'), name='recfeuille_recherche_fts'),
+        GinIndex(OpClass(Upper('libelle_recette'), name='gin_trgm_ops'), name='recfeuille_libelle_trgm'),
+    ]),
+]
+
+CONFIGURATION_FR_UNACCENT = """
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'fr_unaccent') THEN
+        CREATE TEXT SEARCH CONFIGURATION fr_unaccent (COPY = french);
+        ALTER TEXT SEARCH CONFIGURATION fr_unaccent
+            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, french_stem;
+    END IF;
+END
+$$;
+"""
+
+
+def creer_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS unaccent')
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(CONFIGURATION_FR_UNACCENT)
+    for app_label, model_name, index in INDEX:
+        model = apps.get_model(app_label, model_name)
+        for idx in index:
+            schema_editor.add_index(model, idx)
+
+
+def supprimer_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for app_label, model_name, index in INDEX:
+        model = apps.get_model(app_label, model_name)
+        for idx in index:
+            schema_editor.remove_index(model, idx)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tableau_bord_feuilles', '0001_initial'),
+        ('demandes', '0004_depensefeuille_demandes_de_annee_c918bc_idx_and_more'),
+        ('recettes', '0002_recettefeuille_recettes_re_annee_db5e0d_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_index, supprimer_index),
+    ]
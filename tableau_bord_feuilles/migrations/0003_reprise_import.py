@@ -0,0 +1,38 @@
+# Generated by Django 5.0.4 on 2026-10-17 23:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tableau_bord_feuilles', '0002_recherche_plein_texte'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RepriseImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('empreinte_fichier', models.CharField(max_length=64, verbose_name='Empreinte SHA-256 du fichier')),
+                ('nom_fichier', models.CharField(blank=True, max_length=255, verbose_name='Fichier')),
+                ('feuille', models.CharField(max_length=100, verbose_name='Feuille')),
+                ('statut', models.CharField(choices=[('EN_COURS', 'En cours'), ('TERMINE', 'Terminé')], default='EN_COURS', max_length=10, verbose_name='Statut')),
+                ('derniere_ligne', models.PositiveIntegerField(default=0, verbose_name='Dernière ligne traitée')),
+                ('lignes_importees', models.PositiveIntegerField(default=0, verbose_name='Lignes importées')),
+                ('doublons', models.PositiveIntegerField(default=0, verbose_name='Doublons ignorés')),
+                ('erreurs', models.PositiveIntegerField(default=0, verbose_name='Lignes en erreur')),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_modification', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': "Point de reprise d'import",
+                'verbose_name_plural': "Points de reprise d'import",
+                'ordering': ['-date_modification'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='repriseimport',
+            constraint=models.UniqueConstraint(fields=('empreinte_fichier', 'feuille'), name='reprise_import_fichier_feuille'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.0.4 on 2026-10-17 23:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tableau_bord_feuilles', '0003_reprise_import'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportFeuilleWeb',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fichier', models.FileField(upload_to='imports_feuilles/%Y/%m/', verbose_name='Fichier')),
+                ('nom_fichier', models.CharField(max_length=255, verbose_name='Nom du fichier')),
+                ('feuille', models.CharField(choices=[('DEPENSES', 'Dépenses'), ('RECETTES', 'Recettes')], max_length=10, verbose_name='Feuille')),
+                ('statut', models.CharField(choices=[('ANALYSE_EN_ATTENTE', "En attente d'analyse"), ('ANALYSE_EN_COURS', 'Analyse en cours'), ('A_CONFIRMER', 'À confirmer'), ('IMPORT_EN_ATTENTE', "En attente d'import"), ('IMPORT_EN_COURS', 'Import en cours'), ('TERMINE', 'Terminé'), ('ECHEC', 'Échec'), ('ANNULE', 'Annulé')], default='ANALYSE_EN_ATTENTE', max_length=20, verbose_name='Statut')),
+                ('lignes_lues', models.PositiveIntegerField(default=0, verbose_name='Lignes lues')),
+                ('lignes_nouvelles', models.PositiveIntegerField(default=0, verbose_name='Nouvelles lignes')),
+                ('doublons', models.PositiveIntegerField(default=0, verbose_name='Doublons')),
+                ('erreurs', models.PositiveIntegerField(default=0, verbose_name='Lignes en erreur')),
+                ('non_resolus', models.JSONField(blank=True, default=dict, verbose_name='Articles et banques non résolus')),
+                ('lignes_importees', models.PositiveIntegerField(default=0, verbose_name='Lignes importées')),
+                ('message', models.TextField(blank=True, verbose_name='Message')),
+                ('jeton', models.UUIDField(blank=True, editable=False, null=True)),
+                ('travailleur', models.CharField(blank=True, max_length=100)),
+                ('tentatives', models.PositiveSmallIntegerField(default=0)),
+                ('delai_max', models.PositiveIntegerField(default=1800, verbose_name="Durée maximale d'exécution (s)")),
+                ('date_limite', models.DateTimeField(blank=True, null=True)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_modification', models.DateTimeField(auto_now=True)),
+                ('cree_par', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='imports_feuilles', to=settings.AUTH_USER_MODEL, verbose_name='Téléversé par')),
+            ],
+            options={
+                'verbose_name': 'Import de feuille',
+                'verbose_name_plural': 'Imports de feuilles',
+                'ordering': ['-date_creation'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LigneImportFeuille',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.PositiveIntegerField(verbose_name='Ligne')),
+                ('categorie', models.CharField(choices=[('NOUVELLE', 'Nouvelle'), ('DOUBLON', 'Doublon'), ('ERREUR', 'Erreur')], max_length=10, verbose_name='Catégorie')),
+                ('donnees', models.JSONField(blank=True, default=dict, verbose_name='Champs lus')),
+                ('article', models.CharField(blank=True, max_length=50, verbose_name='Article littera (fichier)')),
+                ('banque', models.CharField(blank=True, max_length=100, verbose_name='Banque (fichier)')),
+                ('nature_non_resolue', models.BooleanField(default=False)),
+                ('banque_non_resolue', models.BooleanField(default=False)),
+                ('message', models.CharField(blank=True, max_length=255)),
+                ('import_feuille', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lignes', to='tableau_bord_feuilles.importfeuilleweb')),
+            ],
+            options={
+                'verbose_name': "Ligne d'import",
+                'verbose_name_plural': "Lignes d'import",
+                'ordering': ['import_feuille', 'numero'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='importfeuilleweb',
+            index=models.Index(fields=['statut', 'date_creation'], name='tableau_bor_statut_ec2927_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ligneimportfeuille',
+            index=models.Index(fields=['import_feuille', 'categorie', 'numero'], name='tableau_bor_import__db17e9_idx'),
+        ),
+    ]
@@ -1,3 +1,361 @@
-from django.db import models
+"""
+Modèles du tableau de bord des feuilles DEPENSES / RECETTES
+"""
+from django.db import models, transaction
+from django.db.models import Sum, Count, F
+from decimal import Decimal
 
-# Create your models here.
+
+class AgregatFeuilleMensuel(models.Model):
+    """
+    Cumul mensuel des lignes DepenseFeuille / RecetteFeuille.
+
+    Une ligne par (type, année, mois, banque, article littera, service) avec
+    les totaux FC / USD et le nombre de lignes. La table est tenue à jour dans
+    la même transaction que chaque création, modification ou suppression de
+    feuille (voir tableau_bord_feuilles.signals) et peut être reconstruite
+    avec la commande `reconstruire_agregats_feuilles`.
+
+    Il n'y a volontairement pas de contrainte d'unicité sur la clé : les
+    tableaux de bord font toujours un SUM() sur ces lignes, deux lignes pour
+    la même clé (insertion concurrente) restent donc correctes et sont
+    fusionnées à la prochaine reconstruction.
+    """
+    TYPE_DEPENSE = 'DEPENSE'
+    TYPE_RECETTE = 'RECETTE'
+    TYPE_CHOICES = [
+        (TYPE_DEPENSE, 'Dépense'),
+        (TYPE_RECETTE, 'Recette'),
+    ]
+    MOIS_CHOICES = [(i, str(i)) for i in range(1, 13)]
+
+    type_operation = models.CharField(max_length=10, choices=TYPE_CHOICES, verbose_name="Type d'opération")
+    annee = models.PositiveIntegerField(verbose_name="Année")
+    mois = models.PositiveSmallIntegerField(choices=MOIS_CHOICES, verbose_name="Mois")
+    banque = models.ForeignKey(
+        'banques.Banque',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='agregats_feuilles',
+        verbose_name="Banque"
+    )
+    nature_economique = models.ForeignKey(
+        'demandes.NatureEconomique',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='agregats_feuilles',
+        verbose_name="Article Littera"
+    )
+    service = models.ForeignKey(
+        'accounts.Service',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='agregats_feuilles',
+        verbose_name="Service bénéficiaire"
+    )
+    total_fc = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'), verbose_name="Total FC")
+    total_usd = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'), verbose_name="Total USD")
+    nombre = models.IntegerField(default=0, verbose_name="Nombre de lignes")
+
+    class Meta:
+        verbose_name = "Agrégat mensuel (feuilles)"
+        verbose_name_plural = "Agrégats mensuels (feuilles)"
+        ordering = ['-annee', '-mois', 'type_operation']
+        indexes = [
+            models.Index(fields=['annee', 'mois', 'type_operation']),
+            models.Index(fields=['banque', 'annee']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_type_operation_display()} {self.mois:02d}/{self.annee} - {self.total_fc} FC / {self.total_usd} USD"
+
+    @staticmethod
+    def cle_depuis_feuille(instance):
+        """Retourne la clé d'agrégation (dict de filtres) d'une ligne de feuille"""
+        from demandes.models import DepenseFeuille
+
+        if isinstance(instance, DepenseFeuille):
+            return {
+                'type_operation': AgregatFeuilleMensuel.TYPE_DEPENSE,
+                'annee': instance.annee,
+                'mois': instance.mois,
+                'banque_id': instance.banque_id,
+                'nature_economique_id': instance.nature_economique_id,
+                'service_id': instance.service_beneficiaire_id,
+            }
+        return {
+            'type_operation': AgregatFeuilleMensuel.TYPE_RECETTE,
+            'annee': instance.annee,
+            'mois': instance.mois,
+            'banque_id': instance.banque_id,
+            'nature_economique_id': None,
+            'service_id': None,
+        }
+
+    @classmethod
+    def appliquer(cls, cle, montant_fc, montant_usd, nombre):
+        """
+        Ajoute (ou retire avec des valeurs négatives) un delta à la ligne de la clé.
+        La mise à jour se fait avec des expressions F() pour rester correcte
+        en cas d'écritures concurrentes.
+        """
+        montant_fc = montant_fc or Decimal('0.00')
+        montant_usd = montant_usd or Decimal('0.00')
+        with transaction.atomic():
+            nb_lignes = cls.objects.filter(**cle).update(
+                total_fc=F('total_fc') + montant_fc,
+                total_usd=F('total_usd') + montant_usd,
+                nombre=F('nombre') + nombre,
+            )
+            if not nb_lignes:
+                cls.objects.create(
+                    total_fc=montant_fc,
+                    total_usd=montant_usd,
+                    nombre=nombre,
+                    **cle
+                )
+
+    @classmethod
+    def reconstruire(cls):
+        """
+        Vide la table et la recalcule entièrement depuis les feuilles
+        (une requête GROUP BY par table). Retourne le nombre de lignes créées.
+        """
+        from demandes.models import DepenseFeuille
+        from recettes.models import RecetteFeuille
+
+        agregats = []
+        with transaction.atomic():
+            cls.objects.all().delete()
+
+            depenses = DepenseFeuille.objects.order_by().values(
+                'annee', 'mois', 'banque_id', 'nature_economique_id', 'service_beneficiaire_id'
+            ).annotate(total_fc=Sum('montant_fc'), total_usd=Sum('montant_usd'), nombre=Count('id'))
+            for row in depenses:
+                agregats.append(cls(
+                    type_operation=cls.TYPE_DEPENSE,
+                    annee=row['annee'],
+                    mois=row['mois'],
+                    banque_id=row['banque_id'],
+                    nature_economique_id=row['nature_economique_id'],
+                    service_id=row['service_beneficiaire_id'],
+                    total_fc=row['total_fc'] or Decimal('0.00'),
+                    total_usd=row['total_usd'] or Decimal('0.00'),
+                    nombre=row['nombre'],
+                ))
+
+            recettes = RecetteFeuille.objects.order_by().values(
+                'annee', 'mois', 'banque_id'
+            ).annotate(total_fc=Sum('montant_fc'), total_usd=Sum('montant_usd'), nombre=Count('id'))
+            for row in recettes:
+                agregats.append(cls(
+                    type_operation=cls.TYPE_RECETTE,
+                    annee=row['annee'],
+                    mois=row['mois'],
+                    banque_id=row['banque_id'],
+                    total_fc=row['total_fc'] or Decimal('0.00'),
+                    total_usd=row['total_usd'] or Decimal('0.00'),
+                    nombre=row['nombre'],
+                ))
+
+            cls.objects.bulk_create(agregats, batch_size=1000)
+
+            # Les soldes des périodes ouvertes seront recalculés depuis les nouveaux agrégats
+            from clotures.models import ClotureMensuelle
+            ClotureMensuelle.objects.filter(statut='OUVERT').update(soldes_a_recalculer=True)
+        return len(agregats)
+
+
+class RepriseImport(models.Model):
+    """
+    Point de reprise d'un import de feuille DATADAF (voir import_feuilles).
+
+    Une ligne par (empreinte du fichier, feuille) : la dernière ligne de la
+    feuille traitée est mise à jour dans la transaction de chaque lot, si
+    bien qu'un import interrompu reprend exactement après le dernier lot
+    enregistré. Un fichier modifié a une autre empreinte et repart du début.
+    """
+    STATUT_CHOICES = [
+        ('EN_COURS', 'En cours'),
+        ('TERMINE', 'Terminé'),
+    ]
+
+    empreinte_fichier = models.CharField(max_length=64, verbose_name="Empreinte SHA-256 du fichier")
+    nom_fichier = models.CharField(max_length=255, blank=True, verbose_name="Fichier")
+    feuille = models.CharField(max_length=100, verbose_name="Feuille")
+    statut = models.CharField(max_length=10, choices=STATUT_CHOICES, default='EN_COURS', verbose_name="Statut")
+    derniere_ligne = models.PositiveIntegerField(default=0, verbose_name="Dernière ligne traitée")
+    lignes_importees = models.PositiveIntegerField(default=0, verbose_name="Lignes importées")
+    doublons = models.PositiveIntegerField(default=0, verbose_name="Doublons ignorés")
+    erreurs = models.PositiveIntegerField(default=0, verbose_name="Lignes en erreur")
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_modification = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Point de reprise d'import"
+        verbose_name_plural = "Points de reprise d'import"
+        ordering = ['-date_modification']
+        constraints = [
+            models.UniqueConstraint(fields=['empreinte_fichier', 'feuille'], name='reprise_import_fichier_feuille'),
+        ]
+
+    def __str__(self):
+        return f"{self.nom_fichier} [{self.feuille}] - ligne {self.derniere_ligne} ({self.get_statut_display()})"
+
+
+class ImportFeuilleWeb(models.Model):
+    """
+    Import d'une feuille DEPENSES / RECETTES téléversée depuis l'application.
+
+    Le fichier est analysé par le travailleur `run_report_worker` (lignes
+    nouvelles, doublons, erreurs, articles et banques non résolus, voir
+    LigneImportFeuille) ; l'insertion n'a lieu qu'après confirmation, elle
+    aussi dans le travailleur. La réservation suit le principe de
+    etats.TacheGeneration : mise à jour conditionnelle du statut en attente
+    vers le statut en cours, avec un jeton propre à chaque réservation.
+    """
+    FEUILLE_CHOICES = [
+        ('DEPENSES', 'Dépenses'),
+        ('RECETTES', 'Recettes'),
+    ]
+    STATUT_CHOICES = [
+        ('ANALYSE_EN_ATTENTE', "En attente d'analyse"),
+        ('ANALYSE_EN_COURS', 'Analyse en cours'),
+        ('A_CONFIRMER', 'À confirmer'),
+        ('IMPORT_EN_ATTENTE', "En attente d'import"),
+        ('IMPORT_EN_COURS', 'Import en cours'),
+        ('TERMINE', 'Terminé'),
+        ('ECHEC', 'Échec'),
+        ('ANNULE', 'Annulé'),
+    ]
+    # Statut en attente -> statut pendant le traitement par le travailleur
+    ETAPES = {
+        'ANALYSE_EN_ATTENTE': 'ANALYSE_EN_COURS',
+        'IMPORT_EN_ATTENTE': 'IMPORT_EN_COURS',
+    }
+    MAX_TENTATIVES = 3
+
+    fichier = models.FileField(upload_to='imports_feuilles/%Y/%m/', verbose_name="Fichier")
+    nom_fichier = models.CharField(max_length=255, verbose_name="Nom du fichier")
+    feuille = models.CharField(max_length=10, choices=FEUILLE_CHOICES, verbose_name="Feuille")
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='ANALYSE_EN_ATTENTE', verbose_name="Statut")
+    cree_par = models.ForeignKey(
+        'accounts.User',
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='imports_feuilles',
+        verbose_name="Téléversé par"
+    )
+
+    # Résultat de l'analyse, puis de l'import
+    lignes_lues = models.PositiveIntegerField(default=0, verbose_name="Lignes lues")
+    lignes_nouvelles = models.PositiveIntegerField(default=0, verbose_name="Nouvelles lignes")
+    doublons = models.PositiveIntegerField(default=0, verbose_name="Doublons")
+    erreurs = models.PositiveIntegerField(default=0, verbose_name="Lignes en erreur")
+    non_resolus = models.JSONField(default=dict, blank=True, verbose_name="Articles et banques non résolus")
+    lignes_importees = models.PositiveIntegerField(default=0, verbose_name="Lignes importées")
+    message = models.TextField(blank=True, verbose_name="Message")
+
+    # Réservation par un travailleur
+    jeton = models.UUIDField(null=True, blank=True, editable=False)
+    travailleur = models.CharField(max_length=100, blank=True)
+    tentatives = models.PositiveSmallIntegerField(default=0)
+    delai_max = models.PositiveIntegerField(default=1800, verbose_name="Durée maximale d'exécution (s)")
+    date_limite = models.DateTimeField(null=True, blank=True)
+
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_modification = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Import de feuille"
+        verbose_name_plural = "Imports de feuilles"
+        ordering = ['-date_creation']
+        indexes = [
+            models.Index(fields=['statut', 'date_creation']),
+        ]
+
+    def __str__(self):
+        return f"{self.nom_fichier} [{self.feuille}] - {self.get_statut_display()}"
+
+    @property
+    def en_traitement(self):
+        return self.statut in ('ANALYSE_EN_ATTENTE', 'ANALYSE_EN_COURS', 'IMPORT_EN_ATTENTE', 'IMPORT_EN_COURS')
+
+    @classmethod
+    def reserver(cls, travailleur):
+        """Réserve le prochain import en attente (analyse ou insertion), None s'il n'y en a pas"""
+        import uuid
+        from datetime import timedelta
+        from django.utils import timezone
+
+        candidats = cls.objects.filter(statut__in=list(cls.ETAPES)).order_by('date_modification', 'pk')
+        for pk, statut, delai_max in candidats.values_list('pk', 'statut', 'delai_max')[:10]:
+            maintenant = timezone.now()
+            reserve = cls.objects.filter(pk=pk, statut=statut).update(
+                statut=cls.ETAPES[statut],
+                jeton=uuid.uuid4(),
+                travailleur=travailleur[:100],
+                tentatives=F('tentatives') + 1,
+                date_limite=maintenant + timedelta(seconds=delai_max),
+            )
+            if reserve:
+                return cls.objects.get(pk=pk)
+        return None
+
+    def mettre_a_jour(self, **champs):
+        """Écrit seulement si l'import appartient toujours à ce jeton ; retourne True si c'est le cas"""
+        encours = list(self.ETAPES.values())
+        return bool(ImportFeuilleWeb.objects.filter(pk=self.pk, jeton=self.jeton, statut__in=encours).update(**champs))
+
+    @classmethod
+    def expirer_imports_depasses(cls):
+        """
+        Remet en attente les traitements dont la date limite est passée
+        (travailleur arrêté), ou les passe en échec après MAX_TENTATIVES.
+        """
+        from django.utils import timezone
+
+        nombre = 0
+        attente = {en_cours: en_attente for en_attente, en_cours in cls.ETAPES.items()}
+        for pk, statut, tentatives in cls.objects.filter(
+            statut__in=list(attente), date_limite__lt=timezone.now()
+        ).values_list('pk', 'statut', 'tentatives'):
+            if tentatives < cls.MAX_TENTATIVES:
+                champs = {'statut': attente[statut], 'jeton': None, 'date_limite': None}
+            else:
+                champs = {'statut': 'ECHEC', 'message': "Délai d'exécution dépassé"}
+            nombre += cls.objects.filter(pk=pk, statut=statut).update(**champs)
+        return nombre
+
+
+class LigneImportFeuille(models.Model):
+    """Ligne d'un ImportFeuilleWeb analysé : aperçu avant confirmation"""
+    CATEGORIE_CHOICES = [
+        ('NOUVELLE', 'Nouvelle'),
+        ('DOUBLON', 'Doublon'),
+        ('ERREUR', 'Erreur'),
+    ]
+
+    import_feuille = models.ForeignKey(ImportFeuilleWeb, on_delete=models.CASCADE, related_name='lignes')
+    numero = models.PositiveIntegerField(verbose_name="Ligne")
+    categorie = models.CharField(max_length=10, choices=CATEGORIE_CHOICES, verbose_name="Catégorie")
+    donnees = models.JSONField(default=dict, blank=True, verbose_name="Champs lus")
+    article = models.CharField(max_length=50, blank=True, verbose_name="Article littera (fichier)")
+    banque = models.CharField(max_length=100, blank=True, verbose_name="Banque (fichier)")
+    nature_non_resolue = models.BooleanField(default=False)
+    banque_non_resolue = models.BooleanField(default=False)
+    message = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        verbose_name = "Ligne d'import"
+        verbose_name_plural = "Lignes d'import"
+        ordering = ['import_feuille', 'numero']
+        indexes = [
+            models.Index(fields=['import_feuille', 'categorie', 'numero']),
+        ]
+
+    def __str__(self):
+        return f"Ligne {self.numero} ({self.get_categorie_display()})"
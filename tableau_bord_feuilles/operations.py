@@ -0,0 +1,239 @@
+"""
+Liste fusionnée des opérations (DepenseFeuille + RecetteFeuille) du tableau général.
+
+La fusion est faite par la base : un UNION ALL de deux values() aux colonnes
+alignées, trié par (date, id, source) et paginé par clé (keyset) plutôt que
+par OFFSET. Les totaux et les nombres d'opérations sont obtenus par une seule
+requête d'agrégat conditionnel sur le même UNION ALL. Aucune ligne n'est
+chargée en mémoire au-delà de la page affichée.
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import F, Q, Value
+
+from demandes.models import DepenseFeuille
+from recettes.models import RecetteFeuille
+from .recherche import rechercher_feuilles
+
+
+SOURCE_DEPENSE = 0
+SOURCE_RECETTE = 1
+TYPES_OPERATION = {SOURCE_DEPENSE: 'dépense', SOURCE_RECETTE: 'recette'}
+
+TAILLE_PAGE = 50
+
+
+def filtrer_feuilles(parametres):
+    """
+    Querysets DepenseFeuille / RecetteFeuille filtrés selon les paramètres du
+    tableau général (GET ou POST) : type, annee, mois, banque, nature,
+    service, date_debut, date_fin, search. Nature et service ne portent que
+    sur les dépenses.
+    """
+    depenses = DepenseFeuille.objects.all()
+    recettes = RecetteFeuille.objects.all()
+
+    type_filter = parametres.get('type', '')
+    if type_filter == 'depense':
+        recettes = RecetteFeuille.objects.none()
+    elif type_filter == 'recette':
+        depenses = DepenseFeuille.objects.none()
+
+    communs = Q()
+    if parametres.get('annee'):
+        communs &= Q(annee=parametres['annee'])
+    if parametres.get('mois'):
+        communs &= Q(mois=parametres['mois'])
+    if parametres.get('banque'):
+        communs &= Q(banque_id=parametres['banque'])
+    if parametres.get('date_debut'):
+        communs &= Q(date__gte=parametres['date_debut'])
+    if parametres.get('date_fin'):
+        communs &= Q(date__lte=parametres['date_fin'])
+    depenses = depenses.filter(communs)
+    recettes = recettes.filter(communs)
+
+    if parametres.get('nature'):
+        depenses = depenses.filter(nature_economique_id=parametres['nature'])
+    if parametres.get('service'):
+        depenses = depenses.filter(service_beneficiaire_id=parametres['service'])
+
+    search = parametres.get('search', '')
+    if search:
+        depenses = rechercher_feuilles(depenses, search, classer=False)
+        recettes = rechercher_feuilles(recettes, search, classer=False)
+    return depenses, recettes
+
+
+def lire_curseur(valeur):
+    """Décode un curseur « AAAA-MM-JJ.id.source », None s'il est absent ou invalide"""
+    try:
+        jour, identifiant, source = valeur.split('.')
+        return date.fromisoformat(jour), int(identifiant), int(source)
+    except (AttributeError, ValueError):
+        return None
+
+
+def curseur(operation):
+    return f"{operation['date'].isoformat()}.{operation['id']}.{operation['source']}"
+
+
+def _decimal(valeur):
+    # SQLite renvoie les SUM de décimaux en float, PostgreSQL en Decimal
+    if valeur is None:
+        return Decimal('0.00')
+    return Decimal(str(valeur)).quantize(Decimal('0.01'))
+
+
+class OperationsFeuilles:
+    """Opérations fusionnées de deux querysets de feuilles déjà filtrés"""
+
+    def __init__(self, depenses, recettes):
+        self.depenses = depenses.order_by()
+        self.recettes = recettes.order_by()
+
+    def _colonnes_depenses(self, depenses):
+        return depenses.values(
+            'id', 'date', 'mois', 'annee', 'montant_fc', 'montant_usd',
+            source=Value(SOURCE_DEPENSE),
+            libelle=F('libelle_depenses'),
+            nature=F('nature_economique__titre'),
+            service=F('service_beneficiaire__nom_service'),
+            banque_nom=F('banque__nom_banque'),
+            remarque=F('observation'),
+        )
+
+    def _colonnes_recettes(self, recettes):
+        return recettes.values(
+            'id', 'date', 'mois', 'annee', 'montant_fc', 'montant_usd',
+            source=Value(SOURCE_RECETTE),
+            libelle=F('libelle_recette'),
+            nature=Value(''),
+            service=Value(''),
+            banque_nom=F('banque__nom_banque'),
+            remarque=Value(''),
+        )
+
+    @staticmethod
+    def _borne(queryset, source, borne, avant):
+        """
+        Lignes strictement après (avant=False, ordre décroissant) ou avant
+        (avant=True) le curseur dans l'ordre (date, id, source).
+        """
+        jour, identifiant, source_borne = borne
+        if avant:
+            condition = Q(date__gt=jour) | Q(date=jour, id__gt=identifiant)
+            meme_id_inclus = source > source_borne
+        else:
+            condition = Q(date__lt=jour) | Q(date=jour, id__lt=identifiant)
+            meme_id_inclus = source < source_borne
+        if meme_id_inclus:
+            condition |= Q(date=jour, id=identifiant)
+        return queryset.filter(condition)
+
+    def union(self, borne=None, avant=False):
+        depenses, recettes = self.depenses, self.recettes
+        if borne is not None:
+            depenses = self._borne(depenses, SOURCE_DEPENSE, borne, avant)
+            recettes = self._borne(recettes, SOURCE_RECETTE, borne, avant)
+        return self._colonnes_depenses(depenses).union(self._colonnes_recettes(recettes), all=True)
+
+    def page(self, apres=None, avant=None, taille=TAILLE_PAGE):
+        """
+        Une page d'opérations, les plus récentes d'abord.
+        `apres` / `avant` sont les curseurs des liens Suivant / Précédent.
+        Retourne {'operations', 'curseur_suivant', 'curseur_precedent'}.
+        """
+        borne_avant = lire_curseur(avant)
+        borne_apres = None if borne_avant else lire_curseur(apres)
+
+        if borne_avant:
+            lignes = list(self.union(borne_avant, avant=True).order_by('date', 'id', 'source')[:taille + 1])
+            a_precedent = len(lignes) > taille
+            lignes = lignes[:taille][::-1]
+            a_suivant = True
+        else:
+            lignes = list(self.union(borne_apres).order_by('-date', '-id', '-source')[:taille + 1])
+            a_suivant = len(lignes) > taille
+            lignes = lignes[:taille]
+            a_precedent = borne_apres is not None
+
+        return {
+            'operations': [self._operation(ligne) for ligne in lignes],
+            'curseur_suivant': curseur(lignes[-1]) if lignes and a_suivant else None,
+            'curseur_precedent': curseur(lignes[0]) if lignes and a_precedent else None,
+        }
+
+    def iterer(self, taille_lot=2000):
+        """
+        Toutes les opérations, les plus récentes d'abord, lues par lots de
+        `taille_lot` (curseur côté serveur sous PostgreSQL) pour les exports.
+        """
+        lignes = self.union().order_by('-date', '-id', '-source').iterator(chunk_size=taille_lot)
+        for ligne in lignes:
+            yield self._operation(ligne)
+
+    @staticmethod
+    def _operation(ligne):
+        """Ligne au format attendu par les gabarits du tableau général"""
+        return {
+            'type': TYPES_OPERATION[ligne['source']],
+            'source': ligne['source'],
+            'id': ligne['id'],
+            'date': ligne['date'],
+            'libelle': ligne['libelle'],
+            'nature': ligne['nature'] or '',
+            'service': ligne['service'] or '',
+            'banque': ligne['banque_nom'] or '',
+            'montant_cdf': ligne['montant_fc'],
+            'montant_usd': ligne['montant_usd'],
+            'observation': ligne['remarque'] or '',
+            'mois': ligne['mois'],
+            'annee': ligne['annee'],
+        }
+
+    def totaux(self):
+        """Totaux et nombres par type, en une requête d'agrégat conditionnel sur l'UNION ALL"""
+        union = self.depenses.values(
+            source=Value(SOURCE_DEPENSE), cdf=F('montant_fc'), usd=F('montant_usd')
+        ).union(
+            self.recettes.values(source=Value(SOURCE_RECETTE), cdf=F('montant_fc'), usd=F('montant_usd')),
+            all=True
+        )
+        try:
+            sql, params = union.query.sql_with_params()
+        except EmptyResultSet:
+            sql = None
+        requete = f"""
+            SELECT
+                SUM(CASE WHEN source = {SOURCE_DEPENSE} THEN 1 ELSE 0 END),
+                SUM(CASE WHEN source = {SOURCE_RECETTE} THEN 1 ELSE 0 END),
+                SUM(CASE WHEN source = {SOURCE_DEPENSE} THEN cdf END),
+                SUM(CASE WHEN source = {SOURCE_DEPENSE} THEN usd END),
+                SUM(CASE WHEN source = {SOURCE_RECETTE} THEN cdf END),
+                SUM(CASE WHEN source = {SOURCE_RECETTE} THEN usd END)
+            FROM ({sql}) operations
+        """
+        if sql is None:
+            # Les deux querysets sont vides (none())
+            nb_depenses = nb_recettes = dep_cdf = dep_usd = rec_cdf = rec_usd = None
+        else:
+            with connections[self.depenses.db].cursor() as cursor:
+                cursor.execute(requete, params)
+                nb_depenses, nb_recettes, dep_cdf, dep_usd, rec_cdf, rec_usd = cursor.fetchone()
+
+        totaux = {
+            'nb_depenses': nb_depenses or 0,
+            'nb_recettes': nb_recettes or 0,
+            'total_depenses_cdf': _decimal(dep_cdf),
+            'total_depenses_usd': _decimal(dep_usd),
+            'total_recettes_cdf': _decimal(rec_cdf),
+            'total_recettes_usd': _decimal(rec_usd),
+        }
+        totaux['nb_operations'] = totaux['nb_depenses'] + totaux['nb_recettes']
+        totaux['solde_cdf'] = totaux['total_recettes_cdf'] - totaux['total_depenses_cdf']
+        totaux['solde_usd'] = totaux['total_recettes_usd'] - totaux['total_depenses_usd']
+        return totaux
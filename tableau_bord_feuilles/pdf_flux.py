@@ -0,0 +1,85 @@
+"""
+Rendu PDF en flux pour les exports volumineux (tableau général, états).
+
+- FlowablesEnFlux : la « story » ReportLab est alimentée à la demande par un
+  générateur ; seuls quelques flowables existent en mémoire à un instant donné.
+- tableaux_par_tranches : découpe les lignes (lues avec .iterator()) en
+  tableaux d'environ une page, avec l'en-tête répété.
+- fichier_temporaire_pdf / reponse_fichier_pdf : le PDF est écrit dans un
+  fichier temporaire servi par FileResponse au lieu d'un BytesIO recopié
+  dans la réponse.
+"""
+import tempfile
+
+from django.http import FileResponse
+
+
+# Lignes de tableau par tranche (≈ une page A4 paysage en police 7-8)
+LIGNES_PAR_TRANCHE = 30
+
+
+class FlowablesEnFlux(list):
+    """
+    Liste de flowables remplie à la demande depuis un itérable.
+
+    BaseDocTemplate.build() ne consomme que la tête de la liste (len, [0],
+    del [0], réinsertion des morceaux découpés) : la liste est réalimentée
+    dès qu'il y reste moins de `reserve` éléments.
+    """
+
+    def __init__(self, flowables, reserve=4):
+        super().__init__()
+        self._source = iter(flowables)
+        self._reserve = reserve
+        self._remplir()
+
+    def _remplir(self):
+        while self._source is not None and list.__len__(self) < self._reserve:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+
+    def __len__(self):
+        self._remplir()
+        return list.__len__(self)
+
+
+def tableaux_par_tranches(entetes, lignes, col_widths, style, styles_ligne=None, taille=LIGNES_PAR_TRANCHE):
+    """
+    Génère des Table de `taille` lignes au plus, chacune précédée de l'en-tête.
+
+    `lignes` est un itérable (idéalement un .iterator()) ; `styles_ligne`
+    est une fonction optionnelle (index_dans_tranche, ligne) -> commandes
+    TableStyle supplémentaires pour la ligne.
+    """
+    from reportlab.platypus import Table, TableStyle
+
+    def tableau(tranche):
+        table = Table([entetes] + tranche, colWidths=col_widths, repeatRows=1)
+        commandes = list(style)
+        if styles_ligne:
+            for i, ligne in enumerate(tranche, start=1):
+                commandes.extend(styles_ligne(i, ligne))
+        table.setStyle(TableStyle(commandes))
+        return table
+
+    tranche = []
+    for ligne in lignes:
+        tranche.append(ligne)
+        if len(tranche) >= taille:
+            yield tableau(tranche)
+            tranche = []
+    if tranche:
+        yield tableau(tranche)
+
+
+def fichier_temporaire_pdf():
+    """Fichier temporaire anonyme, supprimé à sa fermeture (fin de la réponse)"""
+    return tempfile.TemporaryFile(suffix='.pdf')
+
+
+def reponse_fichier_pdf(fichier, nom_fichier):
+    """Sert le PDF écrit dans `fichier` en téléchargement, par blocs"""
+    fichier.seek(0)
+    return FileResponse(fichier, as_attachment=True, filename=nom_fichier, content_type='application/pdf')
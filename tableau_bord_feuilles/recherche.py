@@ -0,0 +1,172 @@
+"""
+Recherche plein texte sur les libellés des feuilles DEPENSES / RECETTES.
+
+Un seul point d'entrée, `rechercher_feuilles(queryset, texte)`, partagé par
+les listes, le tableau général et le détail des opérations :
+  - PostgreSQL : tsvector avec la configuration `fr_unaccent` (racinisation
+    française, insensible aux accents) et index GIN trigrammes pour garder la
+    recherche par sous-chaîne ; les index sont créés par la migration
+    0002_recherche_plein_texte ;
+  - SQLite (développement) : tables virtuelles FTS5 synchronisées par
+    triggers, installées après chaque migrate (voir installer_fts_sqlite) ;
+  - autre base, ou FTS5 indisponible : icontains, comme auparavant.
+Les résultats peuvent être classés par pertinence (annotation `pertinence`).
+"""
+import re
+
+from django.db import connections, OperationalError
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from demandes.models import DepenseFeuille
+from recettes.models import RecetteFeuille
+
+
+CONFIG_FR = 'fr_unaccent'
+
+# Champs indexés par modèle de feuille
+CHAMPS_RECHERCHE = {
+    DepenseFeuille: ('libelle_depenses', 'observation'),
+    RecetteFeuille: ('libelle_recette',),
+}
+
+
+def termes_recherche(texte):
+    """Découpe la saisie en mots (la ponctuation est ignorée)"""
+    return re.findall(r'\w+', texte or '')
+
+
+def _sous_chaine(champs, texte):
+    condition = Q()
+    for champ in champs:
+        condition |= Q(**{f'{champ}__icontains': texte})
+    return condition
+
+
+def rechercher_feuilles(queryset, texte, classer=True, ou=None):
+    """
+    Filtre un queryset de DepenseFeuille ou RecetteFeuille sur les mots-clés.
+
+    Si `classer` est vrai, le queryset est annoté avec `pertinence` et trié
+    par pertinence décroissante puis par date. `ou` est une condition Q
+    supplémentaire acceptée en alternative aux mots-clés (ex. titre de la
+    nature économique).
+    """
+    texte = (texte or '').strip()
+    if not texte:
+        return queryset
+
+    champs = CHAMPS_RECHERCHE[queryset.model]
+    termes = termes_recherche(texte)
+    connection = connections[queryset.db]
+    if termes and connection.vendor == 'postgresql':
+        queryset = _rechercher_postgresql(queryset, champs, texte, termes, classer, ou)
+    elif termes and connection.vendor == 'sqlite' and fts_sqlite_disponible(queryset.model, connection):
+        queryset = _rechercher_sqlite(queryset, termes, classer, ou)
+    else:
+        # Saisie sans mot (ponctuation seule) ou base sans index plein texte
+        condition = _sous_chaine(champs, texte)
+        if ou is not None:
+            condition |= ou
+        return queryset.filter(condition)
+
+    if classer:
+        queryset = queryset.order_by('-pertinence', '-date', '-date_creation')
+    return queryset
+
+
+def _rechercher_postgresql(queryset, champs, texte, termes, classer, ou):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+    # Même expression que l'index GIN de la migration 0002_recherche_plein_texte
+    vecteur = SearchVector(*champs, config=CONFIG_FR)
+    # Chaque mot est racinisé puis cherché en préfixe : « paiem » trouve « paiements »
+    requete = SearchQuery(' & '.join(f'{terme}:*' for terme in termes), config=CONFIG_FR, search_type='raw')
+
+    # Sous-chaîne sur le libellé (index trigrammes), comme l'ancienne recherche icontains
+    condition = Q(vecteur_recherche=requete) | _sous_chaine(champs[:1], texte)
+    if ou is not None:
+        condition |= ou
+    queryset = queryset.alias(vecteur_recherche=vecteur).filter(condition)
+    if classer:
+        queryset = queryset.annotate(pertinence=SearchRank(vecteur, requete))
+    return queryset
+
+
+def _rechercher_sqlite(queryset, termes, classer, ou):
+    table_fts = nom_table_fts(queryset.model)
+    table = queryset.model._meta.db_table
+    # Chaque mot est cherché en préfixe, les guillemets neutralisent la syntaxe FTS5
+    expression = ' '.join('"{}"*'.format(terme.replace('"', '""')) for terme in termes)
+
+    correspondances = RawSQL(f'SELECT rowid FROM {table_fts} WHERE {table_fts} MATCH %s', (expression,))
+    condition = Q(pk__in=correspondances)
+    if ou is not None:
+        condition |= ou
+    queryset = queryset.filter(condition)
+    if classer:
+        # bm25() est négatif, plus petit = plus pertinent
+        queryset = queryset.annotate(pertinence=RawSQL(
+            f'SELECT -bm25({table_fts}) FROM {table_fts} '
+            f'WHERE {table_fts} MATCH %s AND rowid = "{table}"."id"',
+            (expression,)
+        ))
+    return queryset
+
+
+def nom_table_fts(model):
+    return f'{model._meta.db_table}_fts'
+
+
+def fts_sqlite_disponible(model, connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [nom_table_fts(model)]
+        )
+        return cursor.fetchone() is not None
+
+
+def installer_fts_sqlite(connection):
+    """
+    Crée (si besoin) les tables FTS5 et les triggers de synchronisation, puis
+    reconstruit l'index quand les triggers manquaient. À rappeler après chaque
+    migrate : SQLite recrée les tables lors de certains ALTER, ce qui supprime
+    les triggers. Sans effet si FTS5 n'est pas compilé dans SQLite.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    for model, champs in CHAMPS_RECHERCHE.items():
+        table = model._meta.db_table
+        table_fts = nom_table_fts(model)
+        colonnes = ', '.join(champs)
+        nouvelles = ', '.join(f'new.{champ}' for champ in champs)
+        anciennes = ', '.join(f'old.{champ}' for champ in champs)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                [f'{table_fts}_%']
+            )
+            if cursor.fetchone()[0] == 3:
+                continue
+            try:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {table_fts} USING fts5("
+                    f"{colonnes}, content='{table}', content_rowid='id', "
+                    f"tokenize='unicode61 remove_diacritics 2')"
+                )
+            except OperationalError:
+                return
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {table_fts}_ai AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {table_fts}(rowid, {colonnes}) VALUES (new.id, {nouvelles}); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {table_fts}_ad AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {table_fts}({table_fts}, rowid, {colonnes}) VALUES ('delete', old.id, {anciennes}); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {table_fts}_au AFTER UPDATE ON {table} BEGIN "
+                f"INSERT INTO {table_fts}({table_fts}, rowid, {colonnes}) VALUES ('delete', old.id, {anciennes}); "
+                f"INSERT INTO {table_fts}(rowid, {colonnes}) VALUES (new.id, {nouvelles}); END"
+            )
+            cursor.execute(f"INSERT INTO {table_fts}({table_fts}) VALUES ('rebuild')")
@@ -0,0 +1,96 @@
+"""
+Maintenance incrémentale de la table AgregatFeuilleMensuel.
+
+Les feuilles DepenseFeuille / RecetteFeuille enveloppent leur save() dans une
+transaction : l'état précédent de la ligne est relu en pre_save et le delta
+est appliqué en post_save, dans la même transaction que l'écriture.
+Les suppressions (y compris QuerySet.delete()) passent par post_delete, que
+Django exécute dans la transaction du Collector.
+
+Chaque écriture marque aussi la clôture de la période concernée comme
+« soldes à recalculer » ; les tableaux de bord ne recalculent qu'à ce moment-là.
+
+installer_recherche_plein_texte est branché sur post_migrate dans apps.py.
+"""
+from decimal import Decimal
+
+from django.db import connections
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from clotures.models import ClotureMensuelle
+from demandes.models import DepenseFeuille
+from recettes.models import RecetteFeuille
+from .models import AgregatFeuilleMensuel
+from .recherche import installer_fts_sqlite
+
+
+CHAMPS_DEPENSE = ['annee', 'mois', 'banque', 'nature_economique', 'service_beneficiaire', 'montant_fc', 'montant_usd']
+CHAMPS_RECETTE = ['annee', 'mois', 'banque', 'montant_fc', 'montant_usd']
+
+
+def _etat_precedent(sender, instance):
+    """Relit la ligne en base avant modification (None pour une création)"""
+    if instance.pk is None:
+        return None
+    champs = CHAMPS_DEPENSE if sender is DepenseFeuille else CHAMPS_RECETTE
+    ancien = sender.objects.filter(pk=instance.pk).only(*champs).first()
+    if ancien is None:
+        return None
+    return {
+        'cle': AgregatFeuilleMensuel.cle_depuis_feuille(ancien),
+        'montant_fc': ancien.montant_fc or Decimal('0.00'),
+        'montant_usd': ancien.montant_usd or Decimal('0.00'),
+    }
+
+
+def _appliquer(cle, montant_fc, montant_usd, nombre):
+    AgregatFeuilleMensuel.appliquer(cle, montant_fc, montant_usd, nombre)
+    ClotureMensuelle.marquer_a_recalculer(cle['mois'], cle['annee'])
+
+
+@receiver(pre_save, sender=DepenseFeuille)
+@receiver(pre_save, sender=RecetteFeuille)
+def memoriser_etat_feuille(sender, instance, **kwargs):
+    instance._agregat_precedent = _etat_precedent(sender, instance)
+
+
+@receiver(post_save, sender=DepenseFeuille)
+@receiver(post_save, sender=RecetteFeuille)
+def mettre_a_jour_agregat_feuille(sender, instance, created, **kwargs):
+    precedent = getattr(instance, '_agregat_precedent', None)
+    instance._agregat_precedent = None
+
+    cle = AgregatFeuilleMensuel.cle_depuis_feuille(instance)
+    montant_fc = instance.montant_fc or Decimal('0.00')
+    montant_usd = instance.montant_usd or Decimal('0.00')
+
+    if precedent is None:
+        _appliquer(cle, montant_fc, montant_usd, 1)
+        return
+
+    if precedent['cle'] == cle:
+        delta_fc = montant_fc - precedent['montant_fc']
+        delta_usd = montant_usd - precedent['montant_usd']
+        if delta_fc or delta_usd:
+            _appliquer(cle, delta_fc, delta_usd, 0)
+        return
+
+    # La ligne a changé de période, de banque, de nature ou de service
+    _appliquer(precedent['cle'], -precedent['montant_fc'], -precedent['montant_usd'], -1)
+    _appliquer(cle, montant_fc, montant_usd, 1)
+
+
+@receiver(post_delete, sender=DepenseFeuille)
+@receiver(post_delete, sender=RecetteFeuille)
+def retirer_feuille_agregat(sender, instance, **kwargs):
+    _appliquer(
+        AgregatFeuilleMensuel.cle_depuis_feuille(instance),
+        -(instance.montant_fc or Decimal('0.00')),
+        -(instance.montant_usd or Decimal('0.00')),
+        -1,
+    )
+
+
+def installer_recherche_plein_texte(sender, using, **kwargs):
+    installer_fts_sqlite(connections[using])
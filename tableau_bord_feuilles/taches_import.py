@@ -0,0 +1,183 @@
+"""
+Traitement en arrière-plan des imports téléversés (voir ImportFeuilleWeb).
+
+Les deux étapes sont exécutées par le travailleur `manage.py run_report_worker`,
+jamais dans la requête :
+  - analyser_import : lecture du classeur, classement des lignes (nouvelles,
+    doublons, erreurs) et relevé des articles et banques non résolus, sans
+    rien insérer ; les lignes d'aperçu (LigneImportFeuille) sont créées par lot ;
+  - executer_import : après confirmation, insertion en masse des lignes
+    nouvelles par le moteur d'import (un bulk_create par lot et par
+    transaction) ; les doublons sont recontrôlés, la base ayant pu changer
+    depuis l'analyse.
+"""
+import logging
+import traceback
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from .import_feuilles import IMPORTS_PAR_FEUILLE, PREMIERE_LIGNE, TAILLE_LOT, ImportImpossible
+from .models import ImportFeuilleWeb, LigneImportFeuille
+
+logger = logging.getLogger(__name__)
+
+
+class ImportRepris(Exception):
+    """L'import a expiré ou a été annulé : le travail en cours est abandonné"""
+
+
+def _reserve(pk, jeton):
+    import_feuille = ImportFeuilleWeb.objects.get(pk=pk)
+    return import_feuille if import_feuille.jeton == jeton else None
+
+
+def _lignes_du_fichier(import_feuille):
+    """Ouvre le classeur téléversé (stockage de fichiers Django) en lecture seule"""
+    import openpyxl
+
+    fichier = import_feuille.fichier.open('rb')
+    try:
+        wb = openpyxl.load_workbook(fichier, read_only=True, data_only=True)
+    except Exception as e:
+        fichier.close()
+        raise ImportImpossible(f'Classeur illisible : {e}')
+    if import_feuille.feuille not in wb.sheetnames:
+        wb.close()
+        fichier.close()
+        raise ImportImpossible(f'Feuille "{import_feuille.feuille}" introuvable. Feuilles: {wb.sheetnames}')
+    return wb, fichier, wb[import_feuille.feuille].iter_rows(min_row=PREMIERE_LIGNE, values_only=True)
+
+
+def _echouer(import_feuille, message):
+    import_feuille.mettre_a_jour(statut='ECHEC', message=message[:2000], date_limite=None)
+
+
+def analyser_import(pk, jeton, taille_lot=TAILLE_LOT):
+    """
+    Analyse le classeur d'un import réservé avec `jeton` et crée son aperçu.
+    Retourne le nombre de lignes nouvelles, None en cas d'échec.
+    """
+    import_feuille = _reserve(pk, jeton)
+    if import_feuille is None:
+        return None
+
+    moteur = IMPORTS_PAR_FEUILLE[import_feuille.feuille](taille_lot=taille_lot)
+    non_resolus = {'article': Counter(), 'banque': Counter()}
+    try:
+        # Un passage précédent interrompu a pu laisser des lignes
+        import_feuille.lignes.all().delete()
+        wb, fichier, lignes = _lignes_du_fichier(import_feuille)
+        try:
+            for lot in moteur.analyser(lignes, premiere_ligne=PREMIERE_LIGNE):
+                apercu = []
+                for numero, categorie, champs, references, message in lot:
+                    manquantes = moteur.references_non_resolues(champs, references) if champs else {}
+                    for cle, libelle in manquantes.items():
+                        non_resolus[cle][libelle] += 1
+                    apercu.append(LigneImportFeuille(
+                        import_feuille=import_feuille,
+                        numero=numero,
+                        categorie=categorie,
+                        donnees=moteur.champs_en_json(champs) if champs else {},
+                        article=references.get('article', '')[:50],
+                        banque=references.get('banque', '')[:100],
+                        nature_non_resolue='article' in manquantes,
+                        banque_non_resolue='banque' in manquantes,
+                        message=message[:255],
+                    ))
+                with transaction.atomic():
+                    LigneImportFeuille.objects.bulk_create(apercu)
+                    if not import_feuille.mettre_a_jour(lignes_lues=moteur.resultat.lues):
+                        raise ImportRepris()
+        finally:
+            wb.close()
+            fichier.close()
+    except ImportRepris:
+        logger.warning("Import %s repris par un autre travailleur ou annulé, analyse abandonnée", pk)
+        return None
+    except ImportImpossible as e:
+        _echouer(import_feuille, str(e))
+        return None
+    except Exception:
+        logger.exception("Erreur lors de l'analyse de l'import %s", pk)
+        _echouer(import_feuille, traceback.format_exc())
+        return None
+
+    resultat = moteur.resultat
+    if not import_feuille.mettre_a_jour(
+        statut='A_CONFIRMER',
+        lignes_lues=resultat.lues,
+        lignes_nouvelles=resultat.importees,
+        doublons=resultat.doublons,
+        erreurs=len(resultat.erreurs),
+        non_resolus={cle: dict(compteur.most_common()) for cle, compteur in non_resolus.items() if compteur},
+        message=f'Analyse en {resultat.duree:.2f}s',
+        jeton=None,
+        date_limite=None,
+    ):
+        return None
+    return resultat.importees
+
+
+def executer_import(pk, jeton, taille_lot=TAILLE_LOT):
+    """
+    Insère les lignes nouvelles d'un import confirmé, réservé avec `jeton`.
+    Retourne le nombre de lignes importées, None en cas d'échec.
+    """
+    import_feuille = _reserve(pk, jeton)
+    if import_feuille is None:
+        return None
+
+    moteur = IMPORTS_PAR_FEUILLE[import_feuille.feuille](taille_lot=taille_lot)
+    nouvelles = import_feuille.lignes.filter(categorie='NOUVELLE').order_by('numero').values_list('numero', 'donnees')
+    try:
+        lot = []
+        for numero, donnees in nouvelles.iterator(chunk_size=taille_lot):
+            lot.append((numero, moteur.champs_depuis_json(donnees)))
+            if len(lot) >= taille_lot:
+                _enregistrer(import_feuille, moteur, lot)
+                lot = []
+        if lot:
+            _enregistrer(import_feuille, moteur, lot)
+    except ImportRepris:
+        logger.warning("Import %s repris par un autre travailleur, insertion interrompue", pk)
+        return None
+    except Exception:
+        logger.exception("Erreur lors de l'import %s", pk)
+        _echouer(import_feuille, traceback.format_exc())
+        return None
+
+    resultat = moteur.resultat
+    message = f'{resultat.importees} ligne(s) importée(s)'
+    if resultat.doublons:
+        message += f', {resultat.doublons} doublon(s) apparu(s) depuis l\'analyse'
+    if resultat.erreurs:
+        message += f', {len(resultat.erreurs)} erreur(s) : ' + ' ; '.join(resultat.erreurs[:5])
+    if not import_feuille.mettre_a_jour(
+        statut='TERMINE',
+        lignes_importees=resultat.importees,
+        message=message[:2000],
+        jeton=None,
+        date_limite=None,
+    ):
+        return None
+    return resultat.importees
+
+
+def _enregistrer(import_feuille, moteur, lot):
+    # Les lots déjà insérés sont retrouvés comme doublons si l'import est repris
+    if not import_feuille.mettre_a_jour(lignes_importees=moteur.resultat.importees, date_modification=timezone.now()):
+        raise ImportRepris()
+    moteur.enregistrer_lot(lot, lot[-1][0])
+
+
+def executer(pk, jeton):
+    """Étape suivante d'un import réservé : analyse ou insertion selon son statut"""
+    statut = ImportFeuilleWeb.objects.filter(pk=pk).values_list('statut', flat=True).first()
+    if statut == 'ANALYSE_EN_COURS':
+        return analyser_import(pk, jeton)
+    if statut == 'IMPORT_EN_COURS':
+        return executer_import(pk, jeton)
+    return None
@@ -1,3 +1,884 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import date
+from io import BytesIO, StringIO
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Q, Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import Service, User
+from banques.models import Banque
+from demandes.models import DepenseFeuille, NatureEconomique
+from rapports.cache_artefacts import CacheRapports, normaliser_filtres
+from recettes.models import RecetteFeuille
+
+from .agregation import AgregationFeuilles
+from .models import AgregatFeuilleMensuel
+from .operations import OperationsFeuilles
+from .pdf_flux import FlowablesEnFlux
+from .recherche import rechercher_feuilles
+
+
+def creer_depense(banque, nature, service, montant_fc, montant_usd=Decimal('0.00'), mois=3, annee=2025):
+    return DepenseFeuille.objects.create(
+        mois=mois,
+        annee=annee,
+        date=date(annee, mois, 1),
+        nature_economique=nature,
+        service_beneficiaire=service,
+        libelle_depenses="Dépense de test",
+        banque=banque,
+        montant_fc=montant_fc,
+        montant_usd=montant_usd,
+    )
+
+
+def creer_recette(banque, montant_fc, montant_usd=Decimal('0.00'), mois=3, annee=2025):
+    return RecetteFeuille.objects.create(
+        mois=mois,
+        annee=annee,
+        date=date(annee, mois, 1),
+        libelle_recette="Recette de test",
+        banque=banque,
+        montant_fc=montant_fc,
+        montant_usd=montant_usd,
+    )
+
+
+class AgregatFeuilleMensuelTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.banque_a = Banque.objects.create(nom_banque="Banque A")
+        cls.banque_b = Banque.objects.create(nom_banque="Banque B")
+        cls.nature = NatureEconomique.objects.create(code="1111", titre="Nature test")
+        cls.service = Service.objects.create(nom_service="Service test")
+        cls.banque_ids = [cls.banque_a.pk, cls.banque_b.pk, None]
+
+    def totaux_agregats(self, **filtres):
+        return AgregatFeuilleMensuel.objects.filter(**filtres).aggregate(
+            total_fc=Sum('total_fc'), total_usd=Sum('total_usd'), nombre=Sum('nombre')
+        )
+
+    def totaux_feuilles(self, model, **filtres):
+        totaux = model.objects.filter(**filtres).aggregate(total_fc=Sum('montant_fc'), total_usd=Sum('montant_usd'))
+        totaux['nombre'] = model.objects.filter(**filtres).count()
+        return totaux
+
+    def assertAgregatsCoherents(self):
+        for model, type_operation in [
+            (DepenseFeuille, AgregatFeuilleMensuel.TYPE_DEPENSE),
+            (RecetteFeuille, AgregatFeuilleMensuel.TYPE_RECETTE),
+        ]:
+            for banque_id in self.banque_ids:
+                attendu = self.totaux_feuilles(model, banque_id=banque_id)
+                obtenu = self.totaux_agregats(type_operation=type_operation, banque_id=banque_id)
+                self.assertEqual(obtenu['total_fc'] or 0, attendu['total_fc'] or 0)
+                self.assertEqual(obtenu['total_usd'] or 0, attendu['total_usd'] or 0)
+                self.assertEqual(obtenu['nombre'] or 0, attendu['nombre'])
+
+    def test_creation_modification_suppression(self):
+        depense = creer_depense(self.banque_a, self.nature, self.service, Decimal('100.00'), Decimal('5.00'))
+        creer_depense(self.banque_a, self.nature, self.service, Decimal('50.00'))
+        recette = creer_recette(self.banque_b, Decimal('300.00'), Decimal('10.00'))
+        self.assertAgregatsCoherents()
+
+        # Modification du montant : même clé
+        depense.montant_fc = Decimal('120.00')
+        depense.save()
+        self.assertAgregatsCoherents()
+
+        # Changement de banque et de mois : la ligne change de clé
+        depense.banque = self.banque_b
+        depense.mois = 4
+        depense.save()
+        self.assertAgregatsCoherents()
+
+        recette.delete()
+        DepenseFeuille.objects.filter(banque=self.banque_a).delete()
+        self.assertAgregatsCoherents()
+
+    def test_suppression_banque(self):
+        creer_depense(self.banque_a, self.nature, self.service, Decimal('100.00'))
+        creer_recette(self.banque_a, Decimal('40.00'))
+        self.banque_a.delete()
+        self.assertAgregatsCoherents()
+
+    def test_reconstruction(self):
+        creer_depense(self.banque_a, self.nature, self.service, Decimal('100.00'))
+        creer_depense(self.banque_a, self.nature, self.service, Decimal('30.00'))
+        creer_recette(self.banque_b, Decimal('40.00'))
+        AgregatFeuilleMensuel.objects.update(total_fc=0, nombre=0)
+
+        call_command('reconstruire_agregats_feuilles', stdout=StringIO())
+
+        self.assertEqual(AgregatFeuilleMensuel.objects.count(), 2)
+        self.assertAgregatsCoherents()
+
+
+class AgregationFeuillesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.nature = NatureEconomique.objects.create(code="1111", titre="Nature test")
+        cls.service = Service.objects.create(nom_service="Service test")
+        cls.utilisateur = User.objects.create_user('daf', password='x', role='SUPER_ADMIN')
+        cls.annee = timezone.now().year
+        cls.mois = timezone.now().month
+
+    def ajouter_banques(self, nombre, debut=0):
+        banques = []
+        for i in range(debut, debut + nombre):
+            banque = Banque.objects.create(nom_banque=f"Banque {i}")
+            for mois in {1, self.mois}:
+                creer_depense(banque, self.nature, self.service, Decimal('10.00'), Decimal('1.00'), mois=mois, annee=self.annee)
+                creer_recette(banque, Decimal('100.00'), Decimal('2.00'), mois=mois, annee=self.annee)
+            banques.append(banque)
+        return banques
+
+    def test_totaux_par_banque_et_par_mois(self):
+        banques = self.ajouter_banques(3)
+        agregation = AgregationFeuilles(Q(annee=self.annee, mois=1))
+
+        with self.assertNumQueries(2):
+            totaux = agregation.totaux()
+            stats = agregation.stats_banques(banques)
+            evolution = AgregationFeuilles.evolution_mensuelle(self.annee)
+
+        nb_mois = len({1, self.mois})
+        self.assertEqual(totaux['depenses_cdf'], Decimal('30.00'))
+        self.assertEqual(totaux['recettes_usd'], Decimal('6.00'))
+        self.assertEqual(totaux['nb_depenses'], 3)
+        self.assertEqual(totaux['solde_cdf'], Decimal('270.00'))
+        self.assertEqual([s['nb_operations'] for s in stats], [2, 2, 2])
+        self.assertEqual(evolution[0]['depenses_cdf'], 30.0)
+        self.assertEqual(sum(item['recettes_cdf'] for item in evolution), 300.0 * nb_mois)
+
+    def test_budget_requetes_independant_du_nombre_de_banques(self):
+        self.client.force_login(self.utilisateur)
+        self.ajouter_banques(2)
+        # Première requête : création de la période de clôture et de la session
+        self.client.get('/tableau-bord-feuilles/')
+
+        with CaptureQueriesContext(connection) as avec_2_banques:
+            response = self.client.get('/tableau-bord-feuilles/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['stats_par_banque']), 2)
+
+        self.ajouter_banques(8, debut=2)
+
+        with CaptureQueriesContext(connection) as avec_10_banques:
+            response = self.client.get('/tableau-bord-feuilles/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['stats_par_banque']), 10)
+
+        self.assertEqual(len(avec_2_banques.captured_queries), len(avec_10_banques.captured_queries))
+
+
+class SoldesClotureTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.banque = Banque.objects.create(nom_banque="Banque A")
+        cls.utilisateur = User.objects.create_user('daf', password='x', role='SUPER_ADMIN')
+        cls.annee = timezone.now().year
+        cls.mois = timezone.now().month
+
+    def test_tableau_de_bord_sans_ecriture_sur_la_cloture(self):
+        from clotures.models import ClotureMensuelle
+
+        self.client.force_login(self.utilisateur)
+        periode = ClotureMensuelle.objects.create(mois=self.mois, annee=self.annee)
+        periode.calculer_soldes()
+        creer_recette(self.banque, Decimal('500.00'), mois=self.mois, annee=self.annee)
+
+        periode.refresh_from_db()
+        self.assertTrue(periode.soldes_a_recalculer)
+
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.client.get('/tableau-bord-feuilles/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['solde_net_fc'], Decimal('500.00'))
+        ecritures = [
+            q['sql'] for q in requetes.captured_queries
+            if 'clotures_cloturemensuelle' in q['sql'] and not q['sql'].lstrip().upper().startswith('SELECT')
+        ]
+        self.assertEqual(ecritures, [])
+
+        periode.calculer_soldes()
+        periode.refresh_from_db()
+        self.assertFalse(periode.soldes_a_recalculer)
+        self.assertEqual(periode.total_recettes_fc, Decimal('500.00'))
+
+
+class PlansRequetesTests(TestCase):
+
+    def test_aucun_parcours_sequentiel_des_feuilles(self):
+        sortie = StringIO()
+        call_command('verifier_plans_requetes', lignes=3000, stdout=sortie)
+        self.assertIn('plan(s) vérifié(s)', sortie.getvalue())
+        self.assertFalse(DepenseFeuille.objects.exists())
+
+
+class RechercheFeuillesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.banque = Banque.objects.create(nom_banque="Banque A")
+        cls.nature = NatureEconomique.objects.create(code="1111", titre="Nature test")
+        cls.service = Service.objects.create(nom_service="Service test")
+
+    def depense(self, libelle, observation=''):
+        depense = creer_depense(self.banque, self.nature, self.service, Decimal('10.00'))
+        depense.libelle_depenses = libelle
+        depense.observation = observation
+        depense.save()
+        return depense
+
+    def libelles(self, queryset):
+        return [ligne.libelle_depenses for ligne in queryset]
+
+    def test_accents_prefixes_et_classement(self):
+        self.depense("Achat de fournitures", observation="Réparation du véhicule")
+        self.depense("Réparation véhicule de service", observation="réparation urgente")
+        self.depense("Carburant")
+
+        resultats = rechercher_feuilles(DepenseFeuille.objects.all(), "reparation vehic")
+        self.assertEqual(self.libelles(resultats), ["Réparation véhicule de service", "Achat de fournitures"])
+        self.assertEqual(self.libelles(rechercher_feuilles(DepenseFeuille.objects.all(), "fourniture")), ["Achat de fournitures"])
+        self.assertEqual(rechercher_feuilles(DepenseFeuille.objects.all(), "inconnu").count(), 0)
+
+    def test_index_suit_modifications_et_suppressions(self):
+        depense = self.depense("Loyer du bureau")
+        creer_recette(self.banque, Decimal('5.00'))
+
+        depense.libelle_depenses = "Électricité du bureau"
+        depense.save()
+        self.assertEqual(rechercher_feuilles(DepenseFeuille.objects.all(), "loyer").count(), 0)
+        self.assertEqual(rechercher_feuilles(DepenseFeuille.objects.all(), "electricite").count(), 1)
+        self.assertEqual(rechercher_feuilles(RecetteFeuille.objects.all(), "recette test").count(), 1)
+
+        depense.delete()
+        self.assertEqual(rechercher_feuilles(DepenseFeuille.objects.all(), "bureau").count(), 0)
+
+    def test_condition_alternative(self):
+        self.depense("Carburant")
+        resultats = rechercher_feuilles(
+            DepenseFeuille.objects.all(), "nature", classer=False, ou=Q(nature_economique__titre__icontains="nature")
+        )
+        self.assertEqual(resultats.count(), 1)
+
+
+class OperationsFeuillesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.banque = Banque.objects.create(nom_banque="Banque A")
+        cls.nature = NatureEconomique.objects.create(code="1111", titre="Nature test")
+        cls.service = Service.objects.create(nom_service="Service test")
+        cls.utilisateur = User.objects.create_user('daf', password='x', role='SUPER_ADMIN')
+
+    def peupler(self, nombre):
+        # Plusieurs lignes par jour et par table, pour tester le départage (date, id, source) ;
+        # montants distincts d'un appel à l'autre (l'empreinte de contenu est unique)
+        debut = DepenseFeuille.objects.count()
+        for i in range(debut, debut + nombre):
+            mois = i % 3 + 1
+            creer_depense(self.banque, self.nature, self.service, Decimal(i), Decimal('1.00'), mois=mois)
+            creer_recette(self.banque, Decimal(i * 2), Decimal('2.00'), mois=mois)
+
+    def operations(self):
+        return OperationsFeuilles(DepenseFeuille.objects.all(), RecetteFeuille.objects.all())
+
+    def test_parcours_complet_dans_les_deux_sens(self):
+        self.peupler(23)
+        attendu = sorted(
+            [(d, i, 0) for d, i in DepenseFeuille.objects.values_list('date', 'id')] +
+            [(d, i, 1) for d, i in RecetteFeuille.objects.values_list('date', 'id')],
+            reverse=True
+        )
+
+        pages = []
+        page = self.operations().page(taille=10)
+        pages.append(page)
+        while page['curseur_suivant']:
+            page = self.operations().page(apres=page['curseur_suivant'], taille=10)
+            pages.append(page)
+        obtenu = [(op['date'], op['id'], op['source']) for p in pages for op in p['operations']]
+        self.assertEqual(obtenu, attendu)
+        self.assertEqual(len(pages), 5)
+        self.assertIsNone(pages[0]['curseur_precedent'])
+
+        # Retour en arrière depuis la dernière page
+        precedente = self.operations().page(avant=pages[-1]['curseur_precedent'], taille=10)
+        self.assertEqual(precedente['operations'], pages[-2]['operations'])
+
+    def test_totaux_en_une_requete(self):
+        self.peupler(10)
+        with self.assertNumQueries(1):
+            totaux = self.operations().totaux()
+        self.assertEqual(totaux['nb_depenses'], 10)
+        self.assertEqual(totaux['nb_operations'], 20)
+        self.assertEqual(totaux['total_depenses_cdf'], Decimal('45.00'))
+        self.assertEqual(totaux['total_recettes_usd'], Decimal('20.00'))
+        self.assertEqual(totaux['solde_cdf'], Decimal('45.00'))
+
+        vide = OperationsFeuilles(DepenseFeuille.objects.none(), RecetteFeuille.objects.none())
+        self.assertEqual(vide.totaux()['nb_operations'], 0)
+        self.assertEqual(vide.page()['operations'], [])
+
+    def test_budget_requetes_independant_du_volume(self):
+        self.client.force_login(self.utilisateur)
+        self.peupler(5)
+        self.client.get('/tableau-bord-feuilles/tableau-general/')
+
+        with CaptureQueriesContext(connection) as peu_de_lignes:
+            response = self.client.get('/tableau-bord-feuilles/tableau-general/')
+        self.assertEqual(response.status_code, 200)
+
+        self.peupler(60)
+        with CaptureQueriesContext(connection) as beaucoup_de_lignes:
+            response = self.client.get('/tableau-bord-feuilles/tableau-general/?type=depense')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['operations']), 50)
+        self.assertEqual(response.context['nb_depenses'], 65)
+        self.assertIsNotNone(response.context['curseur_suivant'])
+        self.assertLessEqual(len(beaucoup_de_lignes.captured_queries), len(peu_de_lignes.captured_queries))
+
+
+CACHE_TEST = tempfile.mkdtemp()
+
+
+@override_settings(RAPPORTS_CACHE_REPERTOIRE=CACHE_TEST)
+class ExportsPDFTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.banque = Banque.objects.create(nom_banque="Banque A")
+        cls.nature = NatureEconomique.objects.create(code="1111", titre="Nature test")
+        cls.service = Service.objects.create(nom_service="Service test")
+        cls.utilisateur = User.objects.create_user('daf', password='x', role='SUPER_ADMIN')
+        for i in range(70):
+            creer_depense(cls.banque, cls.nature, cls.service, Decimal(i))
+            creer_recette(cls.banque, Decimal(i))
+
+    def test_flowables_consommes_a_la_demande(self):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.platypus import Paragraph, SimpleDocTemplate
+
+        produits = []
+
+        def paragraphes():
+            for i in range(200):
+                produits.append(i)
+                yield Paragraph(f"Ligne {i}", getSampleStyleSheet()['Normal'])
+
+        story = FlowablesEnFlux(paragraphes(), reserve=4)
+        self.assertEqual(len(produits), 4)
+        SimpleDocTemplate(BytesIO(), pagesize=A4).build(story)
+        self.assertEqual(len(produits), 200)
+
+    def test_tableau_general_pdf_en_flux(self):
+        self.client.force_login(self.utilisateur)
+        response = self.client.post('/tableau-bord-feuilles/tableau-general/pdf/', {'annee': 2025})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+        response = self.client.post('/tableau-bord-feuilles/tableau-general/pdf/', {'annee': 1990})
+        self.assertEqual(response.status_code, 404)
+
+    def test_kit_de_mise_en_page_partage(self):
+        from rapports.mise_en_page_pdf import _modele_logo, styles_pdf
+
+        self.assertIs(styles_pdf(), styles_pdf())
+        for mois in ('3', ''):
+            response = self.client.post('/tableau-bord-feuilles/generer-etats/', {
+                'type_etat': 'synthese_par_banque', 'annee_synthese_banque': '2025', 'mois_synthese_banque': mois,
+            })
+            contenu = b''.join(response.streaming_content)
+            # Le logo est présent une fois dans chaque document, sans relecture du fichier
+            self.assertEqual(contenu.count(b'/Subtype /Image'), 1)
+        self.assertEqual(_modele_logo.cache_info().currsize, 1)
+
+        sortie = StringIO()
+        call_command('mesurer_mise_en_page_pdf', '--pdfs', '2', stdout=sortie)
+        self.assertIn('ms CPU par PDF', sortie.getvalue())
+
+    def test_etat_pdf_en_flux(self):
+        response = self.client.post('/tableau-bord-feuilles/generer-etats/', {
+            'type_etat': 'depense_par_nature', 'annee_nature': '2025', 'mois_nature': '3',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+
+@override_settings(RAPPORTS_CACHE_REPERTOIRE=CACHE_TEST)
+class CacheRapportsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.banque = Banque.objects.create(nom_banque="Banque A")
+        cls.nature = NatureEconomique.objects.create(code="1111", titre="Nature test")
+        cls.service = Service.objects.create(nom_service="Service test")
+        cls.utilisateur = User.objects.create_user('daf', password='x', role='SUPER_ADMIN')
+        cls.depense = creer_depense(cls.banque, cls.nature, cls.service, Decimal('100.00'))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(CACHE_TEST, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(CACHE_TEST, ignore_errors=True)
+
+    def fichiers_en_cache(self):
+        return sorted(p.name for p in CacheRapports().repertoire.glob('*/*'))
+
+    def generer(self, **filtres):
+        donnees = {'type_etat': 'depense_par_nature', 'annee_nature': '2025', 'mois_nature': '3'}
+        donnees.update(filtres)
+        response = self.client.post('/tableau-bord-feuilles/generer-etats/', donnees)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_normalisation_des_filtres(self):
+        self.assertEqual(
+            normaliser_filtres({'annee': ' 2025 ', 'mois': '', 'banques': [3, 1], 'nature': None}),
+            normaliser_filtres({'banques': (1, 3), 'annee': '2025'}),
+        )
+
+    def test_etat_servi_depuis_le_cache_tant_que_les_feuilles_ne_changent_pas(self):
+        premier = self.generer()
+        self.assertEqual(len(self.fichiers_en_cache()), 1)
+
+        with CaptureQueriesContext(connection) as requetes:
+            self.assertEqual(self.generer(mois_nature=' 3', nature_economique=''), premier)
+        # Version des données : un agrégat des feuilles, puis les libellés imprimés
+        self.assertEqual(len(requetes), 2)
+        self.assertEqual(len(self.fichiers_en_cache()), 1)
+
+        # Une écriture sur une autre période ne change pas la version
+        creer_depense(self.banque, self.nature, self.service, Decimal('5.00'), mois=4)
+        self.generer()
+        self.assertEqual(len(self.fichiers_en_cache()), 1)
+
+        # Une modification de la période produit une nouvelle entrée
+        self.depense.libelle_depenses = "Libellé corrigé"
+        self.depense.save()
+        self.generer()
+        self.assertEqual(len(self.fichiers_en_cache()), 2)
+
+        # Une banque renommée est imprimée autrement : nouvelle entrée
+        Banque.objects.filter(pk=self.banque.pk).update(nom_banque="Banque A renommée")
+        self.generer()
+        self.assertEqual(len(self.fichiers_en_cache()), 3)
+
+    def test_version_limitee_aux_libelles_imprimes(self):
+        from demandes.models import DemandePaiement
+        from rapports.cache_artefacts import version_donnees
+
+        DemandePaiement.objects.create(
+            service_demandeur=self.service, nature_economique=self.nature, description="Demande",
+            montant=Decimal('10.00'), devise='USD', cree_par=self.utilisateur,
+        )
+        querysets = (DemandePaiement.objects.all(), DepenseFeuille.objects.all())
+        with self.assertNumQueries(3):
+            version = version_donnees(*querysets)
+
+        # Mot de passe ou description changés : rien de cela n'est imprimé
+        self.utilisateur.set_password('y')
+        self.utilisateur.save()
+        Service.objects.filter(pk=self.service.pk).update(description="Nouvelle description")
+        self.assertEqual(version_donnees(*querysets), version)
+
+        NatureEconomique.objects.filter(pk=self.nature.pk).update(titre="Nature renommée")
+        self.assertNotEqual(version_donnees(*querysets), version)
+
+    def test_synthese_pdf_en_cache(self):
+        import json
+        self.client.force_login(self.utilisateur)
+        data = json.dumps({
+            'titre': 'Synthèse', 'type_etat': 'DEPENSE_FEUILLE', 'annee': '2025', 'mois': '3',
+            'nombre': 1, 'total_cdf': '100', 'total_usd': '0',
+        })
+        premier = self.client.get('/tableau-bord-feuilles/rapports/synthese/pdf/', {'data': data})
+        self.assertEqual(premier['Content-Type'], 'application/pdf')
+        second = self.client.get('/tableau-bord-feuilles/rapports/synthese/pdf/', {'data': data})
+        self.assertTrue(second.streaming)
+        self.assertEqual(b''.join(second.streaming_content), premier.content)
+        self.assertEqual(len(self.fichiers_en_cache()), 1)
+
+    def test_eviction_des_moins_recemment_servis(self):
+        cache = CacheRapports(taille_max=25)
+        for i, cle in enumerate(['aa01', 'bb02', 'cc03']):
+            chemin = cache.enregistrer(cle, 'pdf', BytesIO(b'x' * 10))
+            os.utime(chemin, (1000 + i, 1000 + i))
+        # Les trois fichiers dépassaient la limite : le plus ancien a été évincé
+        self.assertIsNone(cache.lire('aa01', 'pdf'))
+        # bb02 est relu, cc03 devient le moins récemment servi
+        self.assertIsNotNone(cache.lire('bb02', 'pdf'))
+        cache.enregistrer('dd04', 'pdf', BytesIO(b'x' * 10))
+        self.assertEqual(self.fichiers_en_cache(), ['bb02.pdf', 'dd04.pdf'])
+
+
+@override_settings(RAPPORTS_CACHE_REPERTOIRE=CACHE_TEST, ETATS_LOT_MODE='direct')
+class LotEtatsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.banques = [Banque.objects.create(nom_banque=nom) for nom in ("Rawbank", "Equity BCDC")]
+        cls.nature = NatureEconomique.objects.create(code="1111", titre="Nature test")
+        cls.service = Service.objects.create(nom_service="Service test")
+        cls.utilisateur = User.objects.create_user('daf', password='x', role='SUPER_ADMIN', is_staff=True, is_superuser=True)
+        for mois in (1, 2):
+            for banque in cls.banques:
+                creer_depense(banque, cls.nature, cls.service, Decimal('10.00'), mois=mois)
+
+    def setUp(self):
+        self.sortie = tempfile.NamedTemporaryFile(suffix='.zip', delete=False).name
+        self.addCleanup(os.unlink, self.sortie)
+
+    def test_commande_genere_l_archive_et_les_minutages(self):
+        sortie = StringIO()
+        call_command(
+            'generate_etats_batch', '--debut', '2025-01', '--fin', '2025-02', '--annuel',
+            '--mode', 'direct', '--sortie', self.sortie, stdout=sortie,
+        )
+        self.assertIn('✓ 12 rapport(s) écrit(s)', sortie.getvalue())
+
+        with zipfile.ZipFile(self.sortie) as archive:
+            noms = archive.namelist()
+            self.assertIn('2025-01/rapport_par_banque_rawbank.pdf', noms)
+            self.assertIn('2025-02/rapport_par_banque_equity-bcdc.pdf', noms)
+            self.assertIn('2025-annuel/synthese_par_banque.pdf', noms)
+            self.assertTrue(archive.read('2025-01/depense_par_nature.pdf').startswith(b'%PDF'))
+            minutages = archive.read('minutages.csv').decode().splitlines()
+        # 3 périodes x (2 banques + 2 autres états), plus l'en-tête
+        self.assertEqual(len(minutages), 13)
+        self.assertEqual(len(noms), 13)
+
+    def test_periode_invalide(self):
+        from django.core.management.base import CommandError
+        with self.assertRaises(CommandError):
+            call_command('generate_etats_batch', '--debut', '2025-13', stdout=StringIO())
+
+    def test_erreur_isolee_quel_que_soit_le_mode(self):
+        from . import lots_etats
+
+        def generer_rapport(rapport, repertoire):
+            if rapport['banque_id']:
+                raise RuntimeError('rendu impossible')
+            chemin = os.path.join(repertoire, rapport['nom'].replace('/', '__'))
+            with open(chemin, 'wb') as fichier:
+                fichier.write(b'%PDF')
+            return dict(rapport, chemin=chemin, taille=4, duree=0.0, erreur=None)
+
+        rapports = lots_etats.rapports_du_lot([(2025, 1)], ['synthese_par_banque', 'rapport_par_banque'])
+        for mode in ('direct', 'thread'):
+            with self.subTest(mode=mode), mock.patch.object(lots_etats, 'generer_rapport', generer_rapport):
+                resultats = lots_etats.generer_lot(rapports, self.sortie, mode=mode)
+                self.assertEqual([r['erreur'] for r in resultats], [None, 'rendu impossible', 'rendu impossible'])
+                with zipfile.ZipFile(self.sortie) as archive:
+                    self.assertEqual(sorted(archive.namelist()), ['2025-01/synthese_par_banque.pdf', 'minutages.csv'])
+
+    def test_action_administration(self):
+        from clotures.models import ClotureMensuelle
+        cloture = ClotureMensuelle.objects.create(mois=1, annee=2025)
+        self.client.force_login(self.utilisateur)
+        url = '/admin/clotures/cloturemensuelle/'
+
+        response = self.client.post(url, {'action': 'generer_etats_du_lot', '_selected_action': [cloture.pk]})
+        self.assertContains(response, 'Synthèse par banque')
+
+        response = self.client.post(url, {
+            'action': 'generer_etats_du_lot', '_selected_action': [cloture.pk],
+            'types': ['synthese_par_banque'], 'generer': '1',
+        })
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(sorted(archive.namelist()), ['2025-01/synthese_par_banque.pdf', 'minutages.csv'])
+
+    @override_settings(ETATS_LOT_MODE='process', ETATS_LOT_CONCURRENCE=3)
+    def test_action_administration_pool_borne(self):
+        from clotures.models import ClotureMensuelle
+        from . import lots_etats
+
+        cloture = ClotureMensuelle.objects.create(mois=1, annee=2025)
+        self.client.force_login(self.utilisateur)
+        with mock.patch.object(lots_etats, 'generer_lot') as generer_lot:
+            self.client.post('/admin/clotures/cloturemensuelle/', {
+                'action': 'generer_etats_du_lot', '_selected_action': [cloture.pk],
+                'types': ['synthese_par_banque'], 'generer': '1',
+            })
+        # Dans la requête : des threads, jamais de processus, en nombre borné
+        self.assertEqual(generer_lot.call_args.kwargs, {'mode': 'thread', 'concurrence': 3})
+
+
+class ImportFeuillesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.rawbank = Banque.objects.create(nom_banque="Rawbank")
+        cls.equity = Banque.objects.create(nom_banque="Equity BCDC")
+        cls.nature = NatureEconomique.objects.create(code="1111", titre="Nature test")
+        cls.nature_lettres = NatureEconomique.objects.create(code="AB12", titre="Nature en lettres")
+
+    def classeur(self, feuille, lignes):
+        import openpyxl
+
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = feuille
+        ws.append(['DATADAF'])
+        ws.append([])
+        ws.append(['MOIS', 'ANNEE', 'DATE'])
+        for ligne in lignes:
+            ws.append(ligne)
+        chemin = tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False).name
+        self.addCleanup(os.unlink, chemin)
+        wb.save(chemin)
+        return chemin
+
+    def test_import_depenses_par_lots(self):
+        from clotures.models import ClotureMensuelle
+
+        cloture = ClotureMensuelle.objects.create(mois=3, annee=2025)
+        ClotureMensuelle.objects.filter(pk=cloture.pk).update(soldes_a_recalculer=False)
+        creer_depense(self.rawbank, self.nature, None, Decimal('100.00'))
+        lignes = [
+            # Déjà en base (même date, libellé, banque, montants)
+            [3, 2025, date(2025, 3, 1), 1111, 'Dépense de test', 'RAWBANK', 100, 0],
+            [3, 2025, date(2025, 3, 2), '11 11', 'Carburant', 'equity', '250,50', 0, 'obs'],
+            [3, 2025, '03/03/2025', 'ab12', 'Fournitures', 'Raw', 0, 12.5],
+            [3, 2025, date(2025, 3, 2), '11 11', 'Carburant', 'equity', '250,50', 0],  # doublon du fichier
+            [None, None, None, None, 'Sans date', 'Rawbank', 10, 0],
+            [None, None, None, None, None, None, None, None],
+        ] + [[4, 2025, date(2025, 4, i), 9999, f'Ligne {i}', 'Inconnue', i, 0] for i in range(1, 6)]
+        chemin = self.classeur('DEPENSES', lignes)
+
+        sortie = StringIO()
+        with CaptureQueriesContext(connection) as requetes:
+            call_command('import_depenses_feuille', '--file', chemin, '--batch-size', '4', stdout=sortie)
+        self.assertIn('7 ligne(s) importée(s), 2 doublon(s) ignoré(s)', sortie.getvalue())
+        self.assertIn('Ligne 8: date manquante', sortie.getvalue())
+        self.assertIn('lignes/s', sortie.getvalue())
+        # Pas de requête par ligne : références, puis empreintes, insertion et agrégats par lot
+        self.assertLess(len(requetes), 40)
+
+        carburant = DepenseFeuille.objects.get(libelle_depenses='Carburant')
+        self.assertEqual((carburant.nature_economique, carburant.banque), (self.nature, self.equity))
+        self.assertEqual(carburant.montant_fc, Decimal('250.50'))
+        fournitures = DepenseFeuille.objects.get(libelle_depenses='Fournitures')
+        self.assertEqual((fournitures.nature_economique, fournitures.banque), (self.nature_lettres, self.rawbank))
+        self.assertIsNone(DepenseFeuille.objects.get(libelle_depenses='Ligne 1').banque)
+
+        # Agrégats tenus à jour malgré bulk_create (pas de signaux) et clôture à recalculer
+        totaux = AgregatFeuilleMensuel.objects.filter(type_operation='DEPENSE').aggregate(
+            total_fc=Sum('total_fc'), nombre=Sum('nombre')
+        )
+        self.assertEqual(totaux, {'total_fc': Decimal('365.50'), 'nombre': 8})
+        cloture.refresh_from_db()
+        self.assertTrue(cloture.soldes_a_recalculer)
+
+        # Un second passage ne relit pas le fichier ; relu depuis le début, il n'importe rien
+        # (--skip-duplicates, toujours actif, reste accepté)
+        sortie = StringIO()
+        call_command('import_depenses_feuille', '--file', chemin, stdout=sortie)
+        self.assertIn('Fichier déjà importé', sortie.getvalue())
+        sortie = StringIO()
+        call_command('import_depenses_feuille', '--file', chemin, '--restart', '--skip-duplicates', stdout=sortie)
+        self.assertIn('0 ligne(s) importée(s), 9 doublon(s) ignoré(s)', sortie.getvalue())
+
+    def test_ligne_enregistree_entre_recherche_et_insertion(self):
+        from unittest import mock
+        from .import_feuilles import ImportDepensesFeuille
+
+        moteur = ImportDepensesFeuille(taille_lot=10)
+        moteur.charger_references()
+        champs = [moteur.lire_ligne(ligne + [None])[0] for ligne in (
+            [3, 2025, date(2025, 3, 1), 1111, 'Dépense de test', 'Rawbank', 100, 0],
+            [3, 2025, date(2025, 3, 2), 1111, 'Carburant', 'Rawbank', 50, 0],
+        )]
+        # Un autre import enregistre la première ligne après la recherche des empreintes
+        with mock.patch.object(ImportDepensesFeuille, 'charger_empreintes'):
+            creer_depense(self.rawbank, self.nature, None, Decimal('100.00'))
+            moteur.enregistrer_lot(list(enumerate(champs, start=4)), 5, termine=True)
+
+        self.assertEqual((moteur.resultat.importees, moteur.resultat.doublons, moteur.resultat.erreurs), (1, 1, []))
+        self.assertEqual(DepenseFeuille.objects.count(), 2)
+        totaux = AgregatFeuilleMensuel.objects.filter(type_operation='DEPENSE').aggregate(
+            total_fc=Sum('total_fc'), nombre=Sum('nombre')
+        )
+        self.assertEqual(totaux, {'total_fc': Decimal('150.00'), 'nombre': 2})
+
+    def test_import_recettes_dry_run(self):
+        chemin = self.classeur('RECETTES', [
+            [5, 2025, date(2025, 5, 2), 'Recette A', 'Rawbank', 1000, 0],
+            [5, 2025, date(2025, 5, 3), 'Recette B', 'Equity BCDC', 0, 20],
+        ])
+        sortie = StringIO()
+        call_command('import_recettes_feuille', '--file', chemin, '--dry-run', stdout=sortie)
+        self.assertIn('2 ligne(s) importée(s)', sortie.getvalue())
+        self.assertIn('Recette B', sortie.getvalue())
+        self.assertFalse(RecetteFeuille.objects.exists())
+
+        call_command('import_recettes_feuille', '--file', chemin, '--skip-duplicates', stdout=StringIO())
+        self.assertEqual(RecetteFeuille.objects.get(libelle_recette='Recette B').banque, self.equity)
+        self.assertEqual(AgregatFeuilleMensuel.objects.get(type_operation='RECETTE', banque=self.rawbank).total_fc,
+                         Decimal('1000.00'))
+
+    def test_reprise_apres_interruption(self):
+        from unittest import mock
+        from .import_feuilles import ImportFeuille
+        from .models import RepriseImport
+
+        chemin = self.classeur('DEPENSES', [
+            [6, 2025, date(2025, 6, i), '1111', f'Ligne {i}', 'Rawbank', 10, 0] for i in range(1, 11)
+        ])
+        appliquer = ImportFeuille.mettre_a_jour_agregats
+        appels = []
+
+        def interrompre_au_troisieme_lot(objets):
+            appels.append(len(objets))
+            if len(appels) == 3:
+                raise KeyboardInterrupt
+            appliquer(objets)
+
+        with mock.patch.object(ImportFeuille, 'mettre_a_jour_agregats', side_effect=interrompre_au_troisieme_lot):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('import_depenses_feuille', '--file', chemin, '--batch-size', '3', stdout=StringIO())
+        # Deux lots de 3 lignes validés (lignes 4 à 9 de la feuille), le troisième annulé
+        self.assertEqual(DepenseFeuille.objects.count(), 6)
+        reprise = RepriseImport.objects.get(feuille='DEPENSES')
+        self.assertEqual((reprise.statut, reprise.derniere_ligne, reprise.lignes_importees), ('EN_COURS', 9, 6))
+
+        sortie = StringIO()
+        call_command('import_depenses_feuille', '--file', chemin, '--batch-size', '3', stdout=sortie)
+        self.assertIn('Reprise à la ligne 10', sortie.getvalue())
+        self.assertIn('4 ligne(s) importée(s), 0 doublon(s)', sortie.getvalue())
+        self.assertEqual(DepenseFeuille.objects.count(), 10)
+        self.assertEqual(AgregatFeuilleMensuel.objects.get(type_operation='DEPENSE').nombre, 10)
+        reprise.refresh_from_db()
+        self.assertEqual((reprise.statut, reprise.derniere_ligne, reprise.lignes_importees), ('TERMINE', 13, 10))
+
+    def test_plusieurs_feuilles_en_parallele(self):
+        import openpyxl
+
+        wb = openpyxl.Workbook()
+        for feuille, ligne in [('DEPENSES', [7, 2025, date(2025, 7, 1), '1111', 'Dépense', 'Rawbank', 5, 0]),
+                               ('RECETTES', [7, 2025, date(2025, 7, 1), 'Recette', 'Rawbank', 8, 0])]:
+            ws = wb.create_sheet(feuille)
+            for _ in range(3):
+                ws.append([])
+            ws.append(ligne)
+        chemin = tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False).name
+        self.addCleanup(os.unlink, chemin)
+        wb.save(chemin)
+
+        sortie = StringIO()
+        call_command('import_datadaf', '--files', chemin, chemin, '--mode', 'direct', stdout=sortie)
+        self.assertIn('[DEPENSES]: 1 ligne(s) importée(s)', sortie.getvalue())
+        self.assertIn('[RECETTES]: 1 ligne(s) importée(s)', sortie.getvalue())
+        self.assertIn('✓ 2 ligne(s) importée(s)', sortie.getvalue())
+        self.assertEqual((DepenseFeuille.objects.count(), RecetteFeuille.objects.count()), (1, 1))
+
+    @override_settings(MEDIA_ROOT=tempfile.gettempdir())
+    def test_import_televerse_apercu_puis_confirmation(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.urls import reverse
+        from .models import ImportFeuilleWeb
+
+        utilisateur = User.objects.create_user('opsdaf', password='x', role='OpsDaf')
+        self.client.force_login(utilisateur)
+        creer_depense(self.rawbank, self.nature, None, Decimal('100.00'))
+        chemin = self.classeur('DEPENSES', [
+            [3, 2025, date(2025, 3, 1), 1111, 'Dépense de test', 'RAWBANK', 100, 0],  # déjà en base
+            [3, 2025, date(2025, 3, 2), '1111', 'Carburant', 'Equity', 250, 0],
+            [3, 2025, date(2025, 3, 3), 'ZZ99', 'Fournitures', 'Banque X', 0, 12.5],
+            [None, None, None, None, 'Sans date', 'Rawbank', 10, 0],
+        ])
+        with open(chemin, 'rb') as fichier:
+            reponse = self.client.post(reverse('tableau_bord_feuilles:import_feuille'), {
+                'feuille': 'DEPENSES',
+                'fichier': SimpleUploadedFile('DATADAF.xlsx', fichier.read()),
+            })
+        import_feuille = ImportFeuilleWeb.objects.get()
+        self.addCleanup(import_feuille.fichier.delete, save=False)
+        self.assertRedirects(reponse, reverse('tableau_bord_feuilles:import_detail', args=[import_feuille.pk]))
+        # Rien n'est lu dans la requête : l'analyse attend le travailleur
+        self.assertEqual((import_feuille.statut, import_feuille.lignes.count()), ('ANALYSE_EN_ATTENTE', 0))
+
+        call_command('run_report_worker', '--une-fois', '--mode', 'direct', stdout=StringIO())
+        import_feuille.refresh_from_db()
+        self.assertEqual(import_feuille.statut, 'A_CONFIRMER')
+        self.assertEqual((import_feuille.lignes_nouvelles, import_feuille.doublons, import_feuille.erreurs), (2, 1, 1))
+        self.assertEqual(import_feuille.non_resolus, {'article': {'ZZ99': 1}, 'banque': {'Banque X': 1}})
+        self.assertEqual(DepenseFeuille.objects.count(), 1)
+
+        detail = reverse('tableau_bord_feuilles:import_detail', args=[import_feuille.pk])
+        reponse = self.client.get(detail, {'filtre': 'NOUVELLE'})
+        self.assertEqual([ligne.numero for ligne in reponse.context['page_obj']], [5, 6])
+        self.assertContains(reponse, 'Banque X')
+        reponse = self.client.get(detail, {'filtre': 'ERREUR'})
+        self.assertContains(reponse, 'date manquante')
+
+        self.client.post(reverse('tableau_bord_feuilles:import_confirmer', args=[import_feuille.pk]))
+        call_command('run_report_worker', '--une-fois', '--mode', 'direct', stdout=StringIO())
+        import_feuille.refresh_from_db()
+        self.assertEqual((import_feuille.statut, import_feuille.lignes_importees), ('TERMINE', 2))
+        carburant = DepenseFeuille.objects.get(libelle_depenses='Carburant')
+        self.assertEqual((carburant.banque, carburant.nature_economique, carburant.montant_fc),
+                         (self.equity, self.nature, Decimal('250.00')))
+        self.assertIsNone(DepenseFeuille.objects.get(libelle_depenses='Fournitures').banque)
+        self.assertEqual(AgregatFeuilleMensuel.objects.filter(type_operation='DEPENSE').aggregate(n=Sum('nombre'))['n'], 3)
+
+
+class BenchmarksTests(TestCase):
+
+    def setUp(self):
+        self.sortie = tempfile.NamedTemporaryFile(suffix='.json', delete=False).name
+        self.addCleanup(os.unlink, self.sortie)
+
+    def test_jeu_de_donnees_et_mesures(self):
+        import json
+        from django.core.management.base import CommandError
+        call_command(
+            'seed_benchmark_data', '--depenses', '300', '--recettes', '200', '--demandes', '60',
+            '--banques', '3', '--natures', '12', '--services', '4', '--annees', '1', stdout=StringIO(),
+        )
+        # Plus les feuilles créées par le paiement des relevés
+        volume = DepenseFeuille.objects.count()
+        self.assertGreater(volume, 300)
+        with self.assertRaises(CommandError):
+            call_command('seed_benchmark_data', stdout=StringIO())
+
+        sortie = StringIO()
+        call_command('run_benchmarks', '--iterations', '2', '--filtre', 'liste', '--sortie', self.sortie, stdout=sortie)
+        self.assertIn('✓ 2 scénario(s) mesuré(s)', sortie.getvalue())
+        with open(self.sortie, encoding='utf-8') as fichier:
+            rapport = json.load(fichier)
+        self.assertEqual(rapport['volumes']['depenses_feuille'], volume)
+        mesure = rapport['scenarios']['Liste DEPENSES']
+        self.assertEqual(mesure['statut'], 200)
+        self.assertLessEqual(mesure['p50_ms'], mesure['p95_ms'])
+        self.assertGreater(mesure['requetes'], 0)
+
+        # Comparaison avec une référence où la liste faisait moins de requêtes
+        rapport['scenarios']['Liste DEPENSES']['requetes'] -= 1
+        with open(self.sortie, 'w', encoding='utf-8') as fichier:
+            json.dump(rapport, fichier)
+        with self.assertRaises(CommandError):
+            call_command('run_benchmarks', '--iterations', '1', '--filtre', 'liste DEPENSES',
+                         '--sortie', os.devnull, '--comparer', self.sortie, stdout=StringIO())
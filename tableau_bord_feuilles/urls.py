@@ -3,6 +3,7 @@ from . import views
 from . import views_rapports
 from . import views_tableau_general
 from . import views_etats_feuilles
+from . import views_imports
  
 app_name = 'tableau_bord_feuilles'
 
@@ -35,5 +36,11 @@ urlpatterns = [
     path('rapports/synthese/pdf/', views_etats_feuilles.RapportSynthesePDFView.as_view(), name='rapport_synthese_pdf'),
     path('rapports/groupe/pdf/', views_etats_feuilles.RapportGroupePDFView.as_view(), name='rapport_groupe_pdf'),
     
+    # Import des feuilles depuis l'application (analyse et import par le travailleur)
+    path('imports/', views_imports.ImportFeuilleWebView.as_view(), name='import_feuille'),
+    path('imports/<int:pk>/', views_imports.ImportFeuilleWebDetailView.as_view(), name='import_detail'),
+    path('imports/<int:pk>/confirmer/', views_imports.ImportFeuilleWebConfirmerView.as_view(), name='import_confirmer'),
+    path('imports/<int:pk>/annuler/', views_imports.ImportFeuilleWebAnnulerView.as_view(), name='import_annuler'),
+    
     
 ]
\ No newline at end of file
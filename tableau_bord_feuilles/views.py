@@ -1,15 +1,16 @@
 from django.shortcuts import render
 from django.http import JsonResponse, HttpResponse
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum, Count, Avg, Q, F, DecimalField
+from django.db.models import Count, Avg, Q, F, DecimalField
 from django.db.models.functions import ExtractYear, ExtractMonth, TruncMonth
 from django.utils.timezone import now
 from django.core.paginator import Paginator
-from decimal import Decimal
 from django.contrib.humanize.templatetags.humanize import intcomma
 from demandes.models import DepenseFeuille
 from recettes.models import RecetteFeuille
 from banques.models import Banque
+from .agregation import AgregationFeuilles
+from .recherche import rechercher_feuilles
 import json
 
 
@@ -40,9 +41,8 @@ def tableau_bord_feuilles(request):
     # Récupérer la période actuelle (clôture)
     try:
         periode_actuelle = ClotureMensuelle.get_periode_actuelle()
-        # Calculer les soldes de la période
-        periode_actuelle.calculer_soldes()
-        periode_actuelle.refresh_from_db()
+        # Soldes de la période (lecture seule : aucune écriture sur la clôture)
+        periode_actuelle.calculer_soldes_lecture_seule()
     except:
         # En cas d'erreur, créer une période par défaut
         periode_actuelle = ClotureMensuelle.objects.create(
@@ -53,16 +53,6 @@ def tableau_bord_feuilles(request):
             solde_ouverture_usd=0
         )
     
-    # Récupérer les données des dépenses et recettes de la période actuelle
-    depenses = DepenseFeuille.objects.filter(
-        mois=periode_actuelle.mois,
-        annee=periode_actuelle.annee
-    )
-    recettes = RecetteFeuille.objects.filter(
-        mois=periode_actuelle.mois,
-        annee=periode_actuelle.annee
-    )
-    
     # Filtres par année et mois
     annee_filter = request.GET.get('annee')
     mois_filter = request.GET.get('mois')
@@ -74,91 +64,48 @@ def tableau_bord_feuilles(request):
     if mois_filter is None:
         mois_filter = periode_actuelle.mois
     
-    # Appliquer les filtres
+    # Filtre commun aux feuilles et aux agrégats mensuels (mêmes colonnes annee / mois / banque)
+    filtre = Q(mois=periode_actuelle.mois, annee=periode_actuelle.annee)
+    
     if annee_filter:
         annee_filter = int(annee_filter)
-        depenses = depenses.filter(annee=annee_filter)
-        recettes = recettes.filter(annee=annee_filter)
+        filtre &= Q(annee=annee_filter)
     
     if mois_filter:
         mois_filter = int(mois_filter)
-        depenses = depenses.filter(mois=mois_filter)
-        recettes = recettes.filter(mois=mois_filter)
+        filtre &= Q(mois=mois_filter)
         
     if banque_filter:
-        depenses = depenses.filter(banque_id=banque_filter)
-        recettes = recettes.filter(banque_id=banque_filter)
+        filtre &= Q(banque_id=banque_filter)
+    
+    # Tous les totaux de la page en quelques requêtes groupées
+    agregation = AgregationFeuilles(filtre)
+    totaux = agregation.totaux()
     
     # Statistiques générales
-    total_depenses_cdf = depenses.aggregate(total=Sum('montant_fc'))['total'] or Decimal('0.00')
-    total_depenses_usd = depenses.aggregate(total=Sum('montant_usd'))['total'] or Decimal('0.00')
-    total_recettes_cdf = recettes.aggregate(total=Sum('montant_fc'))['total'] or Decimal('0.00')
-    total_recettes_usd = recettes.aggregate(total=Sum('montant_usd'))['total'] or Decimal('0.00')
+    total_depenses_cdf = totaux['depenses_cdf']
+    total_depenses_usd = totaux['depenses_usd']
+    total_recettes_cdf = totaux['recettes_cdf']
+    total_recettes_usd = totaux['recettes_usd']
     
     # Soldes
-    solde_cdf = total_recettes_cdf - total_depenses_cdf
-    solde_usd = total_recettes_usd - total_depenses_usd
+    solde_cdf = totaux['solde_cdf']
+    solde_usd = totaux['solde_usd']
     
     # Nombre d'opérations
-    nb_depenses = depenses.count()
-    nb_recettes = recettes.count()
+    nb_depenses = totaux['nb_depenses']
+    nb_recettes = totaux['nb_recettes']
     
     # Statistiques par banque
-    stats_par_banque = []
-    banques = Banque.objects.filter(
-        Q(depense_feuilles__isnull=False) | Q(recette_feuilles__isnull=False)
-    ).distinct()
-    
-    for banque in banques:
-        depenses_banque = depenses.filter(banque=banque)
-        recettes_banque = recettes.filter(banque=banque)
-        
-        total_dep_cdf = depenses_banque.aggregate(total=Sum('montant_fc'))['total'] or Decimal('0.00')
-        total_dep_usd = depenses_banque.aggregate(total=Sum('montant_usd'))['total'] or Decimal('0.00')
-        total_rec_cdf = recettes_banque.aggregate(total=Sum('montant_fc'))['total'] or Decimal('0.00')
-        total_rec_usd = recettes_banque.aggregate(total=Sum('montant_usd'))['total'] or Decimal('0.00')
-        
-        stats_par_banque.append({
-            'banque': banque,
-            'total_depenses_cdf': total_dep_cdf,
-            'total_depenses_usd': total_dep_usd,
-            'total_recettes_cdf': total_rec_cdf,
-            'total_recettes_usd': total_rec_usd,
-            'solde_cdf': total_rec_cdf - total_dep_cdf,
-            'solde_usd': total_rec_usd - total_dep_usd,
-            'nb_operations': depenses_banque.count() + recettes_banque.count()
-        })
+    banques = Banque.objects.filter(agregats_feuilles__nombre__gt=0).distinct()
+    stats_par_banque = agregation.stats_banques(banques)
     
     # Évolution mensuelle : données par mois pour l'année sélectionnée (tous les mois, pas filtré par mois)
-    depenses_evol = DepenseFeuille.objects.filter(annee=annee_filter)
-    recettes_evol = RecetteFeuille.objects.filter(annee=annee_filter)
-    if banque_filter:
-        depenses_evol = depenses_evol.filter(banque_id=banque_filter)
-        recettes_evol = recettes_evol.filter(banque_id=banque_filter)
-    evolution_mensuelle = []
-    for mois in range(1, 13):
-        dep_mois = depenses_evol.filter(mois=mois)
-        rec_mois = recettes_evol.filter(mois=mois)
-        
-        total_dep_cdf = dep_mois.aggregate(total=Sum('montant_fc'))['total'] or Decimal('0.00')
-        total_dep_usd = dep_mois.aggregate(total=Sum('montant_usd'))['total'] or Decimal('0.00')
-        total_rec_cdf = rec_mois.aggregate(total=Sum('montant_fc'))['total'] or Decimal('0.00')
-        total_rec_usd = rec_mois.aggregate(total=Sum('montant_usd'))['total'] or Decimal('0.00')
-        
-        evolution_mensuelle.append({
-            'mois': mois,
-            'mois_nom': ['Jan', 'Fév', 'Mar', 'Avr', 'Mai', 'Jun', 'Jul', 'Aoû', 'Sep', 'Oct', 'Nov', 'Déc'][mois-1],
-            'depenses_cdf': float(total_dep_cdf),
-            'depenses_usd': float(total_dep_usd),
-            'recettes_cdf': float(total_rec_cdf),
-            'recettes_usd': float(total_rec_usd),
-            'solde_cdf': float(total_rec_cdf - total_dep_cdf),
-            'solde_usd': float(total_rec_usd - total_dep_usd)
-        })
+    evolution_mensuelle = AgregationFeuilles.evolution_mensuelle(annee_filter, banque_filter)
     
     # Top 10 des plus grosses dépenses et recettes
-    top_depenses = depenses.order_by('-montant_fc', '-montant_usd')[:10]
-    top_recettes = recettes.order_by('-montant_fc', '-montant_usd')[:10]
+    top_depenses = agregation.top_depenses(10)
+    top_recettes = agregation.top_recettes(10)
     
     # Données pour les graphiques
     graph_data = {
@@ -177,9 +124,7 @@ def tableau_bord_feuilles(request):
     }
     
     # Récupérer les années disponibles (inclure l'année en cours pour les valeurs par défaut)
-    annees_depenses = list(DepenseFeuille.objects.values_list('annee', flat=True).distinct())
-    annees_recettes = list(RecetteFeuille.objects.values_list('annee', flat=True).distinct())
-    annees_disponibles = sorted(set(annees_depenses + annees_recettes + [current_year]), reverse=True)
+    annees_disponibles = sorted(set(AgregationFeuilles.annees_disponibles() + [current_year]), reverse=True)
     
     context = {
         'total_depenses_cdf': total_depenses_cdf,
@@ -259,14 +204,13 @@ def detail_operations(request):
         recettes = recettes.filter(banque_id=banque_filter)
     
     if search:
-        depenses = depenses.filter(
-            Q(libelle_depenses__icontains=search) |
-            Q(nature_economique__titre__icontains=search) |
-            Q(banque__nom_banque__icontains=search)
+        depenses = rechercher_feuilles(
+            depenses, search, classer=False,
+            ou=Q(nature_economique__titre__icontains=search) | Q(banque__nom_banque__icontains=search)
         )
-        recettes = recettes.filter(
-            Q(libelle_recette__icontains=search) |
-            Q(banque__nom_banque__icontains=search)
+        recettes = rechercher_feuilles(
+            recettes, search, classer=False,
+            ou=Q(banque__nom_banque__icontains=search)
         )
     
     # Combiner les opérations
@@ -1,5 +1,4 @@
 from django.shortcuts import render
-from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import View
 from django.http import JsonResponse, HttpResponse
@@ -16,30 +15,13 @@ from datetime import datetime
 try:
     from reportlab.lib.pagesizes import landscape, A4
     from reportlab.lib.units import cm
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, KeepTogether
-    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Table, TableStyle, Paragraph, Spacer, KeepTogether
     from reportlab.lib import colors
     from io import BytesIO
     from urllib.parse import unquote
+    # Styles, logo et pied de page construits une fois par processus
+    from rapports.mise_en_page_pdf import DocumentRapport, entete_logo, styles_pdf
     REPORTLAB_AVAILABLE = True
-
-    def _draw_footer(canvas, doc, page_count=None):
-        """Pied de page : Page x de xx à gauche, date du jour à droite"""
-        from datetime import date
-        date_str = date.today().strftime('%d/%m/%Y')
-        page_num = canvas.getPageNumber()
-        total = page_count if page_count else page_num
-        canvas.saveState()
-        canvas.setFont("Helvetica", 8)
-        canvas.drawString(50, 25, f"Page {page_num} de {total}")
-        canvas.drawRightString(792, 25, date_str)
-        canvas.restoreState()
-
-    def _footer_on_first(canvas, doc):
-        _draw_footer(canvas, doc)
-
-    def _footer_on_later(canvas, doc):
-        _draw_footer(canvas, doc)
 except ImportError as e:
     REPORTLAB_AVAILABLE = False
     print(f"WARNING: ReportLab n'est pas disponible: {e}. Les rapports PDF ne fonctionneront pas.")
@@ -48,6 +30,31 @@ from demandes.models import DepenseFeuille, NatureEconomique
 from recettes.models import RecetteFeuille
 from banques.models import Banque
 from accounts.models import Service
+from rapports.cache_artefacts import CacheRapports, version_donnees
+from .pdf_flux import fichier_temporaire_pdf, reponse_fichier_pdf
+
+
+# Champs POST filtrant chaque état PDF « feuilles » : (année, mois, autres filtres)
+CHAMPS_FILTRES_ETATS = {
+    'depense_par_nature': ('annee_nature', 'mois_nature', 'nature_economique'),
+    'depense_par_mois': ('annee_mois', 'mois_depense'),
+    'rapport_par_banque': ('annee_banque', 'mois_banque', 'banque_rapport'),
+    'synthese_par_banque': ('annee_synthese_banque', 'mois_synthese_banque'),
+    'synthese_par_depenses': ('annee_synthese_depenses', 'mois_synthese_depenses'),
+    'recette_du_mois': ('annee_recette', 'mois_recette'),
+    'recette_par_banque': ('annee_recette_banque', 'mois_recette_banque', 'banque_recette'),
+    'synthese_recettes': ('annee_synthese_recettes', 'mois_synthese_recettes'),
+}
+
+
+def feuilles_de_la_periode(modele, annee, mois):
+    """Lignes de feuille d'une période (annee / mois vides ou invalides : pas de filtre)"""
+    queryset = modele.objects.all()
+    if annee and str(annee).isdigit():
+        queryset = queryset.filter(annee=int(annee))
+    if mois and str(mois).isdigit():
+        queryset = queryset.filter(mois=int(mois))
+    return queryset
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -437,10 +444,8 @@ class EtatsFeuillesGenererView(View):
             print(f"Génération rapport: {type_etat}, format: {format_sortie}, type: {type_rapport}")
             
             # Gérer les nouveaux types d'état
-            if type_etat in ['depense_par_nature', 'depense_par_mois', 'rapport_par_banque', 'synthese_par_banque', 'synthese_par_depenses']:
-                return self._generer_pdf_nouveaux_etats(request, type_etat)
-            elif type_etat in ['recette_du_mois', 'recette_par_banque', 'synthese_recettes']:
-                return self._generer_pdf_nouveaux_etats(request, type_etat)
+            if type_etat in CHAMPS_FILTRES_ETATS:
+                return self._generer_pdf_en_cache(request, type_etat)
             
             if type_rapport == 'SYNTHESE':
                 # Rapport synthétique - juste les totaux
@@ -464,14 +469,31 @@ class EtatsFeuillesGenererView(View):
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
     
+    def _generer_pdf_en_cache(self, request, type_etat):
+        """
+        Sert le PDF depuis le cache des rapports si les mêmes filtres ont déjà
+        été demandés aujourd'hui sur des feuilles inchangées, sinon le génère.
+        """
+        champs = CHAMPS_FILTRES_ETATS[type_etat]
+        annee, mois = request.POST.get(champs[0]), request.POST.get(champs[1])
+        modele = RecetteFeuille if 'recette' in type_etat else DepenseFeuille
+        filtres = {champ: request.POST.get(champ) for champ in champs}
+        filtres['jour'] = timezone.localdate()
+
+        cache = CacheRapports()
+        cle = cache.cle(f'feuilles:{type_etat}', filtres, version_donnees(feuilles_de_la_periode(modele, annee, mois)))
+        filename = f"etat_{type_etat}_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
+        response = cache.reponse(cle, 'pdf', filename, 'application/pdf')
+        if response is not None:
+            return response
+        return cache.conserver_reponse(cle, 'pdf', self._generer_pdf_nouveaux_etats(request, type_etat), 'application/pdf')
+    
     def _generer_pdf_nouveaux_etats(self, request, type_etat):
         """Générer un PDF pour les nouveaux types d'état"""
         try:
             if not REPORTLAB_AVAILABLE:
                 return JsonResponse({'success': False, 'error': 'ReportLab non disponible. pip install reportlab'})
-            from reportlab.lib.styles import ParagraphStyle
-            styles_temp = getSampleStyleSheet()
-            style_cell_libelle = ParagraphStyle('CellLibelleFlat', parent=styles_temp['Normal'], fontSize=8, leading=9)
+            style_cell_libelle = styles_pdf()['CellLibelle']
             # Construire le queryset (même logique que preview)
             if type_etat in ['depense_par_nature', 'depense_par_mois', 'rapport_par_banque', 'synthese_par_banque', 'synthese_par_depenses']:
                 queryset = DepenseFeuille.objects.all()
@@ -533,7 +555,7 @@ class EtatsFeuillesGenererView(View):
                         f"{float(dep.montant_fc):,.2f}".replace(',', ' '),
                         f"{float(dep.montant_usd):,.2f}".replace(',', ' '),
                     ]
-                rows = [row_from_dep(d) for d in queryset[:25]]
+                rows = [row_from_dep(d) for d in queryset.select_related('nature_economique', 'banque')[:25]]
                 
             elif type_etat in ['recette_du_mois', 'recette_par_banque', 'synthese_recettes']:
                 queryset = RecetteFeuille.objects.all()
@@ -575,7 +597,7 @@ class EtatsFeuillesGenererView(View):
                         f"{float(rec.montant_fc or 0):,.2f}".replace(',', ' '),
                         f"{float(rec.montant_usd or 0):,.2f}".replace(',', ' '),
                     ]
-                rows = [row_from_rec(r) for r in queryset[:25]]
+                rows = [row_from_rec(r) for r in queryset.select_related('banque')[:25]]
                 
             else:
                 return JsonResponse({'success': False, 'error': 'Type d\'état non valide'})
@@ -585,38 +607,14 @@ class EtatsFeuillesGenererView(View):
             total_usd = queryset.aggregate(s=Sum('montant_usd'))['s'] or Decimal('0')
             
             # Générer le PDF
-            buffer = BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=landscape(A4),
+            fichier = fichier_temporaire_pdf()
+            doc = DocumentRapport(fichier, pagesize=landscape(A4),
                 rightMargin=0.5*cm, leftMargin=0.3*cm,
                 topMargin=0.5*cm, bottomMargin=0.8*cm)
-            styles = getSampleStyleSheet()
+            styles = styles_pdf()
             elements = []
-            # Logo du projet en en-tête (à gauche)
-            logo_path = settings.BASE_DIR / 'static' / 'img' / 'WhatsApp Image 2026-03-07 at 17.24.40.jpeg'
-            if logo_path.exists():
-                logo = Image(str(logo_path), width=3*cm, height=3*cm)
-                # Rendre le logo circulaire
-                logo.drawHeight = 3*cm
-                logo.drawWidth = 3*cm
-                
-                # Créer un tableau 2x2 pour positionnement absolu
-                # [ [logo, vide], [vide, titre] ]
-                logo_table = Table([
-                    [logo, ''],
-                    ['', '']
-                ], colWidths=[3*cm, 20*cm], rowHeights=[3*cm, 0.5*cm])
-                logo_table.setStyle(TableStyle([
-                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                    ('LEFTPADDING', (0, 0), (-1, -1), 0),
-                    ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-                    ('TOPPADDING', (0, 0), (-1, -1), 0),
-                    ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-                    # Masquer les bordures
-                    ('GRID', (0, 0), (-1, -1), 0, colors.white),
-                ]))
-                elements.append(logo_table)
-                elements.append(Spacer(1, 0.3*cm))
+            # Logo (à gauche)
+            elements.extend(entete_logo())
             elements.append(Paragraph(titre, styles['Title']))
             # Ligne « Émis le / Période » au format reçu, pour tous les états simples
             mois_noms = ['', 'Janvier', 'Février', 'Mars', 'Avril', 'Mai', 'Juin',
@@ -689,14 +687,9 @@ class EtatsFeuillesGenererView(View):
                 elements.append(total_table)
             else:
                 elements.append(Paragraph("Aucune donnée pour les critères sélectionnés.", styles['Normal']))
-            doc.build(elements, onFirstPage=_footer_on_first, onLaterPages=_footer_on_later)
-            pdf_value = buffer.getvalue()
-            buffer.close()
-            
-            response = HttpResponse(pdf_value, content_type='application/pdf')
+            doc.build(elements)
             filename = f"etat_{type_etat}_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
+            return reponse_fichier_pdf(fichier, filename)
             
         except Exception as e:
             print(f"Erreur génération PDF: {str(e)}")
@@ -707,40 +700,16 @@ class EtatsFeuillesGenererView(View):
     def _generer_pdf_depense_par_nature(self, request, queryset, mois, annee):
         """Générer PDF dépense par nature : nature au niveau du regroupement, pas dans les lignes détail"""
         try:
-            from reportlab.lib.styles import ParagraphStyle
-            buffer = BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=landscape(A4),
+            fichier = fichier_temporaire_pdf()
+            doc = DocumentRapport(fichier, pagesize=landscape(A4),
                 rightMargin=1.5*cm, leftMargin=0.3*cm,
                 topMargin=0.5*cm, bottomMargin=1.5*cm)
-            styles = getSampleStyleSheet()
-            style_cell = ParagraphStyle('CellLibelle', parent=styles['Normal'], fontSize=8, leading=9)
-            style_regroupement = ParagraphStyle('Regroupement', parent=styles['Heading2'], fontSize=9, leading=10)
+            styles = styles_pdf()
+            style_cell = styles['CellLibelle']
+            style_regroupement = styles['Regroupement']
             elements = []
             # Logo (à gauche)
-            logo_path = settings.BASE_DIR / 'static' / 'img' / 'WhatsApp Image 2026-03-07 at 17.24.40.jpeg'
-            if logo_path.exists():
-                logo = Image(str(logo_path), width=3*cm, height=3*cm)
-                # Rendre le logo circulaire
-                logo.drawHeight = 3*cm
-                logo.drawWidth = 3*cm
-                
-                # Créer un tableau 2x2 pour positionnement absolu
-                logo_table = Table([
-                    [logo, ''],
-                    ['', '']
-                ], colWidths=[3*cm, 20*cm], rowHeights=[3*cm, 0.5*cm])
-                logo_table.setStyle(TableStyle([
-                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                    ('LEFTPADDING', (0, 0), (-1, -1), 0),
-                    ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-                    ('TOPPADDING', (0, 0), (-1, -1), 0),
-                    ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-                    # Masquer les bordures
-                    ('GRID', (0, 0), (-1, -1), 0, colors.white),
-                ]))
-                elements.append(logo_table)
-                elements.append(Spacer(1, 0.3*cm))
+            elements.extend(entete_logo())
             mois_noms = ['', 'Janvier', 'Février', 'Mars', 'Avril', 'Mai', 'Juin',
                          'Juillet', 'Août', 'Septembre', 'Octobre', 'Novembre', 'Décembre']
             titre = 'ÉTAT DES DÉPENSES PAR ARTICLE LITTERA'
@@ -871,13 +840,9 @@ class EtatsFeuillesGenererView(View):
                     ('ALIGN', (3, 0), (-1, -1), 'RIGHT'),
                 ]))
                 elements.append(grand_table)
-            doc.build(elements, onFirstPage=_footer_on_first, onLaterPages=_footer_on_later)
-            pdf_value = buffer.getvalue()
-            buffer.close()
-            response = HttpResponse(pdf_value, content_type='application/pdf')
+            doc.build(elements)
             filename = f"etat_depense_par_nature_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
+            return reponse_fichier_pdf(fichier, filename)
         except Exception as e:
             print(f"Erreur _generer_pdf_depense_par_nature: {str(e)}")
             import traceback
@@ -887,38 +852,15 @@ class EtatsFeuillesGenererView(View):
     def _generer_pdf_rapport_par_banque(self, request, queryset, mois, annee):
         """Générer PDF rapport par banque : même structure que dépense par nature, regroupement par banque"""
         try:
-            from reportlab.lib.styles import ParagraphStyle
-            buffer = BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=landscape(A4),
+            fichier = fichier_temporaire_pdf()
+            doc = DocumentRapport(fichier, pagesize=landscape(A4),
                 rightMargin=1.5*cm, leftMargin=0.3*cm,
                 topMargin=0.5*cm, bottomMargin=1.5*cm)
-            styles = getSampleStyleSheet()
-            style_cell = ParagraphStyle('CellLibelle', parent=styles['Normal'], fontSize=8, leading=9)
-            style_regroupement = ParagraphStyle('Regroupement', parent=styles['Heading2'], fontSize=9, leading=10)
+            styles = styles_pdf()
+            style_cell = styles['CellLibelle']
+            style_regroupement = styles['Regroupement']
             elements = []
-            logo_path = settings.BASE_DIR / 'static' / 'img' / 'WhatsApp Image 2026-03-07 at 17.24.40.jpeg'
-            if logo_path.exists():
-                logo = Image(str(logo_path), width=3*cm, height=3*cm)
-                # Rendre le logo circulaire
-                logo.drawHeight = 3*cm
-                logo.drawWidth = 3*cm
-                # Créer un tableau 2x2 pour positionnement absolu
-                logo_table = Table([
-                    [logo, ''],
-                    ['', '']
-                ], colWidths=[3*cm, 20*cm], rowHeights=[3*cm, 0.5*cm])
-                logo_table.setStyle(TableStyle([
-                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                    ('LEFTPADDING', (0, 0), (-1, -1), 0),
-                    ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-                    ('TOPPADDING', (0, 0), (-1, -1), 0),
-                    ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-                    # Masquer les bordures
-                    ('GRID', (0, 0), (-1, -1), 0, colors.white),
-                ]))
-                elements.append(logo_table)
-                elements.append(Spacer(1, 0.3*cm))
+            elements.extend(entete_logo())
             # Titre sans période (comme dépense par nature)
             titre = 'RAPPORT DES DÉPENSES PAR BANQUE'
             elements.append(Paragraph(titre, styles['Title']))
@@ -1048,13 +990,9 @@ class EtatsFeuillesGenererView(View):
                     ('ALIGN', (3, 0), (-1, -1), 'RIGHT'),
                 ]))
                 elements.append(grand_table)
-            doc.build(elements, onFirstPage=_footer_on_first, onLaterPages=_footer_on_later)
-            pdf_value = buffer.getvalue()
-            buffer.close()
-            response = HttpResponse(pdf_value, content_type='application/pdf')
+            doc.build(elements)
             filename = f"rapport_par_banque_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
+            return reponse_fichier_pdf(fichier, filename)
         except Exception as e:
             print(f"Erreur _generer_pdf_rapport_par_banque: {str(e)}")
             import traceback
@@ -1064,35 +1002,13 @@ class EtatsFeuillesGenererView(View):
     def _generer_pdf_synthese_par_banque(self, request, queryset, mois, annee):
         """Synthèse par banque : une ligne par banque (totaux) + total général. Filtres : mois et année uniquement."""
         try:
-            buffer = BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=landscape(A4),
+            fichier = fichier_temporaire_pdf()
+            doc = DocumentRapport(fichier, pagesize=landscape(A4),
                 rightMargin=1.5*cm, leftMargin=0.3*cm,
                 topMargin=0.5*cm, bottomMargin=1.5*cm)
-            styles = getSampleStyleSheet()
+            styles = styles_pdf()
             elements = []
-            logo_path = settings.BASE_DIR / 'static' / 'img' / 'WhatsApp Image 2026-03-07 at 17.24.40.jpeg'
-            if logo_path.exists():
-                logo = Image(str(logo_path), width=3*cm, height=3*cm)
-                # Rendre le logo circulaire
-                logo.drawHeight = 3*cm
-                logo.drawWidth = 3*cm
-                # Créer un tableau 2x2 pour positionnement absolu
-                logo_table = Table([
-                    [logo, ''],
-                    ['', '']
-                ], colWidths=[3*cm, 20*cm], rowHeights=[3*cm, 0.5*cm])
-                logo_table.setStyle(TableStyle([
-                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                    ('LEFTPADDING', (0, 0), (-1, -1), 0),
-                    ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-                    ('TOPPADDING', (0, 0), (-1, -1), 0),
-                    ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-                    # Masquer les bordures
-                    ('GRID', (0, 0), (-1, -1), 0, colors.white),
-                ]))
-                elements.append(logo_table)
-                elements.append(Spacer(1, 0.3*cm))
+            elements.extend(entete_logo())
             titre = 'SYNTHÈSE PAR BANQUE'
             elements.append(Paragraph(titre, styles['Title']))
             mois_noms = ['', 'Janvier', 'Février', 'Mars', 'Avril', 'Mai', 'Juin',
@@ -1173,13 +1089,9 @@ class EtatsFeuillesGenererView(View):
                 elements.append(tt)
             else:
                 elements.append(Paragraph("Aucune donnée pour la période sélectionnée.", styles['Normal']))
-            doc.build(elements, onFirstPage=_footer_on_first, onLaterPages=_footer_on_later)
-            pdf_value = buffer.getvalue()
-            buffer.close()
-            response = HttpResponse(pdf_value, content_type='application/pdf')
+            doc.build(elements)
             filename = f"synthese_par_banque_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
+            return reponse_fichier_pdf(fichier, filename)
         except Exception as e:
             print(f"Erreur _generer_pdf_synthese_par_banque: {str(e)}")
             import traceback
@@ -1377,6 +1289,26 @@ class RapportSynthesePDFView(LoginRequiredMixin, View):
     """Vue pour générer les rapports synthétiques en PDF"""
     
     def get(self, request, *args, **kwargs):
+        try:
+            data = json.loads(unquote(request.GET.get('data', '{}')))
+        except ValueError:
+            data = None
+        if not REPORTLAB_AVAILABLE or not isinstance(data, dict) or 'type_etat' not in data:
+            return self._generer_pdf(request)
+        
+        # Le PDF ne dépend que de `data` ; la version des feuilles de la période
+        # est ajoutée à la clé comme pour les autres rapports
+        modele = RecetteFeuille if 'RECETTE' in str(data['type_etat']).upper() else DepenseFeuille
+        version = version_donnees(feuilles_de_la_periode(modele, data.get('annee'), data.get('mois')))
+        cache = CacheRapports()
+        cle = cache.cle('feuilles:synthese', dict(data, jour=timezone.localdate()), version)
+        filename = f"synthese_{str(data['type_etat']).lower()}_{data.get('annee', 'tout')}.pdf"
+        response = cache.reponse(cle, 'pdf', filename, 'application/pdf')
+        if response is not None:
+            return response
+        return cache.conserver_reponse(cle, 'pdf', self._generer_pdf(request), 'application/pdf')
+    
+    def _generer_pdf(self, request):
         if not REPORTLAB_AVAILABLE:
             return HttpResponse("ReportLab n'est pas disponible. Veuillez l'installer avec: pip install reportlab", content_type='text/plain')
         
@@ -1390,11 +1322,11 @@ class RapportSynthesePDFView(LoginRequiredMixin, View):
             
             # Créer le buffer PDF
             buffer = BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=landscape(A4), 
+            doc = DocumentRapport(buffer, pagesize=landscape(A4), 
                                rightMargin=1.5*cm, leftMargin=1.5*cm, 
                                topMargin=1.5*cm, bottomMargin=1.5*cm)
             
-            styles = getSampleStyleSheet()
+            styles = styles_pdf()
             elements = []
             
             # Titre
@@ -1453,7 +1385,7 @@ class RapportSynthesePDFView(LoginRequiredMixin, View):
             elements.append(Spacer(1, 1*cm))
             
             # Générer le PDF
-            doc.build(elements, onFirstPage=_footer_on_first, onLaterPages=_footer_on_later)
+            doc.build(elements)
             
             # Préparer la réponse
             pdf_value = buffer.getvalue()
@@ -1496,11 +1428,11 @@ class RapportGroupePDFView(LoginRequiredMixin, View):
             
             # Créer le buffer PDF
             buffer = BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=landscape(A4), 
+            doc = DocumentRapport(buffer, pagesize=landscape(A4), 
                                rightMargin=1.5*cm, leftMargin=1.5*cm, 
                                topMargin=1.5*cm, bottomMargin=1.5*cm)
             
-            styles = getSampleStyleSheet()
+            styles = styles_pdf()
             elements = []
             
             # Titre personnalisé selon le critère
@@ -1691,7 +1623,7 @@ class RapportGroupePDFView(LoginRequiredMixin, View):
                 elements.append(Spacer(1, 1*cm))
             
             # Générer le PDF
-            doc.build(elements, onFirstPage=_footer_on_first, onLaterPages=_footer_on_later)
+            doc.build(elements)
             
             # Préparer la réponse
             pdf_value = buffer.getvalue()
@@ -0,0 +1,115 @@
+"""
+Import des feuilles DEPENSES / RECETTES depuis l'application
+
+Le classeur téléversé est enregistré puis analysé par le travailleur
+`run_report_worker` ; la page de l'import affiche l'aperçu paginé (lignes
+nouvelles, doublons, erreurs, articles et banques non résolus) et les lignes
+nouvelles ne sont insérées qu'après confirmation, elles aussi par le
+travailleur. Aucune lecture du classeur n'a lieu dans la requête.
+"""
+from django.contrib import messages
+from django.core.paginator import Paginator
+from django.shortcuts import get_object_or_404, redirect, render
+from django.views.generic import View
+
+from accounts.permissions import RoleRequiredMixin
+from .forms_imports import ImportFeuilleWebForm
+from .models import ImportFeuilleWeb
+
+
+LIGNES_PAR_PAGE = 50
+
+# Filtres de l'aperçu : valeur du paramètre ?filtre= -> filtre des lignes
+FILTRES_APERCU = {
+    'NOUVELLE': {'categorie': 'NOUVELLE'},
+    'DOUBLON': {'categorie': 'DOUBLON'},
+    'ERREUR': {'categorie': 'ERREUR'},
+    'ARTICLE': {'nature_non_resolue': True},
+    'BANQUE': {'banque_non_resolue': True},
+}
+
+
+class ImportFeuilleWebMixin(RoleRequiredMixin):
+    permission_function = 'peut_voir_menu_depenses_daf'
+
+    def get_import(self, pk):
+        return get_object_or_404(ImportFeuilleWeb.objects.select_related('cree_par'), pk=pk)
+
+
+class ImportFeuilleWebView(ImportFeuilleWebMixin, View):
+    """Téléversement d'un classeur et liste des derniers imports"""
+    template_name = 'tableau_bord_feuilles/import_feuille.html'
+
+    def get(self, request, *args, **kwargs):
+        return self.afficher(ImportFeuilleWebForm())
+
+    def post(self, request, *args, **kwargs):
+        form = ImportFeuilleWebForm(request.POST, request.FILES)
+        if not form.is_valid():
+            return self.afficher(form)
+        import_feuille = form.save(commit=False)
+        import_feuille.nom_fichier = request.FILES['fichier'].name[:255]
+        import_feuille.cree_par = request.user
+        import_feuille.save()
+        messages.success(request, "Fichier reçu : l'analyse est en cours, l'aperçu s'affichera sur cette page.")
+        return redirect('tableau_bord_feuilles:import_detail', pk=import_feuille.pk)
+
+    def afficher(self, form):
+        imports = ImportFeuilleWeb.objects.select_related('cree_par')[:20]
+        return render(self.request, self.template_name, {'form': form, 'imports': imports})
+
+
+class ImportFeuilleWebDetailView(ImportFeuilleWebMixin, View):
+    """Avancement et aperçu paginé d'un import"""
+    template_name = 'tableau_bord_feuilles/import_feuille_detail.html'
+
+    def get(self, request, pk, *args, **kwargs):
+        import_feuille = self.get_import(pk)
+        filtre = request.GET.get('filtre', '')
+        lignes = import_feuille.lignes.filter(**FILTRES_APERCU.get(filtre, {})).order_by('numero')
+        page = Paginator(lignes, LIGNES_PAR_PAGE).get_page(request.GET.get('page'))
+        non_resolus = import_feuille.non_resolus or {}
+        return render(request, self.template_name, {
+            'import_feuille': import_feuille,
+            'page_obj': page,
+            'filtre': filtre,
+            'filtres': [
+                ('', 'Toutes', import_feuille.lignes_nouvelles + import_feuille.doublons + import_feuille.erreurs),
+                ('NOUVELLE', 'Nouvelles', import_feuille.lignes_nouvelles),
+                ('DOUBLON', 'Doublons', import_feuille.doublons),
+                ('ERREUR', 'Erreurs', import_feuille.erreurs),
+            ],
+            'articles_non_resolus': sorted(non_resolus.get('article', {}).items(), key=lambda item: -item[1]),
+            'banques_non_resolues': sorted(non_resolus.get('banque', {}).items(), key=lambda item: -item[1]),
+            'est_depenses': import_feuille.feuille == 'DEPENSES',
+        })
+
+
+class ImportFeuilleWebConfirmerView(ImportFeuilleWebMixin, View):
+    """Confirmation : les lignes nouvelles seront insérées par le travailleur"""
+
+    def post(self, request, pk, *args, **kwargs):
+        confirme = ImportFeuilleWeb.objects.filter(pk=pk, statut='A_CONFIRMER').update(
+            statut='IMPORT_EN_ATTENTE', tentatives=0, message=''
+        )
+        if confirme:
+            messages.success(request, "Import confirmé : les lignes nouvelles vont être enregistrées.")
+        else:
+            messages.error(request, "Cet import ne peut plus être confirmé.")
+        return redirect('tableau_bord_feuilles:import_detail', pk=pk)
+
+
+class ImportFeuilleWebAnnulerView(ImportFeuilleWebMixin, View):
+    """Abandon d'un import pas encore confirmé (aucune ligne n'a été insérée)"""
+
+    def post(self, request, pk, *args, **kwargs):
+        import_feuille = self.get_import(pk)
+        annule = ImportFeuilleWeb.objects.filter(
+            pk=pk, statut__in=['ANALYSE_EN_ATTENTE', 'ANALYSE_EN_COURS', 'A_CONFIRMER', 'ECHEC']
+        ).update(statut='ANNULE', jeton=None, date_limite=None)
+        if annule:
+            import_feuille.lignes.all().delete()
+            messages.success(request, "Import annulé.")
+        else:
+            messages.error(request, "Cet import ne peut plus être annulé.")
+        return redirect('tableau_bord_feuilles:import_detail', pk=pk)
@@ -2,24 +2,26 @@ from django.shortcuts import render
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import View
 from django.http import HttpResponse
-from django.db.models import Sum, Q
+from django.db.models import Sum
 from django.utils import timezone
 from decimal import Decimal
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.lib.units import cm
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
 from django.contrib.humanize.templatetags.humanize import intcomma
-from django.core.paginator import Paginator
 from datetime import datetime
+from itertools import chain
 import json
 
-from demandes.models import DepenseFeuille, NatureEconomique
-from recettes.models import RecetteFeuille
+from demandes.models import NatureEconomique
 from banques.models import Banque
 from accounts.models import Service
+from .agregation import AgregationFeuilles
+from .operations import OperationsFeuilles, filtrer_feuilles
+from .pdf_flux import FlowablesEnFlux, fichier_temporaire_pdf, reponse_fichier_pdf, tableaux_par_tranches
 
 
 def format_montant_pdf(montant):
@@ -45,118 +47,26 @@ class TableauGeneralFeuillesView(LoginRequiredMixin, View):
         date_fin = request.GET.get('date_fin', '')
         search = request.GET.get('search', '')
         
-        # Récupérer les données de base
-        depenses = DepenseFeuille.objects.all()
-        recettes = RecetteFeuille.objects.all()
+        # Fusion, tri et pagination par la base (UNION ALL + pagination par clé)
+        depenses, recettes = filtrer_feuilles(request.GET)
+        operations = OperationsFeuilles(depenses, recettes)
+        page = operations.page(apres=request.GET.get('apres'), avant=request.GET.get('avant'))
+        totaux = operations.totaux()
         
-        # Filtrer par type
-        if type_filter == 'depense':
-            recettes = RecetteFeuille.objects.none()
-        elif type_filter == 'recette':
-            depenses = DepenseFeuille.objects.none()
-        
-        # Appliquer les filtres sur les dépenses
-        if annee_filter:
-            depenses = depenses.filter(annee=annee_filter)
-        if mois_filter:
-            depenses = depenses.filter(mois=mois_filter)
-        if banque_filter:
-            depenses = depenses.filter(banque_id=banque_filter)
-        if nature_filter:
-            depenses = depenses.filter(nature_economique_id=nature_filter)
-        if service_filter:
-            depenses = depenses.filter(service_beneficiaire_id=service_filter)
-        if date_debut:
-            depenses = depenses.filter(date__gte=date_debut)
-        if date_fin:
-            depenses = depenses.filter(date__lte=date_fin)
-        if search:
-            depenses = depenses.filter(
-                Q(libelle_depenses__icontains=search) |
-                Q(observation__icontains=search)
-            )
-        
-        # Appliquer les filtres sur les recettes
-        if annee_filter:
-            recettes = recettes.filter(annee=annee_filter)
-        if mois_filter:
-            recettes = recettes.filter(mois=mois_filter)
-        if banque_filter:
-            recettes = recettes.filter(banque_id=banque_filter)
-        if date_debut:
-            recettes = recettes.filter(date__gte=date_debut)
-        if date_fin:
-            recettes = recettes.filter(date__lte=date_fin)
-        if search:
-            recettes = recettes.filter(libelle_recette__icontains=search)
-        
-        # Combiner et trier
-        operations = []
-        
-        # Ajouter les dépenses
-        for dep in depenses:
-            operations.append({
-                'type': 'dépense',
-                'date': dep.date,
-                'libelle': dep.libelle_depenses,
-                'nature': dep.nature_economique.titre if dep.nature_economique else '',
-                'service': dep.service_beneficiaire.nom_service if dep.service_beneficiaire else '',
-                'banque': dep.banque.nom_banque if dep.banque else '',
-                'montant_cdf': dep.montant_fc,
-                'montant_usd': dep.montant_usd,
-                'observation': dep.observation,
-                'mois': dep.mois,
-                'annee': dep.annee,
-                'id': dep.id,
-            })
-        
-        # Ajouter les recettes
-        for rec in recettes:
-            operations.append({
-                'type': 'recette',
-                'date': rec.date,
-                'libelle': rec.libelle_recette,
-                'nature': '',
-                'service': '',
-                'banque': rec.banque.nom_banque if rec.banque else '',
-                'montant_cdf': rec.montant_fc,
-                'montant_usd': rec.montant_usd,
-                'observation': '',
-                'mois': rec.mois,
-                'annee': rec.annee,
-                'id': rec.id,
-            })
-        
-        # Trier par date
-        operations.sort(key=lambda x: x['date'], reverse=True)
-        
-        # Pagination
-        paginator = Paginator(operations, 50)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
-        
-        # Calculer les totaux
-        total_depenses_cdf = sum(op['montant_cdf'] for op in operations if op['type'] == 'dépense')
-        total_depenses_usd = sum(op['montant_usd'] for op in operations if op['type'] == 'dépense')
-        total_recettes_cdf = sum(op['montant_cdf'] for op in operations if op['type'] == 'recette')
-        total_recettes_usd = sum(op['montant_usd'] for op in operations if op['type'] == 'recette')
-        solde_cdf = total_recettes_cdf - total_depenses_cdf
-        solde_usd = total_recettes_usd - total_depenses_usd
+        # Paramètres de filtrage à conserver dans les liens de pagination
+        parametres = request.GET.copy()
+        for cle in ('apres', 'avant', 'page'):
+            parametres.pop(cle, None)
         
         # Récupérer les données pour les filtres
-        annees_disponibles = sorted(set(
-            list(DepenseFeuille.objects.values_list('annee', flat=True).distinct()) +
-            list(RecetteFeuille.objects.values_list('annee', flat=True).distinct())
-        ), reverse=True)
+        annees_disponibles = sorted(AgregationFeuilles.annees_disponibles(), reverse=True)
         
         context = {
-            'page_obj': page_obj,
-            'total_depenses_cdf': total_depenses_cdf,
-            'total_depenses_usd': total_depenses_usd,
-            'total_recettes_cdf': total_recettes_cdf,
-            'total_recettes_usd': total_recettes_usd,
-            'solde_cdf': solde_cdf,
-            'solde_usd': solde_usd,
+            'operations': page['operations'],
+            'curseur_suivant': page['curseur_suivant'],
+            'curseur_precedent': page['curseur_precedent'],
+            'parametres_filtres': parametres.urlencode(),
+            **totaux,
             'banques': Banque.objects.all(),
             'natures': NatureEconomique.objects.all(),
             'services': Service.objects.all(),
@@ -171,9 +81,6 @@ class TableauGeneralFeuillesView(LoginRequiredMixin, View):
             'date_debut': date_debut,
             'date_fin': date_fin,
             'search': search,
-            'nb_operations': len(operations),
-            'nb_depenses': len([op for op in operations if op['type'] == 'dépense']),
-            'nb_recettes': len([op for op in operations if op['type'] == 'recette']),
         }
         
         return render(request, self.template_name, context)
@@ -195,82 +102,19 @@ class TableauGeneralPDFView(LoginRequiredMixin, View):
         search = request.POST.get('search', '')
         
         # Appliquer les mêmes filtres que dans la vue principale
-        depenses = DepenseFeuille.objects.all()
-        recettes = RecetteFeuille.objects.all()
-        
-        if type_filter == 'depense':
-            recettes = RecetteFeuille.objects.none()
-        elif type_filter == 'recette':
-            depenses = DepenseFeuille.objects.none()
-        
-        if annee_filter:
-            depenses = depenses.filter(annee=annee_filter)
-            recettes = recettes.filter(annee=annee_filter)
-        if mois_filter:
-            depenses = depenses.filter(mois=mois_filter)
-            recettes = recettes.filter(mois=mois_filter)
-        if banque_filter:
-            depenses = depenses.filter(banque_id=banque_filter)
-            recettes = recettes.filter(banque_id=banque_filter)
-        if nature_filter:
-            depenses = depenses.filter(nature_economique_id=nature_filter)
-        if service_filter:
-            depenses = depenses.filter(service_beneficiaire_id=service_filter)
-        if date_debut:
-            depenses = depenses.filter(date__gte=date_debut)
-            recettes = recettes.filter(date__gte=date_debut)
-        if date_fin:
-            depenses = depenses.filter(date__lte=date_fin)
-            recettes = recettes.filter(date__lte=date_fin)
-        if search:
-            depenses = depenses.filter(
-                Q(libelle_depenses__icontains=search) |
-                Q(observation__icontains=search)
-            )
-            recettes = recettes.filter(libelle_recette__icontains=search)
+        depenses, recettes = filtrer_feuilles(request.POST)
+        operations = OperationsFeuilles(depenses, recettes)
+        totaux = operations.totaux()
         
-        # Combiner les données
-        operations = []
-        
-        for dep in depenses:
-            operations.append({
-                'type': 'dépense',
-                'date': dep.date,
-                'libelle': dep.libelle_depenses,
-                'nature': dep.nature_economique.titre if dep.nature_economique else '',
-                'service': dep.service_beneficiaire.nom_service if dep.service_beneficiaire else '',
-                'banque': dep.banque.nom_banque if dep.banque else '',
-                'montant_cdf': dep.montant_fc,
-                'montant_usd': dep.montant_usd,
-                'observation': dep.observation,
-            })
-        
-        for rec in recettes:
-            operations.append({
-                'type': 'recette',
-                'date': rec.date,
-                'libelle': rec.libelle_recette,
-                'nature': '',
-                'service': '',
-                'banque': rec.banque.nom_banque if rec.banque else '',
-                'montant_cdf': rec.montant_fc,
-                'montant_usd': rec.montant_usd,
-                'observation': '',
-            })
-        
-        # Trier par date
-        operations.sort(key=lambda x: x['date'], reverse=True)
-        
-        if not operations:
+        if not totaux['nb_operations']:
             return HttpResponse("Aucune opération trouvée pour les filtres sélectionnés", status=404)
         
-        # Créer le PDF
-        response = HttpResponse(content_type='application/pdf')
+        # Le PDF est écrit dans un fichier temporaire puis servi par blocs
+        fichier = fichier_temporaire_pdf()
         filename = f"tableau_general_feuilles_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
         
         # Document PDF en mode paysage
-        doc = SimpleDocTemplate(response, pagesize=landscape(A4), rightMargin=1.5*cm, leftMargin=1.5*cm, 
+        doc = SimpleDocTemplate(fichier, pagesize=landscape(A4), rightMargin=1.5*cm, leftMargin=1.5*cm, 
                               topMargin=2*cm, bottomMargin=2*cm)
         
         # Styles
@@ -331,20 +175,11 @@ class TableauGeneralPDFView(LoginRequiredMixin, View):
         story.append(Paragraph(filtre_texte, subtitle_style))
         story.append(Spacer(1, 15))
         
-        # Statistiques
-        total_depenses_cdf = sum(op['montant_cdf'] for op in operations if op['type'] == 'dépense')
-        total_depenses_usd = sum(op['montant_usd'] for op in operations if op['type'] == 'dépense')
-        total_recettes_cdf = sum(op['montant_cdf'] for op in operations if op['type'] == 'recette')
-        total_recettes_usd = sum(op['montant_usd'] for op in operations if op['type'] == 'recette')
-        solde_cdf = total_recettes_cdf - total_depenses_cdf
-        solde_usd = total_recettes_usd - total_depenses_usd
-        nb_depenses = len([op for op in operations if op['type'] == 'dépense'])
-        nb_recettes = len([op for op in operations if op['type'] == 'recette'])
-        
-        story.append(Paragraph(f"<b>Nombre d'opérations:</b> {len(operations)} (Dépenses: {nb_depenses}, Recettes: {nb_recettes})", subtitle_style))
-        story.append(Paragraph(f"<b>Total Dépenses:</b> {format_montant_pdf(total_depenses_cdf)} CDF / {format_montant_pdf(total_depenses_usd)} USD", subtitle_style))
-        story.append(Paragraph(f"<b>Total Recettes:</b> {format_montant_pdf(total_recettes_cdf)} CDF / {format_montant_pdf(total_recettes_usd)} USD", subtitle_style))
-        story.append(Paragraph(f"<b>Solde Net:</b> {format_montant_pdf(solde_cdf)} CDF / {format_montant_pdf(solde_usd)} USD", subtitle_style))
+        # Statistiques (une requête d'agrégat, pas de parcours des lignes)
+        story.append(Paragraph(f"<b>Nombre d'opérations:</b> {totaux['nb_operations']} (Dépenses: {totaux['nb_depenses']}, Recettes: {totaux['nb_recettes']})", subtitle_style))
+        story.append(Paragraph(f"<b>Total Dépenses:</b> {format_montant_pdf(totaux['total_depenses_cdf'])} CDF / {format_montant_pdf(totaux['total_depenses_usd'])} USD", subtitle_style))
+        story.append(Paragraph(f"<b>Total Recettes:</b> {format_montant_pdf(totaux['total_recettes_cdf'])} CDF / {format_montant_pdf(totaux['total_recettes_usd'])} USD", subtitle_style))
+        story.append(Paragraph(f"<b>Solde Net:</b> {format_montant_pdf(totaux['solde_cdf'])} CDF / {format_montant_pdf(totaux['solde_usd'])} USD", subtitle_style))
         story.append(Spacer(1, 20))
         
         # Tableau détaillé
@@ -353,11 +188,9 @@ class TableauGeneralPDFView(LoginRequiredMixin, View):
         
         # En-têtes du tableau
         headers = ['Date', 'Type', 'Libellé', 'Nature', 'Service', 'Banque', 'Montant CDF', 'Montant USD', 'Observation']
-        data = [headers]
         
-        # Données
-        for op in operations:
-            data.append([
+        def ligne_pdf(op):
+            return [
                 op['date'].strftime('%d/%m/%Y'),
                 op['type'].upper(),
                 op['libelle'][:40] + '...' if len(op['libelle']) > 40 else op['libelle'],
@@ -367,11 +200,9 @@ class TableauGeneralPDFView(LoginRequiredMixin, View):
                 format_montant_pdf(op['montant_cdf']),
                 format_montant_pdf(op['montant_usd']),
                 op['observation'][:30] + '...' if len(op['observation']) > 30 else op['observation'],
-            ])
+            ]
         
-        # Créer le tableau
-        table = Table(data, colWidths=[2.5*cm, 1.5*cm, 6*cm, 2.5*cm, 2*cm, 2*cm, 2.5*cm, 2.5*cm, 3*cm])
-        table.setStyle(TableStyle([
+        style_tableau = [
             ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
             ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
@@ -387,24 +218,31 @@ class TableauGeneralPDFView(LoginRequiredMixin, View):
             ('ALIGN', (5, 1), (5, -1), 'LEFT'),
             ('ALIGN', (8, 1), (8, -1), 'LEFT'),
             ('ALIGN', (6, 1), (7, -1), 'RIGHT'),
-        ]))
+        ]
         
         # Couleurs pour les types
-        for i, row in enumerate(data[1:], start=1):
-            if row[1] == 'DÉPENSE':
-                table.setStyle(TableStyle([('TEXTCOLOR', (0, i), (-1, i), colors.red)]))
-            else:
-                table.setStyle(TableStyle([('TEXTCOLOR', (0, i), (-1, i), colors.green)]))
-        
-        story.append(table)
+        def couleur_ligne(i, row):
+            couleur = colors.red if row[1] == 'DÉPENSE' else colors.green
+            return [('TEXTCOLOR', (0, i), (-1, i), couleur)]
+        
+        # Tableau construit par tranches d'une page au fil de la lecture des lignes
+        lignes = (ligne_pdf(op) for op in operations.iterer())
+        tableaux = tableaux_par_tranches(
+            headers, lignes,
+            col_widths=[2.5*cm, 1.5*cm, 6*cm, 2.5*cm, 2*cm, 2*cm, 2.5*cm, 2.5*cm, 3*cm],
+            style=style_tableau,
+            styles_ligne=couleur_ligne,
+        )
         
         # Pied de page
-        story.append(Spacer(1, 15))
-        story.append(Paragraph(f"Généré le {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}", 
-                             ParagraphStyle('Footer', parent=styles['Normal'], 
-                                           fontSize=8, alignment=TA_CENTER, textColor=colors.grey)))
+        pied = [
+            Spacer(1, 15),
+            Paragraph(f"Généré le {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}", 
+                      ParagraphStyle('Footer', parent=styles['Normal'], 
+                                     fontSize=8, alignment=TA_CENTER, textColor=colors.grey)),
+        ]
         
         # Générer le PDF
-        doc.build(story)
+        doc.build(FlowablesEnFlux(chain(story, tableaux, pied)))
         
-        return response
+        return reponse_fichier_pdf(fichier, filename)